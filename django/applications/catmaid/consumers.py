@@ -3,9 +3,24 @@ import logging
 
 from asgiref.sync import async_to_sync
 
+from channels.db import database_sync_to_async
+from channels.generic.http import AsyncHttpConsumer
 from channels.generic.websocket import WebsocketConsumer
 from channels.layers import get_channel_layer
 
+from django.http import QueryDict
+
+from guardian.utils import get_anonymous_user
+
+from rest_framework.authtoken.models import Token
+
+from catmaid.control.authentication import (has_any_role, permission_cache,
+        PermissionError)
+from catmaid.control.node import (compile_node_list_result_async,
+        get_node_list_query)
+from catmaid.middleware import AjaxExceptionMiddleware
+from catmaid.models import UserRole
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,6 +60,68 @@ class UpdateConsumer(WebsocketConsumer):
         self.send(text_data=event["data"])
 
 
+class NodeListConsumer(AsyncHttpConsumer):
+    """Answer node list requests like the node_list_tuples() view, but query
+    all configured node providers concurrently. The first valid result is
+    returned and all other queries are cancelled. Queries run in a thread
+    pool with its own database connections, which allows a single ASGI worker
+    to serve many concurrent tracing clients.
+    """
+
+    async def handle(self, body):
+        try:
+            project_id = int(self.scope['url_route']['kwargs']['project_id'])
+            data = self.get_request_data(body)
+            await database_sync_to_async(self.check_permissions)(project_id)
+            node_providers, params, options = get_node_list_query(project_id, data)
+            response = await compile_node_list_result_async(project_id,
+                    node_providers, params, **options)
+        except Exception as e:
+            logger.debug(f"Async node list request failed: {e}")
+            response = AjaxExceptionMiddleware(None).process_exception(None, e)
+
+        await self.send_response(response.status_code, response.content,
+                headers=[(b'Content-Type', response['Content-Type'].encode())])
+
+    def get_request_data(self, body):
+        method = self.scope['method']
+        if method == 'GET':
+            return QueryDict(self.scope['query_string'])
+        elif method == 'POST':
+            return QueryDict(body)
+        else:
+            raise ValueError("Unsupported HTTP method: " + method)
+
+    def get_user(self):
+        """Get the user of an API token in the X-Authorization or Authorization
+        header, or the session user.
+        """
+        headers = dict(self.scope['headers'])
+        auth = headers.get(b'x-authorization') or headers.get(b'authorization')
+        if auth:
+            keyword, _, key = auth.decode().partition(' ')
+            if keyword == 'Token' and key:
+                token = Token.objects.select_related('user').filter(key=key.strip()).first()
+                if not token:
+                    raise PermissionError("Invalid token")
+                return token.user
+        user = self.scope.get('user')
+        if not user or user.is_anonymous:
+            user = get_anonymous_user()
+        return user
+
+    def check_permissions(self, project_id):
+        """Raise a PermissionError unless the user is allowed to browse or
+        annotate the passed in project.
+        """
+        u = self.get_user()
+        perms = permission_cache.get_perms(u, project_id)
+        if not (u.is_active and (u.is_superuser or
+                has_any_role(perms, [UserRole.Annotate, UserRole.Browse]))):
+            raise PermissionError(f"User '{u.username}' with ID {u.id} does not " +
+                    f"have the required permissions in project {project_id}")
+
+
 def msg_user(user_id, event_name, data:str="", data_type:str="text", is_raw_data:bool=False,
         ignore_missing:bool=True) -> None:
     """Send a message to a user. This message will contain a dictionary with the
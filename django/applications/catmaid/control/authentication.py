@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
 from functools import wraps
-from itertools import groupby
+from itertools import chain, groupby
 import json
 import re
-from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple, Union
+import threading
+import time
+from typing import Any, DefaultDict, Dict, FrozenSet, List, Optional, Set, Tuple, Union
 from psycopg2 import ProgrammingError
 
 from guardian.core import ObjectPermissionChecker
@@ -21,6 +24,7 @@ from django.contrib.auth import authenticate, logout, login
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.forms import UserCreationForm
 from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.http import HttpRequest, HttpResponseRedirect, JsonResponse
 from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import _get_queryset, render
@@ -166,6 +170,147 @@ def check_user_role(user, project, roles) -> bool:
     return has_role
 
 
+# Maps roles to the project permissions that grant them
+ROLE_PERMISSIONS = {
+    UserRole.Annotate: 'can_annotate',
+    UserRole.Browse: 'can_browse',
+    UserRole.Fork: 'can_fork',
+    UserRole.Import: 'can_import',
+    UserRole.QueueComputeTask: 'can_queue_compute_task',
+}
+
+
+def has_any_role(perms, roles) -> bool:
+    """Check whether a set of project permission codenames grants at least one
+    of the passed in roles. Administrator permission satisfies any role.
+    """
+    if 'can_administer' in perms:
+        return True
+    if isinstance(roles, str):
+        roles = [roles]
+    return any(ROLE_PERMISSIONS.get(role) in perms for role in roles)
+
+
+class ProjectPermissionCache(object):
+    """Keeps the permissions users have on projects in memory for a short
+    time, so that permission checks for frequent requests don't need to query
+    the database. Entries are invalidated through signals when permissions,
+    group memberships, users or projects change in this process. Changes in
+    other processes become visible once entries are older than max_age
+    seconds. A max_age of zero disables the cache.
+    """
+
+    def __init__(self, max_age=None, max_entries=10000):
+        self._max_age = max_age
+        self.max_entries = max_entries
+
+        # Maps (user ID, project ID) to (creation time, permissions) tuples.
+        self.entries:OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Incremented with each invalidation
+        self.generation = 0
+
+        self.lock = threading.RLock()
+
+    @property
+    def max_age(self):
+        if self._max_age is None:
+            return getattr(settings, 'PERMISSION_CACHE_MAX_AGE', 10)
+        return self._max_age
+
+    def get_perms(self, user, project_id) -> FrozenSet[str]:
+        """Get the permission codenames explicitly assigned to the passed in
+        user on a project, either directly or through groups. Superuser status
+        isn't taken into account. Raises Project.DoesNotExist if the project
+        isn't cached and doesn't exist.
+        """
+        project_id = int(project_id)
+        max_age = self.max_age
+        if not max_age or user.id is None:
+            return self._query_perms(user, project_id)
+
+        key = (user.id, project_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if time.time() - entry[0] <= max_age:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+            self.misses += 1
+            generation = self.generation
+
+        perms = self._query_perms(user, project_id)
+
+        with self.lock:
+            # Don't store permissions that might have been changed during the
+            # query.
+            if generation == self.generation:
+                self.entries[key] = (time.time(), perms)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+        return perms
+
+    def _query_perms(self, user, project_id) -> FrozenSet[str]:
+        project = Project.objects.get(pk=project_id)
+        return frozenset(chain(get_user_perms(user, project),
+                get_group_perms(user, project)))
+
+    def invalidate(self, user_id=None, project_id=None) -> int:
+        """Remove all entries of a user and/or project. If neither is passed
+        in, all entries are removed. Returns the number of removed entries.
+        """
+        with self.lock:
+            self.generation += 1
+            if user_id is None and project_id is None:
+                to_remove = list(self.entries.keys())
+            else:
+                to_remove = [k for k in self.entries
+                        if (user_id is None or k[0] == user_id) and
+                        (project_id is None or k[1] == project_id)]
+            for k in to_remove:
+                del self.entries[k]
+            self.invalidations += len(to_remove)
+            return len(to_remove)
+
+    def clear(self) -> None:
+        self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+
+# The permission cache of this process
+permission_cache = ProjectPermissionCache()
+
+
+def get_project_permissions(request:HttpRequest, project_id) -> FrozenSet[str]:
+    """Get the explicitly assigned permissions of the request user on the
+    passed in project. The result is stored with the request for further checks
+    during the same request and is otherwise looked up in the permission cache.
+    """
+    project_id = int(project_id)
+    request_perms = getattr(request, '_catmaid_project_perms', None)
+    if request_perms is None:
+        request_perms = {}
+        request._catmaid_project_perms = request_perms # type: ignore
+    perms = request_perms.get(project_id)
+    if perms is None:
+        perms = permission_cache.get_perms(request.user, project_id)
+        request_perms[project_id] = perms
+    return perms
+
+
 def requires_superuser():
     """
     This decorator will raise an error if the logged in user is no superuser.
@@ -197,10 +342,10 @@ def requires_user_role(roles):
 
     def decorated_with_requires_user_role(f):
         def inner_decorator(request, roles=roles, *args, **kwargs):
-            p = Project.objects.get(pk=kwargs['project_id'])
             u = request.user
+            perms = get_project_permissions(request, kwargs['project_id'])
 
-            has_role = check_user_role(u, p, roles)
+            has_role = u.is_active and (u.is_superuser or has_any_role(perms, roles))
             is_token_authenticated = getattr(request, '_is_token_authenticated', False)
 
             # If a request is authenticated through an API token permissions are
@@ -209,8 +354,7 @@ def requires_user_role(roles):
             # for admin accounts.
             if is_token_authenticated and not contains_read_roles(roles) and \
                     settings.REQUIRE_EXTRA_TOKEN_PERMISSIONS:
-                has_role = 'can_annotate_with_token' in get_user_perms(u, p) or \
-                        'can_annotate_with_token' in get_group_perms(u, p)
+                has_role = 'can_annotate_with_token' in perms
 
             if has_role:
                 # The user can execute the function.
@@ -846,3 +990,42 @@ def deactivate_inactive_users() -> List:
     """)
 
     return [row[0] for row in cursor.fetchall()]
+
+
+def invalidate_user_permissions(sender, instance, **kwargs) -> None:
+    permission_cache.invalidate(user_id=instance.user_id)
+
+
+def invalidate_all_permissions(sender, instance, **kwargs) -> None:
+    permission_cache.invalidate()
+
+
+def invalidate_user(sender, instance, **kwargs) -> None:
+    permission_cache.invalidate(user_id=instance.id)
+
+
+def invalidate_project(sender, instance, **kwargs) -> None:
+    permission_cache.invalidate(project_id=instance.id)
+
+
+def invalidate_group_membership(sender, instance, action, reverse, pk_set, **kwargs) -> None:
+    if not action.startswith('post_'):
+        return
+    # For reverse relations the instance is a group and pk_set contains user
+    # IDs, which is not available for clear().
+    if isinstance(instance, User):
+        permission_cache.invalidate(user_id=instance.id)
+    elif pk_set:
+        for user_id in pk_set:
+            permission_cache.invalidate(user_id=user_id)
+    else:
+        permission_cache.invalidate()
+
+
+for signal in (post_save, post_delete):
+    signal.connect(invalidate_user_permissions, sender=UserObjectPermission)
+    signal.connect(invalidate_all_permissions, sender=GroupObjectPermission)
+    signal.connect(invalidate_user, sender=User)
+    signal.connect(invalidate_project, sender=Project)
+post_delete.connect(invalidate_all_permissions, sender=Group)
+m2m_changed.connect(invalidate_group_membership, sender=User.groups.through)
@@ -2,10 +2,9 @@
 
 from collections import defaultdict
 from functools import partial
-from itertools import combinations, chain
+from itertools import combinations
 import json
 import math
-import networkx as nx
 from rest_framework.decorators import api_view
 
 from typing import Any, DefaultDict, Dict, Iterator, List, Optional, Set, Tuple, Union
@@ -16,12 +15,15 @@ from django.http import HttpRequest, JsonResponse
 from catmaid.models import UserRole
 from catmaid.control.authentication import requires_user_role
 from catmaid.control.common import get_request_list
+from catmaid.control.connectivity import get_connectivity_graph
 from catmaid.control.skeleton import _neuronnames
 
-def _next_circle(skeleton_set:Set, relations, cursor, allowed_connector_ids=None) -> DefaultDict:
-    """ Return a dictionary of skeleton IDs in the skeleton_set vs a dictionary of connected skeletons vs how many connections."""
-    cursor.execute(f'''
-        SELECT tc1.skeleton_id, tc1.relation_id, tc2.skeleton_id
+def _next_circle(skeleton_set:Set, relations, cursor, allowed_connector_ids) -> DefaultDict:
+    """ Return a dictionary of skeleton IDs in the skeleton_set vs a dictionary
+    of connected skeletons vs how many connections, using only the allowed
+    connectors."""
+    cursor.execute('''
+        SELECT tc1.skeleton_id, tc1.relation_id, tc2.skeleton_id, 1
         FROM treenode_connector tc1,
              treenode_connector tc2
         WHERE tc1.skeleton_id = ANY(%(skeleton_ids)s::bigint[])
@@ -30,7 +32,7 @@ def _next_circle(skeleton_set:Set, relations, cursor, allowed_connector_ids=None
           AND tc1.relation_id != tc2.relation_id
           AND tc1.relation_id = ANY(%(allowed_relation_ids)s::bigint[])
           AND tc2.relation_id = ANY(%(allowed_relation_ids)s::bigint[])
-          {'AND tc1.connector_id = ANY(%(allowed_c_ids)s::bigint[])' if allowed_connector_ids else ''}
+          AND tc1.connector_id = ANY(%(allowed_c_ids)s::bigint[])
     ''', {
         'skeleton_ids': list(skeleton_set),
         'allowed_relation_ids': [relations['presynaptic_to'], relations['postsynaptic_to']],
@@ -38,7 +40,7 @@ def _next_circle(skeleton_set:Set, relations, cursor, allowed_connector_ids=None
     })
     connections:DefaultDict = defaultdict(partial(defaultdict, partial(defaultdict, int)))
     for row in cursor.fetchall():
-        connections[row[0]][row[1]][row[2]] += 1
+        connections[row[0]][row[1]][row[2]] += row[3]
     return connections
 
 def _relations(cursor, project_id:Union[int,str]) -> Dict:
@@ -90,6 +92,13 @@ def circles_of_hell(request:HttpRequest, project_id) -> JsonResponse:
           items:
             type: integer
           paramType: form
+        - name: max_results
+          description: |
+            (Optional) Stop expanding once at least this many skeletons are
+            found. Only used without allowed_connector_ids.
+          required: false
+          type: integer
+          paramType: form
     """
     n_circles = int(request.POST.get('n_circles', 1))
     if n_circles < 1:
@@ -104,20 +113,31 @@ def circles_of_hell(request:HttpRequest, project_id) -> JsonResponse:
     mins, relations = _clean_mins(request, cursor, int(project_id))
 
     allowed_connector_ids = get_request_list(request.POST, 'allowed_connector_ids', None)
-
-    current_circle = first_circle
-    all_circles = first_circle
-
-    while n_circles > 0 and current_circle:
-        n_circles -= 1
-        connections = _next_circle(current_circle, relations, cursor, allowed_connector_ids)
-        next_circle = set(skID for c in connections.values() \
-                          for relationID, cs in c.items() \
-                          for skID, count in cs.items() if count >= mins[relationID])
-        current_circle = next_circle - all_circles
-        all_circles = all_circles.union(next_circle)
-
-    skeleton_ids = tuple(all_circles - first_circle)
+    max_results = request.POST.get('max_results')
+    max_results = int(max_results) if max_results else None
+
+    if allowed_connector_ids:
+        current_circle = first_circle
+        all_circles = first_circle
+
+        while n_circles > 0 and current_circle:
+            n_circles -= 1
+            connections = _next_circle(current_circle, relations, cursor, allowed_connector_ids)
+            next_circle = set(skID for c in connections.values() \
+                              for relationID, cs in c.items() \
+                              for skID, count in cs.items() if count >= mins[relationID])
+            current_circle = next_circle - all_circles
+            all_circles = all_circles.union(next_circle)
+
+        skeleton_ids = tuple(all_circles - first_circle)
+    else:
+        # Without connector constraints, all circles are computed on the
+        # in-memory connectivity graph.
+        graph = get_connectivity_graph(project_id)
+        skeleton_ids = tuple(graph.expand(first_circle, n_circles,
+                min_downstream=mins[relations['presynaptic_to']],
+                min_upstream=mins[relations['postsynaptic_to']],
+                max_results=max_results))
     return JsonResponse([skeleton_ids, _neuronnames(skeleton_ids, project_id)], safe=False)
 
 
@@ -131,69 +151,18 @@ def find_directed_paths(request:HttpRequest, project_id=None) -> JsonResponse:
         raise Exception('Need at least 1 skeleton IDs for both sources and targets to find directed paths!')
 
     path_length = int(request.POST.get('path_length', 2))
-    cursor = connection.cursor()
-    min:Union[int,float] = int(request.POST.get('min_synapses', -1))
-    if -1 == min:
-        min = float('inf')
-
-    relations = _relations(cursor, project_id)
-
-    def next_level(skids, rel1, rel2):
-        cursor.execute('''
-        SELECT tc1.skeleton_id, tc2.skeleton_id
-        FROM treenode_connector tc1,
-             treenode_connector tc2
-        WHERE tc1.skeleton_id in (%s)
-          AND tc1.connector_id = tc2.connector_id
-          AND tc1.skeleton_id != tc2.skeleton_id
-          AND tc1.relation_id = %s
-          AND tc2.relation_id = %s
-        GROUP BY tc1.skeleton_id, tc2.skeleton_id
-        HAVING count(*) >= %s
-        ''' % (','.join(str(skid) for skid in skids),
-               rel1,
-               rel2,
-               min))
-        return cursor.fetchall()
-
-
-    # bidirectional search
-    i = 0
-    middle = path_length / 2
-    s1 = sources
-    t1 = targets
-    graph = nx.DiGraph()
-    pre = relations['presynaptic_to']
-    post = relations['postsynaptic_to']
-
-    while i <= middle:
-        if 0 == len(s1):
-            break
-        s2 = set()
-        for pre_skid, post_skid in next_level(s1, pre, post):
-            graph.add_edge(pre_skid, post_skid)
-            if post_skid not in s1:
-                s2.add(post_skid)
-        s1 = s2
-        i += 1
-        if i < middle and len(t1) > 0:
-            t2 = set()
-            for post_skid, pre_skid in next_level(t1, post, pre):
-                graph.add_edge(pre_skid, post_skid)
-                if pre_skid not in t1:
-                    t2.add(pre_skid)
-            t1 = t2
-
-    # Nodes will not be in the graph if they didn't have further connections,
-    # like for example will happen for placeholder skeletons e.g. at unmerged postsynaptic sites.
-    all_paths = []
-    for source in sources:
-        if graph.has_node(source):
-            for target in targets:
-                if graph.has_node(target):
-                    # The cutoff is the maximum number of hops, not the number of vertices in the path, hence -1:
-                    for path in nx.all_simple_paths(graph, source, target, cutoff=(path_length -1)):
-                        all_paths.append(path)
+    min_synapses = int(request.POST.get('min_synapses', -1))
+    if min_synapses < 1:
+        raise ValueError('Need a minimum number of synapses of at least 1')
+    max_paths = request.POST.get('max_paths')
+
+    # The cutoff is the maximum number of hops, not the number of vertices in
+    # the path, hence -1. Skeletons without connections are not part of the
+    # graph, like for example placeholder skeletons at unmerged postsynaptic
+    # sites.
+    graph = get_connectivity_graph(project_id)
+    all_paths = graph.directed_paths(sources, targets, path_length - 1,
+            min_weight=min_synapses, max_paths=int(max_paths) if max_paths else None)
 
     return JsonResponse(all_paths, safe=False)
 
@@ -214,52 +183,11 @@ def find_directed_path_skeletons(request:HttpRequest, project_id=None) -> JsonRe
     if -1 == min_synapses:
         min_synapses = float('inf')
 
-    cursor = connection.cursor()
-    relations = _relations(cursor, project_id)
-
-    def fetch_adjacent(cursor, skids, relation1, relation2, min_synapses) -> Iterator[Any]:
-        """ Return the list of skids one hop away from the given skids. """
-        cursor.execute("""
-        SELECT tc2.skeleton_id
-        FROM treenode_connector tc1,
-             treenode_connector tc2
-        WHERE tc1.project_id = %(project_id)s
-          AND tc1.skeleton_id = ANY (%(skeleton_ids)s::bigint[])
-          AND tc1.connector_id = tc2.connector_id
-          AND tc1.skeleton_id != tc2.skeleton_id
-          AND tc1.relation_id = %(relation_1)s
-          AND tc2.relation_id = %(relation_2)s
-        GROUP BY tc1.skeleton_id, tc2.skeleton_id
-        HAVING count(*) >= %(min_synapses)s
-        """, {
-            'project_id': int(project_id),
-            'skeleton_ids': [int(skid) for skid in skids],
-            'relation_1': int(relation1),
-            'relation_2': int(relation2),
-            'min_synapses': float(min_synapses),
-        })
-        return chain.from_iterable(cursor.fetchall())
-
-    pre = relations['presynaptic_to']
-    post = relations['postsynaptic_to']
-
-    def fetch_fronts(cursor, skids, max_n_hops, relation1, relation2, min_synapses) -> List[Set]:
-        fronts = [set(skids)]
-        for n_hops in range(1, max_n_hops):
-            adjacent = set(fetch_adjacent(cursor, fronts[-1], relation1, relation2, min_synapses))
-            for front in fronts:
-                adjacent -= front
-            if len(adjacent) > 0:
-                fronts.append(adjacent)
-            else:
-                break
-        # Fill in the rest
-        while len(fronts) < max_n_hops:
-            fronts.append(set())
-        return fronts
-
-    origin_fronts = fetch_fronts(cursor, origin_skids, max_n_hops, pre, post, min_synapses)
-    target_fronts = fetch_fronts(cursor, target_skids, max_n_hops, post, pre, min_synapses)
+    graph = get_connectivity_graph(project_id)
+    origin_fronts = graph.fronts(origin_skids, max_n_hops,
+            min_downstream=min_synapses, min_upstream=float('inf'))
+    target_fronts = graph.fronts(target_skids, max_n_hops,
+            min_downstream=float('inf'), min_upstream=min_synapses)
 
     skeleton_ids = origin_fronts[0].union(target_fronts[0])
 
@@ -394,5 +394,5 @@ def batches(iterable, size):
     while True:
         chunk = [val for _, val in zip(range(size), source)]
         if not chunk:
-            raise StopIteration
+            return
         yield chunk
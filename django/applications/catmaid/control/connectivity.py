@@ -0,0 +1,660 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import psycopg2
+from scipy import sparse
+
+from django.conf import settings
+from django.db import connection, connections
+
+from catmaid.control.common import get_relation_to_id_map
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class ConnectivityMatrix(object):
+    """A sparse connectivity matrix between row and column skeletons. Rows
+    and columns are described by an ID and a label, and the number of synapses
+    from each row to each column is stored in a SciPy CSR matrix. Rows and
+    columns can represent groups of skeletons after aggregation, in which case
+    their ID is the ID of the group (e.g. an annotation ID).
+    """
+
+    def __init__(self, matrix, row_ids, col_ids, row_labels=None,
+            col_labels=None) -> None:
+        self.matrix = sparse.csr_matrix(matrix)
+        self.row_ids = np.asarray(row_ids, dtype=np.int64)
+        self.col_ids = np.asarray(col_ids, dtype=np.int64)
+        self.row_labels = list(self.row_ids.tolist() if row_labels is None else row_labels)
+        self.col_labels = list(self.col_ids.tolist() if col_labels is None else col_labels)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @classmethod
+    def from_edges(cls, row_skeleton_ids, col_skeleton_ids, sources, targets,
+            counts) -> "ConnectivityMatrix":
+        """Create a matrix with rows and columns in the passed in order from
+        parallel arrays of source skeleton IDs, target skeleton IDs and synapse
+        counts. Skeleton IDs can be requested multiple times.
+        """
+        row_skeleton_ids = np.asarray(row_skeleton_ids, dtype=np.int64)
+        col_skeleton_ids = np.asarray(col_skeleton_ids, dtype=np.int64)
+        unique_rows = np.unique(row_skeleton_ids)
+        unique_cols = np.unique(col_skeleton_ids)
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+
+        # Ignore edges that refer to skeletons not part of the matrix.
+        row_index = np.searchsorted(unique_rows, sources)
+        col_index = np.searchsorted(unique_cols, targets)
+        valid = (row_index < len(unique_rows)) & (col_index < len(unique_cols))
+        valid[valid] &= (unique_rows[row_index[valid]] == sources[valid]) & \
+                (unique_cols[col_index[valid]] == targets[valid])
+
+        # Duplicate entries are summed up during the CSR conversion.
+        matrix = sparse.coo_matrix((counts[valid], (row_index[valid], col_index[valid])),
+                shape=(len(unique_rows), len(unique_cols))).tocsr()
+
+        # Map the unique skeletons back to the requested order.
+        matrix = matrix[np.searchsorted(unique_rows, row_skeleton_ids)]
+        matrix = matrix[:, np.searchsorted(unique_cols, col_skeleton_ids)]
+
+        return cls(matrix, row_skeleton_ids, col_skeleton_ids)
+
+    @classmethod
+    def from_db(cls, project_id, row_skeleton_ids, col_skeleton_ids) -> "ConnectivityMatrix":
+        """Create a matrix with the number of synapses from each row skeleton
+        to each column skeleton, based on the materialized skeleton
+        connectivity.
+        """
+        relation_map = get_relation_to_id_map(project_id,
+                ('presynaptic_to', 'postsynaptic_to'))
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT sc.skeleton_id, sc.partner_skeleton_id, SUM(sc.count)
+            FROM catmaid_skeleton_connectivity sc
+            WHERE sc.skeleton_id = ANY(%(row_skeleton_ids)s::bigint[])
+              AND sc.partner_skeleton_id = ANY(%(col_skeleton_ids)s::bigint[])
+              AND sc.relation_id = %(pre_rel_id)s
+              AND sc.partner_relation_id = %(post_rel_id)s
+            GROUP BY sc.skeleton_id, sc.partner_skeleton_id
+        ''', {
+            'row_skeleton_ids': list(row_skeleton_ids),
+            'col_skeleton_ids': list(col_skeleton_ids),
+            'pre_rel_id': relation_map['presynaptic_to'],
+            'post_rel_id': relation_map['postsynaptic_to'],
+        })
+        edges = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+
+        return cls.from_edges(row_skeleton_ids, col_skeleton_ids, edges[:, 0],
+                edges[:, 1], edges[:, 2])
+
+    def set_labels(self, names:Dict) -> None:
+        """Use the passed in ID to name mapping for row and column labels. IDs
+        without name keep their current label.
+        """
+        self.row_labels = [names.get(i, l) for i, l in zip(self.row_ids.tolist(), self.row_labels)]
+        self.col_labels = [names.get(i, l) for i, l in zip(self.col_ids.tolist(), self.col_labels)]
+
+    def reorder(self, row_order=None, col_order=None) -> "ConnectivityMatrix":
+        """Return a new matrix with rows and columns taken in the passed in
+        order of indices. Indices that are left out are removed.
+        """
+        row_order = np.arange(self.shape[0]) if row_order is None else np.asarray(row_order, dtype=np.intp)
+        col_order = np.arange(self.shape[1]) if col_order is None else np.asarray(col_order, dtype=np.intp)
+        return ConnectivityMatrix(self.matrix[row_order][:, col_order],
+                self.row_ids[row_order], self.col_ids[col_order],
+                [self.row_labels[i] for i in row_order],
+                [self.col_labels[i] for i in col_order])
+
+    def sort(self, row_sort='none', col_sort='none') -> "ConnectivityMatrix":
+        """Return a new matrix with rows and columns sorted by either their
+        label ("name"), their ID ("id") or their total synapse count in
+        descending order ("count"). Sorting is stable, "none" keeps the current
+        order.
+        """
+        def order(sort, ids, labels, totals):
+            if sort == 'none':
+                return None
+            if sort == 'id':
+                return np.argsort(ids, kind='stable')
+            if sort == 'name':
+                return sorted(range(len(labels)), key=lambda i: str(labels[i]))
+            if sort == 'count':
+                return np.argsort(-totals, kind='stable')
+            raise ValueError(f"Unknown sort order: {sort}")
+
+        row_totals = np.asarray(self.matrix.sum(axis=1)).ravel()
+        col_totals = np.asarray(self.matrix.sum(axis=0)).ravel()
+        return self.reorder(order(row_sort, self.row_ids, self.row_labels, row_totals),
+                order(col_sort, self.col_ids, self.col_labels, col_totals))
+
+    def aggregate(self, row_groups=None, col_groups=None) -> "ConnectivityMatrix":
+        """Return a new matrix in which rows and columns that are part of a
+        group are merged into a single row or column with the summed up
+        synapse counts. Groups are lists of (group ID, label, member IDs)
+        tuples and come first in the new matrix, followed by rows and columns
+        that are not part of any group. Members can be part of multiple groups.
+        """
+        def indicator(groups, ids, labels):
+            if not groups:
+                return None, ids, labels
+            # Skeletons that are part of the matrix multiple times contribute
+            # only once to a group.
+            index:Dict[int, int] = {}
+            for n, i in enumerate(ids.tolist()):
+                index.setdefault(i, n)
+            group_rows, group_cols = [], []
+            grouped_ids = set()
+            for n, (_, _, members) in enumerate(groups):
+                for m in set(members):
+                    k = index.get(m)
+                    if k is not None:
+                        group_rows.append(n)
+                        group_cols.append(k)
+                        grouped_ids.add(m)
+            grouped = np.isin(ids, list(grouped_ids))
+            ungrouped = np.flatnonzero(~grouped)
+            group_rows.extend(range(len(groups), len(groups) + len(ungrouped)))
+            group_cols.extend(ungrouped.tolist())
+            m = sparse.csr_matrix((np.ones(len(group_rows), dtype=np.int64),
+                    (group_rows, group_cols)),
+                    shape=(len(groups) + len(ungrouped), len(ids)))
+            new_ids = np.concatenate([np.array([g[0] for g in groups], dtype=np.int64),
+                    ids[ungrouped]])
+            new_labels = [g[1] for g in groups] + [labels[i] for i in ungrouped]
+            return m, new_ids, new_labels
+
+        row_indicator, row_ids, row_labels = indicator(row_groups, self.row_ids, self.row_labels)
+        col_indicator, col_ids, col_labels = indicator(col_groups, self.col_ids, self.col_labels)
+
+        matrix = self.matrix
+        if row_indicator is not None:
+            matrix = row_indicator.dot(matrix)
+        if col_indicator is not None:
+            matrix = matrix.dot(col_indicator.T)
+
+        return ConnectivityMatrix(matrix, row_ids, col_ids, row_labels, col_labels)
+
+    def to_dict(self) -> Dict[int, Dict[int, int]]:
+        """Return a nested dictionary that maps row IDs to a dictionary of
+        column IDs versus synapse counts for all non-zero entries.
+        """
+        coo = self.matrix.tocoo()
+        result:Dict[int, Dict[int, int]] = {}
+        for source, target, count in zip(self.row_ids[coo.row].tolist(),
+                self.col_ids[coo.col].tolist(), coo.data.tolist()):
+            if count:
+                result.setdefault(source, {})[target] = count
+        return result
+
+    def iter_rows(self) -> Iterator[List]:
+        """Yield a header row with column labels, followed by one row per
+        matrix row, which starts with the row label. Only a single row is
+        expanded into a dense representation at a time.
+        """
+        yield [''] + self.col_labels
+        matrix = self.matrix
+        for n, label in enumerate(self.row_labels):
+            row = np.zeros(self.shape[1], dtype=np.int64)
+            start, end = matrix.indptr[n], matrix.indptr[n + 1]
+            row[matrix.indices[start:end]] = matrix.data[start:end]
+            yield [label] + row.tolist()
+
+    def write_npz(self, target:BinaryIO) -> None:
+        """Write the matrix in the format of scipy.sparse.save_npz(), which can
+        be read with scipy.sparse.load_npz(). Row and column IDs and labels are
+        stored as additional arrays.
+        """
+        np.savez_compressed(target, format=b'csr', shape=self.shape,
+                data=self.matrix.data, indices=self.matrix.indices,
+                indptr=self.matrix.indptr, row_ids=self.row_ids,
+                col_ids=self.col_ids,
+                row_labels=np.array([str(label) for label in self.row_labels]),
+                col_labels=np.array([str(label) for label in self.col_labels]))
+
+    def write_arrow(self, target:BinaryIO) -> None:
+        """Write all non-zero entries as table with the columns source_id,
+        target_id and count to an Arrow IPC file. Labels are stored in the
+        schema metadata.
+        """
+        if pa is None:
+            raise ValueError("Arrow export requires the pyarrow module")
+        coo = self.matrix.tocoo()
+        table = pa.Table.from_arrays([
+            pa.array(self.row_ids[coo.row]),
+            pa.array(self.col_ids[coo.col]),
+            pa.array(coo.data.astype(np.int64)),
+        ], names=['source_id', 'target_id', 'count'])
+        table = table.replace_schema_metadata({
+            'row_ids': ','.join(map(str, self.row_ids.tolist())),
+            'col_ids': ','.join(map(str, self.col_ids.tolist())),
+            'row_labels': '\n'.join(map(str, self.row_labels)),
+            'col_labels': '\n'.join(map(str, self.col_labels)),
+        })
+        writer = pa.ipc.new_file(target, table.schema)
+        writer.write_table(table)
+        writer.close()
+
+
+def get_annotation_groups(project_id, annotation_ids, skeleton_ids) -> List:
+    """Return a list of (annotation ID, annotation name, skeleton IDs) tuples
+    for each passed in annotation, in the passed in order. Only the passed in
+    skeletons are considered, which are linked to an annotation if their
+    neuron is directly annotated with it.
+    """
+    if not annotation_ids:
+        return []
+    relation_map = get_relation_to_id_map(project_id,
+            ('annotated_with', 'model_of'))
+    cursor = connection.cursor()
+    cursor.execute('''
+        SELECT a.id, a.name, array_agg(DISTINCT skeleton.class_instance_a)
+        FROM class_instance a
+        JOIN class_instance_class_instance ann
+            ON ann.class_instance_b = a.id
+        JOIN class_instance_class_instance skeleton
+            ON skeleton.class_instance_b = ann.class_instance_a
+        WHERE a.project_id = %(project_id)s
+          AND a.id = ANY(%(annotation_ids)s::bigint[])
+          AND ann.relation_id = %(annotated_with)s
+          AND skeleton.relation_id = %(model_of)s
+          AND skeleton.class_instance_a = ANY(%(skeleton_ids)s::bigint[])
+        GROUP BY a.id, a.name
+    ''', {
+        'project_id': project_id,
+        'annotation_ids': list(annotation_ids),
+        'skeleton_ids': list(skeleton_ids),
+        'annotated_with': relation_map['annotated_with'],
+        'model_of': relation_map['model_of'],
+    })
+    groups = {row[0]: row for row in cursor.fetchall()}
+    return [groups[a] for a in annotation_ids if a in groups]
+
+
+def _gather_neighbors(indptr, indices, weights, nodes, min_weight) -> np.ndarray:
+    """Return the unique neighbors of the passed in node indices in a CSR
+    graph, using only edges with at least the passed in weight.
+    """
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = lengths.sum()
+    if not total:
+        return np.empty(0, dtype=indices.dtype)
+    # Positions of all edges of all passed in nodes
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + \
+            np.arange(total)
+    return np.unique(indices[offsets[weights[offsets] >= min_weight]])
+
+
+class ConnectivityGraph(object):
+    """A directed graph of the synaptic connections between the skeletons of a
+    project, weighted by the number of synapses from a presynaptic to a
+    postsynaptic skeleton. Edges are stored as CSR arrays for both directions,
+    skeleton IDs are mapped to sorted node indices. Only skeletons with
+    connections are part of the graph. Graphs are shared between threads and
+    aren't changed after they are created.
+    """
+
+    def __init__(self, sources, targets, weights) -> None:
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.int64)
+        # Self-connections are not used for graph traversal.
+        keep = sources != targets
+        sources, targets, weights = sources[keep], targets[keep], weights[keep]
+
+        self.skeleton_ids = np.unique(np.concatenate([sources, targets]))
+        n = len(self.skeleton_ids)
+        source_index = np.searchsorted(self.skeleton_ids, sources)
+        target_index = np.searchsorted(self.skeleton_ids, targets)
+
+        def csr(a, b):
+            order = np.lexsort((b, a))
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(a, minlength=n), out=indptr[1:])
+            return indptr, b[order], weights[order]
+
+        self.out_indptr, self.out_indices, self.out_weights = csr(source_index, target_index)
+        self.in_indptr, self.in_indices, self.in_weights = csr(target_index, source_index)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.out_indices)
+
+    def edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return parallel arrays of source skeleton IDs, target skeleton IDs
+        and synapse counts.
+        """
+        sources = np.repeat(self.skeleton_ids, np.diff(self.out_indptr))
+        return sources, self.skeleton_ids[self.out_indices], self.out_weights
+
+    def updated(self, skeleton_ids, sources, targets, weights) -> 'ConnectivityGraph':
+        """Return a new graph in which all edges of the passed in skeletons
+        are replaced with the passed in edges, which are expected to contain
+        all current edges of these skeletons.
+        """
+        old_sources, old_targets, old_weights = self.edges()
+        skeleton_ids = np.asarray(list(skeleton_ids), dtype=np.int64)
+        keep = ~(np.isin(old_sources, skeleton_ids) | np.isin(old_targets, skeleton_ids))
+        return ConnectivityGraph(np.concatenate([old_sources[keep], np.asarray(sources, dtype=np.int64)]),
+                np.concatenate([old_targets[keep], np.asarray(targets, dtype=np.int64)]),
+                np.concatenate([old_weights[keep], np.asarray(weights, dtype=np.int64)]))
+
+    def to_index(self, skeleton_ids) -> np.ndarray:
+        """Return the node indices of the passed in skeletons that are part of
+        the graph.
+        """
+        skeleton_ids = np.asarray(list(skeleton_ids), dtype=np.int64)
+        index = np.searchsorted(self.skeleton_ids, skeleton_ids)
+        valid = index < len(self.skeleton_ids)
+        valid[valid] = self.skeleton_ids[index[valid]] == skeleton_ids[valid]
+        return np.unique(index[valid])
+
+    def neighbors(self, nodes, min_downstream=1, min_upstream=1) -> np.ndarray:
+        """Return the indices of all nodes that are connected to the passed in
+        node indices with at least min_downstream synapses from or min_upstream
+        synapses to them. A threshold of infinity ignores a direction.
+        """
+        return np.union1d(
+                _gather_neighbors(self.out_indptr, self.out_indices,
+                        self.out_weights, nodes, min_downstream),
+                _gather_neighbors(self.in_indptr, self.in_indices,
+                        self.in_weights, nodes, min_upstream))
+
+    def fronts(self, skeleton_ids, n_fronts, min_downstream=1,
+            min_upstream=1) -> List[Set[int]]:
+        """Return a list of n_fronts sets of skeleton IDs. The first set
+        contains the passed in skeletons, each following one the skeletons that
+        are one hop further away, without skeletons of earlier sets. Once no
+        new skeletons are found, the remaining sets are empty.
+        """
+        fronts:List[Set[int]] = [set(skeleton_ids)]
+        visited = np.zeros(len(self.skeleton_ids), dtype=np.bool_)
+        front = self.to_index(skeleton_ids)
+        visited[front] = True
+        while len(fronts) < n_fronts and len(front):
+            nodes = self.neighbors(front, min_downstream, min_upstream)
+            front = nodes[~visited[nodes]]
+            visited[front] = True
+            if len(front):
+                fronts.append(set(self.skeleton_ids[front].tolist()))
+        while len(fronts) < n_fronts:
+            fronts.append(set())
+        return fronts
+
+    def expand(self, skeleton_ids, n_hops, min_downstream=1, min_upstream=1,
+            max_results=None) -> Set[int]:
+        """Return all skeletons that are at most n_hops away from the passed in
+        skeletons, not including the passed in skeletons. If max_results is
+        set, the expansion stops once it found at least this many skeletons.
+        """
+        start = set(skeleton_ids)
+        found:Set[int] = set()
+        visited = np.zeros(len(self.skeleton_ids), dtype=np.bool_)
+        front = self.to_index(start)
+        visited[front] = True
+        for _ in range(n_hops):
+            if not len(front):
+                break
+            nodes = self.neighbors(front, min_downstream, min_upstream)
+            front = nodes[~visited[nodes]]
+            visited[front] = True
+            found.update(self.skeleton_ids[front].tolist())
+            if max_results is not None and len(found - start) >= max_results:
+                break
+        return found - start
+
+    def _distances(self, nodes, downstream, max_hops, min_weight) -> np.ndarray:
+        """Return the number of hops from the passed in nodes to each node of
+        the graph, following edges downstream or upstream. Unreachable nodes
+        have a distance larger than max_hops.
+        """
+        if downstream:
+            indptr, indices, weights = self.out_indptr, self.out_indices, self.out_weights
+        else:
+            indptr, indices, weights = self.in_indptr, self.in_indices, self.in_weights
+        distances = np.full(len(self.skeleton_ids), max_hops + 1, dtype=np.int64)
+        distances[nodes] = 0
+        front = nodes
+        for hop in range(1, max_hops + 1):
+            if not len(front):
+                break
+            reached = _gather_neighbors(indptr, indices, weights, front, min_weight)
+            front = reached[distances[reached] > hop]
+            distances[front] = hop
+        return distances
+
+    def directed_paths(self, sources, targets, max_hops, min_weight=1,
+            max_paths=None) -> List[List[int]]:
+        """Return all simple paths of at most max_hops downstream edges from
+        any source skeleton to any target skeleton. Only edges with at least
+        min_weight synapses are used. Search space is limited to skeletons
+        that are close enough to both sources and targets. If max_paths is
+        set, the search stops once this many paths are found.
+        """
+        source_nodes = self.to_index(sources)
+        target_nodes = self.to_index(targets)
+        paths:List[List[int]] = []
+        if max_hops < 1 or not len(source_nodes) or not len(target_nodes):
+            return paths
+
+        to_target = self._distances(target_nodes, False, max_hops, min_weight)
+        is_target = np.zeros(len(self.skeleton_ids), dtype=np.bool_)
+        is_target[target_nodes] = True
+
+        def successors(node, depth):
+            start, end = self.out_indptr[node], self.out_indptr[node + 1]
+            nodes = self.out_indices[start:end][self.out_weights[start:end] >= min_weight]
+            # Only continue with nodes from which a target can still be reached.
+            return iter(nodes[to_target[nodes] <= max_hops - depth - 1].tolist())
+
+        for source in source_nodes.tolist():
+            if to_target[source] > max_hops:
+                continue
+            path = [source]
+            on_path = {source}
+            stack = [successors(source, 0)]
+            while stack:
+                node = next(stack[-1], None)
+                if node is None:
+                    stack.pop()
+                    on_path.discard(path.pop())
+                    continue
+                if node in on_path:
+                    continue
+                if is_target[node]:
+                    paths.append(self.skeleton_ids[path + [node]].tolist())
+                    if max_paths is not None and len(paths) >= max_paths:
+                        return paths
+                if len(path) < max_hops:
+                    path.append(node)
+                    on_path.add(node)
+                    stack.append(successors(node, len(path) - 1))
+        return paths
+
+
+def _connectivity_edges(project_id, skeleton_ids=None) -> np.ndarray:
+    """Return an array of (source skeleton ID, target skeleton ID, synapse
+    count) rows of a project, optionally only for edges of the passed in
+    skeletons.
+    """
+    relation_map = get_relation_to_id_map(project_id,
+            ('presynaptic_to', 'postsynaptic_to'))
+    skeleton_filter = '''
+        AND (sc.skeleton_id = ANY(%(skeleton_ids)s::bigint[])
+            OR sc.partner_skeleton_id = ANY(%(skeleton_ids)s::bigint[]))
+    ''' if skeleton_ids is not None else ''
+    cursor = connection.cursor()
+    cursor.execute(f'''
+        SELECT sc.skeleton_id, sc.partner_skeleton_id, SUM(sc.count)
+        FROM catmaid_skeleton_connectivity sc
+        WHERE sc.project_id = %(project_id)s
+          AND sc.relation_id = %(pre_rel_id)s
+          AND sc.partner_relation_id = %(post_rel_id)s
+          AND sc.skeleton_id <> sc.partner_skeleton_id
+          {skeleton_filter}
+        GROUP BY sc.skeleton_id, sc.partner_skeleton_id
+    ''', {
+        'project_id': project_id,
+        'skeleton_ids': list(skeleton_ids) if skeleton_ids is not None else None,
+        'pre_rel_id': relation_map['presynaptic_to'],
+        'post_rel_id': relation_map['postsynaptic_to'],
+    })
+    return np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+
+
+class ConnectivityGraphCache(object):
+    """Keeps the connectivity graphs of projects in the memory of a single
+    process. Graphs are reloaded once they are older than max_age seconds. If
+    SPATIAL_UPDATE_NOTIFICATIONS is enabled, the "catmaid.connectivity-update"
+    events of the database are used to update the edges of changed skeletons
+    before each lookup. A max_age of zero disables the cache, which is the
+    default without update notifications, because cached graphs wouldn't
+    include recent changes otherwise.
+    """
+
+    notify_channel = 'catmaid.connectivity-update'
+
+    def __init__(self, max_age=None) -> None:
+        self._max_age = max_age
+        # Maps project IDs to (load time, graph) tuples
+        self.graphs:Dict[int, Tuple[float, ConnectivityGraph]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+
+        self.lock = threading.RLock()
+        self.listen_connection = None
+        self.listen_pid:Optional[int] = None
+
+    @property
+    def max_age(self):
+        if self._max_age is not None:
+            return self._max_age
+        max_age = getattr(settings, 'CONNECTIVITY_GRAPH_MAX_AGE', None)
+        if max_age is None:
+            return 60 if getattr(settings, 'SPATIAL_UPDATE_NOTIFICATIONS', False) else 0
+        return max_age
+
+    def get(self, project_id) -> ConnectivityGraph:
+        project_id = int(project_id)
+        max_age = self.max_age
+        if not max_age:
+            edges = _connectivity_edges(project_id)
+            return ConnectivityGraph(edges[:, 0], edges[:, 1], edges[:, 2])
+
+        with self.lock:
+            self.process_updates()
+            entry = self.graphs.get(project_id)
+            if entry and time.time() - entry[0] <= max_age:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            load_time = time.time()
+            edges = _connectivity_edges(project_id)
+            graph = ConnectivityGraph(edges[:, 0], edges[:, 1], edges[:, 2])
+            self.graphs[project_id] = (load_time, graph)
+            return graph
+
+    def clear(self) -> None:
+        with self.lock:
+            self.graphs.clear()
+
+    def get_listen_connection(self):
+        # Connections can't be shared with forked processes
+        if self.listen_connection is None or self.listen_pid != os.getpid():
+            db = connections['default']
+            listen_connection = db.get_new_connection(db.get_connection_params())
+            listen_connection.autocommit = True
+            with listen_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.notify_channel}"')
+            self.listen_connection = listen_connection
+            self.listen_pid = os.getpid()
+            # Updates might have been missed before
+            self.graphs.clear()
+        return self.listen_connection
+
+    def handle_update(self, data) -> None:
+        """Update or drop the graph of a project based on a parsed
+        "catmaid.connectivity-update" event payload.
+        """
+        project_id = data.get('project_id')
+        if project_id is None:
+            self.graphs.clear()
+            return
+        entry = self.graphs.get(project_id)
+        if not entry:
+            return
+        skeleton_ids = data.get('skeleton_ids')
+        if skeleton_ids is None:
+            del self.graphs[project_id]
+            return
+        edges = _connectivity_edges(project_id, skeleton_ids)
+        # Other threads might still use the old graph, which is why it is
+        # replaced rather than changed.
+        self.graphs[project_id] = (entry[0], entry[1].updated(skeleton_ids,
+                edges[:, 0], edges[:, 1], edges[:, 2]))
+        self.updates += 1
+
+    def process_updates(self) -> None:
+        """Read all pending connectivity update events without blocking and
+        update the affected graphs. If the event connection fails, all graphs
+        are dropped, because events might have been lost.
+        """
+        if not getattr(settings, 'SPATIAL_UPDATE_NOTIFICATIONS', False):
+            return
+        try:
+            listen_connection = self.get_listen_connection()
+            listen_connection.poll()
+            notifies = listen_connection.notifies
+            while notifies:
+                n = notifies.pop(0)
+                if n.channel != self.notify_channel:
+                    continue
+                try:
+                    self.handle_update(json.loads(n.payload))
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f'Could not parse connectivity update: {n.payload}')
+                    self.graphs.clear()
+        except psycopg2.Error as e:
+            logger.warning(f'Could not read connectivity updates, clearing connectivity graphs: {e}')
+            self.listen_connection = None
+            self.graphs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'graphs': len(self.graphs),
+                'edges': sum(g.n_edges for _, g in self.graphs.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'updates': self.updates,
+            }
+
+
+# The connectivity graph cache of this process
+connectivity_graph_cache = ConnectivityGraphCache()
+
+
+def get_connectivity_graph(project_id) -> ConnectivityGraph:
+    """Get the connectivity graph of a project from the graph cache of this
+    process.
+    """
+    return connectivity_graph_cache.get(project_id)
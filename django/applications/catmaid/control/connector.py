@@ -26,6 +26,8 @@ from catmaid.control.link import (create_treenode_links, LINK_TYPES,
 from catmaid.control.common import (cursor_fetch_dictionary,
         get_relation_to_id_map, get_class_to_id_map, get_request_bool,
         get_request_list)
+from catmaid.control.presence_grid import (get_bounding_box_params,
+        get_present_ids, get_presence_grid_split)
 
 
 logger = logging.getLogger(__name__)
@@ -1091,7 +1093,81 @@ def connector_detail(request:HttpRequest, project_id, connector_id:Union[str,int
     })
 
 def get_connectors_in_bb_postgis3d(params) -> List:
-    """Return a list of connector node IDs in a bounding box.
+    """Return a list of connector node IDs in a bounding box. If no links are
+    requested and the project has an enabled presence grid, it is used to look
+    up connectors in all cells that are fully contained in the bounding box.
+    """
+    if not params.get('with_links', False):
+        presence_split = get_presence_grid_split(params['project_id'], params)
+        if presence_split:
+            return _get_connectors_in_bb_presence_grid(params, *presence_split)
+
+    return _get_connectors_in_bb_postgis3d(params)
+
+
+def _get_connectors_in_bb_presence_grid(params, grid, cell_range,
+        boundary_boxes) -> List:
+    """Return a list of connector node IDs in a bounding box, based on the
+    connectors in the passed in presence grid cells and the connectors in
+    the boundary boxes, which are queried like before.
+    """
+    limit = int(params.get('limit', 0))
+    with_locations = params.get('with_locations', False)
+    skeleton_ids = params.get('skeleton_ids', False)
+    only_linked = params.get('only_linked', False) or bool(skeleton_ids)
+
+    cursor = connection.cursor()
+    candidate_ids = get_present_ids(cursor, grid, cell_range,
+            'linked_connector_ids')
+    if not only_linked:
+        candidate_ids.update(get_present_ids(cursor, grid, cell_range,
+                'connector_ids'))
+
+    for bb in boundary_boxes:
+        bb_params = get_bounding_box_params(params, bb)
+        bb_params.update({
+            'limit': 0,
+            'with_locations': False,
+            'only_linked': only_linked,
+        })
+        candidate_ids.update(r[0] for r in _get_connectors_in_bb_postgis3d(bb_params))
+
+    extra_joins = []
+    if skeleton_ids:
+        extra_joins.append("""
+            JOIN (
+                SELECT DISTINCT tc2.connector_id
+                FROM treenode_connector tc2
+                JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+                    ON tc2.skeleton_id = skeleton.id
+            ) allowed_connector(id)
+                ON allowed_connector.id = c.id
+        """)
+
+    cursor.execute("""
+        SELECT c.id
+            {location_select}
+        FROM UNNEST(%(candidate_ids)s::bigint[]) candidate(id)
+        JOIN connector c
+            ON c.id = candidate.id
+        {extra_joins}
+        ORDER BY c.id
+        {limit_clause}
+    """.format(
+        limit_clause=f'LIMIT {limit}' if limit > 0 else '',
+        location_select=', c.location_x, c.location_y, c.location_z' if with_locations else '',
+        extra_joins='\n'.join(extra_joins),
+    ), {
+        'candidate_ids': list(candidate_ids),
+        'skeleton_ids': skeleton_ids or [],
+    })
+
+    return list(cursor.fetchall())
+
+
+def _get_connectors_in_bb_postgis3d(params) -> List:
+    """Return a list of connector node IDs in a bounding box by intersecting
+    it with all connector links and connectors.
     """
     limit = int(params.get('limit', 0))
     with_locations = params.get('with_locations', False)
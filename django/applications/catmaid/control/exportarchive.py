@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+import gzip
+from itertools import groupby, islice
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.apps import apps
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+
+ARCHIVE_FORMAT = 'catmaid-export-archive'
+ARCHIVE_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Backslash escapes of PostgreSQL's COPY text format
+COPY_ESCAPE_PATTERN = re.compile(r'\\(.)')
+COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t',
+        'v': '\v'}
+
+
+class ExportArchiveWriter():
+    """Write model instances into a directory of per-model JSON lines files,
+    each one with at most chunk_size objects. Each line is a Django python
+    serializer object. Query sets can alternatively be written with
+    PostgreSQL's COPY into a single file per query set. All files are listed
+    with their model and number of objects in a manifest, which is written
+    when the archive is closed.
+    """
+
+    def __init__(self, path, chunk_size=100000, compress=False) -> None:
+        if os.path.exists(os.path.join(path, MANIFEST_NAME)):
+            raise ValueError(f'There is already an export archive in {path}')
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.files:List[Dict[str, Any]] = []
+        self.n_files_per_model:Dict[str, int] = {}
+        self.serializer = serializers.get_serializer('python')()
+
+    def _open(self, model, extension):
+        file_index = self.n_files_per_model.get(model, 0)
+        self.n_files_per_model[model] = file_index + 1
+        name = f'{model}.{file_index:05d}.{extension}'
+        if self.compress:
+            name += '.gz'
+            return name, gzip.open(os.path.join(self.path, name), 'wt')
+        return name, open(os.path.join(self.path, name), 'w')
+
+    def write_objects(self, objects:Iterable) -> int:
+        """Serialize the passed in model instances in chunks and write each
+        chunk into a new file of its model. Returns the number of written
+        objects.
+        """
+        n_written = 0
+        objects_iter = iter(objects)
+        while True:
+            chunk = list(islice(objects_iter, self.chunk_size))
+            if not chunk:
+                break
+            data = self.serializer.serialize(chunk)
+            for model, model_group in groupby(data, lambda o: o['model']):
+                model_rows = list(model_group)
+                name, f = self._open(model, 'jsonl')
+                with f:
+                    for o in model_rows:
+                        f.write(json.dumps(o, cls=DjangoJSONEncoder))
+                        f.write('\n')
+                self.files.append({
+                    'file': name,
+                    'model': model,
+                    'format': 'jsonl',
+                    'count': len(model_rows),
+                })
+                n_written += len(model_rows)
+        return n_written
+
+    def write_copy(self, queryset) -> Optional[int]:
+        """Write all rows of a query set into a new file of its model, using
+        the text format of PostgreSQL's COPY. Rows are streamed from the
+        database and aren't converted to model instances. Returns the number
+        of written rows, if known.
+        """
+        model = queryset.model
+        model_label = model._meta.label_lower
+        columns = [f.column for f in model._meta.concrete_fields]
+        cursor = connection.cursor()
+        sql, params = queryset.query.sql_with_params()
+        query = cursor.mogrify(sql, params)
+        if isinstance(query, bytes):
+            query = query.decode('utf-8')
+
+        name, f = self._open(model_label, 'copy')
+        with f:
+            cursor.copy_expert("""
+                COPY (SELECT {columns} FROM ({query}) exported) TO STDOUT
+            """.format(**{
+                'columns': ', '.join(f'exported.{connection.ops.quote_name(c)}'
+                        for c in columns),
+                'query': query,
+            }), f)
+        count = cursor.rowcount if cursor.rowcount >= 0 else None
+        self.files.append({
+            'file': name,
+            'model': model_label,
+            'format': 'copy',
+            'columns': columns,
+            'count': count,
+        })
+        return count
+
+    def close(self, metadata=None) -> Dict[str, Any]:
+        """Write the manifest and return it. Optional metadata is stored along
+        with it.
+        """
+        manifest = {
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_VERSION,
+            'created': datetime.now().isoformat(),
+            'metadata': metadata or {},
+            'files': self.files,
+        }
+        with open(os.path.join(self.path, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def is_export_archive(path) -> bool:
+    """Whether the passed in path is a directory with an export archive
+    manifest.
+    """
+    return os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+def unescape_copy_value(value) -> Optional[str]:
+    if value == '\\N':
+        return None
+    return COPY_ESCAPE_PATTERN.sub(lambda m: COPY_ESCAPES.get(m.group(1),
+            m.group(1)), value)
+
+
+def read_copy_objects(model_label, columns, lines) -> Iterator[Dict[str, Any]]:
+    """Convert lines of PostgreSQL's COPY text format into Django python
+    serializer objects of the passed in model.
+    """
+    model = apps.get_model(model_label)
+    fields = dict((f.column, f) for f in model._meta.concrete_fields)
+    pk_column = model._meta.pk.column
+    for line in lines:
+        values = line.rstrip('\n').split('\t')
+        obj:Dict[str, Any] = {
+            'model': model_label,
+            'fields': {},
+        }
+        for column, value in zip(columns, values):
+            value = unescape_copy_value(value)
+            if column == pk_column:
+                obj['pk'] = value
+            else:
+                obj['fields'][fields[column].name] = value
+        yield obj
+
+
+def read_export_archive(path) -> Iterator:
+    """Iterate the deserialized objects of all files of an export archive in
+    the order of its manifest. Only one line is kept in memory at a time.
+    """
+    with open(os.path.join(path, MANIFEST_NAME), 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format') != ARCHIVE_FORMAT:
+        raise ValueError(f'Unknown export archive format: {manifest.get("format")}')
+    if manifest.get('version', 0) > ARCHIVE_VERSION:
+        raise ValueError(f'Unsupported export archive version: {manifest.get("version")}')
+
+    for entry in manifest['files']:
+        file_path = os.path.join(path, entry['file'])
+        opener = gzip.open if file_path.endswith('.gz') else open
+        with opener(file_path, 'rt') as f:
+            if entry['format'] == 'jsonl':
+                objects:Iterator = (json.loads(line) for line in f if line.strip())
+            elif entry['format'] == 'copy':
+                objects = read_copy_objects(entry['model'], entry['columns'], f)
+            else:
+                raise ValueError(f'Unknown export archive file format: {entry["format"]}')
+            yield from serializers.deserialize('python', objects)
@@ -1,15 +1,13 @@
 # -*- coding: utf-8 -*-
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
-from itertools import count
 import json
-import networkx as nx
-from networkx.algorithms import weakly_connected_component_subgraphs
-from numpy import subtract
-from numpy.linalg import norm
-from typing import Any, DefaultDict, Dict, List, Optional, Tuple, Union
+import numpy as np
+from typing import Any, DefaultDict, Dict, Iterator, List, Optional, Tuple, Union
 
+from django.conf import settings
 from django.db import connection
 from django.http import JsonResponse
 
@@ -20,8 +18,8 @@ from catmaid.control.authentication import requires_user_role
 from catmaid.control.common import (get_relation_to_id_map, get_request_bool,
         get_request_list)
 from catmaid.control.link import KNOWN_LINK_PAIRS, UNDIRECTED_LINK_TYPES
-from catmaid.control.tree_util import simplify
-from catmaid.control.synapseclustering import tree_max_density
+from catmaid.control.tree_util import ArrayTree, simplify
+from catmaid.control.synapseclustering import tree_synapse_domains
 
 
 def make_new_synapse_count_array() -> List[int]:
@@ -113,49 +111,21 @@ def confidence_split_graph(project_id, skeleton_ids, confidence_threshold,
     for row in cursor.fetchall():
         stc[row[0]].append(row[1:]) # skeleton_id vs (treenode_id, connector_id, relation_id, confidence)
 
-    # Fetch all treenodes of all skeletons
-    cursor.execute('''
-        SELECT skeleton_id, id, parent_id, confidence
-        FROM treenode
-        WHERE project_id = %(project_id)s
-          AND skeleton_id = ANY(%(skeleton_ids)s::bigint[])
-        ORDER BY skeleton_id
-    ''', {
-        'project_id': project_id,
-        'skeleton_ids': skeleton_ids,
-    })
-
     # Dictionary of connector_id vs relation_id vs list of sub-skeleton ID
     connectors:DefaultDict = defaultdict(partial(defaultdict, list))
 
     # All nodes of the graph
     nodeIDs:List = []
 
-    # Read out into memory only one skeleton at a time
-    current_skid = None
-    tree:Optional[nx.DiGraph] = None
-    for row in cursor.fetchall():
-        if row[0] == current_skid:
-            # Build the tree, breaking it at the low-confidence edges
-            if row[2] and row[3] >= confidence_threshold:
-                # mypy cannot prove this will be a DiGraph by here
-                tree.add_edge(row[2], row[1])  # type: ignore
-
-            continue
-
-        if tree:
-            nodeIDs.extend(split_by_confidence(current_skid, tree, stc[current_skid], connectors))
+    # Split all skeletons at their low-confidence edges
+    tasks = [(skid, node_ids, parent_ids, confidences, stc[skid], confidence_threshold)
+            for skid, node_ids, parent_ids, confidences, _ in
+            skeleton_arrays(cursor, project_id, skeleton_ids)]
+    for nodes, _, _, links in split_skeletons(tasks, parallel=1):
+        nodeIDs.extend(nodes)
+        populate_connectors(links, connectors)
 
-        # Start the next tree
-        current_skid = row[0]
-        tree = nx.DiGraph()
-        if row[2] and row[3] > confidence_threshold:
-            tree.add_edge(row[2], row[1])
-
-    if tree:
-        nodeIDs.extend(split_by_confidence(current_skid, tree, stc[current_skid], connectors))
-
-    # Create the edges of the graph from the connectors, which was populated as a side effect of 'split_by_confidence'
+    # Create the edges of the graph from the connectors
     edges:DefaultDict = defaultdict(partial(defaultdict, make_new_synapse_count_array))  # pre vs post vs count
     for c in connectors.values():
         for pre in c[source_rel_id]:
@@ -214,40 +184,13 @@ def dual_split_graph(project_id, skeleton_ids, confidence_threshold, bandwidth,
     not_to_expand = skeleton_ids - expand
 
     if confidence_threshold > 0 and not_to_expand:
-        # Now fetch all treenodes of only skeletons in skeleton_ids (the ones not to expand)
-        cursor.execute('''
-            SELECT skeleton_id, id, parent_id, confidence
-            FROM treenode
-            WHERE project_id = %(project_id)s
-              AND skeleton_id = ANY(%(skids)s::bigint[])
-            ORDER BY skeleton_id
-        ''', {
-            'project_id': project_id,
-            'skids': list(not_to_expand),
-        })
-
-        # Read out into memory only one skeleton at a time
-        current_skid = None
-        tree:Optional[nx.DiGraph] = None
-        for row in cursor.fetchall():
-            if row[0] == current_skid:
-                # Build the tree, breaking it at the low-confidence edges
-                if row[2] and row[3] >= confidence_threshold:
-                    # mypy cannot prove this will be a nx.DiGraph by here
-                    tree.add_edge(row[2], row[1])  # type: ignore
-                continue
-
-            if tree:
-                nodeIDs.extend(split_by_confidence(current_skid, tree, stc[current_skid], connectors))
-
-            # Start the next tree
-            current_skid = row[0]
-            tree = nx.DiGraph()
-            if row[2] and row[3] > confidence_threshold:
-                tree.add_edge(row[2], row[1])
-
-        if tree:
-            nodeIDs.extend(split_by_confidence(current_skid, tree, stc[current_skid], connectors))
+        # Skeletons that are not expanded are only split by confidence
+        tasks = [(skid, node_ids, parent_ids, confidences, stc[skid], confidence_threshold)
+                for skid, node_ids, parent_ids, confidences, _ in
+                skeleton_arrays(cursor, project_id, not_to_expand)]
+        for nodes, _, _, links in split_skeletons(tasks, parallel=1):
+            nodeIDs.extend(nodes)
+            populate_connectors(links, connectors)
     else:
         # No need to split.
         # Populate connectors from the connections among them
@@ -257,56 +200,22 @@ def dual_split_graph(project_id, skeleton_ids, confidence_threshold, bandwidth,
                 connectors[c[1]][c[2]].append((skid, c[3]))
 
 
-    # Now fetch all treenodes of all skeletons to expand
-    cursor.execute('''
-        SELECT skeleton_id, id, parent_id, confidence, location_x, location_y, location_z
-        FROM treenode
-        WHERE project_id = %(project_id)s
-          AND skeleton_id = ANY(%(skids)s::bigint[])
-        ORDER BY skeleton_id
-    ''', {
-        'project_id': project_id,
-        'skids': list(expand),
-    })
-
     # list of edges among synapse domains
     intraedges:List = []
 
     # list of branch nodes, merely structural
     branch_nodeIDs:List = []
 
-    # reset
-    current_skid = None
-    tree = None
-    locations:Optional[Dict] = None
-    for row in cursor.fetchall():
-        if row[0] == current_skid:
-            # Build the tree, breaking it at the low-confidence edges
-            # mypy cannot prove this will have a value by here
-            locations[row[1]] = row[4:]  # type: ignore
-            if row[2] and row[3] >= confidence_threshold:
-                # mypy cannot prove this will have a value by here
-                tree.add_edge(row[2], row[1])  # type: ignore
-            continue
-
-        if tree:
-            ns, bs = split_by_both(current_skid, tree, locations, bandwidth, stc[current_skid], connectors, intraedges)
-            nodeIDs.extend(ns)
-            branch_nodeIDs.extend(bs)
-
-        # Start the next tree
-        current_skid = row[0]
-        tree = nx.DiGraph()
-        locations = {}
-        locations[row[1]] = row[4:]
-        if row[2] and row[3] > confidence_threshold:
-            tree.add_edge(row[2], row[1])
-
-    if tree:
-        ns, bs = split_by_both(current_skid, tree, locations, bandwidth, stc[current_skid], connectors, intraedges)
-        nodeIDs.extend(ns)
-        branch_nodeIDs.extend(bs)
-
+    # Split skeletons to expand by confidence and synapse domain
+    domain_tasks = [(skid, node_ids, parent_ids, confidences, stc[skid],
+            confidence_threshold, bandwidth, locations)
+            for skid, node_ids, parent_ids, confidences, locations in
+            skeleton_arrays(cursor, project_id, expand, with_locations=True)]
+    for nodes, branch_nodes, domain_edges, links in split_skeletons(domain_tasks):
+        nodeIDs.extend(nodes)
+        branch_nodeIDs.extend(branch_nodes)
+        intraedges.extend(domain_edges)
+        populate_connectors(links, connectors)
 
     # Create the edges of the graph
     edges:DefaultDict = defaultdict(partial(defaultdict, make_new_synapse_count_array))  # pre vs post vs count
@@ -325,101 +234,169 @@ def dual_split_graph(project_id, skeleton_ids, confidence_threshold, bandwidth,
     }
 
 
-def populate_connectors(chunkIDs, chunks, cs, connectors) -> None:
-    # Build up edges via the connectors
-    for c in cs:
-        # c is (treenode_id, connector_id, relation_id, confidence)
-        for chunkID, chunk in zip(chunkIDs, chunks):
-            if c[0] in chunk:
-                connectors[c[1]][c[2]].append((chunkID, c[3]))
-                break
-
-
-def subgraphs(digraph, skeleton_id) -> Tuple[List, Tuple]:
-    chunks = list(weakly_connected_component_subgraphs(digraph))
-    if 1 == len(chunks):
-        chunkIDs:Tuple = (str(skeleton_id),) # Note: Here we're loosening the implicit type
+def skeleton_arrays(cursor, project_id, skeleton_ids,
+        with_locations=False) -> Iterator[Tuple]:
+    """ Fetch the treenodes of the passed in skeletons and yield for each
+    skeleton a tuple of its ID and arrays of node IDs, parent IDs (-1 for the
+    root), confidences and, if requested, locations (otherwise None).
+    """
+    cursor.execute(f'''
+        SELECT skeleton_id, id, parent_id, confidence
+            {', location_x, location_y, location_z' if with_locations else ''}
+        FROM treenode
+        WHERE project_id = %(project_id)s
+          AND skeleton_id = ANY(%(skids)s::bigint[])
+        ORDER BY skeleton_id
+    ''', {
+        'project_id': project_id,
+        'skids': list(skeleton_ids),
+    })
+    rows = cursor.fetchall()
+    if not rows:
+        return
+
+    columns = list(zip(*rows))
+    skeleton_column = np.array(columns[0], dtype=np.int64)
+    node_ids = np.array(columns[1], dtype=np.int64)
+    parent_ids = np.array([-1 if p is None else p for p in columns[2]], dtype=np.int64)
+    confidences = np.array(columns[3], dtype=np.int64)
+    locations = np.column_stack(columns[4:7]).astype(np.float64) \
+            if with_locations else None
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(skeleton_column)) + 1))
+    ends = np.concatenate((starts[1:], [len(rows)]))
+    for start, end in zip(starts, ends):
+        yield (int(skeleton_column[start]), node_ids[start:end],
+                parent_ids[start:end], confidences[start:end],
+                None if locations is None else locations[start:end])
+
+
+def populate_connectors(links, connectors) -> None:
+    """ Add (connector_id, relation_id, graph node, confidence) links to the
+    connectors dictionary. """
+    for connector_id, relation_id, node, confidence in links:
+        connectors[connector_id][relation_id].append((node, confidence))
+
+
+def split_skeleton(skeleton_id, node_ids, parent_ids, confidences, cs,
+        confidence_threshold, bandwidth=None, locations=None) -> Tuple[List, List, List, List]:
+    """ Split a skeleton at edges with a confidence lower than the threshold
+    and, if a bandwidth is given, each resulting fragment by synapse domain.
+    The skeleton is given as arrays of node IDs, parent IDs, confidences and
+    locations (needed only with a bandwidth). The list cs contains all
+    synapses as (treenode_id, connector_id, relation_id, confidence) tuples.
+
+    Returns lists of graph nodes, structural branch nodes, edges between
+    synapse domains and (connector_id, relation_id, graph node, confidence)
+    links. Fragments without edges are not part of the graph.
+    """
+    tree = ArrayTree(node_ids, parent_ids)
+    n = len(tree)
+    confidences = np.asarray(confidences)
+    keep = (tree.parent_index >= 0) & (confidences >= confidence_threshold)
+    split_parent = np.where(keep, tree.parent_index, -1)
+
+    # Find the root of each fragment
+    root = np.where(keep, split_parent, np.arange(n))
+    while True:
+        next_root = root[root]
+        if np.array_equal(next_root, root):
+            break
+        root = next_root
+
+    fragment_roots = np.flatnonzero(np.bincount(root, minlength=n) > 1)
+    if 0 == len(fragment_roots):
+        return [], [], [], []
+    fragment_index = np.full(n, -1, dtype=np.int64)
+    fragment_index[fragment_roots] = np.arange(len(fragment_roots))
+    node_fragment = fragment_index[root]
+
+    if 1 == len(fragment_roots):
+        chunkIDs:List = [str(skeleton_id)]
     else:
-        chunkIDs = tuple('%s_%s' % (skeleton_id, (i+1)) for i in range(len(chunks)))
-    return chunks, chunkIDs
-
-
-def split_by_confidence(skeleton_id, digraph, cs, connectors) -> Tuple:
-    """ Split by confidence threshold. Populates connectors (side effect). """
-    chunks, chunkIDs = subgraphs(digraph, skeleton_id)
-    populate_connectors(chunkIDs, chunks, cs, connectors)
-    return chunkIDs
-
+        chunkIDs = ['%s_%s' % (skeleton_id, i + 1) for i in range(len(fragment_roots))]
 
-def split_by_both(skeleton_id, digraph, locations, bandwidth, cs, connectors, intraedges) -> Tuple[List, List]:
-    """ Split by confidence and synapse domain. Populates connectors and intraedges (side effects). """
-    nodes = []
-    branch_nodes = []
+    # Synapses are (treenode_id, connector_id, relation_id, confidence)
+    cs = [c for c in cs if c[0] in tree]
+    synapse_index = tree.indices([c[0] for c in cs])
+    synapse_fragment = node_fragment[synapse_index]
 
-    chunks, chunkIDs = subgraphs(digraph, skeleton_id)
+    if bandwidth is None:
+        links = [(c[1], c[2], chunkIDs[f], c[3])
+                for c, f in zip(cs, synapse_fragment.tolist()) if f >= 0]
+        return chunkIDs, [], [], links
 
-    for i, chunkID, chunk in zip(count(start=1), chunkIDs, chunks):
-        # Populate edge properties with the weight
-        for parent, child in chunk.edges_iter():
-            chunk[parent][child]['weight'] = norm(subtract(locations[child], locations[parent]))
-
-        # Check if need to expand at all
-        blob = tuple(c for c in cs if c[0] in chunk)
-        if 0 == len(blob): # type: ignore
+    nodes:List = []
+    branch_nodes:List = []
+    intraedges:List = []
+    links = []
+    local_index = np.full(n, -1, dtype=np.int64)
+    for i, chunkID in enumerate(chunkIDs, start=1):
+        chunk_synapses = np.flatnonzero(synapse_fragment == i - 1)
+        if 0 == len(chunk_synapses):
             nodes.append(chunkID)
             continue
 
-        treenode_ids, connector_ids, relation_ids, confidences = list(zip(*blob)) # type: ignore
-
-        if 0 == len(connector_ids):
-            nodes.append(chunkID)
-            continue
+        members = np.flatnonzero(node_fragment == i - 1)
+        local_index[members] = np.arange(len(members))
+        member_parents = split_parent[members]
+        local_parent = np.where(member_parents >= 0, local_index[member_parents], -1)
 
         # Invoke Casey's magic: split by synapse domain
-        max_density = tree_max_density(chunk.to_undirected(), treenode_ids,
-                connector_ids, relation_ids, [bandwidth])
-        # Get first element of max_density
-        domains = next(iter(max_density.values()))
-
-        # domains is a dictionary of index vs SynapseGroup instance
+        domains, _ = tree_synapse_domains(local_parent, locations[members],
+                local_index[synapse_index[chunk_synapses]], bandwidth)
+        n_domains = domains.max() + 1
 
-        if 1 == len(domains):
-            for connector_id, relation_id, confidence in zip(connector_ids, relation_ids, confidences):
-                connectors[connector_id][relation_id].append((chunkID, confidence))
+        if 1 == n_domains:
+            links.extend((cs[j][1], cs[j][2], chunkID, cs[j][3]) for j in chunk_synapses)
             nodes.append(chunkID)
             continue
 
-        # Create edges between domains
-        # Pick one treenode from each domain to act as anchor
-        anchors = {d.node_ids[0]: (i+k, d) for k, d in domains.items()}
-
-        # Create new Graph where the edges are the edges among synapse domains
+        # Pick the first treenode of each domain to act as anchor and create
+        # a new graph where the edges are the edges among synapse domains.
+        first_synapse = np.full(n_domains, -1, dtype=np.int64)
+        first_synapse[domains[::-1]] = chunk_synapses[::-1]
+        anchors = {cs[j][0]: i + k for k, j in enumerate(first_synapse.tolist())}
+        member_ids = node_ids[members]
+        chunk = ArrayTree(member_ids,
+                np.where(local_parent >= 0, member_ids[local_parent], -1))
         mini = simplify(chunk, anchors.keys())
 
-        # Many side effects:
-        # * add internal edges to intraedges
-        # * add each domain to nodes
-        # * custom-apply populate_connectors with the known synapses of each domain
-        #   (rather than having to sift through all in cs)
         mini_nodes = {}
-        for node in mini.nodes_iter():
-            nblob = anchors.get(node)
-            if nblob:
-                index, domain = nblob
+        for node in mini.nodes():
+            index = anchors.get(node)
+            if index is not None:
                 domainID = '%s_%s' % (chunkID, index)
                 nodes.append(domainID)
-                for connector_id, relation_id in zip(domain.connector_ids, domain.relations):
-                    confidence = confidences[connector_ids.index(connector_id)]
-                    connectors[connector_id][relation_id].append((domainID, confidence))
             else:
                 domainID = '%s_%s' % (chunkID, node)
                 branch_nodes.append(domainID)
             mini_nodes[node] = domainID
 
-        for a1, a2 in mini.edges_iter():
+        for j, k in zip(chunk_synapses.tolist(), domains.tolist()):
+            links.append((cs[j][1], cs[j][2], '%s_%s' % (chunkID, i + k), cs[j][3]))
+
+        for a1, a2 in mini.edges():
             intraedges.append((mini_nodes[a1], mini_nodes[a2]))
 
-    return nodes, branch_nodes
+    return nodes, branch_nodes, intraedges, links
+
+
+def _split_skeleton_task(task) -> Tuple[List, List, List, List]:
+    return split_skeleton(*task)
+
+
+def split_skeletons(tasks, parallel=None) -> List[Tuple[List, List, List, List]]:
+    """ Run split_skeleton() for each task (a tuple of its arguments). With
+    more than one task, MAX_PARALLEL_GRAPH_WORKERS processes are used.
+    """
+    if parallel is None:
+        parallel = settings.MAX_PARALLEL_GRAPH_WORKERS
+
+    if parallel > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(parallel, len(tasks))) as executor:
+            return list(executor.map(_split_skeleton_task, tasks))
+    return [split_skeleton(*task) for task in tasks]
 
 
 def _skeleton_graph(project_id, skeleton_ids, confidence_threshold, bandwidth,
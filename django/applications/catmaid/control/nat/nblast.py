@@ -0,0 +1,844 @@
+# -*- coding: utf-8 -*-
+
+# A NumPy/SciPy implementation of NBLAST (Costa et al. 2016), which can be used
+# instead of the R bridge in catmaid.control.nat.r. The public functions
+# nblast() and compute_scoring_matrix() accept the same parameters and return
+# the same data as their R counterparts.
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+
+from catmaid.apps import get_system_user
+from catmaid.control.tree_util import ArrayTree
+from catmaid.models import (NblastConfig, NblastConfigDefaultDistanceBreaks,
+        NblastConfigDefaultDotBreaks, PointCloud, PointSet, SkeletonSummary)
+
+from celery.utils.log import get_task_logger
+
+
+logger = get_task_logger(__name__)
+
+# NBLAST works mostly in um space and CATMAID in nm.
+nm_to_um = 1e-3
+
+# The arrays a dotprops cache directory is made of.
+cache_arrays = ('object_ids', 'offsets', 'points', 'vectors', 'alphas')
+
+
+class DotpropsList():
+    """A list of dotprops objects, i.e. points with a tangent vector and an
+    alpha value (how linear the neighborhood of a point is) each. All objects
+    share contiguous point, vector and alpha arrays. The data of the object at
+    index i is found in the range offsets[i]:offsets[i+1] of these arrays.
+    """
+
+    def __init__(self, object_ids, offsets, points, vectors, alphas):
+        self.object_ids = list(object_ids)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.points = points
+        self.vectors = vectors
+        self.alphas = alphas
+        self._index = {oid: i for i, oid in enumerate(self.object_ids)}
+
+    def __len__(self) -> int:
+        return len(self.object_ids)
+
+    def __contains__(self, object_id) -> bool:
+        return object_id in self._index
+
+    def index(self, object_id) -> int:
+        return self._index[object_id]
+
+    def get(self, i) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the points, vectors and alphas of the object at index <i>."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.points[start:end], self.vectors[start:end], self.alphas[start:end]
+
+    def subset(self, object_ids) -> 'DotpropsList':
+        """Get a new list with the passed in objects, in the passed in order.
+        Unknown objects are ignored."""
+        indices = [self._index[oid] for oid in object_ids if oid in self._index]
+        return self.take(indices)
+
+    def take(self, indices) -> 'DotpropsList':
+        starts = self.offsets[indices] if len(indices) else np.zeros(0, dtype=np.int64)
+        ends = self.offsets[np.asarray(indices, dtype=np.int64) + 1] \
+                if len(indices) else np.zeros(0, dtype=np.int64)
+        ranges = [np.arange(s, e) for s, e in zip(starts, ends)]
+        selection = np.concatenate(ranges) if ranges else np.zeros(0, dtype=np.int64)
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(ends - starts, out=offsets[1:])
+        return DotpropsList([self.object_ids[i] for i in indices], offsets,
+                np.asarray(self.points[selection]),
+                np.asarray(self.vectors[selection]),
+                np.asarray(self.alphas[selection]))
+
+    @staticmethod
+    def from_objects(object_ids, objects) -> 'DotpropsList':
+        """Create a new list from a list of (points, vectors, alphas) tuples."""
+        offsets = np.zeros(len(objects) + 1, dtype=np.int64)
+        np.cumsum([len(o[0]) for o in objects], out=offsets[1:])
+        if objects:
+            points = np.concatenate([o[0] for o in objects])
+            vectors = np.concatenate([o[1] for o in objects])
+            alphas = np.concatenate([o[2] for o in objects])
+        else:
+            points = np.zeros((0, 3))
+            vectors = np.zeros((0, 3))
+            alphas = np.zeros(0)
+        return DotpropsList(object_ids, offsets, points, vectors, alphas)
+
+    @staticmethod
+    def concat(lists) -> 'DotpropsList':
+        objects:List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        object_ids:List = []
+        for dps in lists:
+            object_ids.extend(dps.object_ids)
+            objects.extend(dps.get(i) for i in range(len(dps)))
+        return DotpropsList.from_objects(object_ids, objects)
+
+    def save(self, path, meta=None) -> None:
+        """Store this list as a directory of .npy files, which can be memory
+        mapped when loaded. The directory is replaced atomically.
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        tmp_path = tempfile.mkdtemp(dir=parent, prefix='.tmp-dps-')
+        try:
+            for name in cache_arrays:
+                value = self.object_ids if name == 'object_ids' else getattr(self, name)
+                np.save(os.path.join(tmp_path, f'{name}.npy'), np.asarray(value))
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+                json.dump(meta or {}, f)
+            if os.path.exists(path):
+                old_path = tempfile.mkdtemp(dir=parent, prefix='.old-dps-')
+                os.rename(path, os.path.join(old_path, 'data'))
+                os.rename(tmp_path, path)
+                shutil.rmtree(old_path, ignore_errors=True)
+            else:
+                os.rename(tmp_path, path)
+        except:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def load(path, mmap=True) -> Tuple['DotpropsList', Dict[str, Any]]:
+        """Load a list stored with save(). The point, vector and alpha arrays
+        are memory mapped by default, i.e. only the parts that are accessed are
+        read from disk. Returns the list along with its meta data.
+        """
+        arrays = {name: np.load(os.path.join(path, f'{name}.npy'),
+                mmap_mode='r' if mmap else None) for name in cache_arrays}
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        return DotpropsList(arrays['object_ids'].tolist(), arrays['offsets'],
+                arrays['points'], arrays['vectors'], arrays['alphas']), meta
+
+
+def compute_dotprops(points, k=20) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute tangent vectors and alpha values for a N x 3 point array. For
+    each point, the first principal component of its <k> nearest neighbors
+    (including itself) is its tangent vector. Alpha is the share of the first
+    eigenvalue that exceeds the second one, relative to the sum of all three.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    n_points = len(points)
+    if n_points == 0:
+        return points, np.zeros((0, 3)), np.zeros(0)
+    k = max(1, min(k, n_points))
+
+    _, neighbors = cKDTree(points).query(points, k=k)
+    neighbors = neighbors.reshape(n_points, k)
+    neighborhoods = points[neighbors]
+    centered = neighborhoods - neighborhoods.mean(axis=1, keepdims=True)
+    inertia = np.einsum('nki,nkj->nij', centered, centered)
+
+    # Eigenvalues are returned in ascending order, eigenvectors as columns.
+    values, vectors = np.linalg.eigh(inertia)
+    tangents = vectors[:, :, 2]
+    value_sum = values.sum(axis=1)
+    alphas = np.zeros(n_points)
+    valid = value_sum > 0
+    alphas[valid] = (values[valid, 2] - values[valid, 1]) / value_sum[valid]
+
+    return points, tangents, alphas
+
+
+def resample_skeleton(node_ids, parent_ids, locations, step) -> np.ndarray:
+    """Place points every <step> units along each unbranched segment of a
+    skeleton. Segment start and end points are kept.
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+    tree = ArrayTree(node_ids, parent_ids)
+    samples = []
+    for sequence in tree.partition():
+        path = locations[tree.indices(sequence)]
+        edge_lengths = np.linalg.norm(np.diff(path, axis=0), axis=1)
+        arc = np.concatenate(([0.0], np.cumsum(edge_lengths)))
+        total = arc[-1]
+        if total == 0:
+            samples.append(path[:1])
+            continue
+        positions = np.append(np.arange(0, total, step), total)
+        samples.append(np.column_stack([np.interp(positions, arc, path[:, d])
+                for d in range(3)]))
+
+    if not samples:
+        return locations
+    # Branch points end multiple segments.
+    return np.unique(np.concatenate(samples), axis=0)
+
+
+def skeleton_dotprops(skeleton_ids, tangent_neighbors=20, resample_by=1e3) -> DotpropsList:
+    """Get dotprops of skeletons in um space. Skeletons are resampled to
+    <resample_by> nm first. Skeletons without nodes are ignored.
+    """
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT t.skeleton_id, t.id, t.parent_id,
+            t.location_x, t.location_y, t.location_z
+        FROM treenode t
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) query(skeleton_id)
+            ON query.skeleton_id = t.skeleton_id
+        ORDER BY t.skeleton_id
+    """, {
+        'skeleton_ids': list(skeleton_ids),
+    })
+    rows = cursor.fetchall()
+    if not rows:
+        return DotpropsList.from_objects([], [])
+
+    data = np.array([(r[0], r[1], -1 if r[2] is None else r[2]) for r in rows],
+            dtype=np.int64)
+    locations = np.array([r[3:] for r in rows], dtype=np.float64) * nm_to_um
+    found_ids, starts = np.unique(data[:, 0], return_index=True)
+    ends = np.append(starts[1:], len(data))
+
+    step = resample_by * nm_to_um
+    object_ids = []
+    objects = []
+    for skeleton_id, start, end in zip(found_ids, starts, ends):
+        points = resample_skeleton(data[start:end, 1], data[start:end, 2],
+                locations[start:end], step)
+        object_ids.append(int(skeleton_id))
+        objects.append(compute_dotprops(points, tangent_neighbors))
+
+    return DotpropsList.from_objects(object_ids, objects)
+
+
+def pointcloud_dotprops(pointcloud_ids, tangent_neighbors=20) -> DotpropsList:
+    """Get dotprops of point clouds in um space."""
+    object_ids = []
+    objects = []
+    for pcid in pointcloud_ids:
+        pointcloud = PointCloud.objects.prefetch_related('points').get(pk=pcid)
+        points = np.array([(p.location_x, p.location_y, p.location_z)
+                for p in pointcloud.points.all()], dtype=np.float64)
+        object_ids.append(pcid)
+        objects.append(compute_dotprops(points * nm_to_um, tangent_neighbors))
+
+    return DotpropsList.from_objects(object_ids, objects)
+
+
+def pointset_dotprops(pointset_ids, tangent_neighbors=20) -> DotpropsList:
+    """Get dotprops of point sets in um space."""
+    object_ids = []
+    objects = []
+    for psid in pointset_ids:
+        pointset = PointSet.objects.get(pk=psid)
+        points = np.array(pointset.points, dtype=np.float64).reshape(-1, 3)
+        object_ids.append(psid)
+        objects.append(compute_dotprops(points * nm_to_um, tangent_neighbors))
+
+    return DotpropsList.from_objects(object_ids, objects)
+
+
+def get_dotprops(project_id, object_type, object_ids, tangent_neighbors=20,
+        resample_by=1e3, use_cache=True) -> DotpropsList:
+    """Get dotprops for the passed in objects of a particular type, in the
+    passed in order. If <use_cache> is set, objects are read from a matching
+    cache first. Objects that aren't found are ignored.
+    """
+    cached = None
+    if use_cache:
+        cached = get_cached_dotprops(project_id, object_type,
+                tangent_neighbors, resample_by)
+
+    missing = [oid for oid in object_ids if not cached or oid not in cached]
+    if object_type == 'skeleton':
+        computed = skeleton_dotprops(missing, tangent_neighbors, resample_by) \
+                if missing else None
+    elif object_type == 'pointcloud':
+        computed = pointcloud_dotprops(missing, tangent_neighbors) \
+                if missing else None
+    elif object_type == 'pointset':
+        computed = pointset_dotprops(missing, tangent_neighbors) \
+                if missing else None
+    else:
+        raise ValueError(f"Unsupported object type: {object_type}")
+
+    if cached is None:
+        return computed if computed else DotpropsList.from_objects([], [])
+    if not computed:
+        return cached.subset(object_ids)
+    return DotpropsList.concat([cached.subset(object_ids), computed]).subset(object_ids)
+
+
+def get_cache_path(project_id, object_type) -> str:
+    if object_type not in ('skeleton', 'pointcloud', 'pointset'):
+        raise ValueError(f"Unsupported object type: {object_type}")
+
+    return os.path.join(settings.MEDIA_ROOT, settings.MEDIA_CACHE_SUBDIRECTORY,
+            f"dps-cache-project-{project_id}-{object_type}")
+
+
+def get_cached_dotprops(project_id, object_type, tangent_neighbors=None,
+        resample_by=None) -> Optional[DotpropsList]:
+    """Return the memory mapped dotprops cache of a particular <object_type>
+    (skeleton, pointcloud, pointset), if available. If not or if it has been
+    computed with different parameters, None is returned.
+    """
+    cache_path = get_cache_path(project_id, object_type)
+    if not os.path.isdir(cache_path) or not os.access(cache_path, os.R_OK):
+        return None
+
+    try:
+        dotprops, meta = DotpropsList.load(cache_path)
+    except (IOError, OSError, ValueError) as e:
+        logger.warning(f'Could not read dotprops cache {cache_path}: {e}')
+        return None
+
+    if tangent_neighbors is not None and meta.get('tangent_neighbors') != tangent_neighbors:
+        return None
+    if resample_by is not None and object_type == 'skeleton' and \
+            meta.get('resample_by') != resample_by:
+        return None
+
+    return dotprops
+
+
+def get_edition_times(project_id, object_type, object_ids) -> Dict[int, str]:
+    """Get the last edition time of each passed in object as ISO string. For
+    skeletons, the skeleton summary is used.
+    """
+    if object_type == 'skeleton':
+        rows = SkeletonSummary.objects.filter(project_id=project_id,
+                skeleton_id__in=object_ids).values_list('skeleton_id',
+                'last_edition_time')
+    elif object_type == 'pointcloud':
+        rows = PointCloud.objects.filter(project_id=project_id,
+                id__in=object_ids).values_list('id', 'edition_time')
+    elif object_type == 'pointset':
+        rows = PointSet.objects.filter(project_id=project_id,
+                id__in=object_ids).values_list('id', 'edition_time')
+    else:
+        raise ValueError(f"Unsupported object type: {object_type}")
+
+    return {oid: edition_time.isoformat() for oid, edition_time in rows}
+
+
+def find_stale_objects(manifest, object_ids, edition_times) -> Tuple[List, List]:
+    """Split the passed in objects into the ones with an up-to-date cache entry
+    and the ones that need to be computed, because they are new or have been
+    edited since the cache entry was created. The manifest maps stringified
+    object IDs to the edition time of the cached version.
+    """
+    current, stale = [], []
+    for oid in object_ids:
+        edition_time = edition_times.get(oid)
+        if edition_time is not None and manifest.get(str(oid)) == edition_time:
+            current.append(oid)
+        else:
+            stale.append(oid)
+    return current, stale
+
+
+def update_dotprops_cache(cache_path, project_id, object_type, object_ids,
+        compute:Callable[[List], DotpropsList], meta,
+        incremental=False) -> DotpropsList:
+    """Write the dotprops of all passed in objects to a cache, along with a
+    manifest of the edition time of each object. The passed in function is
+    used to compute dotprops for a list of object IDs. In incremental mode, an
+    existing cache created with the same meta data is reused: only objects
+    that are new or have been edited since are computed and objects that
+    aren't part of <object_ids> anymore are dropped.
+    """
+    edition_times = get_edition_times(project_id, object_type, object_ids)
+
+    cached = None
+    manifest:Dict[str, str] = {}
+    if incremental and os.path.isdir(cache_path):
+        try:
+            cached, cached_meta = DotpropsList.load(cache_path)
+            if all(cached_meta.get(k) == v for k, v in meta.items()):
+                manifest = cached_meta.get('manifest', {})
+            else:
+                logger.info('Cache parameters changed, recomputing all objects')
+                cached = None
+        except (IOError, OSError, ValueError) as e:
+            logger.warning(f'Could not read dotprops cache {cache_path}: {e}')
+            cached = None
+
+    current, stale = find_stale_objects(manifest, object_ids, edition_times)
+    logger.debug(f'Found {len(current)} up-to-date and {len(stale)} stale '
+            f'{object_type} cache entries')
+
+    parts = []
+    if cached is not None and current:
+        parts.append(cached.subset(current))
+    if stale:
+        parts.append(compute(stale))
+    dotprops = DotpropsList.concat(parts)
+
+    cache_meta = dict(meta)
+    cache_meta['manifest'] = {str(oid): edition_times[oid]
+            for oid in dotprops.object_ids if oid in edition_times}
+    dotprops.save(cache_path, cache_meta)
+
+    return dotprops
+
+
+def create_dotprops_cache(project_id, object_type, tangent_neighbors=20,
+        min_nodes=500, min_soma_nodes=20, soma_tags=('soma',), resample_by=1e3,
+        progress=False, incremental=False) -> None:
+    """Create a new memory mappable cache for a particular project object
+    type. All objects of a type in a project are prepared. With
+    <incremental>, only objects that changed since the last run are computed.
+    """
+    # A circular dependency would be the result of a top level import
+    from catmaid.control.similarity import get_all_object_ids
+
+    cache_path = get_cache_path(project_id, object_type)
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.exists(cache_dir) or not os.access(cache_dir, os.W_OK):
+        raise ValueError(f"Can not access cache directory: {cache_dir}")
+
+    user = get_system_user()
+    object_ids = get_all_object_ids(project_id, user.id, object_type,
+            min_nodes, min_soma_nodes, soma_tags)
+    if not object_ids:
+        logger.info(f"No {object_type} objects found to populate cache from")
+        return
+
+    def compute(object_ids):
+        if progress:
+            print(f'Computing dotprops for {len(object_ids)} objects')
+        return get_dotprops(project_id, object_type, object_ids,
+                tangent_neighbors, resample_by, use_cache=False)
+
+    dotprops = update_dotprops_cache(cache_path, project_id, object_type,
+            object_ids, compute, {
+                'tangent_neighbors': tangent_neighbors,
+                'resample_by': resample_by,
+            }, incremental)
+
+    logger.debug(f'Stored {object_type} cache with {len(dotprops)} entries: {cache_path}')
+
+
+class ScoreFunction():
+    """Map distances and absolute dot products of nearest neighbor point
+    pairs to scores using a scoring matrix with one row per distance bin and
+    one column per dot product bin. Values outside the break ranges count as
+    part of the first or last bin, like R's findInterval(all.inside=TRUE).
+    """
+
+    def __init__(self, scoring, distbreaks, dotbreaks):
+        self.scoring = np.asarray(scoring, dtype=np.float64)
+        self.distbreaks = np.asarray(distbreaks, dtype=np.float64)
+        self.dotbreaks = np.asarray(dotbreaks, dtype=np.float64)
+        expected_shape = (len(self.distbreaks) - 1, len(self.dotbreaks) - 1)
+        if self.scoring.shape != expected_shape:
+            raise ValueError(f"Scoring matrix needs shape {expected_shape}, "
+                    f"found {self.scoring.shape}")
+
+    def __call__(self, distances, dots) -> np.ndarray:
+        dist_bins = np.clip(np.searchsorted(self.distbreaks, distances,
+                side='right') - 1, 0, self.scoring.shape[0] - 1)
+        dot_bins = np.clip(np.searchsorted(self.dotbreaks, dots,
+                side='right') - 1, 0, self.scoring.shape[1] - 1)
+        return self.scoring[dist_bins, dot_bins]
+
+    def self_score(self, alphas, use_alpha=False) -> float:
+        """The score of an object compared to itself: each point is its own
+        nearest neighbor with a distance of zero."""
+        dots = alphas if use_alpha else np.ones(len(alphas))
+        return float(self(np.zeros(len(alphas)), dots).sum())
+
+
+def nearest_neighbors(query_points, query_vectors, query_alphas, target_tree,
+        target_vectors, target_alphas, use_alpha=False) -> Tuple[np.ndarray, np.ndarray]:
+    """Get distances and absolute dot products for each query point and its
+    nearest neighbor in the target."""
+    distances, neighbors = target_tree.query(query_points, k=1)
+    dots = np.abs(np.einsum('ij,ij->i', query_vectors, target_vectors[neighbors]))
+    if use_alpha:
+        dots *= np.sqrt(query_alphas * target_alphas[neighbors])
+    return distances, dots
+
+
+# Data shared with worker processes. It is set through an initializer to not
+# transfer it again with every task.
+_worker_data:Dict[str, Any] = {}
+
+
+def _init_worker(query, score_fn, use_alpha) -> None:
+    _worker_data['query'] = query
+    _worker_data['score_fn'] = score_fn
+    _worker_data['use_alpha'] = use_alpha
+
+
+def _score_targets(targets) -> np.ndarray:
+    """Score all query objects against each of the passed in targets. Returns
+    a matrix with one row per query object and one column per target."""
+    query = _worker_data['query']
+    score_fn = _worker_data['score_fn']
+    use_alpha = _worker_data['use_alpha']
+
+    scores = np.zeros((len(query), len(targets)))
+    for j in range(len(targets)):
+        target_points, target_vectors, target_alphas = targets.get(j)
+        if len(target_points) == 0:
+            continue
+        # The tree of each target is only built once.
+        tree = cKDTree(target_points)
+        for i in range(len(query)):
+            query_points, query_vectors, query_alphas = query.get(i)
+            if len(query_points) == 0:
+                continue
+            distances, dots = nearest_neighbors(query_points, query_vectors,
+                    query_alphas, tree, target_vectors, target_alphas, use_alpha)
+            scores[i, j] = score_fn(distances, dots).sum()
+    return scores
+
+
+def forward_scores(query, target, score_fn, use_alpha=False, normalized=False,
+        parallel=None) -> np.ndarray:
+    """Compute the NBLAST score of each query object against each target
+    object. The result has one row per query and one column per target. If
+    <normalized> is true, scores are divided by the query's self score. Targets
+    are split into blocks that are scored in up to MAX_PARALLEL_ASYNC_WORKERS
+    processes. Daemonic processes, like the pool workers of Celery, can't
+    start child processes and score all targets themselves.
+    """
+    if parallel is None:
+        parallel = settings.MAX_PARALLEL_ASYNC_WORKERS
+    if parallel > 1 and multiprocessing.current_process().daemon:
+        logger.debug('Computing NBLAST scores without worker processes, '
+                'because the current process is daemonic')
+        parallel = 1
+    n_targets = len(target)
+
+    if parallel > 1 and n_targets > 1:
+        n_blocks = min(n_targets, parallel * 4)
+        blocks = [target.take(list(b))
+                for b in np.array_split(np.arange(n_targets), n_blocks)]
+        with ProcessPoolExecutor(max_workers=parallel, initializer=_init_worker,
+                initargs=(query, score_fn, use_alpha)) as executor:
+            scores = np.hstack(list(executor.map(_score_targets, blocks)))
+    else:
+        _init_worker(query, score_fn, use_alpha)
+        try:
+            scores = _score_targets(target)
+        finally:
+            _worker_data.clear()
+
+    if normalized:
+        self_scores = np.array([score_fn.self_score(query.get(i)[2], use_alpha)
+                for i in range(len(query))])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = scores / self_scores[:, np.newaxis]
+
+    return scores
+
+
+def nblast_scores(query, target, score_fn, normalized='raw', use_alpha=False,
+        reverse=False, parallel=None) -> np.ndarray:
+    """Compute the similarity matrix of query objects (rows) and target
+    objects (columns). With <reverse>, the targets are compared against the
+    queries. The 'mean' and 'geometric-mean' normalizations combine forward and
+    reverse scores, each normalized by the respective self score.
+    """
+    same_objects = query is target
+    if normalized in ('mean', 'geometric-mean'):
+        forward = forward_scores(query, target, score_fn, use_alpha, True, parallel)
+        if same_objects:
+            backward = forward.T
+        else:
+            backward = forward_scores(target, query, score_fn, use_alpha,
+                    True, parallel).T
+        if normalized == 'mean':
+            return (forward + backward) / 2.0
+        # Clamp negative scores to zero to not make negative forward and
+        # backward values become positive in the multiplication.
+        return np.sqrt(np.maximum(forward, 0) * np.maximum(backward, 0))
+
+    is_normalized = normalized != 'raw'
+    if reverse:
+        return forward_scores(target, query, score_fn, use_alpha,
+                is_normalized, parallel).T
+    return forward_scores(query, target, score_fn, use_alpha, is_normalized,
+            parallel)
+
+
+def test_environment() -> JsonResponse:
+    """The native NBLAST implementation has no additional requirements.
+    """
+    return JsonResponse({
+        'setup_ok': True,
+    })
+
+
+def nblast(project_id, user_id, config_id, query_object_ids, target_object_ids,
+        query_type='skeleton', target_type='skeleton', omit_failures=True,
+        normalized='raw', use_alpha=False, remove_target_duplicates=True,
+        min_nodes=500, min_soma_nodes=20, simplify=True, required_branches=10,
+        soma_tags=('soma', ), use_cache=True, reverse=False, top_n=0,
+        resample_by=1e3, use_http=False) -> Dict[str, Any]:
+    """Create NBLAST score for forward similarity from query objects to target
+    objects, like catmaid.control.nat.r.nblast(). Objects are always read from
+    the database or the dotprops cache, <use_http> is ignored. Skeletons are
+    not simplified and the full similarity matrix is computed, also if
+    <top_n> is set.
+    """
+    similarity = None
+    query_object_ids_in_use = None
+    target_object_ids_in_use = None
+    errors = []
+    try:
+        config = NblastConfig.objects.get(project_id=project_id, pk=config_id)
+
+        # Indicate an all-by-all computation. This disabled <remove_target_duplicates>.
+        all_by_all = not query_object_ids and not target_object_ids and \
+                query_type == target_type
+        if all_by_all:
+            logger.debug('Disabling remove_target_duplicates option due to all-by-all computation')
+            remove_target_duplicates = False
+
+        # In case either query_object_ids or target_object_ids is not given, the
+        # value will be filled in with all objects of the respective type.
+        from catmaid.control.similarity import get_all_object_ids
+        if all_by_all:
+            query_object_ids = get_all_object_ids(project_id, user_id,
+                    query_type, min_nodes, min_soma_nodes, soma_tags)
+            target_object_ids = query_object_ids
+        else:
+            if not query_object_ids:
+                query_object_ids = get_all_object_ids(project_id, user_id,
+                        query_type, min_nodes, min_soma_nodes, soma_tags)
+            if not target_object_ids:
+                target_object_ids = get_all_object_ids(project_id, user_id,
+                        target_type, min_nodes, min_soma_nodes, soma_tags)
+
+        # If both query and target IDs are of the same type, the target list of
+        # object IDs can't contain any of the query IDs.
+        if query_type == target_type and remove_target_duplicates:
+            query_id_set = set(query_object_ids)
+            target_object_ids = [oid for oid in target_object_ids
+                    if oid not in query_id_set]
+
+        if simplify:
+            logger.debug('Skeleton simplification is not supported by the '
+                    'native NBLAST implementation, using full skeletons')
+
+        query_dps = get_dotprops(project_id, query_type, query_object_ids,
+                config.tangent_neighbors, resample_by, use_cache)
+        if query_type == target_type and \
+                list(target_object_ids) == list(query_object_ids):
+            target_dps = query_dps
+        else:
+            target_dps = get_dotprops(project_id, target_type,
+                    target_object_ids, config.tangent_neighbors, resample_by,
+                    use_cache)
+
+        if len(query_dps) == 0:
+            raise ValueError("No valid query objects found")
+
+        if len(target_dps) == 0:
+            raise ValueError("No valid target objects found")
+
+        score_fn = ScoreFunction(config.scoring, config.distance_breaks,
+                config.dot_breaks)
+
+        logger.debug('Computing score (alpha: {a}, noramlized: {n}, reverse: {r})'.format(**{
+            'a': 'Yes' if use_alpha else 'No',
+            'n': 'No' if normalized == 'raw' else f'Yes ({normalized})',
+            'r': 'Yes' if reverse else 'No',
+        }))
+
+        scores = nblast_scores(query_dps, target_dps, score_fn, normalized,
+                use_alpha, reverse)
+
+        similarity = scores.tolist()
+        query_object_ids_in_use = list(query_dps.object_ids)
+        target_object_ids_in_use = list(target_dps.object_ids)
+
+        logger.debug('NBLAST computation done')
+
+    except (IOError, OSError, ValueError) as e:
+        logger.exception(e)
+        errors.append(str(e))
+
+    return {
+        "errors": errors,
+        "similarity": similarity,
+        "query_object_ids": query_object_ids_in_use,
+        "target_object_ids": target_object_ids_in_use,
+    }
+
+
+def histogram(distances, dots, distbreaks, dotbreaks) -> np.ndarray:
+    """Count distance and dot product pairs in a 2D histogram with one row
+    per distance bin and one column per dot product bin. Bins are right-closed
+    and values outside of the break ranges are dropped, like R's cut().
+    """
+    distbreaks = np.asarray(distbreaks, dtype=np.float64)
+    dotbreaks = np.asarray(dotbreaks, dtype=np.float64)
+    n_dist_bins, n_dot_bins = len(distbreaks) - 1, len(dotbreaks) - 1
+    dist_bins = np.searchsorted(distbreaks, distances, side='left') - 1
+    dot_bins = np.searchsorted(dotbreaks, dots, side='left') - 1
+    valid = (dist_bins >= 0) & (dist_bins < n_dist_bins) & \
+            (dot_bins >= 0) & (dot_bins < n_dot_bins)
+    counts = np.bincount(dist_bins[valid] * n_dot_bins + dot_bins[valid],
+            minlength=n_dist_bins * n_dot_bins)
+    return counts.reshape(n_dist_bins, n_dot_bins)
+
+
+def pair_histogram(dotprops, pairs, distbreaks, dotbreaks) -> np.ndarray:
+    """Sum the histograms of nearest neighbor distances and dot products of
+    all (query index, target index) pairs."""
+    counts = np.zeros((len(distbreaks) - 1, len(dotbreaks) - 1), dtype=np.int64)
+    targets:Dict[int, List[int]] = {}
+    for query_index, target_index in pairs:
+        targets.setdefault(target_index, []).append(query_index)
+
+    for target_index, query_indices in targets.items():
+        target_points, target_vectors, target_alphas = dotprops.get(target_index)
+        if len(target_points) == 0:
+            continue
+        tree = cKDTree(target_points)
+        for query_index in query_indices:
+            query_points, query_vectors, query_alphas = dotprops.get(query_index)
+            if len(query_points) == 0:
+                continue
+            distances, dots = nearest_neighbors(query_points, query_vectors,
+                    query_alphas, tree, target_vectors, target_alphas)
+            counts += histogram(distances, dots, distbreaks, dotbreaks)
+
+    return counts
+
+
+def scoring_matrix(match_hist, rand_hist, epsilon=1e-6) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the log2 odds scoring matrix from a matching and a random
+    histogram. Returns the scoring matrix along with both probability
+    matrices."""
+    match_prob = match_hist / max(match_hist.sum(), 1)
+    rand_prob = rand_hist / max(rand_hist.sum(), 1)
+    smat = np.log2((match_prob + epsilon) / (rand_prob + epsilon))
+    return smat, match_prob, rand_prob
+
+
+def all_pairs(n) -> List[Tuple[int, int]]:
+    """All ordered pairs of n objects, ignoring self pairs."""
+    return [(i, j) for i in range(n) for j in range(n) if i != j]
+
+
+def compute_scoring_matrix(project_id, user_id, matching_sample,
+        random_sample, distbreaks=NblastConfigDefaultDistanceBreaks,
+        dotbreaks=NblastConfigDefaultDotBreaks, resample_step=1000,
+        tangent_neighbors=5, omit_failures=True, resample_by=1e3,
+        use_http=False) -> Dict[str, Any]:
+    """Create NBLAST scoring matrix for a set of matching skeleton IDs and a set
+    of random skeleton IDs, like catmaid.control.nat.r.compute_scoring_matrix().
+    Matching skeletons are skeletons with a similar morphology, e.g. KCy in
+    FAFB. Matching point sets and point clouds are added to the matching set.
+    If the matching sample defines subsets, only pairs within each subset are
+    used as matching pairs. Otherwise all pairs are compared.
+    """
+    similarity = None
+    matching_histogram = None
+    random_histogram = None
+    matching_probability = None
+    random_probability = None
+    errors = []
+    try:
+        logger.debug('Computing matching object stats')
+        matching_parts = [get_dotprops(project_id, 'skeleton',
+                matching_sample.sample_neurons, tangent_neighbors, resample_by,
+                use_cache=False)]
+        matching_keys = [str(oid) for oid in matching_parts[0].object_ids]
+        if matching_sample.sample_pointsets:
+            pointset_dps = pointset_dotprops(matching_sample.sample_pointsets,
+                    tangent_neighbors)
+            matching_parts.append(pointset_dps)
+            matching_keys.extend(f'pointset-{oid}' for oid in pointset_dps.object_ids)
+        if matching_sample.sample_pointclouds:
+            pointcloud_dps = pointcloud_dotprops(matching_sample.sample_pointclouds,
+                    tangent_neighbors)
+            matching_parts.append(pointcloud_dps)
+            matching_keys.extend(f'pointcloud-{oid}' for oid in pointcloud_dps.object_ids)
+        matching_dps = DotpropsList.concat(matching_parts)
+        matching_dps = DotpropsList(matching_keys, matching_dps.offsets,
+                matching_dps.points, matching_dps.vectors, matching_dps.alphas)
+
+        # Matches are provided as subsets of objects that are similar to each
+        # other (within each set).
+        if matching_sample.subset:
+            match_pairs = []
+            for subset in matching_sample.subset:
+                keys = []
+                for elem_type, elem_key in subset:
+                    if elem_type == 1:
+                        keys.append(f'pointset-{elem_key}')
+                    elif elem_type == 2:
+                        keys.append(f'pointcloud-{elem_key}')
+                    else:
+                        keys.append(str(elem_key))
+                indices = [matching_dps.index(k) for k in keys if k in matching_dps]
+                for a in range(len(indices)):
+                    for b in range(a + 1, len(indices)):
+                        match_pairs.append((indices[a], indices[b]))
+            logger.debug(f'Found {len(match_pairs)} subset pairs')
+        else:
+            match_pairs = all_pairs(len(matching_dps))
+
+        logger.debug('Computing random object stats')
+        random_dps = get_dotprops(project_id, 'skeleton',
+                random_sample.sample_neurons, tangent_neighbors, resample_by,
+                use_cache=False)
+
+        logger.debug('Computing matching and random distributions')
+        match_hist = pair_histogram(matching_dps, match_pairs, distbreaks, dotbreaks)
+        rand_hist = pair_histogram(random_dps, all_pairs(len(random_dps)),
+                distbreaks, dotbreaks)
+
+        logger.debug('Computing scoring matrix')
+        smat, match_prob, rand_prob = scoring_matrix(match_hist, rand_hist)
+
+        similarity = smat.tolist()
+        matching_histogram = match_hist.tolist()
+        random_histogram = rand_hist.tolist()
+        matching_probability = match_prob.tolist()
+        random_probability = rand_prob.tolist()
+
+    except (IOError, OSError, ValueError) as e:
+        errors.append(str(e))
+
+    return {
+        "errors": errors,
+        "similarity": similarity,
+        "matching_histogram": matching_histogram,
+        "random_histogram": random_histogram,
+        "matching_probability": matching_probability,
+        "random_probability": random_probability
+    }
@@ -19,6 +19,7 @@ from django.http import HttpRequest, HttpResponse, JsonResponse
 from catmaid.apps import get_system_user
 from catmaid.control.common import get_request_bool, urljoin
 from catmaid.control.authentication import requires_user_role
+from catmaid.control.nat.nblast import DotpropsList, update_dotprops_cache
 from catmaid.models import (Message, User, UserRole, NblastConfig,
         NblastConfigDefaultDistanceBreaks, NblastConfigDefaultDotBreaks,
         PointCloud, PointSet)
@@ -546,30 +547,88 @@ def get_cache_file_name(project_id, object_type, simplification=10) -> str:
     else:
         raise ValueError(f"Unsupported object type: {object_type}")
 
-    return "r-dps-cache-project-{project_id}-{object_type}{extra}.rda".format(**{
+    return "r-dps-cache-project-{project_id}-{object_type}{extra}".format(**{
         'project_id': project_id,
         'object_type': object_type,
         'extra': extra,
     })
 
 
-def get_cached_dps_data(project_id, object_type, simplification=10):
-    """Return the loaded R object for cache file of a particular <object_type>
+def dotprops_from_r(objects_dps) -> DotpropsList:
+    """Copy the points, tangent vectors and alpha values of a R neuronlist of
+    dotprops objects with object IDs as names into a DotpropsList.
+    """
+    base = importr('base')
+    names = list(base.names(objects_dps))
+    objects = []
+    for i in range(len(objects_dps)):
+        dps = objects_dps[i]
+        objects.append((
+            numpy.asarray(dps.rx2('points'), dtype=numpy.float64).reshape(-1, 3),
+            numpy.asarray(dps.rx2('vect'), dtype=numpy.float64).reshape(-1, 3),
+            numpy.asarray(dps.rx2('alpha'), dtype=numpy.float64).reshape(-1),
+        ))
+
+    return DotpropsList.from_objects(list(map(int, names)), objects)
+
+
+def dotprops_to_r(dotprops:DotpropsList, k):
+    """Create a R neuronlist of dotprops objects from a DotpropsList, named by
+    object ID. Only the selected objects are read from memory mapped lists.
+    """
+    as_dotprops_list = robjects.r('''
+        function(points, vect, alpha, offsets, names, k) {
+          colnames(points) <- c("X", "Y", "Z")
+          colnames(vect) <- NULL
+          objects <- lapply(seq_along(names), function(i) {
+            r <- seq_len(offsets[i + 1] - offsets[i]) + offsets[i]
+            dps <- list(points=points[r, , drop=FALSE], alpha=alpha[r],
+                        vect=vect[r, , drop=FALSE])
+            attr(dps, "k") <- k
+            class(dps) <- c("dotprops", "list")
+            dps
+          })
+          names(objects) <- names
+          nat::as.neuronlist(objects)
+        }
+    ''')
+    Matrix = robjects.r.matrix
+    n_points = len(dotprops.points)
+    points = Matrix(rinterface.FloatSexpVector(
+            numpy.asarray(dotprops.points).ravel().tolist()), nrow=n_points, byrow=True)
+    vect = Matrix(rinterface.FloatSexpVector(
+            numpy.asarray(dotprops.vectors).ravel().tolist()), nrow=n_points, byrow=True)
+    alpha = rinterface.FloatSexpVector(numpy.asarray(dotprops.alphas).tolist())
+    offsets = rinterface.IntSexpVector(dotprops.offsets.tolist())
+    names = rinterface.StrSexpVector(list(map(str, dotprops.object_ids)))
+
+    return as_dotprops_list(points, vect, alpha, offsets, names, k)
+
+
+def get_cached_dps_data(project_id, object_type, simplification=10,
+        object_ids=None):
+    """Return R dotprops from the cache of a particular <object_type>
     (skeleton, pointcloud, pointset), if available. If not, None is returned.
+    The cache is memory mapped and if <object_ids> are passed in, only these
+    objects are read and returned.
     """
     cache_file = get_cache_file_name(project_id, object_type, simplification)
     cache_path = os.path.join(settings.MEDIA_ROOT, settings.MEDIA_CACHE_SUBDIRECTORY, cache_file)
     if not os.path.exists(cache_path) \
             or not os.access(cache_path, os.R_OK ) \
-            or not os.path.isfile(cache_path):
+            or not os.path.isdir(cache_path):
         return None
 
     try:
-        base = importr('base')
-        object_dps_cache = base.readRDS(cache_path)
-
-        return object_dps_cache
-    except RRuntimeError:
+        object_dps_cache, meta = DotpropsList.load(cache_path)
+        if object_ids is not None:
+            object_dps_cache = object_dps_cache.subset(object_ids)
+        if len(object_dps_cache) == 0:
+            return None
+
+        return dotprops_to_r(object_dps_cache, meta.get('tangent_neighbors', 20))
+    except (IOError, OSError, ValueError, RRuntimeError) as e:
+        logger.warning(f'Could not read dotprops cache {cache_path}: {e}')
         return None
 
 
@@ -594,9 +653,12 @@ def get_catmaid_connection(user_id):
 def create_dps_data_cache(project_id, object_type, tangent_neighbors=20,
         parallel=True, detail=10, omit_failures=True, min_nodes=500,
         min_soma_nodes=20, soma_tags=('soma'), resample_by=1e3,
-        use_http=False, progress=False) -> None:
+        use_http=False, progress=False, incremental=False) -> None:
     """Create a new cache file for a particular project object type and
-    detail level. All objects of a type in a project are prepared.
+    detail level. All objects of a type in a project are prepared. With
+    <incremental>, only objects that were added or edited since the existing
+    cache was created are computed and objects that don't exist anymore are
+    removed from it.
     """
     # A circular dependency would be the result of a top level import
     from catmaid.control.similarity import get_all_object_ids
@@ -608,6 +670,11 @@ def create_dps_data_cache(project_id, object_type, tangent_neighbors=20,
         raise ValueError(f"Can not access cache directory: {cache_dir}")
     if os.path.exists(cache_path) and not os.access(cache_path, os.W_OK):
         raise ValueError(f"Can not access cache file for writing: {cache_path}")
+    cache_meta = {
+        'tangent_neighbors': tangent_neighbors,
+        'resample_by': resample_by,
+        'detail': detail,
+    }
 
     timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
 
@@ -634,77 +701,79 @@ def create_dps_data_cache(project_id, object_type, tangent_neighbors=20,
 
         conn = get_catmaid_connection(user.id) if use_http else None
 
-        logger.debug(f'Fetching {len(object_ids)} skeletons')
-        # Note: scaling down to um
-        objects = neuronlist_for_skeletons(project_id, object_ids, omit_failures,
-                progress=progress, scale=nm_to_um, conn=conn)
-
-        # Simplify
-        if detail > 0:
-            logger.debug('Simplifying skeletons')
-            simplified_objects = robjects.r.nlapply(objects, relmr.simplify_neuron, **{
-                'n': detail,
-                'OmitFailures': omit_failures,
-                '.parallel': parallel,
-            })
-            # Make sure unneeded R objects are deleted
-            del(objects)
-            gc.collect()
-            objects = simplified_objects
-
-        logger.debug('Computing skeleton stats')
-        print('Computing skeleton stats')
-        objects_dps = rnat.dotprops(objects, **{
-                    'k': tangent_neighbors,
-                    'resample': resample_by * nm_to_um,
-                    '.progress': 'text' if progress else 'none',
+        def compute(object_ids):
+            logger.debug(f'Fetching {len(object_ids)} skeletons')
+            # Note: scaling down to um
+            objects = neuronlist_for_skeletons(project_id, object_ids, omit_failures,
+                    progress=progress, scale=nm_to_um, conn=conn)
+
+            # Simplify
+            if detail > 0:
+                logger.debug('Simplifying skeletons')
+                simplified_objects = robjects.r.nlapply(objects, relmr.simplify_neuron, **{
+                    'n': detail,
                     'OmitFailures': omit_failures,
+                    '.parallel': parallel,
                 })
+                # Make sure unneeded R objects are deleted
+                del(objects)
+                gc.collect()
+                objects = simplified_objects
+
+            logger.debug('Computing skeleton stats')
+            print('Computing skeleton stats')
+            objects_dps = rnat.dotprops(objects, **{
+                        'k': tangent_neighbors,
+                        'resample': resample_by * nm_to_um,
+                        '.progress': 'text' if progress else 'none',
+                        'OmitFailures': omit_failures,
+                    })
 
-        del(objects)
+            del(objects)
 
-        # Save cache to disk
-        logger.debug(f'Storing skeleton cache with {len(objects_dps)} entries: {cache_path}')
-        base.saveRDS(objects_dps, **{
-            'file': cache_path,
-        })
+            return dotprops_from_r(objects_dps)
     elif object_type == 'pointcloud':
         # The system user is superuser and should have access to all pointclouds
         object_ids = get_all_object_ids(project_id, user.id, object_type)
         if not object_ids:
             logger.info("No pointclouds found to populate cache from")
             return
-        logger.debug(f'Fetching {len(object_ids)} query point clouds')
-        pointclouds = []
-        for pcid in object_ids:
-            target_pointcloud = PointCloud.objects.prefetch_related('points').get(pk=pcid)
-            points_flat = list(chain.from_iterable(
-                    (p.location_x, p.location_y, p.location_z)
-                    for p in target_pointcloud.points.all()))
-            n_points = len(points_flat) / 3
-            point_data = Matrix(rinterface.FloatSexpVector(points_flat),
-                    nrow=n_points, byrow=True)
-            pointclouds.append(point_data)
-
-        objects = rnat.as_neuronlist(pointclouds)
-        effective_object_ids = list(map(
-                lambda x: str(x), object_ids))
-        objects.names = rinterface.StrSexpVector(effective_object_ids)
-
-        logger.debug('Computing query pointcloud stats')
-        objects_dps = rnat.dotprops(objects.ro * nm_to_um, **{
-                    'k': tangent_neighbors,
-                    'resample': resample_by * nm_to_um,
-                    '.progress': 'none',
-                    'OmitFailures': omit_failures,
-                })
-        # Save
-        base.saveRDS(objects_dps, **{
-            'file': cache_path,
-        })
+
+        def compute(object_ids):
+            logger.debug(f'Fetching {len(object_ids)} query point clouds')
+            pointclouds = []
+            for pcid in object_ids:
+                target_pointcloud = PointCloud.objects.prefetch_related('points').get(pk=pcid)
+                points_flat = list(chain.from_iterable(
+                        (p.location_x, p.location_y, p.location_z)
+                        for p in target_pointcloud.points.all()))
+                n_points = len(points_flat) / 3
+                point_data = Matrix(rinterface.FloatSexpVector(points_flat),
+                        nrow=n_points, byrow=True)
+                pointclouds.append(point_data)
+
+            objects = rnat.as_neuronlist(pointclouds)
+            effective_object_ids = list(map(
+                    lambda x: str(x), object_ids))
+            objects.names = rinterface.StrSexpVector(effective_object_ids)
+
+            logger.debug('Computing query pointcloud stats')
+            objects_dps = rnat.dotprops(objects.ro * nm_to_um, **{
+                        'k': tangent_neighbors,
+                        'resample': resample_by * nm_to_um,
+                        '.progress': 'none',
+                        'OmitFailures': omit_failures,
+                    })
+
+            return dotprops_from_r(objects_dps)
     else:
         raise ValueError(f'Unsupported object type: {object_type}')
 
+    # Save cache to disk, only stale objects are computed in incremental mode.
+    dotprops = update_dotprops_cache(cache_path, project_id, object_type,
+            object_ids, compute, cache_meta, incremental)
+    logger.debug(f'Stored {object_type} cache with {len(dotprops)} entries: {cache_path}')
+
 
 def nblast(project_id, user_id, config_id, query_object_ids, target_object_ids,
         query_type='skeleton', target_type='skeleton', omit_failures=True,
@@ -798,19 +867,32 @@ def nblast(project_id, user_id, config_id, query_object_ids, target_object_ids,
         pointcloud_cache = None
         pointset_cache = None
         if use_cache:
+            # Only the objects compared in this job are read from the memory
+            # mapped caches.
+            def cached_object_ids(object_type):
+                object_ids = []
+                if query_type == object_type:
+                    object_ids.extend(query_object_ids)
+                if target_type == object_type:
+                    object_ids.extend(target_object_ids)
+                return list(set(object_ids))
+
             object_types = (query_type, target_type)
             if 'skeleton' in object_types:
-                # Check if skeleton cache file with R DPS dotprops exists and
-                # load it, if available.
-                skeleton_cache = get_cached_dps_data(project_id, 'skeleton')
+                # Check if skeleton cache with dotprops exists and load the
+                # needed objects, if available.
+                skeleton_cache = get_cached_dps_data(project_id, 'skeleton',
+                        object_ids=cached_object_ids('skeleton'))
             if 'pointcloud' in object_types:
-                # Check if pointcloud cache file with R DPS dotprops exists and
-                # load it, if available.
-                pointcloud_cache = get_cached_dps_data(project_id, 'pointcloud')
+                # Check if pointcloud cache with dotprops exists and load the
+                # needed objects, if available.
+                pointcloud_cache = get_cached_dps_data(project_id, 'pointcloud',
+                        object_ids=cached_object_ids('pointcloud'))
             if 'pointset' in object_types:
-                # Check if pointcloud cache file with R DPS dotprops exists and
-                # load it, if available.
-                pointset_cache = get_cached_dps_data(project_id, 'pointset')
+                # Check if pointset cache with dotprops exists and load the
+                # needed objects, if available.
+                pointset_cache = get_cached_dps_data(project_id, 'pointset',
+                        object_ids=cached_object_ids('pointset'))
 
         # Query objects
         if query_type == 'skeleton':
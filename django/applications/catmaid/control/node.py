@@ -2,22 +2,30 @@
 
 from abc import ABCMeta
 from aggdraw import Draw, Pen, Brush, Font
-from collections import defaultdict
+import asyncio
+from collections import defaultdict, OrderedDict
 from concurrent import futures
 import copy
 import json
+import logging
 import math
 import msgpack
+import numpy as np
+import os
 from PIL import Image, ImageDraw
 import progressbar
 import psycopg2.extras
+from scipy.spatial import cKDTree
 import struct
+import threading
+import time
 from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple, Union
 import ujson
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.conf import settings
-from django.db import connection, connections
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection, connections
 from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
@@ -31,8 +39,11 @@ from catmaid.control.authentication import requires_user_role, \
         can_edit_all_or_fail
 from catmaid.control.common import (batches, get_relation_to_id_map,
         get_request_bool, get_request_list)
+from catmaid.control.tree_util import get_skeleton_arbor
+from catmaid.util import Point3D, is_collinear
 
 
+logger = logging.getLogger(__name__)
 
 ORIENTATIONS = {
     'xy': 0,
@@ -43,6 +54,7 @@ ORIENTATIONS = {
 class BasicNodeProvider(object):
 
     def __init__(self, *args, **kwargs):
+        self.options = kwargs
         self.enabled = kwargs.get('enabled', True)
         self.project_id = kwargs.get('project_id')
         self.orientation = kwargs.get('orientation')
@@ -52,10 +64,23 @@ class BasicNodeProvider(object):
         self.max_width = kwargs.get('max_width')
         self.max_height = kwargs.get('max_height')
         self.max_depth = kwargs.get('max_depth')
+        memory_cache_options = kwargs.get('memory_cache')
+        self.memory_cache = get_node_query_memory_cache(memory_cache_options) \
+                if memory_cache_options else None
+
+    # Whether results of a larger bounding box can be cropped to the query
+    # bounding box with edge_intersects().
+    croppable = False
 
     def prepare_db_statements(self, connection:Any):
         pass
 
+    def edge_intersects(self, params, a, b) -> bool:
+        """Whether the spatial query of this provider for the bounding box in
+        <params> matches the edge between the points <a> and <b>.
+        """
+        raise NotImplementedError()
+
     def matches(self, params) -> bool:
         matches = True
         if not self.enabled:
@@ -84,10 +109,434 @@ class BasicNodeProvider(object):
     def get_tuples(self, params, project_id, explicit_treenode_ids,
                 explicit_connector_ids, include_labels, with_relation_map,
                 with_origin) -> Tuple[Any, Optional[str]]:
+        if self.memory_cache:
+            return self.memory_cache.get_tuples(self, params, project_id,
+                    explicit_treenode_ids, explicit_connector_ids,
+                    include_labels, with_relation_map, with_origin)
         return _node_list_tuples_query(params, project_id,
                 self, explicit_treenode_ids, explicit_connector_ids,
                 include_labels, with_relation_map, with_origin=with_origin), 'json'
 
+    def get_columns(self, params, project_id, explicit_treenode_ids,
+                explicit_connector_ids, include_labels, with_relation_map,
+                with_origin) -> Tuple[Any, Optional[str]]:
+        """Return node data in the columnar format. Node providers that can't
+        produce this format natively, return their regular tuple result, which
+        is converted by create_node_response().
+        """
+        return self.get_tuples(params, project_id, explicit_treenode_ids,
+                explicit_connector_ids, include_labels, with_relation_map,
+                with_origin)
+
+
+class NodeQueryMemoryCache(object):
+    """A size limited in-memory LRU cache for node query results of a single
+    process. Results are stored as msgpack data and are keyed by node
+    provider, project, quantized bounding box, LOD and filter parameters. The
+    query bounding box is expanded to multiples of the configured quantization
+    so that similar views share the same entry, and the result is cropped to
+    the requested bounding box. If the node limit is reached for the expanded
+    bounding box, the result would differ from the one of the requested
+    bounding box and the requested bounding box is queried and cached instead.
+    This is also the case if the provider's spatial filter isn't known or the
+    result depends on other nodes in the bounding box.
+
+    Entries are invalidated based on the "catmaid.spatial-update" events the
+    database emits if SPATIAL_UPDATE_NOTIFICATIONS is enabled. These are read
+    from a separate listening connection before each lookup. Additionally, a
+    maximum age for entries can be set, which is required if events aren't
+    available. Label changes don't emit events, which is why queries that
+    include labels aren't cached.
+    """
+
+    # Filter parameters that influence the query result
+    KEY_PARAMS = ('limit', 'n_largest_skeletons_limit',
+            'n_last_edited_skeletons_limit', 'hidden_last_editor_id',
+            'min_skeleton_length', 'min_skeleton_nodes', 'ordering', 'lod',
+            'lod_type')
+
+    notify_channel = 'catmaid.spatial-update'
+
+    def __init__(self, max_size=256 * 1024 * 1024, max_entries=None,
+            quantization=(2048, 2048, None), max_age=None, listen=True):
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.quantization = quantization
+        self.max_age = max_age
+        self.listen = listen and getattr(settings,
+                'SPATIAL_UPDATE_NOTIFICATIONS', False)
+
+        if not self.listen and max_age is None:
+            raise ImproperlyConfigured('The node query memory cache needs '
+                    'either SPATIAL_UPDATE_NOTIFICATIONS = True or a max_age')
+
+        # Maps keys to (project_id, bounding box, creation time, data) tuples.
+        self.entries:OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Incremented for a project with each processed spatial update
+        self.project_generation:DefaultDict[Any, int] = defaultdict(int)
+
+        self.lock = threading.RLock()
+        self.listen_connection = None
+        self.listen_pid = None
+
+    def quantize(self, params) -> Dict[str, Any]:
+        """Return a copy of the passed in query parameters with the bounding
+        box expanded to the next multiples of the quantization values.
+        """
+        quantized = copy.copy(params)
+        for dim, (low, high) in enumerate((('left', 'right'), ('top', 'bottom'),
+                ('z1', 'z2'))):
+            q = self.quantization[dim]
+            if q:
+                quantized[low] = math.floor(params[low] / q) * q
+                quantized[high] = math.ceil(params[high] / q) * q
+                if quantized[high] == quantized[low]:
+                    quantized[high] += q
+        return quantized
+
+    def make_key(self, provider, project_id, params, include_labels,
+            with_relation_map, with_origin, quantized) -> Tuple:
+        options = tuple(sorted((k, repr(v)) for k, v in provider.options.items()))
+        return (type(provider).__name__, options, project_id,
+                params['left'], params['top'], params['z1'],
+                params['right'], params['bottom'], params['z2'],
+                tuple(params.get(k) for k in self.KEY_PARAMS),
+                bool(include_labels), with_relation_map, bool(with_origin),
+                quantized)
+
+    def get(self, key, default=None) -> Optional[bytes]:
+        """Return the data of an entry or the passed in default value if
+        there is no valid entry for the key."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if self.max_age is not None and \
+                    time.time() - entry[2] > self.max_age:
+                self._remove(key)
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key, project_id, bb, data) -> None:
+        """Store the passed in data for a key. Data can be None to record
+        that there is no cacheable result for this key."""
+        size = len(data) if data else 0
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if self.max_size and size > self.max_size:
+                return
+            self.entries[key] = (project_id, bb, time.time(), data)
+            self.size += size
+            # Evict least recently used entries
+            while self.entries and ((self.max_size and self.size > self.max_size) or \
+                    (self.max_entries and len(self.entries) > self.max_entries)):
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key) -> None:
+        entry = self.entries.pop(key)
+        if entry[3]:
+            self.size -= len(entry[3])
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def invalidate(self, project_id, bb_min, bb_max) -> int:
+        """Remove all entries of a project with a bounding box that intersects
+        with the passed in bounding box. Returns the number of removed entries.
+        """
+        with self.lock:
+            self.project_generation[project_id] += 1
+            to_remove = [k for k, e in self.entries.items()
+                    if e[0] == project_id and
+                    e[1][0][0] <= bb_max[0] and e[1][1][0] >= bb_min[0] and
+                    e[1][0][1] <= bb_max[1] and e[1][1][1] >= bb_min[1] and
+                    e[1][0][2] <= bb_max[2] and e[1][1][2] >= bb_min[2]]
+            for k in to_remove:
+                self._remove(k)
+            self.invalidations += len(to_remove)
+            return len(to_remove)
+
+    def handle_spatial_update(self, data) -> None:
+        """Invalidate entries based on a parsed "catmaid.spatial-update" event
+        payload, which is either of type edge, edges, point or box.
+        """
+        project_id = data.get('project_id')
+        data_type = data.get('type')
+        if data_type == 'edge':
+            points = [data['p1'], data['p2']]
+        elif data_type == 'edges':
+            points = [p for edge in data['edges'] for p in edge]
+        elif data_type == 'point':
+            points = [data['p']]
+        elif data_type == 'box':
+            points = [data['min'], data['max']]
+        else:
+            logger.warning(f"Unknown spatial update type: {data_type}")
+            return
+        bb_min = [min(p[dim] for p in points) for dim in range(3)]
+        bb_max = [max(p[dim] for p in points) for dim in range(3)]
+        self.invalidate(project_id, bb_min, bb_max)
+
+    def get_listen_connection(self):
+        # Connections can't be shared with forked processes
+        if self.listen_connection is None or self.listen_pid != os.getpid():
+            db = connections['default']
+            listen_connection = db.get_new_connection(db.get_connection_params())
+            listen_connection.autocommit = True
+            with listen_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.notify_channel}"')
+            self.listen_connection = listen_connection
+            self.listen_pid = os.getpid()
+            # Updates might have been missed before
+            self.clear()
+        return self.listen_connection
+
+    def process_spatial_updates(self) -> None:
+        """Read all pending spatial update events without blocking and
+        invalidate the affected entries. If the event connection fails, the
+        whole cache is cleared, because events might have been lost.
+        """
+        if not self.listen:
+            return
+        try:
+            listen_connection = self.get_listen_connection()
+            listen_connection.poll()
+            notifies = listen_connection.notifies
+            while notifies:
+                n = notifies.pop(0)
+                if n.channel != self.notify_channel:
+                    continue
+                try:
+                    self.handle_spatial_update(json.loads(n.payload))
+                except (ValueError, KeyError, TypeError, IndexError):
+                    logger.warning(f'Could not parse spatial update: {n.payload}')
+        except psycopg2.Error as e:
+            logger.warning(f'Could not read spatial updates, clearing node query memory cache: {e}')
+            self.listen_connection = None
+            self.clear()
+
+    def query(self, key, provider, params, project_id, with_relation_map,
+            with_origin, allow_limit) -> Optional[bytes]:
+        """Query and cache the msgpack encoded result of the passed in
+        provider and bounding box. If allow_limit is false and the node limit
+        is reached, None is cached and returned.
+        """
+        generation = self.project_generation[project_id]
+        result = _node_list_tuples_query(copy.copy(params), project_id,
+                provider, with_relation_map=with_relation_map,
+                with_origin=with_origin)
+        # The fourth element is the node_limit_reached flag.
+        tuples = msgpack.packb(result) if allow_limit or not result[3] else None
+        # Don't store results that might have been affected by changes
+        # during the query.
+        self.process_spatial_updates()
+        if generation == self.project_generation[project_id]:
+            bb = ((params['left'], params['top'], params['z1']),
+                    (params['right'], params['bottom'], params['z2']))
+            self.put(key, project_id, bb, tuples)
+        return tuples
+
+    def crop(self, provider, data, params, with_relation_map) -> Optional[bytes]:
+        """Crop a msgpack encoded query result of a larger bounding box to the
+        nodes and links the passed in provider returns for the bounding box in
+        <params>. Returns None if linked nodes are missing in the result.
+        """
+        result = msgpack.unpackb(data, raw=False, strict_map_key=False)
+        locations = {t[0]: t[2:5] for t in result[0]}
+
+        # Edges of the result's treenodes whose parent is not part of the
+        # result don't intersect with the larger bounding box either.
+        treenode_ids = set()
+        for t in result[0]:
+            parent_location = locations.get(t[0] if t[1] is None else t[1])
+            if parent_location and provider.edge_intersects(params,
+                    t[2:5], parent_location):
+                treenode_ids.add(t[0])
+                if t[1] is not None:
+                    treenode_ids.add(t[1])
+
+        # Linked treenodes are always part of the result.
+        connectors = []
+        used_relations:Set = set()
+        for c in result[1]:
+            links = []
+            for link in c[7]:
+                treenode_location = locations.get(link[0])
+                if not treenode_location:
+                    return None
+                if provider.edge_intersects(params, treenode_location, c[1:4]):
+                    links.append(link)
+            if links or provider.edge_intersects(params, c[1:4], c[1:4]):
+                connectors.append(c[:7] + [links])
+                treenode_ids.update(link[0] for link in links)
+                used_relations.update(link[1] for link in links)
+
+        treenodes = [t for t in result[0] if t[0] in treenode_ids]
+        relation_map = result[4]
+        if with_relation_map == 'used':
+            relation_map = {r: name for r, name in relation_map.items()
+                    if r in used_relations}
+
+        return msgpack.packb([treenodes, connectors, result[2],
+                len(treenodes) == params['limit'], relation_map] + result[5:])
+
+    def get_tuples(self, provider, params, project_id, explicit_treenode_ids,
+            explicit_connector_ids, include_labels, with_relation_map,
+            with_origin) -> Tuple[Any, Optional[str]]:
+        """Return the msgpack encoded query result of the passed in provider
+        for a quantized version of the query bounding box, cropped to the
+        query bounding box. If the node limit is reached in the quantized
+        bounding box or the result can't be cropped, the result for the
+        original bounding box is returned. Explicitly requested nodes are
+        queried separately and added as extra nodes. Queries that include
+        labels aren't cached.
+        """
+        if include_labels:
+            return _node_list_tuples_query(params, project_id, provider,
+                    explicit_treenode_ids, explicit_connector_ids,
+                    include_labels, with_relation_map,
+                    with_origin=with_origin), 'json'
+
+        self.process_spatial_updates()
+
+        missing = object()
+        tuples:Any = missing
+        cache_params = self.quantize(params)
+        quantized_key = self.make_key(provider, project_id, cache_params,
+                include_labels, with_relation_map, with_origin, True)
+        key = self.make_key(provider, project_id, params, include_labels,
+                with_relation_map, with_origin, False)
+        # Skeleton origins and the skeleton limits depend on the other nodes
+        # in the bounding box.
+        croppable = provider.croppable and not with_origin and \
+                not params.get('n_largest_skeletons_limit') and \
+                not params.get('n_last_edited_skeletons_limit')
+        if croppable and any(cache_params[k] != params[k] for k in ('left',
+                'top', 'z1', 'right', 'bottom', 'z2')):
+            tuples = self.get(quantized_key, missing)
+            if tuples is missing:
+                tuples = self.query(quantized_key, provider, cache_params,
+                        project_id, with_relation_map, with_origin, False)
+            if tuples is not None:
+                tuples = self.crop(provider, tuples, params, with_relation_map)
+
+        # The quantized bounding box can't be used if it reaches the node
+        # limit, which is marked with None.
+        if tuples is missing or tuples is None:
+            tuples = self.get(key, missing)
+            if tuples is missing:
+                tuples = self.query(key, provider, params, project_id,
+                        with_relation_map, with_origin, True)
+
+        if explicit_treenode_ids or explicit_connector_ids:
+            extra_tuples, extra_type = get_extra_nodes(params, project_id,
+                explicit_treenode_ids, explicit_connector_ids, include_labels,
+                with_relation_map, with_origin)
+            if extra_type != 'json':
+                raise ValueError("Unexpected type")
+            tuples = add_msgpack_extra_tuples(tuples, [extra_tuples])
+
+        return tuples, 'msgpack'
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+
+# Memory caches of this process, keyed by their configuration.
+_node_query_memory_caches:Dict[str, NodeQueryMemoryCache] = {}
+
+
+def get_node_query_memory_cache(options) -> NodeQueryMemoryCache:
+    """Get the node query memory cache for the passed in configuration. Node
+    providers with the same configuration share a cache. Setting options to
+    True uses the default configuration.
+    """
+    if options is True:
+        options = {}
+    cache_key = repr(sorted(options.items()))
+    cache = _node_query_memory_caches.get(cache_key)
+    if not cache:
+        cache = NodeQueryMemoryCache(**options)
+        _node_query_memory_caches[cache_key] = cache
+    return cache
+
+
+def edge_intersects_section(params, a, b) -> bool:
+    """Whether the edge between the points <a> and <b> intersects with the XY
+    bounding box in <params> and is not farther away from the rectangle of this
+    bounding box at the center of its Z range than half its depth, which are
+    the spatial filters of the PostGIS node queries.
+    """
+    left, top, right, bottom = params['left'], params['top'], \
+            params['right'], params['bottom']
+    if min(a[0], b[0]) > right or max(a[0], b[0]) < left or \
+            min(a[1], b[1]) > bottom or max(a[1], b[1]) < top:
+        return False
+
+    halfz = params['z1'] + (params['z2'] - params['z1']) * 0.5
+    halfzdiff = abs(params['z2'] - params['z1']) * 0.5
+    d = [b[i] - a[i] for i in range(3)]
+
+    # The squared distance to the rectangle is a quadratic function of the
+    # position t on the edge between the points at which the edge crosses the
+    # rectangle's borders in X or Y.
+    breaks = [0.0, 1.0]
+    for dim, low, high in ((0, left, right), (1, top, bottom)):
+        if d[dim]:
+            breaks.extend(t for t in ((low - a[dim]) / d[dim],
+                    (high - a[dim]) / d[dim]) if 0.0 < t < 1.0)
+    breaks.sort()
+
+    for t0, t1 in zip(breaks[:-1], breaks[1:]):
+        # Each component of the distance vector is of the form c + k * t
+        tm = (t0 + t1) * 0.5
+        terms = [(a[2] - halfz, d[2])]
+        for dim, low, high in ((0, left, right), (1, top, bottom)):
+            v = a[dim] + d[dim] * tm
+            if v < low:
+                terms.append((low - a[dim], -d[dim]))
+            elif v > high:
+                terms.append((a[dim] - high, d[dim]))
+        kk = sum(k * k for _, k in terms)
+        t = min(max(-sum(c * k for c, k in terms) / kk, t0), t1) if kk else t0
+        if sum((c + k * t) ** 2 for c, k in terms) <= halfzdiff * halfzdiff:
+            return True
+    return False
+
+
+def add_msgpack_extra_tuples(tuples, extra_tuples) -> bytes:
+    """Add the passed in list of extra data to msgpack encoded node query
+    result data.
+    """
+    if tuples[0:1] == b'\x95':
+        # A five element list can just be extended to a six element list with
+        # the extra data list appended.
+        return b'\x96' + tuples[1:] + msgpack.packb(extra_tuples)
+    elif tuples[0:1] == b'\x96':
+        result = msgpack.unpackb(tuples, raw=False, strict_map_key=False)
+        result[5].extend(extra_tuples)
+        return msgpack.packb(result)
+    else:
+        raise ValueError("Unexpected Msgpack tuple format")
+
 
 def get_extra_nodes(params, project_id, explicit_treenode_ids,
         explicit_connector_ids, include_labels, with_relation_map, with_origin):
@@ -325,7 +774,8 @@ class GridCachedNodeProvider(CachedNodeProvider):
         psycopg2.extras.register_default_jsonb(loads=ujson.loads)
         # Find grid that has a cell configuration closest to what we are looking for.
         cursor.execute("""
-            SELECT id, cell_width, cell_height, cell_depth, n_lod_levels
+            SELECT id, cell_width, cell_height, cell_depth, n_lod_levels,
+                lod_strategy
             FROM node_grid_cache g
             WHERE project_id = %(project_id)s
             ORDER BY @((g.cell_width::double precision * g.cell_height::double precision * g.cell_depth::double precision) - %(volume)s::double precision) ASC
@@ -336,8 +786,9 @@ class GridCachedNodeProvider(CachedNodeProvider):
         if not grid_data:
             return None, None
 
-        grid_id, cell_width, cell_height, cell_depth, lod_levels = grid_data[0], \
-                grid_data[1], grid_data[2], grid_data[3], grid_data[4]
+        grid_id, cell_width, cell_height, cell_depth, lod_levels, lod_strategy = \
+                grid_data[0], grid_data[1], grid_data[2], grid_data[3], \
+                grid_data[4], grid_data[5]
 
         min_w_i = int(params['left'] // cell_width)
         min_h_i = int(params['top'] // cell_height)
@@ -362,7 +813,7 @@ class GridCachedNodeProvider(CachedNodeProvider):
                 lod = 1.0
             else:
                 lod = max(0.0, min(1.0, float(lod)))
-            lod_max = max(1.0, int(lod * lod_levels))
+            lod_max = max(1, int(lod * lod_levels))
         elif lod_type == 'absolute':
             if lod == 'max' or lod in (0, '0'):
                 lod_max = lod_levels
@@ -371,6 +822,11 @@ class GridCachedNodeProvider(CachedNodeProvider):
         else:
             raise ValueError(f"Unknown LOD type: {lod_type}")
 
+        # Each LOD level of a topology preserving grid is a complete result
+        # on its own.
+        if lod_strategy == 'topology':
+            lod_min = lod_max
+
         # Do the actual grid cell lookup in a separate query, to only use
         # constant values in the index checks. The Z index condition is slightly
         # special, because the parameter is exclusive
@@ -519,6 +975,18 @@ class PostgisNodeProvider(BasicNodeProvider, metaclass=ABCMeta):
         if connection and not settings.PREPARED_STATEMENTS:
             self.prepare_db_statements(connection)
 
+    def get_columns(self, params, project_id, explicit_treenode_ids,
+                explicit_connector_ids, include_labels, with_relation_map,
+                with_origin) -> Tuple[Any, Optional[str]]:
+        # Memory cached results are only available in the tuple format.
+        if self.memory_cache:
+            return self.get_tuples(params, project_id, explicit_treenode_ids,
+                    explicit_connector_ids, include_labels, with_relation_map,
+                    with_origin)
+        return _node_list_columnar_query(params, project_id, self,
+                explicit_treenode_ids, explicit_connector_ids, include_labels,
+                with_relation_map, with_origin=with_origin), 'columnar'
+
     def prepare_db_statements(self, connection) -> None:
         """Create prepared statements on a given connection. This is mainly useful
         for long lived connections.
@@ -538,20 +1006,48 @@ class PostgisNodeProvider(BasicNodeProvider, metaclass=ABCMeta):
                     real, real, real, real, real, int, bigint[]) AS
             {self.connector_query_prepare}
         """)
+        # Variants of both statements for the columnar format
+        cursor.execute(f"""
+            PREPARE {self.TREENODE_STATEMENT_NAME}_columns (int, real, real,
+                    real, real, real, real, real, real, int, bigint[]) AS
+            {treenode_columns_query(self.treenode_query_prepare)}
+        """)
+        cursor.execute(f"""
+            PREPARE {self.CONNECTOR_STATEMENT_NAME}_columns (int, real, real,
+                    real, real, real, real, real, real, int, bigint[]) AS
+            {connector_columns_query(self.connector_query_prepare)}
+        """)
 
     def get_treenode_data(self, cursor, params, extra_treenode_ids=None):
         """ Selects all treenodes of which links to other treenodes intersect
         with the request bounding box. Will optionally fetch additional
         treenodes.
         """
+        self.execute_treenode_query(cursor, params, extra_treenode_ids)
+
+        treenodes = cursor.fetchall()
+        treenode_ids = [t[0] for t in treenodes]
+
+        return treenode_ids, treenodes
+
+    def execute_treenode_query(self, cursor, params, extra_treenode_ids=None,
+            columnar=False) -> None:
+        """Run the treenode query of this provider on the passed in cursor,
+        without fetching the result. This allows callers to consume the result
+        rows in whatever form they need. With columnar, the result is a single
+        row with the binary representation of each column (see
+        treenode_columns_query()).
+        """
         params['halfzdiff'] = abs(params['z2'] - params['z1']) * 0.5
         params['halfz'] = params['z1'] + (params['z2'] - params['z1']) * 0.5
         params['sanitized_treenode_ids'] = list(map(int, extra_treenode_ids or []))
 
         if self.prepared_statements:
             # Use a prepared statement to get the treenodes
+            statement_name = f'{self.TREENODE_STATEMENT_NAME}_columns' \
+                    if columnar else self.TREENODE_STATEMENT_NAME
             cursor.execute(f'''
-                EXECUTE {self.TREENODE_STATEMENT_NAME}(%(project_id)s,
+                EXECUTE {statement_name}(%(project_id)s,
                     %(left)s, %(top)s, %(z1)s, %(right)s, %(bottom)s, %(z2)s,
                     %(halfz)s, %(halfzdiff)s, %(limit)s,
                     %(sanitized_treenode_ids)s)
@@ -697,34 +1193,45 @@ class PostgisNodeProvider(BasicNodeProvider, metaclass=ABCMeta):
                     'ordering': result_order,
                 })
 
-            cursor.execute(query, params)
+            if columnar:
+                query = treenode_columns_query(query)
 
-        treenodes = cursor.fetchall()
-        treenode_ids = [t[0] for t in treenodes]
-
-        return treenode_ids, treenodes
+            cursor.execute(query, params)
 
     def get_connector_data(self, cursor, params, missing_connector_ids=None) -> List:
         """Selects all connectors that are in or have links that intersect the
         bounding box, or that are in missing_connector_ids.
         """
+        self.execute_connector_query(cursor, params, missing_connector_ids)
+
+        return list(cursor.fetchall())
+
+    def execute_connector_query(self, cursor, params, missing_connector_ids=None,
+            columnar=False) -> None:
+        """Run the connector query of this provider on the passed in cursor,
+        without fetching the result. With columnar, the result is a single row
+        with the binary representation of each connector and link column (see
+        connector_columns_query()).
+        """
         params['halfz'] = params['z1'] + (params['z2'] - params['z1']) * 0.5
         params['halfzdiff'] = abs(params['z2'] - params['z1']) * 0.5
         params['sanitized_connector_ids'] = list(map(int, missing_connector_ids or []))
 
         if self.prepared_statements:
             # Use a prepared statement to get connectors
+            statement_name = f'{self.CONNECTOR_STATEMENT_NAME}_columns' \
+                    if columnar else self.CONNECTOR_STATEMENT_NAME
             cursor.execute(f'''
-                EXECUTE {self.CONNECTOR_STATEMENT_NAME}(%(project_id)s,
+                EXECUTE {statement_name}(%(project_id)s,
                     %(left)s, %(top)s, %(z1)s, %(right)s, %(bottom)s, %(z2)s,
                     %(halfz)s, %(halfzdiff)s, %(limit)s,
                     %(sanitized_connector_ids)s)
             ''', params)
+        elif columnar:
+            cursor.execute(connector_columns_query(self.connector_query_psycopg), params)
         else:
             cursor.execute(self.connector_query_psycopg, params)
 
-        return list(cursor.fetchall())
-
 
 class Postgis3dNodeProvider(PostgisNodeProvider):
     """
@@ -742,6 +1249,9 @@ class Postgis3dNodeProvider(PostgisNodeProvider):
     """
 
     TREENODE_STATEMENT_NAME = PostgisNodeProvider.TREENODE_STATEMENT_NAME + '_3d'
+
+    croppable = True
+
     treenode_query = '''
         WITH bb_edge AS (
             SELECT te.id, te.parent_id
@@ -848,6 +1358,12 @@ class Postgis3dNodeProvider(PostgisNodeProvider):
         ON (geom_connector_id = c.id)
     '''
 
+    def edge_intersects(self, params, a, b) -> bool:
+        # Like the &&& and ST_3DDWithin filters of the queries above.
+        return min(a[2], b[2]) <= params['z2'] and \
+                max(a[2], b[2]) >= params['z1'] and \
+                edge_intersects_section(params, a, b)
+
 
 class Postgis3dMultiJoinNodeProvider(Postgis3dNodeProvider):
     """Like Postgis3dNodeProvider, but doing different joins for the extra set
@@ -1011,6 +1527,9 @@ class Postgis3dSpGistNodeProvider(Postgis3dNodeProvider):
     """
 
     TREENODE_STATEMENT_NAME = PostgisNodeProvider.TREENODE_STATEMENT_NAME + '_3d'
+
+    # Treenodes are only filtered by their bounding box
+    croppable = False
     treenode_query = '''
           WITH extra_nodes AS (
               SELECT UNNEST({sanitized_treenode_ids}::bigint[]) AS id
@@ -1080,6 +1599,9 @@ class Postgis2dNodeProvider(PostgisNodeProvider):
     """
 
     TREENODE_STATEMENT_NAME = PostgisNodeProvider.TREENODE_STATEMENT_NAME + '_2d'
+
+    croppable = True
+
     treenode_query = """
           WITH z_filtered_edge AS (
             SELECT te.id, te.parent_id, te.edge
@@ -1189,6 +1711,13 @@ class Postgis2dNodeProvider(PostgisNodeProvider):
           ON (geom_connector_id = c.id)
     """
 
+    def edge_intersects(self, params, a, b) -> bool:
+        # Like the Z range and ST_3DDWithin filters of the queries above. The
+        # Z range of the query is half-open.
+        return min(a[2], b[2]) < params['z2'] and \
+                max(a[2], b[2]) >= params['z1'] and \
+                edge_intersects_section(params, a, b)
+
 
 class Postgis2dMultiJoinNodeProvider(Postgis2dNodeProvider):
     """
@@ -1442,13 +1971,13 @@ def update_node_query_cache(node_providers=None, log=print, force=False) -> None
     if not node_providers:
         node_providers = get_node_provider_configs()
 
-    for np in node_providers:
-        log(f"Checking node provider {np}")
-        if type(np) in (list, tuple):
-            key = np[0]
-            options = np[1]
+    for node_provider in node_providers:
+        log(f"Checking node provider {node_provider}")
+        if type(node_provider) in (list, tuple):
+            key = node_provider[0]
+            options = node_provider[1]
         else:
-            key = np
+            key = node_provider
             options = {}
 
         project_id = options.get('project_id')
@@ -1558,7 +2087,136 @@ def get_tracing_bounding_box(project_id, cursor=None, bb_limits=None):
     return row
 
 
-def get_lod_buckets(result_tuple, lod_levels, lod_bucket_size, lod_strategy) -> List[List]:
+def decimate_treenodes(treenodes, protected_ids, eps, bounds=None) -> List:
+    """Return a reduced list of the passed in treenode rows that preserves the
+    topology of all fragments. Roots, leaves, branch nodes and the passed in
+    protected nodes (e.g. tagged or connector-linked nodes) are always kept.
+    Other nodes are removed if they are collinear (within <eps>) with the
+    closest kept nodes around them. Kept nodes reference their closest kept
+    ancestor as parent ("virtual edge"), which gets the lowest confidence of
+    the edges it replaces.
+
+    If bounds [min_x, min_y, min_z, max_x, max_y, max_z] are passed in, all
+    nodes outside of it, all nodes linked to them and their parents are kept
+    too. Such nodes can be part of the results of multiple grid cells, which
+    now agree on their parents.
+    """
+    rows = dict((t[0], t) for t in treenodes)
+    n_children:DefaultDict[Any, int] = defaultdict(int)
+    for t in treenodes:
+        if t[1] in rows:
+            n_children[t[1]] += 1
+
+    keep = set(protected_ids)
+    if bounds:
+        min_x, min_y, min_z, max_x, max_y, max_z = bounds
+        outside = set(t[0] for t in treenodes if not (
+                min_x <= t[2] < max_x and min_y <= t[3] < max_y and
+                min_z <= t[4] < max_z))
+        border = set()
+        for t in treenodes:
+            if t[0] in outside or t[1] in outside:
+                border.add(t[0])
+                if t[1] in rows:
+                    border.add(t[1])
+        keep.update(border)
+        keep.update(rows[node_id][1] for node_id in border
+                if rows[node_id][1] in rows)
+
+    def is_candidate(t):
+        return t[0] not in keep and t[1] in rows and n_children[t[0]] == 1
+
+    points = dict((t[0], Point3D(t[2], t[3], t[4])) for t in treenodes)
+
+    # Walk up from each kept node along the chain of removal candidates above
+    # it. Every candidate has exactly one child and is therefore visited once.
+    # A candidate is removed if it and all nodes removed since the last kept
+    # node are between this node and the next node of the chain.
+    removed = set()
+    for t in treenodes:
+        if is_candidate(t) or t[1] not in rows:
+            continue
+        chain = []
+        parent = rows[t[1]]
+        while is_candidate(parent):
+            chain.append(parent[0])
+            parent = rows[parent[1]]
+        if not chain:
+            continue
+        chain.append(parent[0])
+
+        anchor = points[t[0]]
+        pending:List = []
+        for node_id, next_id in zip(chain[:-1], chain[1:]):
+            pending.append(points[node_id])
+            next_point = points[next_id]
+            if all(is_collinear(anchor, next_point, p, True, eps) for p in pending):
+                removed.add(node_id)
+            else:
+                anchor = pending[-1]
+                pending = []
+
+    if not removed:
+        return list(treenodes)
+
+    decimated = []
+    for t in treenodes:
+        if t[0] in removed:
+            continue
+        parent_id, confidence = t[1], t[5]
+        if parent_id in removed:
+            while parent_id in removed:
+                parent = rows[parent_id]
+                confidence = min(confidence, parent[5])
+                parent_id = parent[1]
+            t = list(t)
+            t[1], t[5] = parent_id, confidence
+        decimated.append(t)
+
+    return decimated
+
+
+def _get_topology_lod_buckets(result_tuple, lod_levels, tolerance,
+        bounds=None) -> List[List]:
+    """Every bucket is a complete result with its own decimated treenodes. The
+    last bucket contains all treenodes, the tolerance of the second to last
+    one is <tolerance> and doubles with every coarser LOD level. Readers of
+    such caches need to use only a single bucket, because virtual parents of
+    one LOD level aren't valid in another one.
+    """
+    protected_ids = set(result_tuple[2].keys()) if result_tuple[2] else set()
+    for c in result_tuple[1]:
+        protected_ids.update(link[0] for link in c[7])
+
+    result_buckets:List[List] = []
+    treenodes = result_tuple[0]
+    for lod_level in range(lod_levels - 2, -1, -1):
+        eps = tolerance * 2 ** (lod_levels - 2 - lod_level)
+        # Coarser levels can start from the previous result, because all
+        # protected and topologically relevant nodes are kept there.
+        treenodes = decimate_treenodes(treenodes, protected_ids, eps, bounds)
+        bucket = list(result_tuple)
+        bucket[0] = treenodes
+        result_buckets.append(bucket)
+    result_buckets.reverse()
+    result_buckets.append(result_tuple)
+
+    return result_buckets
+
+
+def get_lod_buckets(result_tuple, lod_levels, lod_bucket_size, lod_strategy,
+        bounds=None) -> List[List]:
+    """Split the passed in result into <lod_levels> buckets. The "linear",
+    "quadratic" and "exponential" strategies split the ordered nodes into
+    buckets of growing size, which are meant to be combined by readers. The
+    "topology" strategy stores a complete and decimated result in each bucket,
+    see _get_topology_lod_buckets(). Its optional bounds are passed on to
+    decimate_treenodes().
+    """
+    if lod_strategy == 'topology':
+        return _get_topology_lod_buckets(result_tuple, lod_levels,
+                settings.DEFAULT_CACHE_GRID_LOD_TOLERANCE, bounds)
+
     nodes = result_tuple[0]
     connectors = result_tuple[1]
     n_nodes_to_add = len(nodes)
@@ -1760,22 +2418,66 @@ def update_cache(project_id, data_type, orientations, steps, node_limit=None,
             z += step
 
 
+def get_existing_grid_cells(cursor, grid_id, cell_defs) -> Set[Tuple[int, int, int]]:
+    """Return the set of (x, y, z) cell indices of the passed in cell
+    definitions that are already stored for the passed in grid.
+    """
+    if not cell_defs:
+        return set()
+    cursor.execute("""
+        SELECT c.x_index, c.y_index, c.z_index
+        FROM node_grid_cache_cell c
+        JOIN UNNEST(%(x_indices)s::int[], %(y_indices)s::int[],
+                %(z_indices)s::int[]) query(x_index, y_index, z_index)
+            ON c.x_index = query.x_index
+            AND c.y_index = query.y_index
+            AND c.z_index = query.z_index
+        WHERE c.grid_id = %(grid_id)s
+    """, {
+        'grid_id': grid_id,
+        'x_indices': [c[0] for c in cell_defs],
+        'y_indices': [c[1] for c in cell_defs],
+        'z_indices': [c[2] for c in cell_defs],
+    })
+    return set(cursor.fetchall())
+
+
 def process_batch(cell_defs, project_id, grid_id, cell_width, cell_height,
         cell_depth, params, allow_empty, lod_levels,
         lod_bucket_size, lod_strategy, update_json_cache,
-        update_json_text_cache, update_msgpack_cache):
+        update_json_text_cache, update_msgpack_cache, resume=False,
+        provider=None, cursor=None) -> Tuple[int, int, int, float]:
+    """Update all passed in grid cells. If <resume> is true, cells that exist
+    already in the grid are skipped. When run in a worker process, a new
+    database connection is opened for this process. Returns a tuple with the
+    number of processed cells, created cells, skipped cells and the time spent
+    in seconds.
+    """
+    start = time.time()
+    if not provider:
+        provider = Postgis3dNodeProvider()
+    if not cursor:
+        cursor = connection.cursor()
+
+    skipped = 0
+    if resume:
+        existing_cells = get_existing_grid_cells(cursor, grid_id, cell_defs)
+        if existing_cells:
+            cell_defs = [c for c in cell_defs if tuple(c) not in existing_cells]
+            skipped = len(existing_cells)
+
     created_in_process = 0
-    processed = 0
+    processed = skipped
     for w_i, h_i, d_i in cell_defs:
         added = update_grid_cell(project_id, grid_id, w_i,
             h_i, d_i, cell_width, cell_height, cell_depth, params,
             allow_empty, lod_levels, lod_bucket_size, lod_strategy,
             update_json_cache, update_json_text_cache,
-            update_msgpack_cache)
+            update_msgpack_cache, provider=provider, cursor=cursor)
         processed += 1
         if added:
             created_in_process += 1
-    return processed, created_in_process
+    return processed, created_in_process, skipped, time.time() - start
 
 
 def update_grid_cache(project_id, data_type, orientations,
@@ -1787,7 +2489,16 @@ def update_grid_cache(project_id, data_type, orientations,
         delete=False, bb_limits=None, log=print, progress=True,
         allow_empty=False, lod_levels=1, lod_bucket_size=500,
         lod_strategy='quadratic', jobs=1, depth_steps=1, chunksize=10,
-        ordering=None) -> None:
+        ordering=None, resume=False) -> None:
+    """Materialize the grid cache for the passed in project and orientations.
+
+    With <jobs> larger than one, cells are distributed in batches of
+    <chunksize> cells over a pool of worker processes, each using its own
+    database connection. Only a limited number of batches is queued at a time.
+    If <resume> is true, cells that are already stored in the grid are
+    skipped, which allows to continue an interrupted build. Empty cells are
+    only stored with <allow_empty> and are otherwise evaluated again.
+    """
     if data_type not in ('json', 'json_text', 'msgpack'):
         raise ValueError('Type must be one of: json, json_text, msgpack')
     if project_id is None:
@@ -1871,7 +2582,13 @@ def update_grid_cache(project_id, data_type, orientations,
     provider = Postgis3dNodeProvider()
     types = ', '.join(data_types)
 
-    executor = futures.ProcessPoolExecutor(jobs)
+    executor = futures.ProcessPoolExecutor(jobs) if jobs > 1 else None
+    # Limit the number of queued batches so that the work queue doesn't need
+    # to hold the cell definitions of the whole grid.
+    max_pending_batches = jobs * 4
+
+    if resume:
+        log(' -> Skipping cells that exist already')
 
     for o in orientations:
         orientation_id = ORIENTATIONS[o]
@@ -1898,7 +2615,7 @@ def update_grid_cache(project_id, data_type, orientations,
         })
         grid_ids = cursor.fetchall()
         if grid_ids:
-            grid_id = grid_ids[0]
+            grid_id = grid_ids[0][0]
         else:
             cursor.execute("""
                 INSERT INTO node_grid_cache (project_id, orientation,
@@ -1959,7 +2676,11 @@ def update_grid_cache(project_id, data_type, orientations,
         min_z = bb[0][2]
 
         counter = 0
+        processed = 0
         created = 0
+        skipped = 0
+        worker_time = 0.0
+        start_time = time.time()
 
         # If the effective bounding box should be reavaluated
         for depth_section in range(depth_steps):
@@ -2028,42 +2749,82 @@ def update_grid_cache(project_id, data_type, orientations,
                         for w_i in range(local_min_w_i, local_max_w_i + 1):
                             yield w_i, h_i, d_i
 
-            if jobs > 1:
+            if executor:
                 # We need to close all database connections to not accidentally
                 # share the file descriptors of current connections with forks.
                 connections.close_all()
 
-                tasks = [executor.submit(process_batch, cell_defs, project_id,
-                        grid_id, cell_width, cell_height, cell_depth, params,
+                submit_job = executor.submit
+
+                def submit(cell_defs):
+                    return submit_job(process_batch, cell_defs,
+                            project_id, grid_id, cell_width, cell_height,
+                            cell_depth, params, allow_empty, lod_levels,
+                            lod_bucket_size, lod_strategy, update_json_cache,
+                            update_json_text_cache, update_msgpack_cache,
+                            resume)
+
+                results = run_batches(submit, batches(iterate_space(), chunksize),
+                        max_pending_batches)
+            else:
+                results = (process_batch(cell_defs, project_id, grid_id,
+                        cell_width, cell_height, cell_depth, params,
                         allow_empty, lod_levels, lod_bucket_size, lod_strategy,
                         update_json_cache, update_json_text_cache,
-                        update_msgpack_cache)
-                    for cell_defs in batches(iterate_space(), chunksize)]
-
-                for future in futures.as_completed(tasks):
-                    result = future.result()
-                    if progress:
-                        counter += result[0]
-                        bar.update(counter)
-                    created += result[1]
-            else:
-                for w_i, h_i, d_i in iterate_space():
-                    if progress:
-                        counter += 1
-                        bar.update(counter)
-
-                    added = update_grid_cell(project_id, grid_id, w_i, h_i, d_i,
-                            cell_width, cell_height, cell_depth, provider,
-                            params, allow_empty, lod_levels, lod_bucket_size,
-                            lod_strategy, update_json_cache,
-                            update_json_text_cache, update_msgpack_cache, cursor)
-                    if added:
-                        created += 1
+                        update_msgpack_cache, resume, provider, cursor)
+                    for cell_defs in batches(iterate_space(), chunksize))
+
+            for result in results:
+                if progress:
+                    counter += result[0]
+                    bar.update(counter)
+                processed += result[0]
+                created += result[1]
+                skipped += result[2]
+                worker_time += result[3]
 
-        log(f' -> Materialized {created} grid cells')
         if progress:
             bar.finish()
 
+        elapsed = time.time() - start_time
+        log(f' -> Materialized {created} grid cells')
+        log(get_grid_cache_throughput_report(processed, created, skipped,
+                elapsed, worker_time, jobs))
+
+    if executor:
+        executor.shutdown()
+
+
+def run_batches(submit, batch_iter, max_pending):
+    """Submit all batches of <batch_iter> using the passed in <submit>
+    function, which is expected to return a future. At most <max_pending>
+    futures are pending at any time. Results are yielded as they complete.
+    """
+    pending:Set = set()
+    for batch in batch_iter:
+        pending.add(submit(batch))
+        if len(pending) >= max_pending:
+            done, pending = futures.wait(pending,
+                    return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    for future in futures.as_completed(pending):
+        yield future.result()
+
+
+def get_grid_cache_throughput_report(n_processed, n_created, n_skipped,
+        elapsed, worker_time, jobs) -> str:
+    """Format a summary of a grid cache update. The worker utilization is the
+    fraction of the available process time that was spent on computing cells.
+    """
+    n_computed = n_processed - n_skipped
+    rate = n_computed / elapsed if elapsed else 0.0
+    utilization = worker_time / (elapsed * jobs) if elapsed and jobs else 0.0
+    return (f' -> Computed {n_computed} cells ({n_created} stored, '
+            f'{n_skipped} skipped) in {elapsed:.1f}s with {jobs} process(es): '
+            f'{rate:.1f} cells/s, {rate / max(1, jobs):.1f} cells/s per '
+            f'process, worker utilization {utilization:.0%}')
+
 
 def update_grid_cell(project_id, grid_id, w_i, h_i, d_i, cell_width,
         cell_height, cell_depth, params, allow_empty, lod_levels,
@@ -2088,9 +2849,22 @@ def update_grid_cell(project_id, grid_id, w_i, h_i, d_i, cell_width,
     if not (allow_empty or result_tuple[0] or result_tuple[1]):
         return False
 
+    bounds = (params['left'], params['top'], params['z1'],
+            params['right'], params['bottom'], params['z2'])
     result_buckets = get_lod_buckets(result_tuple, lod_levels,
-            lod_bucket_size, lod_strategy)
+            lod_bucket_size, lod_strategy, bounds)
 
+    _store_grid_cell(cursor, grid_id, w_i, h_i, d_i, result_buckets,
+            update_json_cache, update_json_text_cache, update_msgpack_cache)
+
+    return True
+
+
+def _store_grid_cell(cursor, grid_id, w_i, h_i, d_i, result_buckets,
+        update_json_cache, update_json_text_cache, update_msgpack_cache) -> None:
+    """Write the passed in LOD buckets of a grid cell for each requested data
+    type.
+    """
     if update_json_cache:
         cursor.execute("""
             INSERT INTO node_grid_cache_cell (grid_id,
@@ -2139,9 +2913,290 @@ def update_grid_cell(project_id, grid_id, w_i, h_i, d_i, cell_width,
             'data':  [None if not v else psycopg2.Binary(msgpack.packb(v)) for v in result_buckets],
         })
 
+
+def get_grid_cell_buckets(cursor, grid_id, w_i, h_i, d_i) -> Optional[List]:
+    """Get the decoded LOD buckets of a grid cell. Data is read from the first
+    available data type in the order msgpack, json and json text. Returns None
+    if the cell doesn't exist or has no data.
+    """
+    # For JSONB type cache, use ujson to decode, this is roughly 2x faster
+    psycopg2.extras.register_default_jsonb(loads=ujson.loads)
+    cursor.execute("""
+        SELECT msgpack_data, json_data, json_text_data
+        FROM node_grid_cache_cell
+        WHERE grid_id = %(grid_id)s
+            AND x_index = %(x_index)s
+            AND y_index = %(y_index)s
+            AND z_index = %(z_index)s
+    """, {
+        'grid_id': grid_id,
+        'x_index': w_i,
+        'y_index': h_i,
+        'z_index': d_i,
+    })
+    row = cursor.fetchone()
+    if not row:
+        return None
+
+    msgpack_data, json_data, json_text_data = row
+    if msgpack_data:
+        buckets = [msgpack.unpackb(bytes(b), raw=False, strict_map_key=False)
+                if b else None for b in msgpack_data]
+    elif json_data:
+        buckets = list(json_data)
+    elif json_text_data:
+        buckets = [json.loads(b) if b else None for b in json_text_data]
+    else:
+        return None
+
+    # Labels are keyed by node ID, which JSON stores as string.
+    for b in buckets:
+        if b and b[2]:
+            b[2] = {int(k): v for k, v in b[2].items()}
+
+    return buckets
+
+
+def update_grid_cell_delta(project_id, grid_id, w_i, h_i, d_i, cell_width,
+        cell_height, cell_depth, params, dirty_box, update_json_cache,
+        update_json_text_cache, update_msgpack_cache, provider=None,
+        cursor=None, lod_strategy=None) -> bool:
+    """Update an existing grid cell by applying only the changes within the
+    passed in dirty bounding box [min_x, min_y, min_z, max_x, max_y, max_z]
+    to the cached data, rather than querying the whole cell. The dirty box
+    has to contain the old and new locations of all changed nodes, which is
+    the case for the bounding box of spatial update events.
+
+    Only the part of the cell that intersects the dirty box is queried. The
+    result replaces all cached nodes in this region. Cached nodes outside of
+    the queried region, but within the dirty box, are checked for changes by
+    ID. Cached links of connectors that aren't part of the query result are
+    checked by ID as well, because their treenode might have been in the dirty
+    box. Removed links are dropped, changed links require a full update of the
+    cell. Returns False if the delta update can't be applied and the cell needs
+    to be recomputed completely. This is the case if the cell doesn't exist
+    yet, if the cached result depends on global skeleton filters, if the node
+    limit is hit, if cached nodes outside of the queried region are connected
+    to changed nodes or if nodes are added or removed in a cell with more than
+    one LOD level, because this would change the LOD buckets. Cells with more
+    than one "topology" LOD level are always recomputed, because changes can
+    alter their decimation.
+
+    The cached data is rewritten instead of using
+    GridCachedNodeProvider.update_tuples(), which can only append extra nodes
+    to a cached result, but can't replace or remove nodes in it.
+    """
+    if params.get('ordering') or params.get('n_largest_skeletons_limit') or \
+            params.get('n_last_edited_skeletons_limit'):
+        return False
+
+    if not provider:
+        provider = Postgis3dNodeProvider()
+
+    if not cursor:
+        cursor = connection.cursor()
+
+    buckets = get_grid_cell_buckets(cursor, grid_id, w_i, h_i, d_i)
+    if not buckets or not buckets[0]:
+        return False
+    if any(b[3] for b in buckets if b):
+        return False
+    if lod_strategy == 'topology' and len(buckets) > 1:
+        return False
+
+    # Query the intersection of the cell with the dirty box. A small margin
+    # makes sure nodes on the border of the box are included.
+    margin = 1.0
+    cell_min = (w_i * cell_width, h_i * cell_height, d_i * cell_depth)
+    cell_max = ((w_i + 1) * cell_width, (h_i + 1) * cell_height, (d_i + 1) * cell_depth)
+    box_min = [min(max(dirty_box[i] - margin, cell_min[i]), cell_max[i]) for i in range(3)]
+    box_max = [max(min(dirty_box[3 + i] + margin, cell_max[i]), cell_min[i]) for i in range(3)]
+
+    delta_params = copy.copy(params)
+    delta_params['left'], delta_params['top'], delta_params['z1'] = box_min
+    delta_params['right'], delta_params['bottom'], delta_params['z2'] = box_max
+    delta = _node_list_tuples_query(delta_params, project_id, provider,
+            include_labels=True)
+
+    limit = params.get('limit')
+    if delta[3] or (limit and len(delta[0]) >= limit):
+        return False
+
+    delta_treenodes = {t[0]: list(t) for t in delta[0]}
+    delta_connectors = {c[0]: list(c[:7]) + [list(c[7])] for c in delta[1]}
+
+    def in_dirty_box(x, y, z):
+        return dirty_box[0] - margin <= x <= dirty_box[3] + margin and \
+                dirty_box[1] - margin <= y <= dirty_box[4] + margin and \
+                dirty_box[2] - margin <= z <= dirty_box[5] + margin
+
+    # Find cached nodes and links that might have changed, but that are not
+    # part of the delta query result.
+    candidate_treenodes = {}
+    candidate_connectors = {}
+    candidate_links = {}
+    candidate_outside_links = {}
+    for b in buckets:
+        if not b:
+            continue
+        for t in b[0]:
+            if t[0] not in delta_treenodes and in_dirty_box(t[2], t[3], t[4]):
+                candidate_treenodes[t[0]] = t[8]
+        for c in b[1]:
+            if c[0] in delta_connectors:
+                delta_link_ids = set(link[4]
+                        for link in delta_connectors[c[0]][7])
+                for link in c[7]:
+                    if link[4] not in delta_link_ids:
+                        candidate_links[link[4]] = link[3]
+            else:
+                if in_dirty_box(c[1], c[2], c[3]):
+                    candidate_connectors[c[0]] = c[5]
+                for link in c[7]:
+                    candidate_outside_links[link[4]] = link[3]
+
+    def find_stale(table, candidates, removed_only=False):
+        """Return all IDs of the passed in {id: edition_time} map that don't
+        exist anymore or have a different edition time. With removed_only,
+        None is returned if an ID has a different edition time."""
+        if not candidates:
+            return set()
+        cursor.execute("""
+            SELECT t.id, EXTRACT(EPOCH FROM t.edition_time)::float8
+            FROM {table} t
+            JOIN UNNEST(%(ids)s::bigint[]) query(id)
+                ON query.id = t.id
+        """.format(table=table), {
+            'ids': list(candidates.keys()),
+        })
+        current = dict(cursor.fetchall())
+        stale = set()
+        for node_id, edition_time in candidates.items():
+            current_edition_time = current.get(node_id)
+            if current_edition_time is None:
+                stale.add(node_id)
+            elif current_edition_time != edition_time:
+                if removed_only:
+                    return None
+                stale.add(node_id)
+        return stale
+
+    stale_treenodes = find_stale('treenode', candidate_treenodes)
+    stale_connectors = find_stale('connector', candidate_connectors)
+    stale_links = find_stale('treenode_connector', candidate_links)
+    # Changed links of connectors outside of the delta query result can't be
+    # updated without querying them.
+    removed_outside_links = find_stale('treenode_connector',
+            candidate_outside_links, True)
+    if removed_outside_links is None:
+        return False
+
+    # Cached nodes outside of the delta query result are only kept if none of
+    # their edges and links changed. A changed edge is part of the delta query
+    # result if it still intersects the cell, otherwise a kept node might not
+    # belong to the cell anymore, e.g. a child outside of the cell whose
+    # parent moved out of it. Such cells need a full update.
+    cached_treenodes = {t[0]: t for b in buckets if b for t in b[0]}
+    changed_treenodes = set(stale_treenodes)
+    for node_id, t in delta_treenodes.items():
+        cached = cached_treenodes.get(node_id)
+        if cached and (cached[1] != t[1] or list(cached[2:5]) != t[2:5]):
+            changed_treenodes.add(node_id)
+    if changed_treenodes:
+        kept_treenodes = set(cached_treenodes.keys()) - \
+                set(delta_treenodes.keys()) - stale_treenodes
+        for t in cached_treenodes.values():
+            if t[0] in kept_treenodes and t[1] in changed_treenodes:
+                return False
+            if t[0] in changed_treenodes and t[1] in kept_treenodes:
+                return False
+        for b in buckets:
+            if not b:
+                continue
+            for c in b[1]:
+                if c[0] not in delta_connectors and c[0] not in stale_connectors \
+                        and any(link[0] in changed_treenodes for link in c[7]):
+                    return False
+
+    # Replace updated nodes in place, remove stale nodes and collect new ones.
+    new_treenodes = dict(delta_treenodes)
+    new_connectors = dict(delta_connectors)
+    n_removed = 0
+    for b in buckets:
+        if not b:
+            continue
+        treenodes = []
+        for t in b[0]:
+            if t[0] in stale_treenodes:
+                n_removed += 1
+            elif t[0] in delta_treenodes:
+                treenodes.append(new_treenodes.pop(t[0]))
+            else:
+                treenodes.append(t)
+        connectors = []
+        for c in b[1]:
+            if c[0] in stale_connectors:
+                n_removed += 1
+            elif c[0] in delta_connectors:
+                updated = new_connectors.pop(c[0])
+                delta_link_ids = set(link[4] for link in updated[7])
+                updated[7].extend(link for link in c[7]
+                        if link[4] not in delta_link_ids
+                        and link[4] not in stale_links)
+                connectors.append(updated)
+            elif any(link[4] in removed_outside_links for link in c[7]):
+                connectors.append(list(c[:7]) + [[link for link in c[7]
+                        if link[4] not in removed_outside_links]])
+            else:
+                connectors.append(c)
+        b[0], b[1] = treenodes, connectors
+
+    n_lod_levels = len(buckets)
+    if n_lod_levels > 1 and (n_removed or new_treenodes or new_connectors):
+        return False
+
+    first_bucket = buckets[0]
+    first_bucket[0].extend(new_treenodes.values())
+    first_bucket[1].extend(new_connectors.values())
+
+    if limit and sum(len(b[0]) for b in buckets if b) >= limit:
+        return False
+
+    # Update labels of all changed nodes and merge relation maps.
+    labels = first_bucket[2]
+    for node_id in stale_treenodes | stale_connectors:
+        labels.pop(node_id, None)
+    delta_labels = delta[2]
+    for node_id in _visible_node_ids(delta_params, delta[0], delta[1]):
+        if node_id in delta_labels:
+            labels[node_id] = delta_labels[node_id]
+        else:
+            labels.pop(node_id, None)
+    first_bucket[4].update(delta[4])
+
+    if not (first_bucket[0] or first_bucket[1]) and n_lod_levels == 1:
+        # Empty cells are handled by the regular update.
+        return False
+
+    _store_grid_cell(cursor, grid_id, w_i, h_i, d_i, buckets,
+            update_json_cache, update_json_text_cache, update_msgpack_cache)
+
     return True
 
 
+def _visible_node_ids(params, treenodes, connectors) -> List:
+    """Get the IDs of all treenodes and connectors that are visible in the
+    passed in query bounding box, i.e. the nodes for which a node query
+    returns labels.
+    """
+    top, left, z1 = params['top'], params['left'], params['z1']
+    bottom, right, z2 = params['bottom'], params['right'], params['z2']
+    visible = [t[0] for t in treenodes if left <= t[2] < right and
+            top <= t[3] < bottom and z1 <= t[4] < z2]
+    visible.extend(c[0] for c in connectors if z1 <= c[3] < z2)
+    return visible
+
+
 def prepare_db_statements(connection) -> None:
     node_providers = get_configured_node_providers(get_node_provider_configs(), connection)
     for node_provider in node_providers:
@@ -2249,7 +3304,9 @@ def node_list_tuples(request:HttpRequest, project_id=None, provider=None) -> Htt
       paramType: form
     - name: format
       description: |
-        Either "json" (default) or "msgpack", optional.
+        Either "json" (default), "msgpack" or "columnar", optional. The
+        columnar format is a binary format that transfers treenodes,
+        connectors and links as typed arrays, one per field.
       required: false
       type: string
       paramType: form
@@ -2316,6 +3373,17 @@ def node_list_tuples(request:HttpRequest, project_id=None, provider=None) -> Htt
     else:
         raise ValueError("Unsupported HTTP method: " + request.method)
 
+    node_providers, params, options = get_node_list_query(project_id, data)
+
+    return compile_node_list_result(project_id, node_providers, params,
+            **options)
+
+
+def get_node_list_query(project_id, data) -> Tuple[List, Dict, Dict]:
+    """Parse the node list request parameters in <data>, see
+    node_list_tuples(). Returns the node providers to use, the query parameters
+    and the remaining keyword arguments for compile_node_list_result().
+    """
     params:Dict[str, Optional[Union[int, float]]] = {}
 
     treenode_ids = get_request_list(data, 'treenode_ids', tuple(), int)
@@ -2372,9 +3440,15 @@ def node_list_tuples(request:HttpRequest, project_id=None, provider=None) -> Htt
     else:
         node_providers = get_configured_node_providers(get_node_provider_configs())
 
-    return compile_node_list_result(project_id, node_providers, params,
-        treenode_ids, connector_ids, include_labels, target_format,
-        target_options, with_relation_map, with_origin)
+    return node_providers, params, {
+        'explicit_treenode_ids': treenode_ids,
+        'explicit_connector_ids': connector_ids,
+        'include_labels': include_labels,
+        'target_format': target_format,
+        'target_options': target_options,
+        'with_relation_map': with_relation_map,
+        'with_origin': with_origin,
+    }
 
 
 def _node_list_tuples_query(params, project_id, node_provider,
@@ -2461,58 +3535,16 @@ def _node_list_tuples_query(params, project_id, node_provider,
                 z1 <= r[4] < z2
 
         if include_labels:
-            # Collect treenodes visible in the current section
+            # Collect treenodes and connectors visible in the current section
             visible_treenodes = [row[0] for row in treenodes if is_visible(row)]
-            if visible_treenodes:
-                cursor.execute('''
-                SELECT treenode_class_instance.treenode_id,
-                       class_instance.name
-                FROM class_instance,
-                     treenode_class_instance,
-                     UNNEST(%s::bigint[]) treenodes(tnid)
-                WHERE treenode_class_instance.relation_id = %s
-                  AND class_instance.id = treenode_class_instance.class_instance_id
-                  AND treenode_class_instance.treenode_id = tnid
-                ''', (visible_treenodes, relation_map['labeled_as']))
-                for row in cursor.fetchall():
-                    labels[row[0]].append(row[1])
-
-            # Collect connectors visible in the current section
-            visible = [row[0] for row in connectors if z1 <= row[3] < z2]
-            if visible:
-                cursor.execute('''
-                SELECT connector_class_instance.connector_id,
-                       class_instance.name
-                FROM class_instance,
-                     connector_class_instance,
-                     UNNEST(%s::bigint[]) connectors(cnid)
-                WHERE connector_class_instance.relation_id = %s
-                  AND class_instance.id = connector_class_instance.class_instance_id
-                  AND connector_class_instance.connector_id = cnid
-                ''', (visible, relation_map['labeled_as']))
-                for row in cursor.fetchall():
-                    labels[row[0]].append(row[1])
+            visible_connectors = [row[0] for row in connectors if z1 <= row[3] < z2]
+            labels = _get_node_labels(cursor, relation_map['labeled_as'],
+                    visible_treenodes, visible_connectors)
 
         if with_origin:
             visible_skeletons = set(row[7] for row in treenodes if is_visible(row))
-            # It would be faster to do this query as part of the main treendoe
-            # query, but this is easier to read and implement. It has the
-            # benefit of requiring likely less memory in some cases (repeated
-            # skeleton IDs).
-            # TODO: We night to traverse merges too! This might be possible by
-            # collecting all merges (and splits in the skeleton_origin table.
-            # This duplicates history to some extend, but makes ist easier
-            # accessible. It would be a materialized view hybrid (because it
-            # would also contain imports).
-            cursor.execute('''
-                SELECT skeleton_id, so.source_id, so.data_source_id
-                FROM skeleton_origin so
-                JOIN UNNEST(%(skeleton_ids)s::bigint[]) query_skeleton(id)
-                    ON query_skeleton.id = so.skeleton_id
-            ''', {
-                'skeleton_ids': list(visible_skeletons),
-            })
-            export_skeleton_origin = cursor.fetchall()
+            export_skeleton_origin = _get_skeleton_origins(cursor,
+                    list(visible_skeletons))
         else:
             export_skeleton_origin = []
 
@@ -2537,12 +3569,152 @@ def _node_list_tuples_query(params, project_id, node_provider,
         import traceback
         raise Exception(f'{response_on_error}:{e}\nOriginal error: {traceback.format_exc()}')
 
+def _get_node_labels(cursor, labeled_as_id, treenode_ids, connector_ids) -> DefaultDict[Any, List]:
+    """Get a mapping of node IDs to a list of label names for the passed in
+    treenode and connector IDs.
+    """
+    labels:DefaultDict[Any, List] = defaultdict(list)
+    if len(treenode_ids):
+        cursor.execute('''
+        SELECT treenode_class_instance.treenode_id,
+               class_instance.name
+        FROM class_instance,
+             treenode_class_instance,
+             UNNEST(%s::bigint[]) treenodes(tnid)
+        WHERE treenode_class_instance.relation_id = %s
+          AND class_instance.id = treenode_class_instance.class_instance_id
+          AND treenode_class_instance.treenode_id = tnid
+        ''', (treenode_ids, labeled_as_id))
+        for row in cursor.fetchall():
+            labels[row[0]].append(row[1])
+
+    if len(connector_ids):
+        cursor.execute('''
+        SELECT connector_class_instance.connector_id,
+               class_instance.name
+        FROM class_instance,
+             connector_class_instance,
+             UNNEST(%s::bigint[]) connectors(cnid)
+        WHERE connector_class_instance.relation_id = %s
+          AND class_instance.id = connector_class_instance.class_instance_id
+          AND connector_class_instance.connector_id = cnid
+        ''', (connector_ids, labeled_as_id))
+        for row in cursor.fetchall():
+            labels[row[0]].append(row[1])
+
+    return labels
+
+
+def _get_skeleton_origins(cursor, skeleton_ids) -> List:
+    """Get a list of (skeleton_id, source_id, data_source_id) tuples for all
+    passed in skeletons that have been imported.
+    """
+    # It would be faster to do this query as part of the main treendoe
+    # query, but this is easier to read and implement. It has the
+    # benefit of requiring likely less memory in some cases (repeated
+    # skeleton IDs).
+    # TODO: We night to traverse merges too! This might be possible by
+    # collecting all merges (and splits in the skeleton_origin table.
+    # This duplicates history to some extend, but makes ist easier
+    # accessible. It would be a materialized view hybrid (because it
+    # would also contain imports).
+    cursor.execute('''
+        SELECT skeleton_id, so.source_id, so.data_source_id
+        FROM skeleton_origin so
+        JOIN UNNEST(%(skeleton_ids)s::bigint[]) query_skeleton(id)
+            ON query_skeleton.id = so.skeleton_id
+    ''', {
+        'skeleton_ids': skeleton_ids,
+    })
+    return cursor.fetchall()
+
+
+def _node_list_columnar_query(params, project_id, node_provider,
+        explicit_treenode_ids=tuple(), explicit_connector_ids=tuple(),
+        include_labels=False, with_relation_map='used', with_origin=False) -> bytes:
+    """Like _node_list_tuples_query(), but let the database aggregate the
+    connector and treenode results into binary columns, which are read into
+    typed arrays without creating Python objects for individual rows. The
+    result is returned in the binary columnar format (see
+    pack_node_columns()). Deduplication of connectors and links is done in the
+    database, visibility tests are done on whole columns.
+    """
+    try:
+        cursor = connection.cursor()
+
+        if with_relation_map or include_labels:
+            cursor.execute('''
+            SELECT relation_name, id FROM relation WHERE project_id=%s
+            ''' % project_id)
+            relation_map = dict(cursor.fetchall())
+            id_to_relation = {v: k for k, v in relation_map.items()}
+
+        missing_treenode_ids = set(n for n in explicit_treenode_ids if n != -1)
+        missing_connector_ids = set(c for c in explicit_connector_ids if c != -1)
+
+        response_on_error = 'Failed to query connector locations.'
+        node_provider.execute_connector_query(cursor, params,
+                missing_connector_ids, columnar=True)
+        row = cursor.fetchone()
+        connectors = _columns_from_binary(row[:len(CONNECTOR_COLUMNS)],
+                CONNECTOR_COLUMNS)
+        links = _columns_from_binary(row[len(CONNECTOR_COLUMNS):], LINK_COLUMNS)
+
+        # Treenodes linked to connectors have to be part of the result, even
+        # if they are outside of the field of view.
+        missing_treenode_ids.update(links['treenode_id'].tolist())
+
+        response_on_error = 'Failed to query treenodes'
+        node_provider.execute_treenode_query(cursor, params,
+                missing_treenode_ids, columnar=True)
+        treenodes = _columns_from_binary(cursor.fetchone(), TREENODE_COLUMNS)
+
+        top, left, z1 = params['top'], params['left'], params['z1']
+        bottom, right, z2 = params['bottom'], params['right'], params['z2']
+        visible = (left <= treenodes['x']) & (treenodes['x'] < right) & \
+                (top <= treenodes['y']) & (treenodes['y'] < bottom) & \
+                (z1 <= treenodes['z']) & (treenodes['z'] < z2)
+
+        labels:DefaultDict[Any, List] = defaultdict(list)
+        if include_labels:
+            visible_connectors = (z1 <= connectors['z']) & (connectors['z'] < z2)
+            labels = _get_node_labels(cursor, relation_map['labeled_as'],
+                    treenodes['id'][visible].tolist(),
+                    connectors['id'][visible_connectors].tolist())
+
+        extra_data = []
+        if with_origin:
+            visible_skeletons = np.unique(treenodes['skeleton_id'][visible])
+            export_skeleton_origin = _get_skeleton_origins(cursor,
+                    visible_skeletons.tolist())
+            if export_skeleton_origin:
+                extra_data.append(export_skeleton_origin)
+
+        if with_relation_map == 'used':
+            export_relation_map = {r: id_to_relation[r] for r in
+                    np.unique(links['relation_id']).tolist()}
+        elif with_relation_map == 'all':
+            export_relation_map = id_to_relation
+        else:
+            export_relation_map = {}
+
+        return pack_node_columns(treenodes, connectors, links, labels,
+                len(treenodes['id']) == params['limit'], export_relation_map,
+                extra_data)
+
+    except Exception as e:
+        import traceback
+        raise Exception(f'{response_on_error}:{e}\nOriginal error: {traceback.format_exc()}')
+
+
 def node_list_tuples_query(params, project_id, node_provider,
         explicit_treenode_ids=tuple(), explicit_connector_ids=tuple(),
         include_labels=False, target_format='json', target_options=None,
         with_relation_map=True, with_origin=False) -> HttpResponse:
 
-    result_tuple, data_type = node_provider.get_tuples(params, project_id,
+    get_data = node_provider.get_columns if target_format == 'columnar' \
+            else node_provider.get_tuples
+    result_tuple, data_type = get_data(params, project_id,
         explicit_treenode_ids, explicit_connector_ids, include_labels,
         with_relation_map, with_origin)
 
@@ -2559,7 +3731,9 @@ def compile_node_list_result(project_id, node_providers, params,
     result_tuple, data_type = None, None
     for node_provider in node_providers:
         if node_provider.matches(params):
-            result = node_provider.get_tuples(params, project_id,
+            get_data = node_provider.get_columns if target_format == 'columnar' \
+                    else node_provider.get_tuples
+            result = get_data(params, project_id,
                 explicit_treenode_ids, explicit_connector_ids, include_labels,
                 with_relation_map, with_origin)
             result_tuple, data_type = result
@@ -2572,6 +3746,355 @@ def compile_node_list_result(project_id, node_providers, params,
 
     return create_node_response(result_tuple, params, target_format, target_options, data_type)
 
+
+class NodeProviderRace(object):
+    """Run node provider queries of a single request in concurrent threads and
+    keep track of the database connections they use. Once a result is found,
+    finish() cancels all queries that are still running.
+    """
+
+    def __init__(self):
+        self.finished = False
+        self._lock = threading.Lock()
+        self._connections:Set = set()
+
+    def run(self, get_data, *args) -> Tuple[Any, Optional[str]]:
+        """Call get_data() with the passed in arguments using the database
+        connection of the current thread, unless the race is already over.
+        """
+        close_old_connections()
+        try:
+            connection.ensure_connection()
+            db_connection = connection.connection
+            with self._lock:
+                if self.finished:
+                    return None, None
+                self._connections.add(db_connection)
+            try:
+                return get_data(*args)
+            finally:
+                with self._lock:
+                    self._connections.discard(db_connection)
+        finally:
+            close_old_connections()
+
+    def finish(self) -> None:
+        with self._lock:
+            self.finished = True
+            for db_connection in self._connections:
+                try:
+                    db_connection.cancel()
+                except Exception as e:
+                    logger.debug(f"Could not cancel node query: {e}")
+
+
+_node_list_executor = None
+_node_list_executor_lock = threading.Lock()
+
+
+def get_node_list_executor() -> futures.ThreadPoolExecutor:
+    """Get the thread pool of this process that runs node queries for the
+    async node list endpoint. Each thread keeps its own database connection,
+    which makes the pool size the maximum number of database connections in
+    use by concurrent node list requests.
+    """
+    global _node_list_executor
+    with _node_list_executor_lock:
+        if _node_list_executor is None:
+            _node_list_executor = futures.ThreadPoolExecutor(
+                    max_workers=settings.NODE_LIST_ASYNC_POOL_SIZE,
+                    thread_name_prefix='catmaid-node-list')
+    return _node_list_executor
+
+
+async def compile_node_list_result_async(project_id, node_providers, params,
+        explicit_treenode_ids=tuple(), explicit_connector_ids=tuple(),
+        include_labels=False, target_format='json', target_options=None,
+        with_relation_map=True, with_origin=False) -> HttpResponse:
+    """Like compile_node_list_result(), but all matching node providers are
+    queried concurrently in the node list thread pool. The first valid result
+    is used and all other queries are cancelled. If no provider returns a
+    result, the first error of a provider is raised, if any.
+    """
+    loop = asyncio.get_event_loop()
+    executor = get_node_list_executor()
+    race = NodeProviderRace()
+
+    pending:Set[asyncio.Future] = set()
+    for node_provider in node_providers:
+        if node_provider.matches(params):
+            get_data = node_provider.get_columns if target_format == 'columnar' \
+                    else node_provider.get_tuples
+            # Providers can modify the passed in parameters.
+            pending.add(loop.run_in_executor(executor, race.run, get_data,
+                    copy.copy(params), project_id, explicit_treenode_ids,
+                    explicit_connector_ids, include_labels, with_relation_map,
+                    with_origin))
+
+    result_tuple, data_type, error = None, None, None
+    try:
+        while pending and not (result_tuple and data_type):
+            done, pending = await asyncio.wait(pending,
+                    return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    if not error:
+                        error = e
+                    continue
+                if result[0] and result[1]:
+                    result_tuple, data_type = result
+                    break
+    finally:
+        race.finish()
+        for task in pending:
+            task.cancel()
+
+    if not (result_tuple and data_type):
+        if error:
+            raise error
+        raise ValueError("Could not find matching node provider for request")
+
+    return await loop.run_in_executor(executor, create_node_response,
+            result_tuple, params, target_format, target_options, data_type)
+
+# The binary columnar node list format starts with a fixed size header: the
+# magic bytes, a format version, a flags field (bit 0: node limit reached) and
+# the number of treenodes, connectors and links followed by the length of the
+# trailing metadata block. The header is followed by all treenode, connector
+# and link columns in the order below, each one a little endian array padded
+# to a multiple of eight bytes. Missing values, like the parent ID of a root
+# node or an unset confidence, are represented as -1, which is why all integer
+# columns are signed. The data ends with a msgpack encoded list of labels,
+# relation map and extra data, as known from the tuple format.
+NODE_COLUMNS_MAGIC = b'CMNC'
+NODE_COLUMNS_VERSION = 1
+NODE_COLUMNS_HEADER = struct.Struct('<4sHHIIII')
+
+TREENODE_COLUMNS = (
+    ('id', '<i8'),
+    ('parent_id', '<i8'),
+    ('skeleton_id', '<i8'),
+    ('edition_time', '<f8'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+    ('radius', '<f4'),
+    ('user_id', '<i4'),
+    ('confidence', '<i1'),
+)
+
+CONNECTOR_COLUMNS = (
+    ('id', '<i8'),
+    ('edition_time', '<f8'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+    ('user_id', '<i4'),
+    ('confidence', '<i1'),
+)
+
+LINK_COLUMNS = (
+    ('id', '<i8'),
+    ('connector_id', '<i8'),
+    ('treenode_id', '<i8'),
+    ('relation_id', '<i8'),
+    ('edition_time', '<f8'),
+    ('confidence', '<i1'),
+)
+
+# Positions of each column in treenode and connector rows, as they are returned
+# from node provider queries and stored in the tuple format.
+TREENODE_ROW_INDEX = {'id': 0, 'parent_id': 1, 'x': 2, 'y': 3, 'z': 4,
+        'confidence': 5, 'radius': 6, 'skeleton_id': 7, 'edition_time': 8,
+        'user_id': 9}
+CONNECTOR_ROW_INDEX = {'id': 0, 'x': 1, 'y': 2, 'z': 3, 'confidence': 4,
+        'edition_time': 5, 'user_id': 6}
+# Link columns of a tuple format link, prefixed with the connector ID
+LINK_ROW_INDEX = {'connector_id': 0, 'treenode_id': 1, 'relation_id': 2,
+        'confidence': 3, 'edition_time': 4, 'id': 5}
+
+
+def _object_rows(rows, n_columns) -> np.ndarray:
+    """Create a two dimensional object array from a list of result rows."""
+    data = np.empty((len(rows), n_columns), dtype=object)
+    if len(rows):
+        data[:] = rows
+    return data
+
+
+def _columns_from_array(data, columns, row_index) -> Dict[str, np.ndarray]:
+    """Convert the columns of a two dimensional object array into typed
+    arrays. NULL values are represented as -1.
+    """
+    result = {}
+    for name, dtype in columns:
+        col = data[:, row_index[name]]
+        nulls = np.fromiter((v is None for v in col), dtype=bool, count=len(col))
+        if nulls.any():
+            col = col.copy()
+            col[nulls] = -1
+        result[name] = col.astype(dtype)
+    return result
+
+
+def _treenode_columns_from_rows(rows) -> Dict[str, np.ndarray]:
+    return _columns_from_array(_object_rows(rows, len(TREENODE_ROW_INDEX)),
+            TREENODE_COLUMNS, TREENODE_ROW_INDEX)
+
+
+# The PostgreSQL type of each column type and the type of its binary
+# representation, which is big endian.
+COLUMN_SQL_TYPES = {
+    '<i8': ('int8', '>i8'),
+    '<f8': ('float8', '>f8'),
+    '<f4': ('float4', '>f4'),
+    '<i4': ('int4', '>i4'),
+    '<i1': ('int2', '>i2'),
+}
+
+
+def _binary_column_aggregates(columns, source) -> str:
+    """Return a SQL select list that aggregates each of the passed in columns
+    of a relation into a single bytea value with the binary representation
+    of all its values. NULL values are represented as -1. Separate aggregates
+    aren't guaranteed to see rows in the same order, which is why all of them
+    order the rows by their ID.
+    """
+    return ', '.join(f"string_agg({COLUMN_SQL_TYPES[dtype][0]}send("
+            f"COALESCE({source}.{name}::{COLUMN_SQL_TYPES[dtype][0]}, -1)), "
+            f"''::bytea ORDER BY {source}.id)"
+            for name, dtype in columns)
+
+
+def _columns_from_binary(values, columns) -> Dict[str, np.ndarray]:
+    """Read the bytea values of a query with binary column aggregates into
+    typed arrays."""
+    return {name: np.frombuffer(value if value is not None else b'',
+            dtype=COLUMN_SQL_TYPES[dtype][1])
+            for (name, dtype), value in zip(columns, values)}
+
+
+def treenode_columns_query(query) -> str:
+    """Wrap a treenode query of a node provider so that it returns a single
+    row with the binary representation of each treenode column.
+    """
+    names = sorted(TREENODE_ROW_INDEX, key=lambda k: TREENODE_ROW_INDEX[k])
+    return f"""
+        SELECT {_binary_column_aggregates(TREENODE_COLUMNS, 'q')}
+        FROM ({query}) q({', '.join(names)})
+    """
+
+
+def connector_columns_query(query) -> str:
+    """Wrap a connector query of a node provider so that it returns a single
+    row with the binary representation of each connector column, followed by
+    each link column. Each row of a connector query represents one link (or no
+    link) of a connector, which is why both connectors and links are
+    deduplicated.
+    """
+    return f"""
+        WITH q(id, x, y, z, confidence, edition_time, user_id, treenode_id,
+                relation_id, link_confidence, link_edition_time, link_id) AS (
+            {query}
+        )
+        SELECT c.*, l.*
+        FROM (
+            SELECT {_binary_column_aggregates(CONNECTOR_COLUMNS, 'c')}
+            FROM (
+                SELECT DISTINCT ON (q.id) *
+                FROM q
+                ORDER BY q.id
+            ) c
+        ) c, (
+            SELECT {_binary_column_aggregates(LINK_COLUMNS, 'l')}
+            FROM (
+                SELECT DISTINCT ON (q.link_id) q.link_id AS id,
+                    q.id AS connector_id, q.treenode_id, q.relation_id,
+                    q.link_edition_time AS edition_time,
+                    q.link_confidence AS confidence
+                FROM q
+                WHERE q.link_id IS NOT NULL
+                ORDER BY q.link_id
+            ) l
+        ) l
+    """
+
+
+def pack_node_columns(treenodes, connectors, links, labels,
+        node_limit_reached, relation_map, extra_data=None) -> bytes:
+    """Serialize node columns into the binary columnar node list format."""
+    meta = msgpack.packb([labels, relation_map, extra_data or []])
+    parts = [NODE_COLUMNS_HEADER.pack(NODE_COLUMNS_MAGIC,
+            NODE_COLUMNS_VERSION, 1 if node_limit_reached else 0,
+            len(treenodes['id']), len(connectors['id']), len(links['id']),
+            len(meta))]
+    for group, columns in ((treenodes, TREENODE_COLUMNS),
+            (connectors, CONNECTOR_COLUMNS), (links, LINK_COLUMNS)):
+        for name, dtype in columns:
+            data = np.ascontiguousarray(group[name], dtype=dtype).tobytes()
+            parts.append(data)
+            padding = -len(data) % 8
+            if padding:
+                parts.append(b'\0' * padding)
+    parts.append(meta)
+    return b''.join(parts)
+
+
+def unpack_node_columns(data) -> Dict[str, Any]:
+    """Parse binary columnar node list data into a dictionary with the fields
+    treenodes, connectors, links (each a dictionary of column arrays), labels,
+    node_limit_reached, relation_map and extra_data.
+    """
+    magic, version, flags, n_treenodes, n_connectors, n_links, meta_length = \
+            NODE_COLUMNS_HEADER.unpack_from(data, 0)
+    if magic != NODE_COLUMNS_MAGIC:
+        raise ValueError("Unexpected columnar node data format")
+    if version != NODE_COLUMNS_VERSION:
+        raise ValueError(f"Unsupported columnar node data version: {version}")
+
+    offset = NODE_COLUMNS_HEADER.size
+    groups = []
+    for n, columns in ((n_treenodes, TREENODE_COLUMNS),
+            (n_connectors, CONNECTOR_COLUMNS), (n_links, LINK_COLUMNS)):
+        group = {}
+        for name, dtype in columns:
+            group[name] = np.frombuffer(data, dtype=dtype, count=n, offset=offset)
+            offset += group[name].nbytes + (-group[name].nbytes % 8)
+        groups.append(group)
+
+    labels, relation_map, extra_data = msgpack.unpackb(
+            data[offset:offset + meta_length], raw=False, strict_map_key=False)
+
+    return {
+        'treenodes': groups[0],
+        'connectors': groups[1],
+        'links': groups[2],
+        'labels': labels,
+        'node_limit_reached': bool(flags & 1),
+        'relation_map': relation_map,
+        'extra_data': extra_data,
+    }
+
+
+def node_tuples_to_columns(result) -> bytes:
+    """Convert a node query result in the tuple format (e.g. from a cache) into
+    the binary columnar format.
+    """
+    treenodes = _treenode_columns_from_rows(result[0])
+    connectors = _columns_from_array(
+            _object_rows([c[:7] for c in result[1]], len(CONNECTOR_ROW_INDEX)),
+            CONNECTOR_COLUMNS, CONNECTOR_ROW_INDEX)
+    link_rows = [(c[0],) + tuple(link) for c in result[1] for link in c[7]]
+    links = _columns_from_array(_object_rows(link_rows, len(LINK_ROW_INDEX)),
+            LINK_COLUMNS, LINK_ROW_INDEX)
+    extra_data = result[5] if len(result) > 5 else []
+
+    return pack_node_columns(treenodes, connectors, links, result[2],
+            result[3], result[4], extra_data)
+
+
 def create_node_response(result, params, target_format, target_options, data_type) -> HttpResponse:
     if target_format == 'json':
         if data_type == 'json':
@@ -2593,6 +4116,18 @@ def create_node_response(result, params, target_format, target_options, data_typ
         else:
             raise ValueError(f"Unknown data type: {data_type}")
         return HttpResponse(data, content_type='application/octet-stream')
+    elif target_format == 'columnar':
+        if data_type == 'columnar':
+            data = result
+        elif data_type == 'json':
+            data = node_tuples_to_columns(result)
+        elif data_type == 'json_text':
+            data = node_tuples_to_columns(ujson.loads(result))
+        elif data_type == 'msgpack':
+            data = node_tuples_to_columns(msgpack.unpackb(result, use_list=False))
+        else:
+            raise ValueError(f"Unknown data type: {data_type}")
+        return HttpResponse(data, content_type='application/octet-stream')
     elif target_format == 'png' or target_format == 'gif':
         if data_type == 'json':
             data = result
@@ -3001,6 +4536,194 @@ def node_nearest(request:HttpRequest, project_id=None) -> JsonResponse:
     })
 
 
+@api_view(['POST'])
+@requires_user_role(UserRole.Browse)
+def nodes_nearest(request:HttpRequest, project_id=None) -> JsonResponse:
+    """Find the closest node for each of many passed in locations.
+
+    For each location, a skeleton ID or a neuron ID can be passed in, to only
+    look for the closest node in this skeleton or the skeletons of this
+    neuron. Locations with a restriction are answered from the skeleton
+    arbors, all others with a single database query. The result is a list
+    with one [treenode_id, skeleton_id, x, y, z] list for each location, in
+    the order of the query locations. It contains null for locations without
+    any node found.
+    ---
+    parameters:
+        - name: project_id
+          description: The project to operate in.
+          required: true
+          paramType: path
+        - name: points
+          description: |
+            A list of [x, y, z] query locations, optionally as JSON encoded
+            string.
+          required: true
+          type: array
+          items:
+            type: array
+          paramType: form
+        - name: skeleton_ids
+          description: |
+            Optional, a skeleton ID for each query location, the result node
+            has to be in this skeleton. Use -1 or null for no restriction.
+          required: false
+          type: array
+          items:
+            type: integer
+          paramType: form
+        - name: neuron_ids
+          description: |
+            Optional, a neuron ID for each query location, the result node
+            has to be in this neuron. Use -1 or null for no restriction. Only
+            one of skeleton ID and neuron ID can be used for each location.
+          required: false
+          type: array
+          items:
+            type: integer
+          paramType: form
+    """
+    def get_list(name, map_fn):
+        if name in request.POST:
+            return json.loads(request.POST[name])
+        return get_request_list(request.POST, name, None, map_fn=map_fn)
+
+    points = get_list('points', float)
+    if not points:
+        raise ValueError("Need at least one point")
+
+    return JsonResponse(_nodes_nearest(int(project_id), points,
+            get_list('skeleton_ids', int), get_list('neuron_ids', int)),
+            safe=False)
+
+
+def _nodes_nearest(project_id, points, skeleton_ids=None, neuron_ids=None) -> List:
+    """Find the closest treenode for each passed in point, optionally
+    restricted to a skeleton or neuron per point. Points with a restriction
+    are looked up in a KD-tree of the nodes of the respective skeletons, all
+    others are found with one LATERAL nearest neighbor query.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    n_points = len(points)
+
+    def get_restrictions(values, name):
+        if not values:
+            return [None] * n_points
+        if len(values) != n_points:
+            raise ValueError(f"Need one entry in {name} for each point")
+        return [None if v is None or int(v) < 0 else int(v) for v in values]
+
+    point_skeleton_ids = get_restrictions(skeleton_ids, 'skeleton_ids')
+    point_neuron_ids = get_restrictions(neuron_ids, 'neuron_ids')
+
+    cursor = connection.cursor()
+
+    query_neuron_ids = set(n for n in point_neuron_ids if n is not None)
+    neuron_skeletons:DefaultDict[int, List] = defaultdict(list)
+    if query_neuron_ids:
+        cursor.execute("""
+            SELECT cici.class_instance_b, cici.class_instance_a
+            FROM class_instance_class_instance cici
+            JOIN UNNEST(%(neuron_ids)s::bigint[]) neuron(id)
+                ON neuron.id = cici.class_instance_b
+            WHERE cici.project_id = %(project_id)s
+            AND cici.relation_id = %(model_of)s
+            ORDER BY cici.class_instance_a
+        """, {
+            'project_id': project_id,
+            'neuron_ids': list(query_neuron_ids),
+            'model_of': get_relation_to_id_map(project_id, ('model_of',))['model_of'],
+        })
+        for neuron_id, skeleton_id in cursor.fetchall():
+            neuron_skeletons[neuron_id].append(skeleton_id)
+        missing = query_neuron_ids - set(neuron_skeletons.keys())
+        if missing:
+            raise ValueError("Could not find skeletons for neurons: " +
+                    ", ".join(str(n) for n in sorted(missing)))
+
+    # Group points by the skeletons they are restricted to.
+    restricted:DefaultDict[Tuple, List] = defaultdict(list)
+    unrestricted = []
+    for i, (skeleton_id, neuron_id) in enumerate(zip(point_skeleton_ids, point_neuron_ids)):
+        if skeleton_id is not None and neuron_id is not None:
+            raise ValueError("Only skeleton_id or neuron_id can be provided, not both")
+        if skeleton_id is not None:
+            restricted[(skeleton_id,)].append(i)
+        elif neuron_id is not None:
+            restricted[tuple(neuron_skeletons[neuron_id])].append(i)
+        else:
+            unrestricted.append(i)
+
+    results:List = [None] * n_points
+
+    query_skeleton_ids = set(s for key in restricted for s in key)
+    if query_skeleton_ids:
+        cursor.execute("""
+            SELECT id
+            FROM class_instance
+            WHERE project_id = %(project_id)s
+            AND id = ANY(%(skeleton_ids)s::bigint[])
+        """, {
+            'project_id': project_id,
+            'skeleton_ids': list(query_skeleton_ids),
+        })
+        missing = query_skeleton_ids - set(r[0] for r in cursor.fetchall())
+        if missing:
+            raise ValueError("Could not find skeletons: " +
+                    ", ".join(str(s) for s in sorted(missing)))
+
+        arbors = dict((skeleton_id, get_skeleton_arbor(skeleton_id, cursor))
+                for skeleton_id in query_skeleton_ids)
+        for group_skeleton_ids, indices in restricted.items():
+            trees = [arbors[skeleton_id] for skeleton_id in group_skeleton_ids]
+            node_ids = np.concatenate([t.node_ids for t in trees])
+            node_skeleton_ids = np.concatenate([np.full(len(t), skeleton_id)
+                    for t, skeleton_id in zip(trees, group_skeleton_ids)])
+            locations = np.concatenate([np.column_stack([
+                    t.properties['location_x'], t.properties['location_y'],
+                    t.properties['location_z']]) for t in trees])
+            _, nearest = cKDTree(locations).query(points[indices])
+            for i, n in zip(indices, nearest.tolist()):
+                results[i] = [int(node_ids[n]), int(node_skeleton_ids[n])] + \
+                        locations[n].tolist()
+
+    if unrestricted:
+        # Like in node_nearest(), the closest treenode is expected among the
+        # 100 edges with the closest bounding box centroids, so that the
+        # spatial index can be used for each point.
+        cursor.execute("""
+            SELECT query.i, t.id, t.skeleton_id, t.location_x, t.location_y,
+                t.location_z
+            FROM UNNEST(%(indices)s::int[], %(x)s::float8[], %(y)s::float8[],
+                %(z)s::float8[]) query(i, x, y, z)
+            CROSS JOIN LATERAL (
+                SELECT closest_node.id
+                FROM (
+                    SELECT id, edge
+                    FROM treenode_edge
+                    WHERE project_id = %(project_id)s
+                    ORDER BY edge <<->> ST_MakePoint(query.x, query.y, query.z)
+                    LIMIT 100
+                ) closest_node(id, edge)
+                ORDER BY ST_StartPoint(closest_node.edge) <<->>
+                    ST_MakePoint(query.x, query.y, query.z)
+                LIMIT 1
+            ) nearest
+            JOIN treenode t
+                ON t.id = nearest.id
+        """, {
+            'project_id': project_id,
+            'indices': unrestricted,
+            'x': points[unrestricted, 0].tolist(),
+            'y': points[unrestricted, 1].tolist(),
+            'z': points[unrestricted, 2].tolist(),
+        })
+        for row in cursor.fetchall():
+            results[row[0]] = list(row[1:])
+
+    return results
+
+
 def _fetch_location(project_id, location_id):
     """Get the locations of the passed in node ID in the passed in project."""
     locations = _fetch_locations(project_id, [location_id])
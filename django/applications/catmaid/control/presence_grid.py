@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+import math
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from catmaid.models import SpatialPresenceGrid
+
+
+def get_cell_range(box, cell_width, cell_height, cell_depth) -> List[Tuple[int, int]]:
+    """Return the inclusive range of X, Y and Z cell indices of all cells whose
+    closed box intersects the passed in closed box [min_x, min_y, min_z, max_x,
+    max_y, max_z]. This includes cells that only share a boundary with the
+    box.
+    """
+    cell_size = (cell_width, cell_height, cell_depth)
+    return [(int(math.ceil(box[i] / cell_size[i])) - 1,
+            int(math.floor(box[i + 3] / cell_size[i]))) for i in range(3)]
+
+
+def get_cells_in_box(box, cell_width, cell_height, cell_depth) -> List[Tuple[int, int, int]]:
+    """Return the [x, y, z] index of all cells whose closed box intersects the
+    passed in box [min_x, min_y, min_z, max_x, max_y, max_z].
+    """
+    (x0, x1), (y0, y1), (z0, z1) = get_cell_range(box, cell_width,
+            cell_height, cell_depth)
+    return [(x, y, z) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+            for z in range(z0, z1 + 1)]
+
+
+def split_bounding_box(bb, cell_width, cell_height, cell_depth,
+        half_open_z=False) -> Tuple[Optional[List[Tuple[int, int]]], List[Dict[str, float]]]:
+    """Split the passed in bounding box (a dict with the fields minx, miny,
+    minz, maxx, maxy and maxz) into the cells of a grid that are fully
+    contained in it and up to six boundary boxes that cover the rest of it.
+    The contained cells are returned as inclusive X, Y and Z index ranges, or
+    None if no cell is fully contained. Cells are closed boxes, which is why
+    with half_open_z, for a Z range [minz, maxz), cells that end at maxz
+    aren't considered contained.
+    """
+    cell_size = (cell_width, cell_height, cell_depth)
+    bb_min = (bb['minx'], bb['miny'], bb['minz'])
+    bb_max = (bb['maxx'], bb['maxy'], bb['maxz'])
+
+    cell_range = [(int(math.ceil(bb_min[i] / cell_size[i])),
+            int(math.floor(bb_max[i] / cell_size[i])) - 1) for i in range(3)]
+    if half_open_z and cell_range[2][1] + 1 == bb_max[2] / cell_size[2]:
+        cell_range[2] = (cell_range[2][0], cell_range[2][1] - 1)
+    if any(c[0] > c[1] for c in cell_range):
+        return None, [dict((k, bb[k]) for k in ('minx', 'miny', 'minz',
+                'maxx', 'maxy', 'maxz'))]
+
+    inner_min = [cell_range[i][0] * cell_size[i] for i in range(3)]
+    inner_max = [(cell_range[i][1] + 1) * cell_size[i] for i in range(3)]
+
+    # Cut off slabs along X, then along Y within the X range of the contained
+    # cells, and finally along Z within their X and Y range.
+    boundary_boxes = []
+    for dim in range(3):
+        box_min = [inner_min[i] if i < dim else bb_min[i] for i in range(3)]
+        box_max = [inner_max[i] if i < dim else bb_max[i] for i in range(3)]
+        if bb_min[dim] < inner_min[dim]:
+            slab_max = list(box_max)
+            slab_max[dim] = inner_min[dim]
+            boundary_boxes.append((box_min, slab_max))
+        if inner_max[dim] < bb_max[dim]:
+            slab_min = list(box_min)
+            slab_min[dim] = inner_max[dim]
+            boundary_boxes.append((slab_min, box_max))
+
+    return cell_range, [{
+        'minx': b[0][0], 'miny': b[0][1], 'minz': b[0][2],
+        'maxx': b[1][0], 'maxy': b[1][1], 'maxz': b[1][2],
+    } for b in boundary_boxes]
+
+
+def get_bounding_box_params(params, bb) -> Dict[str, Any]:
+    """Return a copy of the passed in query parameters with the bounding box
+    replaced by the passed in one, including its derived Z center and half
+    depth.
+    """
+    bb_params = dict(params, **bb)
+    bb_params['halfzdiff'] = abs(bb['maxz'] - bb['minz']) * 0.5
+    bb_params['halfz'] = bb['minz'] + (bb['maxz'] - bb['minz']) * 0.5
+    return bb_params
+
+
+def get_presence_grid_split(project_id, bb, half_open_z=False) -> Optional[Tuple[SpatialPresenceGrid, List[Tuple[int, int]], List[Dict[str, float]]]]:
+    """If the passed in project has an enabled presence grid and the passed in
+    bounding box fully contains at least SPATIAL_PRESENCE_GRID_MIN_CELLS of
+    its cells, return the grid, the index ranges of the contained cells and
+    the boundary boxes that have to be queried separately. Otherwise, None is
+    returned. With half_open_z, the bounding box Z range is treated as
+    [minz, maxz).
+    """
+    min_cells = settings.SPATIAL_PRESENCE_GRID_MIN_CELLS
+    if not min_cells:
+        return None
+
+    grid = SpatialPresenceGrid.objects.filter(project_id=project_id,
+            enabled=True).order_by('id').first()
+    if not grid:
+        return None
+
+    cell_range, boundary_boxes = split_bounding_box(bb, grid.cell_width,
+            grid.cell_height, grid.cell_depth, half_open_z)
+    if not cell_range:
+        return None
+
+    n_cells = 1
+    for c in cell_range:
+        n_cells *= c[1] - c[0] + 1
+    if n_cells < min_cells:
+        return None
+
+    return grid, cell_range, boundary_boxes
+
+
+def get_present_ids(cursor, grid, cell_range, field) -> Set[int]:
+    """Get the union of all IDs of the passed in cell field (skeleton_ids,
+    connector_ids or linked_connector_ids) in the passed in cell index range.
+    """
+    if field not in ('skeleton_ids', 'connector_ids', 'linked_connector_ids'):
+        raise ValueError(f'Unknown presence grid field: {field}')
+    cursor.execute(f"""
+        SELECT DISTINCT UNNEST({field})
+        FROM spatial_presence_grid_cell
+        WHERE grid_id = %(grid_id)s
+        AND x_index BETWEEN %(min_x)s AND %(max_x)s
+        AND y_index BETWEEN %(min_y)s AND %(max_y)s
+        AND z_index BETWEEN %(min_z)s AND %(max_z)s
+    """, {
+        'grid_id': grid.id,
+        'min_x': cell_range[0][0],
+        'max_x': cell_range[0][1],
+        'min_y': cell_range[1][0],
+        'max_y': cell_range[1][1],
+        'min_z': cell_range[2][0],
+        'max_z': cell_range[2][1],
+    })
+    return set(r[0] for r in cursor.fetchall())
+
+
+def update_presence_grid_cells(cursor, grid, cells) -> None:
+    """Recompute the skeletons and connectors present in the passed in cells
+    ([x, y, z] indices) of a presence grid. The same intersection tests as the
+    bounding box queries of skeletons and connectors are used. Cells that
+    became empty are removed.
+    """
+    if not cells:
+        return
+    cursor.execute("""
+        WITH cell AS (
+            SELECT c.x_index, c.y_index, c.z_index,
+                c.x_index * %(cell_width)s::float8 AS minx,
+                c.y_index * %(cell_height)s::float8 AS miny,
+                c.z_index * %(cell_depth)s::float8 AS minz,
+                (c.x_index + 1) * %(cell_width)s::float8 AS maxx,
+                (c.y_index + 1) * %(cell_height)s::float8 AS maxy,
+                (c.z_index + 1) * %(cell_depth)s::float8 AS maxz
+            FROM UNNEST(%(x_indices)s::int[], %(y_indices)s::int[],
+                %(z_indices)s::int[]) c(x_index, y_index, z_index)
+        ), cell_geom AS (
+            SELECT c.x_index, c.y_index, c.z_index,
+                ST_MakeLine(ARRAY[
+                    ST_MakePoint(c.minx, c.maxy, c.maxz),
+                    ST_MakePoint(c.maxx, c.miny, c.minz)]::geometry[]) AS box,
+                ST_MakePolygon(ST_MakeLine(ARRAY[
+                    ST_MakePoint(c.minx, c.miny, (c.minz + c.maxz) * 0.5),
+                    ST_MakePoint(c.maxx, c.miny, (c.minz + c.maxz) * 0.5),
+                    ST_MakePoint(c.maxx, c.maxy, (c.minz + c.maxz) * 0.5),
+                    ST_MakePoint(c.minx, c.maxy, (c.minz + c.maxz) * 0.5),
+                    ST_MakePoint(c.minx, c.miny, (c.minz + c.maxz) * 0.5)]::geometry[])) AS plane,
+                (c.maxz - c.minz) * 0.5 AS halfzdiff
+            FROM cell c
+        ), presence AS (
+            SELECT g.x_index, g.y_index, g.z_index,
+                ARRAY(
+                    SELECT DISTINCT t.skeleton_id
+                    FROM treenode_edge te
+                    JOIN treenode t
+                        ON t.id = te.id
+                    WHERE te.edge &&& g.box
+                    AND ST_3DDWithin(te.edge, g.plane, g.halfzdiff)
+                    AND te.project_id = %(project_id)s
+                ) AS skeleton_ids,
+                ARRAY(
+                    SELECT cg.id
+                    FROM connector_geom cg
+                    WHERE cg.geom &&& g.box
+                    AND cg.project_id = %(project_id)s
+                ) AS connector_ids,
+                ARRAY(
+                    SELECT DISTINCT tc.connector_id
+                    FROM treenode_connector_edge tce
+                    JOIN treenode_connector tc
+                        ON tc.id = tce.id
+                    WHERE tce.edge &&& g.box
+                    AND ST_3DDWithin(tce.edge, g.plane, g.halfzdiff)
+                    AND tce.project_id = %(project_id)s
+                ) AS linked_connector_ids
+            FROM cell_geom g
+        ), deleted AS (
+            DELETE FROM spatial_presence_grid_cell c
+            USING presence p
+            WHERE c.grid_id = %(grid_id)s
+            AND c.x_index = p.x_index
+            AND c.y_index = p.y_index
+            AND c.z_index = p.z_index
+            AND cardinality(p.skeleton_ids) = 0
+            AND cardinality(p.connector_ids) = 0
+            AND cardinality(p.linked_connector_ids) = 0
+        )
+        INSERT INTO spatial_presence_grid_cell AS c (grid_id, x_index, y_index,
+            z_index, skeleton_ids, connector_ids, linked_connector_ids)
+        SELECT %(grid_id)s, p.x_index, p.y_index, p.z_index, p.skeleton_ids,
+            p.connector_ids, p.linked_connector_ids
+        FROM presence p
+        WHERE cardinality(p.skeleton_ids) > 0
+        OR cardinality(p.connector_ids) > 0
+        OR cardinality(p.linked_connector_ids) > 0
+        ON CONFLICT (grid_id, x_index, y_index, z_index)
+        DO UPDATE SET update_time = EXCLUDED.update_time,
+            skeleton_ids = EXCLUDED.skeleton_ids,
+            connector_ids = EXCLUDED.connector_ids,
+            linked_connector_ids = EXCLUDED.linked_connector_ids
+    """, {
+        'grid_id': grid.id,
+        'project_id': grid.project_id,
+        'cell_width': grid.cell_width,
+        'cell_height': grid.cell_height,
+        'cell_depth': grid.cell_depth,
+        'x_indices': [c[0] for c in cells],
+        'y_indices': [c[1] for c in cells],
+        'z_indices': [c[2] for c in cells],
+    })
+
+
+def get_project_extent(cursor, project_id) -> Optional[List[float]]:
+    """Return the bounding box [min_x, min_y, min_z, max_x, max_y, max_z] of
+    all treenode edges, connectors and connector links in a project or None
+    if there are none.
+    """
+    cursor.execute("""
+        SELECT ST_XMin(e.extent), ST_YMin(e.extent), ST_ZMin(e.extent),
+            ST_XMax(e.extent), ST_YMax(e.extent), ST_ZMax(e.extent)
+        FROM (
+            SELECT ST_3DExtent(g.geom) AS extent
+            FROM (
+                SELECT edge AS geom FROM treenode_edge
+                WHERE project_id = %(project_id)s
+                UNION ALL
+                SELECT geom FROM connector_geom
+                WHERE project_id = %(project_id)s
+                UNION ALL
+                SELECT edge AS geom FROM treenode_connector_edge
+                WHERE project_id = %(project_id)s
+            ) g
+        ) e
+    """, {
+        'project_id': project_id,
+    })
+    extent = cursor.fetchone()
+    if not extent or extent[0] is None:
+        return None
+    return list(extent)
+
+
+def update_presence_grid(project_id, cell_width, cell_height, cell_depth,
+        batch_size=1000, progress_fn=None) -> SpatialPresenceGrid:
+    """Create or rebuild the presence grid with the passed in cell dimensions
+    for a project and enable it. Cells are computed in batches, each one in
+    its own transaction. While this is done, the grid is disabled. An optional
+    progress function is called with the number of computed and total cells
+    after each batch.
+    """
+    grid, _ = SpatialPresenceGrid.objects.get_or_create(project_id=project_id,
+            cell_width=cell_width, cell_height=cell_height,
+            cell_depth=cell_depth)
+    grid.enabled = False
+    grid.save()
+
+    cursor = connection.cursor()
+    cursor.execute("""
+        DELETE FROM spatial_presence_grid_cell WHERE grid_id = %(grid_id)s
+    """, {
+        'grid_id': grid.id,
+    })
+
+    extent = get_project_extent(cursor, project_id)
+    cells = get_cells_in_box(extent, cell_width, cell_height,
+            cell_depth) if extent else []
+    n_cells = len(cells)
+    for i in range(0, n_cells, batch_size):
+        with transaction.atomic():
+            update_presence_grid_cells(cursor, grid, cells[i:i + batch_size])
+        if progress_fn:
+            progress_fn(min(i + batch_size, n_cells), n_cells)
+
+    grid.enabled = True
+    grid.save()
+
+    return grid
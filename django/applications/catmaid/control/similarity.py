@@ -8,6 +8,7 @@ from typing import Any, Dict, List
 
 from celery.task import task
 from celery.utils.log import get_task_logger
+from django.conf import settings
 from django.contrib.gis.db import models as spatial_models
 from django.db import connection, transaction
 from django.http import HttpRequest, HttpResponse, JsonResponse
@@ -27,14 +28,26 @@ from catmaid.control.common import (insert_into_log, get_class_to_id_map,
 from catmaid.models import (NblastConfig, NblastSample, Project, PointSet,
         NblastConfigDefaultDistanceBreaks, NblastConfigDefaultDotBreaks,
         NblastSimilarity, PointCloud, UserRole)
-from catmaid.control.nat.r import (compute_scoring_matrix, nblast,
-        test_environment, setup_environment)
+from catmaid.control.nat import nblast as nat_nblast, r as nat_r
 from catmaid.control.pointcloud import list_pointclouds
 
 
 logger = get_task_logger(__name__)
 
 
+def get_nblast_backend():
+    """Return the module implementing NBLAST, as selected by the
+    NBLAST_BACKEND setting. Both provide the same nblast(),
+    compute_scoring_matrix() and test_environment() functions.
+    """
+    backend = getattr(settings, 'NBLAST_BACKEND', 'r')
+    if backend == 'python':
+        return nat_nblast
+    elif backend == 'r':
+        return nat_r
+    raise ValueError(f"Unknown NBLAST backend: {backend}")
+
+
 def serialize_sample(sample) -> Dict[str, Any]:
     return {
         'id': sample.id,
@@ -158,14 +171,15 @@ def serialize_pointcloud(pointcloud, with_locations=False, with_images=False) ->
 def install_dependencies() -> None:
     """Install all R rependencies.
     """
-    setup_environment()
+    nat_r.setup_environment()
 
 
 @requires_user_role(UserRole.Browse)
 def test_setup(request, project_id) -> JsonResponse:
-    """Test if all required R packages are installed to use the NBLAST API.
+    """Test if all requirements of the configured NBLAST backend are met to use
+    the NBLAST API.
     """
-    return test_environment()
+    return get_nblast_backend().test_environment()
 
 
 class ConfigurationDetail(APIView):
@@ -581,7 +595,8 @@ def compute_nblast_config(config_id, user_id, use_cache=True) -> str:
             config.status = 'computing'
             config.save()
 
-        scoring_info = compute_scoring_matrix(config.project_id, user_id,
+        backend = get_nblast_backend()
+        scoring_info = backend.compute_scoring_matrix(config.project_id, user_id,
                 config.match_sample, config.random_sample,
                 config.distance_breaks, config.dot_breaks,
                 config.resample_step, config.tangent_neighbors)
@@ -707,7 +722,8 @@ def compute_nblast(project_id, user_id, similarity_id, remove_target_duplicates,
             raise ValueError(f"NBLAST config #{config.id}" +
                 " does not have a computed scoring.")
 
-        scoring_info = nblast(project_id, user_id, config.id,
+        backend = get_nblast_backend()
+        scoring_info = backend.nblast(project_id, user_id, config.id,
                 query_object_ids, target_object_ids,
                 similarity.query_type_id, similarity.target_type_id,
                 normalized=similarity.normalized,
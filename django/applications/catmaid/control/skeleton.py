@@ -3,6 +3,7 @@
 from collections import defaultdict
 import csv
 from datetime import datetime, timedelta
+from io import BytesIO
 from itertools import chain
 import dateutil.parser
 import json
@@ -31,16 +32,21 @@ from catmaid.objects import Skeleton, SkeletonGroup, \
         compartmentalize_skeletongroup_by_confidence
 from catmaid.control.authentication import requires_user_role, \
         can_edit_class_instance_or_fail, can_edit_or_fail, can_edit_all_or_fail
+from catmaid.control.connectivity import (ConnectivityMatrix,
+        get_annotation_groups)
 from catmaid.control.common import (insert_into_log, get_class_to_id_map,
         get_relation_to_id_map, _create_relation, get_request_bool,
         get_request_list, Echo)
 from catmaid.control.link import LINK_TYPES
 from catmaid.control.neuron import _delete_if_empty
+from catmaid.control.presence_grid import (get_bounding_box_params,
+        get_present_ids, get_presence_grid_split)
 from catmaid.control.annotation import (annotations_for_skeleton,
         create_annotation_query, _annotate_entities, _update_neuron_annotations)
 from catmaid.control.provenance import get_data_source, normalize_source_url
 from catmaid.control.review import get_review_status
-from catmaid.control.tree_util import find_root, reroot, edge_count_to_root
+from catmaid.control.tree_util import (find_root, reroot, edge_count_to_root,
+        get_skeleton_arbor)
 from catmaid.control.volume import get_volume_details
 
 
@@ -120,41 +126,19 @@ def _open_leaves(project_id, skeleton_id, tnid=None):
     relations = get_relation_to_id_map(project_id, ['labeled_as'])
     labeled_as = relations['labeled_as']
 
-    # Select all nodes and their tags
-    cursor.execute('''
-        SELECT t.id, t.parent_id
-        FROM treenode t
-        WHERE t.skeleton_id = %s
-        ''', (int(skeleton_id),))
+    tree = get_skeleton_arbor(skeleton_id, cursor)
+    n_nodes = len(tree)
 
-    # Some entries repeated, when a node has more than one tag
-    # Create a graph with edges from parent to child, and accumulate parents.
-    tree = nx.DiGraph()
-    n_nodes = 0
-    for row in cursor.fetchall():
-        n_nodes += 1
-        node_id = row[0]
-        if row[1]:
-            # It is ok to add edges that already exist: DiGraph doesn't keep duplicates
-            tree.add_edge(row[1], node_id)
-        else:
-            tree.add_node(node_id)
-
-            # Default to root node
-            if not tnid:
-                tnid = node_id
+    # Default to root node
+    if not tnid:
+        tnid = find_root(tree)
 
     if tnid not in tree:
         raise ValueError("Could not find %s in skeleton %s" % (tnid, int(skeleton_id)))
 
     reroot(tree, tnid)
     distances = edge_count_to_root(tree, root_node=tnid)
-    leaves = set()
-
-    for node_id, out_degree in tree.out_degree_iter():
-        if 0 == out_degree or node_id == tnid and 1 == out_degree:
-            # Found an end node
-            leaves.add(node_id)
+    leaves = _leaves(tree, tnid)
 
     # Select all nodes and their tags
     cursor.execute('''
@@ -250,79 +234,59 @@ def find_labels(request:HttpRequest, project_id=None, skeleton_id=None) -> JsonR
     return JsonResponse(_find_labels(project_id, skeleton_id, label_regex, tnid,
         only_leaves), safe=False)
 
+def _leaves(tree, root_id) -> Set[int]:
+    """Return the end nodes of a tree rooted at the passed in node, which
+    includes the root if it has only one child."""
+    n_children = tree.n_children
+    leaves = set(tree.node_ids[n_children == 0].tolist())
+    if 1 == n_children[tree.index(root_id)]:
+        leaves.add(root_id)
+    return leaves
+
 def _find_labels(project_id, skeleton_id, label_regex, tnid=None,
         only_leaves=False):
     cursor = connection.cursor()
 
+    tree = get_skeleton_arbor(skeleton_id, cursor)
     if tnid is None:
-        cursor.execute("""
-            SELECT id FROM treenode
-            WHERE skeleton_id = %(skeleton_id)s AND parent_id IS NULL
-        """)
-        tnid = cursor.fetchone()[0]
+        tnid = find_root(tree)
+
+    if tnid not in tree:
+        raise ValueError("Could not find %s in skeleton %s" % (tnid, int(skeleton_id)))
 
     cursor.execute("SELECT id FROM relation WHERE project_id=%s AND relation_name='labeled_as'" % int(project_id))
     labeled_as = cursor.fetchone()[0]
 
-    # Select all nodes in the skeleton and any matching labels
+    # Select all matching labels of nodes in the skeleton
     cursor.execute('''
-            SELECT
-                t.id,
-                t.parent_id,
-                t.location_x,
-                t.location_y,
-                t.location_z,
-                ci.name
-            FROM treenode t
-            LEFT OUTER JOIN (
-                treenode_class_instance tci
-                INNER JOIN class_instance ci
-                  ON (tci.class_instance_id = ci.id AND tci.relation_id = %s AND ci.name ~ %s))
+            SELECT tci.treenode_id, ci.name
+            FROM treenode_class_instance tci
+            JOIN class_instance ci
+              ON tci.class_instance_id = ci.id
+            JOIN treenode t
               ON t.id = tci.treenode_id
             WHERE t.skeleton_id = %s
-            ''', (labeled_as, label_regex, int(skeleton_id)))
+              AND tci.relation_id = %s
+              AND ci.name ~ %s
+            ''', (int(skeleton_id), labeled_as, label_regex))
 
     # Some entries repeated, when a node has more than one matching label
-    # Create a graph with edges from parent to child, and accumulate parents
-    tree = nx.DiGraph()
-    for row in cursor.fetchall():
-        nodeID = row[0]
-        if row[1]:
-            # It is ok to add edges that already exist: DiGraph doesn't keep duplicates
-            tree.add_edge(row[1], nodeID)
-        else:
-            tree.add_node(nodeID)
-        tree.node[nodeID]['loc'] = (row[2], row[3], row[4])
-        if row[5]:
-            props = tree.node[nodeID]
-            tags = props.get('tags')
-            if tags:
-                tags.append(row[5])
-            else:
-                props['tags'] = [row[5]]
-
-    if tnid not in tree:
-        raise ValueError("Could not find %s in skeleton %s" % (tnid, int(skeleton_id)))
+    tags:DefaultDict[int, List[str]] = defaultdict(list)
+    for node_id, name in cursor.fetchall():
+        tags[node_id].append(name)
 
     reroot(tree, tnid)
     distances = edge_count_to_root(tree, root_node=tnid)
+    leaves = _leaves(tree, tnid) if only_leaves else None
 
     nearest = []
-    leaves = set()
-
-    if only_leaves:
-        for node_id, out_degree in tree.out_degree_iter():
-            if 0 == out_degree or node_id == tnid and 1 == out_degree:
-                # Found an end node
-                leaves.add(node_id)
-
-    for nodeID, props in tree.nodes_iter(data=True):
-        if only_leaves and nodeID not in leaves:
+    for node_id in sorted(tags.keys(), key=tree.index):
+        if leaves is not None and node_id not in leaves:
             continue
-        if 'tags' in props:
-            # Found a node with a matching label
-            d = distances[nodeID]
-            nearest.append([nodeID, props['loc'], d, props['tags']])
+        # Found a node with a matching label
+        props = tree.node_data(node_id)
+        loc = (props['location_x'], props['location_y'], props['location_z'])
+        nearest.append([node_id, loc, distances[node_id], tags[node_id]])
 
     nearest.sort(key=lambda n: n[2])
 
@@ -1011,49 +975,57 @@ def connectivity_counts(request:HttpRequest, project_id=None) -> JsonResponse:
 
     relations = dict(Relation.objects.filter(project_id=project_id).values_list('relation_name', 'id'))
 
-    source_relation_ids = map(lambda r: relations[r], source_relations)
-    target_relation_ids = map(lambda r: relations[r], target_relations)
+    source_relation_ids = [relations[r] for r in source_relations]
+    target_relation_ids = [relations[r] for r in target_relations]
 
-    extra_select = []
+    cursor = connection.cursor()
     if count_partner_links:
+        # Partner links are counted in the materialized connectivity table.
+        extra_checks = []
+        if source_relation_ids:
+            extra_checks.append("AND sc.relation_id = ANY(%(source_relation_ids)s::bigint[])")
         if target_relation_ids:
-            extra_target_check = """
-                AND tc2.relation_id IN ({})
-            """.format(','.join(map(str, target_relation_ids)))
-        else:
-            extra_target_check = ""
-
-        extra_select.append(f"""
-            JOIN treenode_connector tc2
-                ON tc.connector_id = tc2.connector_id
-                AND tc.id <> tc2.id
-                {extra_target_check}
-        """)
+            extra_checks.append("AND sc.partner_relation_id = ANY(%(target_relation_ids)s::bigint[])")
 
-    if source_relation_ids:
-        extra_source_check = """
-            AND tc.relation_id IN ({})
-        """.format(','.join(map(str, source_relation_ids)))
+        cursor.execute("""
+            SELECT sc.skeleton_id, sc.relation_id, SUM(sc.count)
+            FROM catmaid_skeleton_connectivity sc
+            JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+                ON skeleton.id = sc.skeleton_id
+            WHERE sc.project_id = %(project_id)s
+            {extra_checks}
+            GROUP BY sc.skeleton_id, sc.relation_id
+        """.format(**{
+            'extra_checks': '\n'.join(extra_checks),
+        }), {
+            'project_id': project_id,
+            'skeleton_ids': skeleton_ids,
+            'source_relation_ids': source_relation_ids,
+            'target_relation_ids': target_relation_ids,
+        })
     else:
-        extra_source_check = ""
+        if source_relation_ids:
+            extra_source_check = """
+                AND tc.relation_id = ANY(%(source_relation_ids)s::bigint[])
+            """
+        else:
+            extra_source_check = ""
 
-    cursor = connection.cursor()
-    cursor.execute("""
-        SELECT tc.skeleton_id, tc.relation_id, COUNT(tc)
-        FROM treenode_connector tc
-        JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
-            ON skeleton.id = tc.skeleton_id
-        {extra_select}
-        WHERE tc.project_id = %(project_id)s
-        {extra_source_check}
-        GROUP BY tc.skeleton_id, tc.relation_id
-    """.format(**{
-        'extra_select': '\n'.join(extra_select),
-        'extra_source_check': extra_source_check,
-    }), {
-        'project_id': project_id,
-        'skeleton_ids': skeleton_ids,
-    })
+        cursor.execute("""
+            SELECT tc.skeleton_id, tc.relation_id, COUNT(tc)
+            FROM treenode_connector tc
+            JOIN UNNEST(%(skeleton_ids)s::bigint[]) skeleton(id)
+                ON skeleton.id = tc.skeleton_id
+            WHERE tc.project_id = %(project_id)s
+            {extra_source_check}
+            GROUP BY tc.skeleton_id, tc.relation_id
+        """.format(**{
+            'extra_source_check': extra_source_check,
+        }), {
+            'project_id': project_id,
+            'skeleton_ids': skeleton_ids,
+            'source_relation_ids': source_relation_ids,
+        })
 
     connectivity:Dict = {}
     seen_relations = set()
@@ -1063,7 +1035,7 @@ def connectivity_counts(request:HttpRequest, project_id=None) -> JsonResponse:
             skeletton_entry = {}
             connectivity[row[0]] = skeletton_entry
         seen_relations.add(row[1])
-        skeletton_entry[row[1]] = row[2]
+        skeletton_entry[row[1]] = int(row[2])
 
     if seen_relations:
         relations = dict((v,k) for k,v in relations.items() if v in seen_relations)
@@ -1572,24 +1544,38 @@ def _connected_skeletons(skeleton_ids, op, relation_id_1, relation_id_2,
 
     # Obtain the synapses made by all skeleton_ids considering the desired
     # direction of the synapse, as specified by relation_id_1 and relation_id_2:
-    cursor.execute('''
-    SELECT t1.skeleton_id, t2.skeleton_id, LEAST(t1.confidence, t2.confidence),
-        t1.treenode_id, t2.treenode_id, t1.connector_id
-    FROM treenode_connector t1,
-         treenode_connector t2
-    WHERE t1.skeleton_id = ANY(%s::bigint[])
-      AND t1.relation_id = %s
-      AND t1.connector_id = t2.connector_id
-      AND t1.id != t2.id
-      AND t2.relation_id = %s
-    ''', (list(skeleton_ids), int(relation_id_1), int(relation_id_2)))
-
-    # Sum the number of synapses
-    for srcID, partnerID, confidence, tn1, tn2, connector_id in cursor.fetchall():
-        partner = partners[partnerID]
-        partner.skids[srcID][confidence - 1] += 1
-        if with_nodes:
+    if with_nodes:
+        cursor.execute('''
+        SELECT t1.skeleton_id, t2.skeleton_id, LEAST(t1.confidence, t2.confidence),
+            t1.treenode_id, t2.treenode_id, t1.connector_id
+        FROM treenode_connector t1,
+             treenode_connector t2
+        WHERE t1.skeleton_id = ANY(%s::bigint[])
+          AND t1.relation_id = %s
+          AND t1.connector_id = t2.connector_id
+          AND t1.id != t2.id
+          AND t2.relation_id = %s
+        ''', (list(skeleton_ids), int(relation_id_1), int(relation_id_2)))
+
+        # Sum the number of synapses
+        for srcID, partnerID, confidence, tn1, tn2, connector_id in cursor.fetchall():
+            partner = partners[partnerID]
+            partner.skids[srcID][confidence - 1] += 1
             partner.links.append([tn1, tn2, srcID, connector_id])
+    else:
+        # Without individual links, the materialized link counts can be used.
+        cursor.execute('''
+        SELECT sc.skeleton_id, sc.partner_skeleton_id, sc.confidence, sc.count
+        FROM catmaid_skeleton_connectivity sc
+        WHERE sc.skeleton_id = ANY(%s::bigint[])
+          AND sc.relation_id = %s
+          AND sc.partner_relation_id = %s
+        ''', (list(skeleton_ids), int(relation_id_1), int(relation_id_2)))
+
+        # Sum the number of synapses
+        for srcID, partnerID, confidence, count in cursor.fetchall():
+            partner = partners[partnerID]
+            partner.skids[srcID][confidence - 1] += count
 
     # There may not be any synapses
     if not partners:
@@ -1847,10 +1833,13 @@ def connectivity_matrix(request:HttpRequest, project_id=None) -> JsonResponse:
 
 @api_view(['POST'])
 @requires_user_role(UserRole.Browse)
-def connectivity_matrix_csv(request:HttpRequest, project_id) -> StreamingHttpResponse:
+def connectivity_matrix_csv(request:HttpRequest, project_id) -> HttpResponse:
     """
     Return a CSV file that represents the connectivity matrix of a set of row
-    skeletons and a set of column skeletons.
+    skeletons and a set of column skeletons. Alternatively, the matrix can be
+    exported as SciPy compatible sparse matrix in a NumPy .npz file or as Arrow
+    IPC file with one entry per connected skeleton pair. Rows and columns can
+    optionally be aggregated by annotations and sorted.
     ---
     parameters:
       - name: project_id
@@ -1881,43 +1870,89 @@ def connectivity_matrix_csv(request:HttpRequest, project_id) -> StreamingHttpRes
         type: array
         items:
             type: string
+      - name: row_annotations
+        description: |
+            Optional annotation IDs. Row skeletons of neurons annotated with
+            one of them are aggregated into a single row per annotation. These
+            rows come first, followed by the remaining row skeletons.
+        required: false
+        type: array
+        items:
+          type: integer
+      - name: col_annotations
+        description: |
+            Optional annotation IDs to aggregate column skeletons by, like
+            row_annotations.
+        required: false
+        type: array
+        items:
+          type: integer
+      - name: row_sort
+        description: |
+            How to sort rows: "none" (request order), "name", "id" or "count"
+            (total synapse count, descending).
+        required: false
+        default: none
+        type: string
+      - name: col_sort
+        description: How to sort columns, like row_sort.
+        required: false
+        default: none
+        type: string
+      - name: format
+        description: Export format, one of "csv", "npz" or "arrow".
+        required: false
+        default: csv
+        type: string
     """
     # sanitize arguments
     project_id = int(project_id)
     rows = tuple(get_request_list(request.POST, 'rows', [], map_fn=int))
     cols = tuple(get_request_list(request.POST, 'columns', [], map_fn=int))
     names:Dict = dict(map(lambda x: (int(x[0]), x[1]), get_request_list(request.POST, 'names', [])))
+    row_annotations = get_request_list(request.POST, 'row_annotations', [], map_fn=int)
+    col_annotations = get_request_list(request.POST, 'col_annotations', [], map_fn=int)
+    row_sort = request.POST.get('row_sort', 'none')
+    col_sort = request.POST.get('col_sort', 'none')
+    for sort in (row_sort, col_sort):
+        if sort not in ('none', 'name', 'id', 'count'):
+            raise ValueError(f"Unknown sort order: {sort}")
+    export_format = request.POST.get('format', 'csv')
+    if export_format not in ('csv', 'npz', 'arrow'):
+        raise ValueError(f"Unknown format: {export_format}")
+
+    matrix = ConnectivityMatrix.from_db(project_id, rows, cols)
+    matrix.set_labels(names)
+    if row_annotations or col_annotations:
+        matrix = matrix.aggregate(
+                get_annotation_groups(project_id, row_annotations, rows),
+                get_annotation_groups(project_id, col_annotations, cols))
+    matrix = matrix.sort(row_sort, col_sort)
+
+    if export_format == 'csv':
+        pseudo_buffer = Echo()
+        writer = csv.writer(pseudo_buffer, quoting=csv.QUOTE_NONNUMERIC)
+        response = StreamingHttpResponse((writer.writerow(row) for row in matrix.iter_rows()), # type: ignore
+                content_type='text/csv')
+        filename = 'catmaid-connectivity-matrix.csv'
+    else:
+        data = BytesIO()
+        if export_format == 'npz':
+            matrix.write_npz(data)
+            content_type = 'application/octet-stream'
+        else:
+            matrix.write_arrow(data)
+            content_type = 'application/vnd.apache.arrow.file'
+        response = HttpResponse(data.getvalue(), content_type=content_type)
+        filename = f'catmaid-connectivity-matrix.{export_format}'
 
-    matrix = get_connectivity_matrix(project_id, rows, cols)
-
-    csv_data = []
-    header = [''] + list(map(lambda x: names.get(x, x), cols))
-    csv_data.append(header)
-
-    for n, skid_a in enumerate(rows):
-        # Add row header skeleton ID
-        row = [names.get(skid_a, skid_a)]
-        csv_data.append(row)
-        # Add connectivity information
-        for m, skid_b in enumerate(cols):
-            p = matrix.get(skid_a, {})
-            c = p.get(skid_b, 0)
-            row.append(c)
-
-    pseudo_buffer = Echo()
-    writer = csv.writer(pseudo_buffer, quoting=csv.QUOTE_NONNUMERIC)
-
-    response = StreamingHttpResponse((writer.writerow(row) for row in csv_data), # type: ignore
-            content_type='text/csv')
-
-    filename = 'catmaid-connectivity-matrix.csv'
     response['Content-Disposition'] = f'attachment; filename={filename}'
 
     return response
 
 
 def get_connectivity_matrix(project_id, row_skeleton_ids, col_skeleton_ids,
-        with_locations=False) -> DefaultDict[Any, Dict]:
+        with_locations=False) -> Dict[Any, Dict]:
     """
     Return a sparse connectivity matrix representation for the given skeleton
     IDS. The returned dictionary has a key for each row skeleton having
@@ -1925,31 +1960,30 @@ def get_connectivity_matrix(project_id, row_skeleton_ids, col_skeleton_ids,
     dictionary that maps the connection partners to the individual outgoing
     synapse counts.
     """
+    if not with_locations:
+        # The number of synapses between row skeletons and column skeletons is
+        # available from the materialized link counts.
+        return ConnectivityMatrix.from_db(project_id, row_skeleton_ids,
+                col_skeleton_ids).to_dict()
+
     cursor = connection.cursor()
     relation_map = get_relation_to_id_map(project_id)
     post_rel_id = relation_map['postsynaptic_to']
     pre_rel_id = relation_map['presynaptic_to']
 
-    if with_locations:
-        extra_select = ', c.id, c.location_x, c.location_y, c.location_z'
-        extra_join = 'JOIN connector c ON c.id = t2.connector_id'
-    else:
-        extra_select = ''
-        extra_join = ''
-
     # Obtain all synapses made between row skeletons and column skeletons.
     cursor.execute('''
-        SELECT t1.skeleton_id, t2.skeleton_id
-            {extra_select}
+        SELECT t1.skeleton_id, t2.skeleton_id,
+            c.id, c.location_x, c.location_y, c.location_z
         FROM treenode_connector t1,
              treenode_connector t2
-            {extra_join}
+        JOIN connector c ON c.id = t2.connector_id
         WHERE t1.skeleton_id = ANY(%(row_skeleton_ids)s::bigint[])
           AND t2.skeleton_id = ANY(%(col_skeleton_ids)s::bigint[])
           AND t1.connector_id = t2.connector_id
           AND t1.relation_id = %(pre_rel_id)s
           AND t2.relation_id = %(post_rel_id)s
-    '''.format(extra_select=extra_select, extra_join=extra_join), {
+    ''', {
         'row_skeleton_ids': list(row_skeleton_ids),
         'col_skeleton_ids': list(col_skeleton_ids),
         'pre_rel_id': pre_rel_id,
@@ -1957,38 +1991,28 @@ def get_connectivity_matrix(project_id, row_skeleton_ids, col_skeleton_ids,
     })
 
     # Build a sparse connectivity representation. For all skeletons requested
-    # map a dictionary of partner skeletons and the number of synapses
-    # connecting to each partner. If locations should be returned as well, an
-    # object with the fields 'count' and 'locations' is returned instead of a
-    # single count.
-    if with_locations:
-        outgoing:DefaultDict[Any, Dict] = defaultdict(dict)
-        for r in cursor.fetchall():
-            source, target = r[0], r[1]
-            mapping = outgoing[source]
-            connector_id = r[2]
-            info = mapping.get(target)
-            if not info:
-                info = { 'count': 0, 'locations': {} }
-                mapping[target] = info
-            count = info['count']
-            info['count'] = count + 1
-
-            if connector_id not in info['locations']:
-                location = [r[3], r[4], r[5]]
-                info['locations'][connector_id] = {
-                    'pos': location,
-                    'count': 1,
-                }
-            else:
-                info['locations'][connector_id]['count'] += 1
-    else:
-        outgoing = defaultdict(dict)
-        for r in cursor.fetchall():
-            source, target = r[0], r[1]
-            mapping = outgoing[source]
-            count = mapping.get(target, 0)
-            mapping[target] = count + 1
+    # map a dictionary of partner skeletons and an object with the fields
+    # 'count' and 'locations'.
+    outgoing:DefaultDict[Any, Dict] = defaultdict(dict)
+    for r in cursor.fetchall():
+        source, target = r[0], r[1]
+        mapping = outgoing[source]
+        connector_id = r[2]
+        info = mapping.get(target)
+        if not info:
+            info = { 'count': 0, 'locations': {} }
+            mapping[target] = info
+        count = info['count']
+        info['count'] = count + 1
+
+        if connector_id not in info['locations']:
+            location = [r[3], r[4], r[5]]
+            info['locations'][connector_id] = {
+                'pos': location,
+                'count': 1,
+            }
+        else:
+            info['locations'][connector_id]['count'] += 1
 
     return outgoing
 
@@ -2096,10 +2120,7 @@ def _reroot_skeleton(treenode_id, project_id):
         if first_parent is None:
             return False
 
-        q_treenode = Treenode.objects.filter(
-                skeleton_id=rootnode.skeleton_id,
-                project=project_id).values_list('id', 'parent_id', 'confidence')
-        nodes = {tnid: (parent_id, confidence) for (tnid, parent_id, confidence) in list(q_treenode)}
+        arbor = get_skeleton_arbor(rootnode.skeleton_id)
 
         # Make sure this skeleton is not used in a sampler
         samplers = Sampler.objects.prefetch_related('samplerdomain_set') \
@@ -2110,10 +2131,10 @@ def _reroot_skeleton(treenode_id, project_id):
                 while True:
                     if node_id == upstream_node_id:
                         return True
-                    parent = nodes.get(node_id)
-                    if parent:
-                        node_id = parent[0]
-                    else:
+                    if node_id not in arbor:
+                        return False
+                    node_id = arbor.parent(node_id)
+                    if node_id is None:
                         return False
                 return False
             for sampler in samplers:
@@ -2128,32 +2149,42 @@ def _reroot_skeleton(treenode_id, project_id):
 
         # Traverse up the chain of parents, reversing the parent relationships so
         # that the selected treenode (with ID treenode_id) becomes the root.
-        new_parents = []
-        new_parent = rootnode.id
-        new_confidence = rootnode.confidence
-        node = first_parent
-
         response_on_error = 'An error occured while rerooting.'
+        path = [first_parent]
         while True:
-            # Store current values to be used in next iteration
-            parent, confidence = nodes[node]
+            parent = arbor.parent(path[-1])
+            if parent is None:
+                # Root has been reached
+                break
+            path.append(parent)
 
+        # Confidences are read from the treenode table, because confidence
+        # changes don't update the skeleton summary and the cached arbor
+        # might not include them.
+        cursor = connection.cursor()
+        cursor.execute('''
+            SELECT id, confidence
+            FROM treenode
+            WHERE id = ANY(%(node_ids)s::bigint[])
+        ''', {
+            'node_ids': path,
+        })
+        confidences = dict(cursor.fetchall())
+
+        new_parents = []
+        new_parent = rootnode.id
+        new_confidence = rootnode.confidence
+        for node in path:
             # Set new values
             new_parents.append((node, new_parent, new_confidence))
 
-            if parent is None:
-                # Root has been reached
-                break
-            else:
-                # Prepare next iteration
-                new_parent = node
-                new_confidence = confidence
-                node = parent
+            # Prepare next iteration
+            new_parent = node
+            new_confidence = confidences[node]
 
         # Finally make treenode root
         new_parents.append((rootnode.id, 'NULL', 5)) # Reset to maximum confidence.
 
-        cursor = connection.cursor()
         cursor.execute('''
                 UPDATE treenode
                 SET parent_id = v.parent_id,
@@ -3824,6 +3855,21 @@ def get_skeletons_in_bb(params) -> List:
     else:
         raise ValueError('Need valid node provider (src)')
 
+    # With a presence grid, only the boundary of the bounding box needs to be
+    # tested against edges. The skeletons in all fully contained cells are
+    # looked up. The postgis2d query uses a half-open Z range.
+    presence_split = get_presence_grid_split(params['project_id'], params,
+            half_open_z=(provider == 'postgis2d'))
+    if presence_split:
+        grid, cell_range, boundary_boxes = presence_split
+        candidate_ids = get_present_ids(cursor, grid, cell_range, 'skeleton_ids')
+        for bb in boundary_boxes:
+            cursor.execute(node_query, get_bounding_box_params(params, bb))
+            candidate_ids.update(r[0] for r in cursor.fetchall())
+        params = dict(params, candidate_ids=list(candidate_ids))
+        node_query = """
+            SELECT UNNEST(%(candidate_ids)s::bigint[])
+        """
 
     if extra_where:
         extra_where_val = 'WHERE ' + '\nAND '.join(extra_where)
@@ -3954,7 +4000,7 @@ def skeletons_in_bounding_box(request:HttpRequest, project_id) -> JsonResponse:
 
     volume_id = data.get('volume_id')
     if volume_id is not None:
-        volume = get_volume_details(project_id, volume_id)
+        volume = get_volume_details(project_id, volume_id, with_mesh=False)
         bbmin, bbmax = volume['bbox']['min'], volume['bbox']['max']
         params['minx'] = bbmin['x']
         params['miny'] = bbmin['y']
@@ -1,22 +1,24 @@
 # -*- coding: utf-8 -*-
 
 import array
-from collections import defaultdict, deque
+from collections import defaultdict, deque, OrderedDict
 from datetime import datetime
 from functools import partial
+from itertools import groupby
 import json
 import logging
-from math import sqrt
 import msgpack
-import networkx as nx
+import numpy as np
+from operator import itemgetter
 from psycopg2.extras import DateTimeTZRange
 import pytz
 import struct
-from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, DefaultDict, Dict, List, Optional, Tuple, Union
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import connection
-from django.http import HttpRequest, HttpResponse, JsonResponse, Http404
+from django.http import HttpRequest, HttpResponse, JsonResponse, Http404, \
+        StreamingHttpResponse
 from django.db.models.query import QuerySet
 
 from rest_framework.decorators import api_view
@@ -29,7 +31,7 @@ from catmaid.control.common import (get_relation_to_id_map, get_request_bool,
         get_request_list)
 from catmaid.control.review import get_treenodes_to_reviews, \
         get_treenodes_to_reviews_with_time
-from catmaid.control.tree_util import edge_count_to_root, partition
+from catmaid.control.tree_util import get_skeleton_arbor
 
 
 try:
@@ -392,7 +394,7 @@ def compact_skeleton(request:HttpRequest, project_id=None, skeleton_id=None,
 
 @api_view(['POST'])
 @requires_user_role(UserRole.Browse)
-def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[HttpResponse, JsonResponse]:
+def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[HttpResponse, JsonResponse, StreamingHttpResponse]:
     """Get a compact treenode representation of a list of skeletons, optionally
     with the history of individual nodes and connectors.
 
@@ -419,6 +421,13 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
     data. This requires the client to do slightly more work, but unfortunately
     the original creation time is needed for data that was created without
     history tables enabled.
+
+    If <stream> is true, the response is streamed and each skeleton is sent as
+    soon as it has been loaded. Each skeleton is then represented as the list
+    [skeleton_id, skeleton], with skeleton being in the format described above.
+    With the JSON format, each skeleton is written on its own line (JSON
+    lines). With the msgpack format, the response is a sequence of msgpack
+    encoded skeletons.
     ---
     parameters:
     - skeleton_ids:
@@ -478,6 +487,20 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
       type: boolean
       defaultValue: "false"
       paramType: form
+    - name: format
+      description: |
+        The response format, either "json" or "msgpack".
+      required: false
+      type: string
+      defaultValue: "json"
+      paramType: form
+    - name: stream
+      description: |
+        Whether the response should be streamed one skeleton at a time.
+      required: false
+      type: boolean
+      defaultValue: "false"
+      paramType: form
     type:
     - type: array
       items:
@@ -495,10 +518,33 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
     with_user_info = get_request_bool(request.POST, "with_user_info", False)
     return_format = request.POST.get('format', 'json')
     ordered = get_request_bool(request.POST, "ordered", False)
+    stream = get_request_bool(request.POST, "stream", False)
 
     if not skeleton_ids:
         raise ValueError("No skeleton IDs provided")
 
+    if stream:
+        skeleton_ids = list(OrderedDict.fromkeys(skeleton_ids))
+        # Make sure all skeletons exist before the response is started.
+        existing_skeleton_ids = set(ClassInstance.objects.filter(
+                pk__in=skeleton_ids, project_id=project_id,
+                class_column__class_name='skeleton').values_list('id', flat=True))
+        missing_skeleton_ids = set(skeleton_ids) - existing_skeleton_ids
+        if missing_skeleton_ids:
+            raise Http404(f"Skeleton #{min(missing_skeleton_ids)} doesn't exist")
+
+        skeletons_iter = _compact_skeletons_stream(project_id, skeleton_ids,
+                with_connectors, with_tags, with_history, with_merge_history,
+                with_reviews, with_annotations, with_user_info, ordered)
+
+        if return_format == 'msgpack':
+            return StreamingHttpResponse((msgpack.packb(sk) for sk in skeletons_iter),
+                    content_type='application/octet-stream')
+        else:
+            return StreamingHttpResponse((json.dumps(sk, separators=(',', ':'),
+                    cls=DjangoJSONEncoder, default=default) + '\n' for sk in skeletons_iter),
+                    content_type='application/x-ndjson')
+
     skeletons = {}
     for skeleton_id in skeleton_ids:
         skeletons[skeleton_id] = _compact_skeleton(project_id, skeleton_id,
@@ -519,10 +565,54 @@ def compact_skeleton_detail_many(request:HttpRequest, project_id=None) -> Union[
         })
 
 
+def _compact_skeletons_stream(project_id, skeleton_ids, with_connectors=True,
+        with_tags=True, with_history=False, with_merge_history=True,
+        with_reviews=False, with_annotations=False, with_user_info=False,
+        ordered=False, batch_size=100):
+    """Yield a [skeleton_id, skeleton] list for each passed in skeleton ID,
+    with skeleton being the result of _compact_skeleton(). Without history,
+    treenodes are read in batches of skeletons from a server-side cursor so
+    that only a single skeleton is kept in memory at a time. Within a batch,
+    skeletons are returned ordered by ID.
+    """
+    for start in range(0, len(skeleton_ids), batch_size):
+        batch = sorted(skeleton_ids[start:start + batch_size])
+        if with_history:
+            for skeleton_id in batch:
+                yield [skeleton_id, _compact_skeleton(project_id, skeleton_id,
+                        with_connectors, with_tags, with_history,
+                        with_merge_history, with_reviews, with_annotations,
+                        with_user_info, ordered)]
+            continue
+
+        cursor = connection.chunked_cursor()
+        cursor.execute('''
+            SELECT skeleton_id, id, parent_id, user_id, location_x,
+                location_y, location_z, radius, confidence
+            FROM treenode
+            WHERE skeleton_id = ANY(%(skeleton_ids)s::bigint[])
+            ORDER BY skeleton_id{order}
+        '''.format(order=', id' if ordered else ''), {
+            'skeleton_ids': batch,
+        })
+        skeleton_nodes = groupby(cursor, key=itemgetter(0))
+        next_skeleton = next(skeleton_nodes, None)
+        for skeleton_id in batch:
+            nodes:Tuple = ()
+            if next_skeleton and next_skeleton[0] == skeleton_id:
+                nodes = tuple(row[1:] for row in next_skeleton[1])
+                next_skeleton = next(skeleton_nodes, None)
+            yield [skeleton_id, _compact_skeleton(project_id, skeleton_id,
+                    with_connectors, with_tags, with_history, with_merge_history,
+                    with_reviews, with_annotations, with_user_info, ordered,
+                    nodes=nodes)]
+        cursor.close()
+
+
 def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
         with_tags=True, with_history=False, with_merge_history=True,
         with_reviews=False, with_annotations=False, with_user_info=False,
-        ordered=False, scale=None) -> Tuple[Tuple, Tuple, DefaultDict[Any, List], List, List]:
+        ordered=False, scale=None, nodes=None) -> Tuple[Tuple, Tuple, DefaultDict[Any, List], List, List]:
     """Get a compact treenode representation of a skeleton, optionally with the
     history of individual nodes and connector, reviews and annotationss. Note
     this function is performance critical! Returns, in JSON:
@@ -541,11 +631,16 @@ def _compact_skeleton(project_id, skeleton_id, with_connectors=True,
     data. This requires the client to do slightly more work, but unfortunately
     the original creation time is needed for data that was created without
     history tables enabled.
+
+    If already loaded, treenodes without history can be passed in as <nodes>.
     """
 
     cursor = connection.cursor()
 
-    if not with_history:
+    if nodes is not None:
+        if with_history or scale:
+            raise ValueError("Treenodes can only be passed in without history and scale")
+    elif not with_history:
         cursor.execute('''
             SELECT id, parent_id, user_id,
                 location_x{scale}, location_y{scale}, location_z{scale},
@@ -1154,7 +1249,121 @@ def skeleton_with_metadata(request:HttpRequest, project_id=None, skeleton_id=Non
         },
     )
 
-def _measure_skeletons(skeleton_ids) -> Dict[Any, Any]:
+
+class SkeletonMeasurements():
+    """Summary measurements of a single skeleton."""
+
+    def __init__(self, n_nodes=0, raw_cable=0.0, smooth_cable=0.0,
+            principal_branch_cable=0.0, n_ends=0, n_branch=0):
+        self.n_nodes = n_nodes
+        self.raw_cable = raw_cable
+        self.smooth_cable = smooth_cable
+        self.principal_branch_cable = principal_branch_cable
+        self.n_ends = n_ends
+        self.n_branch = n_branch
+        self.n_pre = 0
+        self.n_post = 0
+
+
+def measure_skeleton_arrays(node_ids, parent_ids, skeleton_ids, locations) -> Dict[int, SkeletonMeasurements]:
+    """Compute cable length, smoothed cable length, principal branch cable
+    length as well as the number of end nodes and branch nodes for all passed
+    in skeletons at once. The input are flat arrays of node IDs, parent IDs
+    (negative for root nodes), skeleton IDs and a (N, 3) array of node
+    locations. All nodes of a skeleton have to be present.
+
+    The smoothed cable is measured on slab node locations that are moved 60%
+    towards the distance weighted average of their neighbors. The principal
+    branch is the path from the end node with the largest number of edges to
+    the root.
+    """
+    node_ids = np.asarray(node_ids, dtype=np.int64)
+    parent_ids = np.asarray(parent_ids, dtype=np.int64)
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+    n = len(node_ids)
+    if n == 0:
+        return {}
+
+    # Map skeleton IDs and parent IDs to array indices
+    unique_skeleton_ids, skeleton_index = np.unique(skeleton_ids, return_inverse=True)
+    n_skeletons = len(unique_skeleton_ids)
+    order = np.argsort(node_ids)
+    has_parent = parent_ids >= 0
+    child_index = np.nonzero(has_parent)[0]
+    parent_index = order[np.searchsorted(node_ids, parent_ids[has_parent], sorter=order)]
+
+    # Raw cable
+    edge_vectors = locations[child_index] - locations[parent_index]
+    edge_lengths = np.sqrt(np.einsum('ij,ij->i', edge_vectors, edge_vectors))
+    raw_cable = np.bincount(skeleton_index[child_index], weights=edge_lengths,
+            minlength=n_skeletons)
+
+    # End nodes and branch nodes. A root with a single child is an end node and
+    # a root with two children is a regular slab node.
+    n_children = np.bincount(parent_index, minlength=n)
+    is_root = ~has_parent
+    is_end = np.where(is_root, n_children == 1, n_children == 0)
+    is_branch = np.where(is_root, n_children > 2, n_children > 1)
+    is_slab = np.where(is_root, n_children == 2, n_children == 1)
+    n_ends = np.bincount(skeleton_index[is_end], minlength=n_skeletons)
+    n_branch = np.bincount(skeleton_index[is_branch], minlength=n_skeletons)
+
+    # Smooth slab nodes by moving them towards the distance weighted average
+    # location of their neighbors. Every edge contributes to both its nodes.
+    weight_sum = np.bincount(parent_index, weights=edge_lengths, minlength=n) + \
+            np.bincount(child_index, weights=edge_lengths, minlength=n)
+    smoothed = locations.copy()
+    smooth_mask = is_slab & (weight_sum > 0)
+    for dim in range(3):
+        weighted = np.bincount(parent_index,
+                weights=edge_lengths * locations[child_index, dim], minlength=n) + \
+                np.bincount(child_index,
+                weights=edge_lengths * locations[parent_index, dim], minlength=n)
+        smoothed[smooth_mask, dim] = 0.4 * locations[smooth_mask, dim] + \
+                0.6 * weighted[smooth_mask] / weight_sum[smooth_mask]
+
+    smooth_vectors = smoothed[child_index] - smoothed[parent_index]
+    smooth_lengths = np.sqrt(np.einsum('ij,ij->i', smooth_vectors, smooth_vectors))
+    smooth_cable = np.bincount(skeleton_index[child_index],
+            weights=smooth_lengths, minlength=n_skeletons)
+
+    # Compute the number of edges and the smoothed cable length to the root
+    # for every node by pointer jumping, which needs a logarithmic number of
+    # steps in the tree depth.
+    ancestor = np.arange(n)
+    ancestor[child_index] = parent_index
+    depth = has_parent.astype(np.int64)
+    root_distance = np.zeros(n)
+    root_distance[child_index] = smooth_lengths
+    while True:
+        next_ancestor = ancestor[ancestor]
+        if np.array_equal(next_ancestor, ancestor):
+            break
+        depth += depth[ancestor]
+        root_distance += root_distance[ancestor]
+        ancestor = next_ancestor
+
+    # The principal branch runs from the leaf with the largest depth to the
+    # root.
+    leaf_index = np.nonzero(n_children == 0)[0]
+    leaf_order = np.lexsort((depth[leaf_index], skeleton_index[leaf_index]))
+    leaf_index = leaf_index[leaf_order]
+    leaf_skeletons = skeleton_index[leaf_index]
+    last_leaf = np.ones(len(leaf_index), dtype=bool)
+    last_leaf[:-1] = leaf_skeletons[1:] != leaf_skeletons[:-1]
+    principal_branch_cable = np.zeros(n_skeletons)
+    principal_branch_cable[leaf_skeletons[last_leaf]] = \
+            root_distance[leaf_index[last_leaf]]
+
+    n_nodes = np.bincount(skeleton_index, minlength=n_skeletons)
+
+    return {int(skid): SkeletonMeasurements(int(n_nodes[i]), float(raw_cable[i]),
+                float(smooth_cable[i]), float(principal_branch_cable[i]),
+                int(n_ends[i]), int(n_branch[i]))
+            for i, skid in enumerate(unique_skeleton_ids)}
+
+
+def _measure_skeletons(skeleton_ids) -> Dict[Any, SkeletonMeasurements]:
     if not skeleton_ids:
         raise Exception("Must provide the ID of at least one skeleton.")
 
@@ -1162,111 +1371,22 @@ def _measure_skeletons(skeleton_ids) -> Dict[Any, Any]:
 
     cursor = connection.cursor()
     cursor.execute('''
-    SELECT id, parent_id, skeleton_id, location_x, location_y, location_z
-    FROM treenode
-    WHERE skeleton_id IN (%s)
-    ''' % skids_string)
-
-    # TODO should be all done with numpy,
-    # TODO  by partitioning the skeleton into sequences of x,y,z representing the slabs
-    # TODO  and then convolving them.
-
-    class Node():
-        def __init__(self, parent_id, x, y, z):
-            self.parent_id = parent_id
-            self.x = x
-            self.y = y
-            self.z = z
-            self.wx = x  # weighted average of itself and neighbors
-            self.wy = y
-            self.wz = z
-            self.children:Dict[Any, float] = {}  # node ID vs distance - is first type an int or an str?
-
-    class Skeleton():
-        def __init__(self):
-            self.nodes:Dict[Any, Node] = {}
-            self.raw_cable = 0.0
-            self.smooth_cable = 0.0
-            self.principal_branch_cable = 0.0
-            self.n_ends = 0
-            self.n_branch = 0
-            self.n_pre = 0
-            self.n_post = 0
-
-    skeletons:Dict[Any, Skeleton] = {}  # skeleton ID vs (node ID vs Node)
-    for row in cursor.fetchall():
-        if row[2] not in skeletons:
-            skeleton = Skeleton()
-            skeletons[row[2]] = skeleton
-        else:
-            skeleton = skeletons[row[2]]
-        skeleton.nodes[row[0]] = Node(row[1], row[3], row[4], row[5])
+    SELECT t.id, COALESCE(t.parent_id, -1), t.skeleton_id,
+        t.location_x, t.location_y, t.location_z
+    FROM treenode t
+    JOIN UNNEST(%(skeleton_ids)s::bigint[]) query(skeleton_id)
+        ON query.skeleton_id = t.skeleton_id
+    ''', {
+        'skeleton_ids': list(skeleton_ids),
+    })
 
-    for skeleton in skeletons.values():
-        nodes = skeleton.nodes
-        tree = nx.DiGraph()
-        root = None
-        # Accumulate children
-        for nodeID, node in nodes.items():
-            if not node.parent_id:
-                root = nodeID
-                continue
-            tree.add_edge(node.parent_id, nodeID)
-            parent = nodes[node.parent_id]
-            distance = sqrt(  pow(node.x - parent.x, 2)
-                            + pow(node.y - parent.y, 2)
-                            + pow(node.z - parent.z, 2))
-            parent.children[nodeID] = distance
-            # Measure raw cable, given that we have the parent already
-            skeleton.raw_cable += distance
-        # Utilize accumulated children and the distances to them
-        for nodeID, node in nodes.items():
-            # Count end nodes and branch nodes
-            n_children = len(node.children)
-            if not node.parent_id:
-                if 1 == n_children:
-                    skeleton.n_ends += 1
-                    continue
-                if n_children > 2:
-                    skeleton.n_branch += 1
-                    continue
-                # Else, if 2 == n_children, the root node is in the middle of the skeleton, being a slab node
-            elif 0 == n_children:
-                skeleton.n_ends += 1
-                continue
-            elif n_children > 1:
-                skeleton.n_branch += 1
-                continue
-            # Compute weighted position for slab nodes only
-            # (root, branch and end nodes do not move)
-            oids = node.children.copy()
-            if node.parent_id:
-                oids[node.parent_id] = skeleton.nodes[node.parent_id].children[nodeID]
-            sum_distances = sum(oids.values())
-            wx, wy, wz = 0, 0, 0
-            for oid, distance in oids.items():
-                other = skeleton.nodes[oid]
-                w = distance / sum_distances if sum_distances != 0 else 0
-                wx += other.x * w
-                wy += other.y * w
-                wz += other.z * w
-            node.wx = node.x * 0.4 + wx * 0.6
-            node.wy = node.y * 0.4 + wy * 0.6
-            node.wz = node.z * 0.4 + wz * 0.6
-        # Find out nodes that belong to the principal branch
-        principal_branch_nodes = set(sorted(partition(tree, root), key=len)[-1])
-        # Compute smoothed cable length, also for principal branch
-        for nodeID, node in nodes.items():
-            if not node.parent_id:
-                # root node
-                continue
-            parent = nodes[node.parent_id]
-            length = sqrt(  pow(node.wx - parent.wx, 2)
-                          + pow(node.wy - parent.wy, 2)
-                          + pow(node.wz - parent.wz, 2))
-            skeleton.smooth_cable += length
-            if nodeID in principal_branch_nodes:
-                skeleton.principal_branch_cable += length
+    rows = cursor.fetchall()
+    if rows:
+        node_ids, parent_ids, node_skeleton_ids, xs, ys, zs = zip(*rows)
+        skeletons = measure_skeleton_arrays(node_ids, parent_ids,
+                node_skeleton_ids, np.column_stack((xs, ys, zs)))
+    else:
+        skeletons = {}
 
     # Count inputs
     cursor.execute('''
@@ -1309,7 +1429,7 @@ def measure_skeletons(request:HttpRequest, project_id=None) -> JsonResponse:
     skeleton_ids = tuple(int(v) for k,v in request.POST.items() if k.startswith('skeleton_ids['))
 
     def asRow(skid, sk):
-        return (skid, int(sk.raw_cable), int(sk.smooth_cable), sk.n_pre, sk.n_post, len(sk.nodes), sk.n_branch, sk.n_ends, sk.principal_branch_cable)
+        return (skid, int(sk.raw_cable), int(sk.smooth_cable), sk.n_pre, sk.n_post, sk.n_nodes, sk.n_branch, sk.n_ends, sk.principal_branch_cable)
     return JsonResponse([asRow(skid, sk) for skid, sk in _measure_skeletons(skeleton_ids).items()], safe=False)
 
 
@@ -1490,76 +1610,25 @@ def _export_review_skeleton(project_id=None, skeleton_id=None,
     If a valid subarbor_node_id is given, only data for the sub-arbor is
     returned that starts at this node.
     """
-    # Get all treenodes of the requested skeleton
+    # Get the arbor of the requested skeleton
     cursor = connection.cursor()
-    cursor.execute("""
-            SELECT
-                t.id,
-                t.parent_id,
-                t.location_x,
-                t.location_y,
-                t.location_z,
-                ARRAY_AGG(svt.orientation),
-                ARRAY_AGG(svt.location_coordinate),
-                t.user_id
-            FROM treenode t
-            LEFT OUTER JOIN suppressed_virtual_treenode svt
-              ON (t.id = svt.child_id)
-            WHERE t.skeleton_id = %s
-            GROUP BY t.id;
-            """, (skeleton_id,))
-    treenodes = cursor.fetchall()
-    # Get all reviews for the requested skeleton
-    reviews = get_treenodes_to_reviews_with_time(skeleton_ids=[skeleton_id])
-
-    if 0 == len(treenodes):
+    try:
+        arbor = get_skeleton_arbor(skeleton_id, cursor)
+    except ValueError:
         return []
 
-    # The root node will be assigned below, depending on retrieved nodes and
-    # sub-arbor requests
-    root_id = None
-
-    # Add each treenode to a networkx graph and attach reviewer information to
-    # it.
-    g = nx.DiGraph()
-    reviewed = set()
-    for t in treenodes:
-        # While at it, send the reviewer IDs, which is useful to iterate fwd
-        # to the first unreviewed node in the segment.
-        g.add_node(t[0], {'id': t[0],
-                          'x': t[2],
-                          'y': t[3],
-                          'z': t[4],
-                          'rids': reviews[t[0]],
-                          'sup': [[o, l] for [o, l] in zip(t[5], t[6]) if o is not None],
-                          'user_id': t[7],
-                          })
-        if reviews[t[0]]:
-            reviewed.add(t[0])
-        if t[1]:  # if parent
-            g.add_edge(t[1], t[0])  # edge from parent to child
-        else:
-            root_id = t[0]
+    root_id = arbor.find_root()
 
     if subarbor_node_id and subarbor_node_id != root_id:
         # Make sure the subarbor node ID (if any) is part of this skeleton
-        if subarbor_node_id not in g:
+        if subarbor_node_id not in arbor:
             raise ValueError("Supplied subarbor node ID (%s) is not part of "
                              "provided skeleton (%s)" % (subarbor_node_id, skeleton_id))
 
-        # Remove connection to parent
-        parent = g.predecessors(subarbor_node_id)[0]
-        g.remove_edge(parent, subarbor_node_id)
-        # Remove all nodes that are upstream from the subarbor node
-        to_delete = set()
-        to_lookat = [root_id]
-        while to_lookat:
-            n = to_lookat.pop()
-            to_lookat.extend(g.successors(n))
-            to_delete.add(n)
-        g.remove_nodes_from(to_delete)
-        # Replace root id with sub-arbor ID
-        root_id=subarbor_node_id
+        # Only keep nodes downstream of the sub-arbor node, which is the new
+        # root.
+        arbor = arbor.subtree(subarbor_node_id)
+        root_id = subarbor_node_id
 
     if not root_id:
         if subarbor_node_id:
@@ -1569,24 +1638,53 @@ def _export_review_skeleton(project_id=None, skeleton_id=None,
             raise ValueError("Couldn't find a reference root node for provided "
                              "subarbor (%s) in provided skeleton (%s)" % (subarbor_node_id, skeleton_id))
 
-    # Create all sequences, as long as possible and always from end towards root
-    distances = edge_count_to_root(g, root_node=root_id)  # distance in number of edges from root
-    seen:Set = set()
+    # Get all reviews and suppressed virtual nodes for the requested skeleton
+    reviews = get_treenodes_to_reviews_with_time(skeleton_ids=[skeleton_id])
+    cursor.execute("""
+            SELECT svt.child_id, svt.orientation, svt.location_coordinate
+            FROM suppressed_virtual_treenode svt
+            JOIN treenode t
+              ON t.id = svt.child_id
+            WHERE t.skeleton_id = %s
+            """, (skeleton_id,))
+    suppressed:DefaultDict[int, List] = defaultdict(list)
+    for child_id, orientation, coordinate in cursor.fetchall():
+        suppressed[child_id].append([orientation, coordinate])
+
+    # Create the node information for each treenode. While at it, send the
+    # reviewer IDs, which is useful to iterate fwd to the first unreviewed
+    # node in the segment.
+    node_ids = arbor.node_ids.tolist()
+    xs, ys, zs, user_ids = (arbor.properties[p].tolist() for p in
+            ('location_x', 'location_y', 'location_z', 'user_id'))
+    nodes = [{'id': node_id,
+              'x': x,
+              'y': y,
+              'z': z,
+              'rids': reviews[node_id],
+              'sup': suppressed.get(node_id, []),
+              'user_id': user_id,
+              } for node_id, x, y, z, user_id in zip(node_ids, xs, ys, zs, user_ids)]
+    reviewed = set(node_id for node_id in node_ids if reviews[node_id])
+
+    # Create all sequences, as long as possible and always from end towards
+    # root. Iterate end nodes sorted from highest to lowest distance to root.
+    # Single node sequences are ok.
+    parent_index = arbor.parent_index.tolist()
+    depths = arbor.depths()
+    ends = np.nonzero(arbor.n_children == 0)[0]
+    ends = ends[np.argsort(-depths[ends], kind='mergesort')].tolist()
+    seen = np.zeros(len(arbor), dtype=bool)
     sequences = []
-    # Iterate end nodes sorted from highest to lowest distance to root
-    endNodeIDs = (nID for nID in g.nodes() if 0 == len(g.successors(nID)))
-    for nodeID in sorted(endNodeIDs, key=distances.get, reverse=True):
-        sequence = [g.node[nodeID]]
-        parents = g.predecessors(nodeID)
-        while parents:
-            parentID = parents[0]
-            sequence.append(g.node[parentID])
-            if parentID in seen:
+    for end in ends:
+        sequence = [nodes[end]]
+        parent = parent_index[end]
+        while parent >= 0:
+            sequence.append(nodes[parent])
+            if seen[parent]:
                 break
-            seen.add(parentID)
-            parents = g.predecessors(parentID)
-
-        # Single node sequences are ok
+            seen[parent] = True
+            parent = parent_index[parent]
         sequences.append(sequence)
 
     # Calculate status
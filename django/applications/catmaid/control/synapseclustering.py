@@ -6,20 +6,15 @@ import networkx as nx
 import numpy as np
 from numpy import array, float32
 from numpy.linalg import norm
-from typing import Any, DefaultDict, Dict, List, NamedTuple, Tuple
-
-logger = logging.getLogger(__name__)
-
-try:
-    from scipy.sparse.csgraph import dijkstra
-except ImportError:
-    logger.warning("CATMAID was unable to load the scipy module. "
-        "Synapse clustering won't be available")
+from typing import DefaultDict, Dict, List, NamedTuple, Optional, Tuple
 
 from catmaid.control.common import get_relation_to_id_map
 from catmaid.models import Treenode, TreenodeConnector, ClassInstance, Relation
 
 
+logger = logging.getLogger(__name__)
+
+
 def synapse_clustering(skeleton_id, h_list) -> Dict:
 
     Gwud = createSpatialGraphFromSkeletonID( skeleton_id )
@@ -35,79 +30,258 @@ def tree_max_density(Gwud, synNodes, connector_ids, relations, h_list) -> Dict:
         relations: list of the type of synapse, 'presynaptic_to' or 'postsynaptic_to'.
         The three lists are synchronized by index.
     """
-
-    D, id2index = distanceMatrix(Gwud, synNodes)
+    node_ids, parent_index, lengths = graph_to_parent_array(Gwud)
+    id2index = {node: i for i, node in enumerate(node_ids)}
+    synapse_indices = np.array([id2index[node] for node in synNodes], dtype=np.int64)
+    densities = synapse_density(TreeDistances(parent_index, lengths),
+            synapse_indices, h_list)
 
     SynapseGroup:NamedTuple = namedtuple("SynapseGroup", ['node_ids', 'connector_ids', 'relations', 'local_max'])
     synapseGroups:Dict = {}
 
-    for h in h_list:
-        expDh = np.exp(-1 * np.multiply(D, D) / (h * h) )
-
-        targLoc:Dict = {}           # targLocs hosts the final destination nodes of the hill climbing
-        densityField:Dict = {}      # densityField stores the height of the hill to be climbed
-        for startNode in synNodes:
-            if startNode not in targLoc:
-                currNode = startNode
-                allOnPath = []
-
-                if startNode not in densityField:
-                    densityField[startNode] = 0
-                    densityField[startNode] = np.sum(expDh[:,id2index[startNode]])
-
-                while True:
-                    allOnPath.append(currNode)
-
-                    # Make sure I have densityField of all neighbors for comparison
-                    if currNode in targLoc:
-                        currNode = targLoc[ currNode ] # Jump right to the end already.
-                        break
-
-                    for nn in Gwud.neighbors( currNode ):
-                        if nn not in densityField:
-                            densityField[nn] = 0
-                            densityField[nn] = np.sum(expDh[:,id2index[nn]])
-
-                    prevNode = currNode
-                    for nn in Gwud.neighbors( currNode ):
-                        if densityField[nn] > densityField[currNode]:
-                            currNode = nn
-
-                    if currNode == prevNode:
-                        break
-
-                for node in allOnPath:
-                    targLoc[node] = currNode
-
-        uniqueTargs = set(targLoc[node] for node in synNodes)
-
-        loc2group = {}
+    for h, density in zip(h_list, densities):
+        # The final destination nodes of the hill climbing on the density field
+        targLoc = tree_density_maxima(parent_index, density, synapse_indices).tolist()
 
+        loc2group:Dict = {}
         synapseGroups[h] = {}
-        for ind, val in enumerate(uniqueTargs):
-            loc2group[val] = ind
-            synapseGroups[h][ind] = SynapseGroup([], [], [], val)
-
         for ind, node in enumerate(synNodes):
-            gi = loc2group[targLoc[node]]
+            gi = loc2group.get(targLoc[ind])
+            if gi is None:
+                gi = loc2group[targLoc[ind]] = len(loc2group)
+                synapseGroups[h][gi] = SynapseGroup([], [], [], node_ids[targLoc[ind]])
             synapseGroups[h][ gi ].node_ids.append( node )
             synapseGroups[h][ gi ].connector_ids.append( connector_ids[ind] )
             synapseGroups[h][ gi ].relations.append( relations[ind] )
 
     return synapseGroups
 
-def distanceMatrix(G, synNodes) -> Tuple[Any, Dict]:
-    """ Given a nx graph, produce an all to all distance dict via scipy sparse matrix black magic.
-     Also, you get in 'id2index' the the mapping from a node id to the index in matrix scaledDistance. """
-    dmat:Dict = {}
-    nodeList = tuple(G.nodes())
-    synNodes = set(synNodes)
-    synIndices = tuple(i for i,node in enumerate(nodeList) if node in synNodes)
+def graph_to_parent_array(G) -> Tuple[List, np.ndarray, np.ndarray]:
+    """ Convert an undirected networkx tree (or forest) into a list of node
+    IDs, an array with the index of each node's parent (-1 for roots) and an
+    array with the length of the edge to the parent, read from the 'weight'
+    edge attribute. The first node of each component becomes its root.
+    """
+    node_ids = list(G.nodes())
+    index = {node: i for i, node in enumerate(node_ids)}
+    parent_index = np.full(len(node_ids), -1, dtype=np.int64)
+    lengths = np.zeros(len(node_ids))
+    seen = set()
+    for start in node_ids:
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = [start]
+        for node in queue:
+            for partner, data in G.adj[node].items():
+                if partner not in seen:
+                    seen.add(partner)
+                    parent_index[index[partner]] = index[node]
+                    lengths[index[partner]] = data.get('weight', 1)
+                    queue.append(partner)
+    return node_ids, parent_index, lengths
+
+class TreeDistances():
+    """ Geodesic distances between the nodes of a tree (or forest) that is
+    given as array of parent indices (negative for roots) and an array with the
+    length of the edge to the parent of each node.
+
+    Each node's distance to its root is accumulated once and the lowest common
+    ancestor (LCA) of two nodes is found in constant time as the shallowest node
+    between their first occurrences in an Euler tour of the tree, using a sparse
+    table for range minimum queries. The distance of two nodes is then
+    root_distance[a] + root_distance[b] - 2 * root_distance[lca(a, b)].
+    Nodes in different components have an infinite distance.
+    """
 
-    dmat = dijkstra(nx.to_scipy_sparse_matrix(G, nodeList),
-            directed=False, indices=synIndices)
+    def __init__(self, parent_index, lengths):
+        parent_index = np.asarray(parent_index, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+        n = len(parent_index)
+
+        # Children of each node as CSR structure
+        children = np.flatnonzero(parent_index >= 0)
+        order = children[np.argsort(parent_index[children], kind='mergesort')].tolist()
+        child_start = np.searchsorted(parent_index[order], np.arange(n + 1)).tolist() \
+                if order else [0] * (n + 1)
+        lengths_list = lengths.tolist()
+
+        # Walk the Euler tour of each component
+        root_distance = [0.0] * n
+        depth = [0] * n
+        component = [0] * n
+        tour:List[int] = []
+        next_child = child_start[:-1]
+        for root in np.flatnonzero(parent_index < 0).tolist():
+            component[root] = root
+            tour.append(root)
+            stack = [root]
+            while stack:
+                node = stack[-1]
+                i = next_child[node]
+                if i < child_start[node + 1]:
+                    next_child[node] = i + 1
+                    child = order[i]
+                    root_distance[child] = root_distance[node] + lengths_list[child]
+                    depth[child] = depth[node] + 1
+                    component[child] = root
+                    stack.append(child)
+                    tour.append(child)
+                else:
+                    stack.pop()
+                    if stack:
+                        tour.append(stack[-1])
+
+        self.root_distance = np.array(root_distance)
+        self.component = np.array(component, dtype=np.int64)
+        self._depth = np.array(depth, dtype=np.int64)
+        tour_array = np.array(tour, dtype=np.int64)
+        self._first = np.empty(n, dtype=np.int64)
+        # Assigning in reverse order leaves the first occurrence
+        self._first[tour_array[::-1]] = np.arange(len(tour_array) - 1, -1, -1)
+
+        # Level k of the sparse table holds the shallowest node of each range
+        # tour entries. Levels are padded to the full tour length.
+        m = len(tour_array)
+        n_levels = max(1, int(np.frexp(m)[1]))
+        index_type = np.int32 if n < 2**31 else np.int64
+        self._table = np.empty((n_levels, m), dtype=index_type)
+        self._table[0] = tour_array
+        width = 1
+        for k in range(1, n_levels):
+            prev = self._table[k - 1]
+            a, b = prev[:m - width], prev[width:]
+            self._table[k, :m - width] = np.where(self._depth[a] <= self._depth[b], a, b)
+            self._table[k, m - width:] = prev[m - width:]
+            width *= 2
+
+    def __len__(self) -> int:
+        return len(self.root_distance)
+
+    def lca(self, a, b) -> np.ndarray:
+        """ Return the lowest common ancestor for each (broadcasted) pair of
+        node indices. The result is undefined for nodes in different
+        components. """
+        fa, fb = np.broadcast_arrays(self._first[a], self._first[b])
+        start = np.minimum(fa, fb)
+        end = np.maximum(fa, fb)
+        # Floor of log2 of the range length
+        level = np.frexp(end - start + 1)[1] - 1
+        left = self._table[level, start]
+        right = self._table[level, end - (1 << level) + 1]
+        return np.where(self._depth[left] <= self._depth[right], left, right)
+
+    def distance(self, a, b) -> np.ndarray:
+        """ Return the geodesic distance for each (broadcasted) pair of node
+        indices. """
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        d = self.root_distance[a] + self.root_distance[b] - \
+                2 * self.root_distance[self.lca(a, b)]
+        return np.where(self.component[a] == self.component[b], d, np.inf)
+
+    def distance_matrix(self, a, b) -> np.ndarray:
+        """ Return the matrix of distances between the node indices in a (rows)
+        and b (columns). """
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        return self.distance(a[:, np.newaxis], b[np.newaxis, :])
+
+    @staticmethod
+    def from_locations(parent_index, locations) -> 'TreeDistances':
+        """ Create a distance engine for a tree with the passed in node
+        locations, edges are weighted by their Euclidean length. """
+        parent_index = np.asarray(parent_index, dtype=np.int64)
+        lengths = np.zeros(len(parent_index))
+        children = np.flatnonzero(parent_index >= 0)
+        lengths[children] = norm(locations[children] - locations[parent_index[children]], axis=1)
+        return TreeDistances(parent_index, lengths)
+
+
+def synapse_density(distances, synapse_indices, h_list,
+        block_size:Optional[int]=None) -> np.ndarray:
+    """ Return the synapse density fields of a tree for the passed in
+    bandwidths as array with one row per bandwidth, i.e. for each node the sum
+    of exp(-d^2 / h^2) over the distinct synapse nodes, where d is the cable
+    distance to the synapse node, provided by a TreeDistances instance.
+    Distances are computed for blocks of synapse nodes, so that no full
+    distance matrix needs to be kept in memory. By default, a block covers
+    about four million node pairs.
+    """
+    n = len(distances)
+    if block_size is None:
+        block_size = max(1, (1 << 22) // max(n, 1))
+    synapse_indices = np.unique(synapse_indices)
+    nodes = np.arange(n)
+    density = np.zeros((len(h_list), n))
+    for start in range(0, len(synapse_indices), block_size):
+        block = synapse_indices[start:start + block_size]
+        D = distances.distance_matrix(block, nodes)
+        D2 = np.multiply(D, D)
+        for i, h in enumerate(h_list):
+            density[i] += np.sum(np.exp(-1 * D2 / (h * h)), axis=0)
+    return density
+
+
+def tree_density_maxima(parent_index, density, node_indices) -> np.ndarray:
+    """ Return for each passed in node the index of the local density maximum
+    that is reached by repeatedly moving to the neighbor with the highest
+    density, as long as it is higher than the density of the current node.
+    """
+    n = len(parent_index)
+    children = np.flatnonzero(parent_index >= 0)
+    parents = parent_index[children]
+
+    # The best neighbor of each node is either its parent or its child with
+    # the highest density. Assigning children in order of increasing density
+    # leaves the densest child of each parent.
+    best = np.arange(n)
+    best_density = density.copy()
+    has_parent = parent_index >= 0
+    best[has_parent] = parent_index[has_parent]
+    best_density[~has_parent] = -np.inf
+    best_density[has_parent] = density[parent_index[has_parent]]
+
+    order = np.argsort(density[children], kind='mergesort')
+    best_child = np.full(n, -1, dtype=np.int64)
+    best_child[parents[order]] = children[order]
+    has_child = best_child >= 0
+    use_child = has_child.copy()
+    use_child[has_child] = density[best_child[has_child]] > best_density[has_child]
+    best[use_child] = best_child[use_child]
+    best_density[use_child] = density[best_child[use_child]]
+
+    # Stay at nodes without a higher neighbor.
+    pointer = np.where(best_density > density, best, np.arange(n))
+
+    # Follow pointers until all of them point to a maximum.
+    while True:
+        next_pointer = pointer[pointer]
+        if np.array_equal(next_pointer, pointer):
+            break
+        pointer = next_pointer
+    return pointer[node_indices]
+
+
+def tree_synapse_domains(parent_index, locations, synapse_indices,
+        bandwidth) -> Tuple[np.ndarray, np.ndarray]:
+    """ Array based equivalent of tree_max_density() for a single bandwidth.
+    Returns for each synapse the index of its domain and for each domain the
+    node index of its density maximum. Domains are numbered in order of their
+    first synapse.
+    """
+    synapse_indices = np.asarray(synapse_indices, dtype=np.int64)
+    distances = TreeDistances.from_locations(parent_index, locations)
+    density = synapse_density(distances, synapse_indices, [bandwidth])[0]
+    maxima = tree_density_maxima(parent_index, density, synapse_indices)
+    unique_maxima, first, domains = np.unique(maxima, return_index=True,
+            return_inverse=True)
+    # Renumber domains by first occurrence
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank[domains], unique_maxima[order]
 
-    return dmat, {node: i for i,node in enumerate(nodeList)}
 
 def countTargets(skeleton_id, pid) -> Dict:
     nTargets = {}
@@ -1,27 +1,300 @@
 # -*- coding: utf-8 -*-
 
 # A 'tree' is a networkx.DiGraph with a single root node (a node without parents)
+# or an ArrayTree, which stores the same information in parent arrays.
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from itertools import islice
 from math import sqrt
 from networkx import Graph, DiGraph
+import numpy as np
 from operator import itemgetter
+import threading
 from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple
 
+from django.conf import settings
+from django.db import connection
+
 from catmaid.models import Treenode
 
 
+class ArrayTree():
+    """A tree stored as a parent array. Node IDs, the index of each node's
+    parent (-1 for the root) and optional node property columns are kept in
+    NumPy arrays, which needs only a few bytes per node compared to a
+    networkx DiGraph. Nodes are addressed by their ID in all public methods.
+    """
+
+    def __init__(self, node_ids, parent_ids, properties=None):
+        """Create a new tree from a list of node IDs and a list of the
+        respective parent IDs, with None or a negative value for the root.
+        Properties are an optional dictionary of property names versus lists
+        of values, in the same order as the node IDs.
+        """
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        parent_ids = np.array([-1 if p is None else p for p in parent_ids],
+                dtype=np.int64)
+        self._order = np.argsort(self.node_ids, kind='mergesort')
+        self.parent_index = np.full(len(self.node_ids), -1, dtype=np.int64)
+        has_parent = parent_ids >= 0
+        parent_ids = parent_ids[has_parent]
+        parent_index = self.indices(parent_ids)
+        unknown = self.node_ids[parent_index] != parent_ids
+        if unknown.any():
+            raise ValueError(f"Parent #{parent_ids[unknown][0]} is not part of the tree")
+        self.parent_index[has_parent] = parent_index
+        self.properties:Dict[str, np.ndarray] = {}
+        if properties:
+            for name, values in properties.items():
+                self.properties[name] = np.asarray(values)
+        self._n_children:Optional[np.ndarray] = None
+        self._children:Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __iter__(self):
+        return iter(self.node_ids.tolist())
+
+    def __contains__(self, node_id) -> bool:
+        i = np.searchsorted(self.node_ids, node_id, sorter=self._order)
+        return i < len(self.node_ids) and \
+                self.node_ids[self._order[i]] == node_id
+
+    def indices(self, node_ids) -> np.ndarray:
+        """Get the array indices of the passed in node IDs, which are
+        expected to be part of this tree."""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        positions = np.searchsorted(self.node_ids, node_ids, sorter=self._order)
+        return self._order[np.minimum(positions, len(self.node_ids) - 1)]
+
+    def index(self, node_id) -> int:
+        index = int(self.indices([node_id])[0])
+        if self.node_ids[index] != node_id:
+            raise KeyError(node_id)
+        return index
+
+    def copy(self) -> 'ArrayTree':
+        tree = ArrayTree.__new__(ArrayTree)
+        tree.node_ids = self.node_ids
+        tree._order = self._order
+        tree.parent_index = self.parent_index.copy()
+        tree.properties = self.properties
+        tree._n_children = None
+        tree._children = None
+        return tree
+
+    @property
+    def n_children(self) -> np.ndarray:
+        """The number of child nodes for each node index."""
+        if self._n_children is None:
+            parents = self.parent_index[self.parent_index >= 0]
+            self._n_children = np.bincount(parents, minlength=len(self))
+        return self._n_children
+
+    def children(self, node_id) -> List[int]:
+        """Return the child IDs of a node."""
+        if self._children is None:
+            child_index = np.nonzero(self.parent_index >= 0)[0]
+            order = child_index[np.argsort(self.parent_index[child_index], kind='mergesort')]
+            starts = np.searchsorted(self.parent_index[order], np.arange(len(self) + 1))
+            self._children = (order, starts)
+        order, starts = self._children
+        index = self.index(node_id)
+        return self.node_ids[order[starts[index]:starts[index + 1]]].tolist()
+
+    def parent(self, node_id) -> Optional[int]:
+        """Return the parent ID of a node or None for the root."""
+        parent_index = self.parent_index[self.index(node_id)]
+        return None if parent_index < 0 else int(self.node_ids[parent_index])
+
+    def node_data(self, node_id) -> Dict[str, Any]:
+        """Get a dictionary of all properties of a node."""
+        index = self.index(node_id)
+        return {name: values[index].item() if isinstance(values[index], np.generic)
+                else values[index] for name, values in self.properties.items()}
+
+    def find_root(self) -> Optional[int]:
+        roots = np.nonzero(self.parent_index < 0)[0]
+        return int(self.node_ids[roots[0]]) if len(roots) else None
+
+    def depths(self) -> np.ndarray:
+        """Return the number of edges to the root for each node index. This
+        is computed by pointer jumping, which needs a logarithmic number of
+        steps in the depth of the tree."""
+        n = len(self)
+        has_parent = self.parent_index >= 0
+        ancestor = np.where(has_parent, self.parent_index, np.arange(n))
+        depth = has_parent.astype(np.int64)
+        while True:
+            next_ancestor = ancestor[ancestor]
+            if np.array_equal(next_ancestor, ancestor):
+                break
+            depth += depth[ancestor]
+            ancestor = next_ancestor
+        return depth
+
+    def edge_count_to_root(self) -> Dict[int, int]:
+        """Return a map of node ID versus the number of nodes on the path to
+        the root, which is one for the root, like edge_count_to_root()."""
+        return dict(zip(self.node_ids.tolist(), (self.depths() + 1).tolist()))
+
+    def reroot(self, new_root) -> None:
+        """Reverse in place the direction of the edges from the new root to
+        the current root."""
+        index = self.index(new_root)
+        previous = -1
+        while index >= 0:
+            parent = self.parent_index[index]
+            self.parent_index[index] = previous
+            previous, index = index, parent
+        self._n_children = None
+        self._children = None
+
+    def subtree_sizes(self) -> np.ndarray:
+        """Return the number of nodes in the sub-tree of each node index,
+        including the node itself."""
+        depths = self.depths()
+        sizes = np.ones(len(self), dtype=np.int64)
+        order = np.argsort(-depths, kind='mergesort')
+        level_starts = np.flatnonzero(np.diff(depths[order])) + 1
+        # Add the sizes of each depth level to their parents, deepest first.
+        for level in np.split(order, level_starts):
+            level = level[self.parent_index[level] >= 0]
+            np.add.at(sizes, self.parent_index[level], sizes[level])
+        return sizes
+
+    def subtree(self, node_id) -> 'ArrayTree':
+        """Return a new tree with the passed in node as root and all its
+        downstream nodes."""
+        index = self.index(node_id)
+        n = len(self)
+        # Let each node point to its ancestor, stopping at the new root
+        ancestor = np.where(self.parent_index >= 0, self.parent_index, np.arange(n))
+        ancestor[index] = index
+        while True:
+            next_ancestor = ancestor[ancestor]
+            if np.array_equal(next_ancestor, ancestor):
+                break
+            ancestor = next_ancestor
+        members = np.nonzero(ancestor == index)[0]
+        parent_ids = self.node_ids[self.parent_index[members]]
+        parent_ids[members == index] = -1
+        return ArrayTree(self.node_ids[members], parent_ids,
+                {name: values[members] for name, values in self.properties.items()})
+
+    def find_common_ancestor(self, nodes) -> Tuple[Any, Any]:
+        """Return the nearest common ancestor of all passed in nodes along
+        with its number of nodes on the path to the root. Like
+        find_common_ancestor(), a single node is returned with a distance of
+        zero."""
+        if 1 == len(nodes):
+            return nodes[0], 0
+        indices = self.indices(nodes)
+        depths = self.depths()
+        ancestor = indices[0]
+        for index in indices[1:]:
+            while depths[index] > depths[ancestor]:
+                index = self.parent_index[index]
+            while depths[ancestor] > depths[index]:
+                ancestor = self.parent_index[ancestor]
+            while index != ancestor:
+                index = self.parent_index[index]
+                ancestor = self.parent_index[ancestor]
+        return int(self.node_ids[ancestor]), int(depths[ancestor]) + 1
+
+    def partition(self):
+        """Partition the tree as a list of sequences of node IDs, see
+        partition()."""
+        depths = self.depths()
+        leaves = np.nonzero(self.n_children == 0)[0]
+        leaves = leaves[np.argsort(-depths[leaves], kind='mergesort')]
+        seen = np.zeros(len(self), dtype=bool)
+        node_ids = self.node_ids
+        parent_index = self.parent_index
+        for leaf in leaves:
+            sequence = [int(node_ids[leaf])]
+            parent = parent_index[leaf]
+            while parent >= 0:
+                sequence.append(int(node_ids[parent]))
+                if seen[parent]:
+                    break
+                seen[parent] = True
+                parent = parent_index[parent]
+
+            if len(sequence) > 1:
+                yield sequence
+
+    def components(self, node_ids) -> List[Set]:
+        """Return the connected components of the sub-tree induced by the
+        passed in nodes as list of sets of node IDs."""
+        members = set(node_ids)
+        component_roots:Dict = {}
+        components:DefaultDict[Any, Set] = defaultdict(set)
+        for node_id in members:
+            path = [node_id]
+            parent = self.parent(node_id)
+            while parent in members and parent not in component_roots:
+                path.append(parent)
+                parent = self.parent(parent)
+            top = component_roots[parent] if parent in component_roots else path[-1]
+            for n in path:
+                component_roots[n] = top
+                components[top].add(n)
+        return list(components.values())
+
+    def cable_length(self, columns=('location_x', 'location_y', 'location_z')) -> float:
+        """Return the sum of all edge lengths, based on the passed in property
+        columns."""
+        child_index = np.nonzero(self.parent_index >= 0)[0]
+        parent_index = self.parent_index[child_index]
+        locations = np.column_stack([self.properties[c] for c in columns]) \
+                .astype(np.float64)
+        edges = locations[child_index] - locations[parent_index]
+        return float(np.sum(np.sqrt(np.einsum('ij,ij->i', edges, edges))))
+
+    def to_digraph(self) -> DiGraph:
+        """Create a networkx DiGraph with edges from parent to child and all
+        properties as node attributes."""
+        tree = DiGraph()
+        names = list(self.properties.keys())
+        columns = [self.properties[name].tolist() for name in names]
+        for i, node_id in enumerate(self.node_ids.tolist()):
+            tree.add_node(node_id, **{name: column[i] for name, column in zip(names, columns)})
+        child_index = np.nonzero(self.parent_index >= 0)[0]
+        tree.add_edges_from(zip(
+                self.node_ids[self.parent_index[child_index]].tolist(),
+                self.node_ids[child_index].tolist()))
+        return tree
+
+
+def _parent(tree, node):
+    """ Return the parent of a node in either tree type or None for the root. """
+    if isinstance(tree, ArrayTree):
+        return tree.parent(node)
+    return next(tree.predecessors_iter(node), None)
+
+def _n_children(tree, node) -> int:
+    if isinstance(tree, ArrayTree):
+        return int(tree.n_children[tree.index(node)])
+    return len(tree.succ[node])
+
 def find_root(tree):
     """ Search and return the first node that has zero predecessors.
     Will be the root node in directed graphs.
     Avoids one database lookup. """
+    if isinstance(tree, ArrayTree):
+        return tree.find_root()
     for node in tree:
         if not next(tree.predecessors_iter(node), None):
             return node
 
 def edge_count_to_root(tree, root_node=None) -> Dict:
     """ Return a map of nodeID vs number of edges from the first node that lacks predecessors (aka the root). If root_id is None, it will be searched for."""
+    if isinstance(tree, ArrayTree):
+        if root_node is not None and root_node != tree.find_root():
+            raise ValueError("Array trees can only be measured from their root")
+        return tree.edge_count_to_root()
     distances = {}
     count = 1
     current_level = [root_node if root_node else find_root(tree)]
@@ -42,6 +315,8 @@ def find_common_ancestor(tree, nodes, ds=None, root_node=None) -> Tuple[Any, Any
     Assumes that nodes contains at least 1 node.
     Assumes that all nodes are present in tree.
     Returns a tuple with the ancestor node and its distance to root. """
+    if isinstance(tree, ArrayTree):
+        return tree.find_common_ancestor(nodes)
     if 1 == len(nodes):
         return nodes[0], 0
     distances = ds if ds else edge_count_to_root(tree, root_node=root_node)
@@ -64,6 +339,9 @@ def find_common_ancestors(tree, node_groups):
 
 def reroot(tree, new_root):
     """ Reverse in place the direction of the edges from the new_root to root. """
+    if isinstance(tree, ArrayTree):
+        tree.reroot(new_root)
+        return
     parent = next(tree.predecessors_iter(new_root), None)
     if not parent:
         # new_root is already the root
@@ -98,20 +376,20 @@ def simplify(tree, keepers) -> Graph:
     for node in keepers:
         path = [node]
         paths.append(path)
-        parent = next(tree.predecessors_iter(node), None)
+        parent = _parent(tree, node)
         while parent is not None:
             if parent in mini:
                 # Reached one of the keeper nodes
                 path.append(parent)
                 break
-            elif len(tree.succ[parent]) > 1:
+            elif _n_children(tree, parent) > 1:
                 # Reached a branch node
                 children[parent] += 1
                 path.append(parent)
                 if parent in seen_branch_nodes:
                     break
                 seen_branch_nodes.add(parent)
-            parent = next(tree.predecessors_iter(parent), None)
+            parent = _parent(tree, parent)
     for path in paths:
         # A path starts and ends with desired nodes for the minified tree.
         # The nodes in the middle of the path are branch nodes
@@ -130,6 +408,9 @@ def partition(tree, root_node=None):
     with branch nodes repeated as ends of all sequences except the longest
     one that finishes at the root.
     Each sequence runs from an end node to either the root or a branch node. """
+    if isinstance(tree, ArrayTree):
+        yield from tree.partition()
+        return
     distances = edge_count_to_root(tree, root_node=root_node) # distance in number of edges from root
     seen:Set = set()
     # Iterate end nodes sorted from highest to lowest distance to root
@@ -157,7 +438,12 @@ def spanning_tree(tree, preserve) -> DiGraph:
         spanning.add_node(next(iter(preserve)))
         return spanning
 
-    if len(tree.successors(find_root(tree))) > 1:
+    if isinstance(tree, ArrayTree):
+        if _n_children(tree, tree.find_root()) > 1:
+            tree = tree.copy()
+            # First end node found
+            reroot(tree, int(tree.node_ids[np.argmin(tree.n_children)]))
+    elif len(tree.successors(find_root(tree))) > 1:
         tree = tree.copy()
         # First end node found
         endNode = next(node for node in tree if not next(tree.successors_iter(node), None))
@@ -188,18 +474,23 @@ def spanning_tree(tree, preserve) -> DiGraph:
 
     return spanning
 
-def cable_length(tree, locations) -> float:
+def cable_length(tree, locations=None) -> float:
     """ locations: a dictionary of nodeID vs iterable of node position (1d, 2d, 3d, ...)
-    Returns the total cable length. """
+    Returns the total cable length. Array trees use their location properties
+    if no locations are passed in. """
+    if isinstance(tree, ArrayTree):
+        if locations is None:
+            return tree.cable_length()
+        tree = tree.to_digraph()
     return sum(sqrt(sum(pow(loc2 - loc1, 2) for loc1, loc2 in zip(locations[a], locations[b]))) for a,b in tree.edges_iter())
 
 
 def lazy_load_trees(skeleton_ids, node_properties):
-    """ Return a lazy collection of pairs of (long, DiGraph)
+    """ Return a lazy collection of pairs of (long, ArrayTree)
     representing (skeleton_id, tree).
     The node_properties is a list of strings, each being a name of a column
     in the django model of the Treenode table that is not the treenode id, parent_id
-    or skeleton_id. """
+    or skeleton_id. They are available as tree properties. """
 
     values_list:Tuple[str, ...] = ('id', 'parent_id', 'skeleton_id')
     props = tuple(set(node_properties) - set(values_list))
@@ -207,23 +498,175 @@ def lazy_load_trees(skeleton_ids, node_properties):
 
     ts = Treenode.objects.filter(skeleton__in=skeleton_ids) \
             .order_by('skeleton') \
-            .values_list(*values_list)
+            .values_list(*values_list) \
+            .iterator()
+
+    def make_tree(rows) -> ArrayTree:
+        columns = list(zip(*rows))
+        return ArrayTree(columns[0], columns[1],
+                {k: v for k, v in zip(props, islice(columns, 3, 3 + len(props)))})
+
     skid = None
-    tree:Optional[DiGraph] = None
+    rows:List = []
     for t in ts:
         if t[2] != skid:
-            if tree:
-                yield (skid, tree)
+            if rows:
+                yield (skid, make_tree(rows))
             # Prepare for the next one
             skid = t[2]
-            tree = DiGraph()
+            rows = []
+        rows.append(t)
+
+    if rows:
+        yield (skid, make_tree(rows))
+
+
+class SkeletonArborCache():
+    """A size limited in-memory LRU cache of skeleton arbors for a single
+    process. Each arbor is stored as ArrayTree with the node locations,
+    confidences and creators as properties. Entries are keyed by skeleton ID
+    and carry the version of the skeleton, which triggers on the treenode
+    table update with every change of its arbor. It is compared to the
+    catmaid_skeleton_version table with a primary key lookup for each access.
+    Versions come from a sequence, so that arbors that include changes of the
+    current transaction can't be mistaken for later committed changes. A
+    maximum size of zero disables the cache.
+    """
+
+    properties = ('location_x', 'location_y', 'location_z', 'confidence', 'user_id')
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+
+        # Maps skeleton IDs to (version, size, tree) tuples.
+        self.entries:OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self.lock = threading.RLock()
+
+    @property
+    def max_size(self):
+        if self._max_size is None:
+            return getattr(settings, 'SKELETON_ARBOR_CACHE_MAX_SIZE', 256 * 1024 * 1024)
+        return self._max_size
+
+    def get(self, skeleton_id, cursor=None) -> ArrayTree:
+        """Get the arbor of the passed in skeleton. The returned tree is a copy
+        that can be rerooted by the caller, its node properties are shared
+        and must not be modified. Raises a ValueError if the skeleton has no
+        nodes.
+        """
+        skeleton_id = int(skeleton_id)
+        if cursor is None:
+            cursor = connection.cursor()
+
+        # The version needs to be read before the arbor. A change committed in
+        # between results in a newer arbor, which is reloaded on the next
+        # access.
+        max_size = self.max_size
+        version = self._query_version(skeleton_id, cursor) if max_size else None
+        if version is not None:
+            with self.lock:
+                entry = self.entries.get(skeleton_id)
+                if entry is not None:
+                    if entry[0] == version:
+                        self.entries.move_to_end(skeleton_id)
+                        self.hits += 1
+                        return entry[2].copy()
+                    self._remove(skeleton_id)
+                    self.invalidations += 1
+        with self.lock:
+            self.misses += 1
+
+        tree = self._query_arbor(skeleton_id, cursor)
+        if version is not None:
+            self.put(skeleton_id, version, tree)
+        return tree.copy()
+
+    def _query_version(self, skeleton_id, cursor) -> int:
+        """Return the version of a skeleton, which is zero for skeletons that
+        haven't changed since versions are recorded."""
+        cursor.execute("""
+            SELECT version
+            FROM catmaid_skeleton_version
+            WHERE skeleton_id = %(skeleton_id)s
+        """, {
+            'skeleton_id': skeleton_id,
+        })
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _query_arbor(self, skeleton_id, cursor) -> ArrayTree:
+        cursor.execute(f"""
+            SELECT id, parent_id, {', '.join(self.properties)}
+            FROM treenode
+            WHERE skeleton_id = %(skeleton_id)s
+        """, {
+            'skeleton_id': skeleton_id,
+        })
+        rows = cursor.fetchall()
+        if not rows:
+            raise ValueError(f"Could not find nodes of skeleton {skeleton_id}")
+        columns = list(zip(*rows))
+        return ArrayTree(columns[0], columns[1], {
+            'location_x': np.array(columns[2], dtype=np.float64),
+            'location_y': np.array(columns[3], dtype=np.float64),
+            'location_z': np.array(columns[4], dtype=np.float64),
+            'confidence': np.array(columns[5], dtype=np.int8),
+            'user_id': np.array(columns[6], dtype=np.int64),
+        })
+
+    def put(self, skeleton_id, version, tree) -> None:
+        size = tree.node_ids.nbytes + tree.parent_index.nbytes + \
+                tree._order.nbytes + sum(v.nbytes for v in tree.properties.values())
+        with self.lock:
+            if skeleton_id in self.entries:
+                self._remove(skeleton_id)
+            if size > self.max_size:
+                return
+            self.entries[skeleton_id] = (version, size, tree)
+            self.size += size
+            # Evict least recently used entries
+            while self.entries and self.size > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, skeleton_id) -> None:
+        entry = self.entries.pop(skeleton_id)
+        self.size -= entry[1]
+
+    def invalidate(self, skeleton_id) -> bool:
+        """Remove the entry of a skeleton. Returns whether there was one."""
+        with self.lock:
+            if skeleton_id not in self.entries:
+                return False
+            self._remove(skeleton_id)
+            self.invalidations += 1
+            return True
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
 
-        fields = {k: v for k,v in zip(props, islice(t, 3, 3 + len(props)))}
-        tree.add_node(t[0], fields) # type: ignore # mypy cannot prove tree will have a value by this point
+arbor_cache = SkeletonArborCache()
 
-        if t[1]:
-            # From child to parent
-            tree.add_edge(t[0], t[1]) # type: ignore # mypy cannot prove tree will have a value by this point
 
-    if tree:
-        yield (skid, tree)
+def get_skeleton_arbor(skeleton_id, cursor=None) -> ArrayTree:
+    """Get the arbor of a skeleton as ArrayTree through the arbor cache of
+    this process, with location_x, location_y, location_z, confidence and
+    user_id as node properties."""
+    return arbor_cache.get(skeleton_id, cursor)
@@ -2,10 +2,10 @@
 
 from collections import defaultdict
 import itertools
+import json
 import math
-import networkx as nx
 import re
-from typing import Any, DefaultDict, Dict, List, Union
+from typing import Any, DefaultDict, Dict, List, Tuple, Union
 
 from django.db import connection
 from django.http import HttpRequest, JsonResponse
@@ -24,6 +24,8 @@ from catmaid.control.common import (get_relation_to_id_map,
 from catmaid.control.neuron import _delete_if_empty
 from catmaid.control.node import _fetch_location, _fetch_locations
 from catmaid.control.link import create_connector_link
+from catmaid.control.tree_util import get_skeleton_arbor
+from catmaid.spatial import notify_spatial_update, suppress_spatial_update_events
 from catmaid.util import Point3D, is_collinear
 
 
@@ -426,6 +428,218 @@ def _create_treenode(project_id, creator, editor, x, y, z, radius, confidence,
                                        str(traceback.format_exc())))
 
 
+@api_view(['POST'])
+@requires_user_role(UserRole.Annotate)
+def create_treenodes(request:HttpRequest, project_id=None) -> JsonResponse:
+    """Create multiple treenodes at once.
+
+    Each node is a list of the form [reference, parent, x, y, z, radius,
+    confidence], with radius and confidence being optional. The reference
+    identifies a node within this request. If the parent of a node is the
+    reference of another node in this request, the node is linked to it.
+    Otherwise it is expected to be the ID of an existing treenode. Nodes with
+    a parent of null or -1 become the root of a new skeleton, modeling a new
+    neuron. All nodes are inserted in one transaction and a single spatial
+    update event is sent.
+
+    Returned are all created treenodes in the order of the request, each one
+    as [reference, treenode ID, skeleton ID, edition time], as well as the
+    edition times of all existing parents.
+    ---
+    parameters:
+    - name: project_id
+      description: Project to work in
+      required: true
+    - name: nodes
+      description: |
+        A list of new nodes, each one of the form [reference, parent, x, y, z,
+        radius, confidence]. Can be a JSON encoded string, which also allows
+        null parents.
+      required: true
+      type: array
+      items:
+        type: array
+      paramType: form
+    - name: state
+      description: |
+        A list of [ID, edition time] pairs for all existing parent treenodes.
+        If no existing treenodes are referenced, the state is not checked.
+      required: false
+      type: string
+      paramType: form
+    """
+    if 'nodes' in request.POST:
+        nodes = json.loads(request.POST['nodes'])
+    else:
+        nodes = get_request_list(request.POST, 'nodes', [], map_fn=lambda x: x)
+    if not nodes:
+        raise ValueError("Need at least one node")
+
+    created_nodes, parent_edition_times = _create_treenodes(int(project_id),
+            request.user, nodes, request.POST.get('state'))
+
+    return JsonResponse({
+        'treenodes': created_nodes,
+        'parent_edition_times': parent_edition_times,
+    })
+
+
+def _create_treenodes(project_id, user, nodes, node_state=None) -> Tuple[List, List]:
+    """Create all passed in nodes of the form [reference, parent, x, y, z,
+    radius, confidence], see create_treenodes(). Existing parents are
+    validated against the passed in state and locked at once. Returns a list of
+    [reference, treenode ID, skeleton ID, edition time] for each node and a
+    list of [ID, edition time] for all existing parents.
+    """
+    n_nodes = len(nodes)
+    references = [n[0] for n in nodes]
+    reference_index = dict((r, i) for i, r in enumerate(references))
+    if len(reference_index) != n_nodes:
+        raise ValueError("Node references need to be unique")
+
+    # Parents are either other nodes of the request or existing treenodes.
+    batch_parents:List = [None] * n_nodes
+    existing_parents:List = [None] * n_nodes
+    children:DefaultDict[int, List] = defaultdict(list)
+    for i, node in enumerate(nodes):
+        if len(node) < 5:
+            raise ValueError(f"Node {node[0]} needs at least a reference, " +
+                    "parent and location")
+        parent = node[1]
+        if parent in reference_index:
+            batch_parents[i] = reference_index[parent]
+            children[reference_index[parent]].append(i)
+        elif parent is not None and int(parent) != -1:
+            existing_parents[i] = int(parent)
+
+    # Order nodes so that parents come before their children.
+    order = [i for i in range(n_nodes) if batch_parents[i] is None]
+    for i in order:
+        order.extend(children[i])
+    if len(order) != n_nodes:
+        raise ValueError("The parent references of the passed in nodes contain a cycle")
+
+    cursor = connection.cursor()
+    relation_map = get_relation_to_id_map(project_id)
+
+    existing_parent_ids = sorted(set(p for p in existing_parents if p is not None))
+    parent_info = {}
+    if existing_parent_ids:
+        state.validate_state(existing_parent_ids, node_state, multinode=True,
+                lock=True, cursor=cursor)
+        cursor.execute("""
+            SELECT id, skeleton_id, edition_time, location_x, location_y,
+                location_z
+            FROM treenode
+            WHERE project_id = %(project_id)s
+            AND id = ANY(%(parent_ids)s::bigint[])
+        """, {
+            'project_id': project_id,
+            'parent_ids': existing_parent_ids,
+        })
+        parent_info = dict((r[0], r[1:]) for r in cursor.fetchall())
+        missing_parent_ids = set(existing_parent_ids) - set(parent_info.keys())
+        if missing_parent_ids:
+            raise ValueError("Parent treenodes don't exist: " +
+                    ", ".join(str(p) for p in sorted(missing_parent_ids)))
+        # Raise an Exception if the user doesn't have permission to edit the
+        # neurons modeled by the skeletons of the parents.
+        for skeleton_id in set(p[0] for p in parent_info.values()):
+            can_edit_skeleton_or_fail(user, project_id, skeleton_id,
+                    relation_map['model_of'])
+
+    # Create a new skeleton and neuron for each root node.
+    class_map = get_class_to_id_map(project_id)
+    skeleton_ids:List = [None] * n_nodes
+    for i in order:
+        if batch_parents[i] is not None:
+            skeleton_ids[i] = skeleton_ids[batch_parents[i]]
+        elif existing_parents[i] is not None:
+            skeleton_ids[i] = parent_info[existing_parents[i]][0]
+        else:
+            new_skeleton = ClassInstance.objects.create(user=user,
+                    project_id=project_id, class_column_id=class_map['skeleton'],
+                    name='skeleton')
+            new_skeleton.name = f'skeleton {new_skeleton.id}'
+            new_skeleton.save()
+            new_neuron = ClassInstance.objects.create(user=user,
+                    project_id=project_id, class_column_id=class_map['neuron'],
+                    name='neuron')
+            new_neuron.name = f'neuron {new_neuron.id}'
+            new_neuron.save()
+            _create_relation(user, project_id, relation_map['model_of'],
+                    new_skeleton.id, new_neuron.id)
+            insert_into_log(project_id, user.id, 'create_neuron',
+                    (nodes[i][2], nodes[i][3], nodes[i][4]),
+                    f'Create neuron {new_neuron.id} and skeleton {new_skeleton.id}')
+            skeleton_ids[i] = new_skeleton.id
+
+    def get_radius(node):
+        radius = node[5] if len(node) > 5 else None
+        return 0 if radius is None or math.isnan(float(radius)) else float(radius)
+
+    def get_confidence(node):
+        confidence = node[6] if len(node) > 6 else None
+        return 5 if confidence is None or math.isnan(float(confidence)) else int(confidence)
+
+    # Reserve IDs for all nodes, so that they can be inserted along with their
+    # parent references in a single statement.
+    cursor.execute("""
+        SELECT nextval('location_id_seq') FROM generate_series(1, %(n)s)
+    """, {
+        'n': n_nodes,
+    })
+    treenode_ids = [r[0] for r in cursor.fetchall()]
+    parent_ids = [treenode_ids[bp] if bp is not None else ep
+            for bp, ep in zip(batch_parents, existing_parents)]
+    locations = [[float(n[2]), float(n[3]), float(n[4])] for n in nodes]
+
+    # Database triggers would emit one spatial update event per edge.
+    suppress_spatial_update_events(cursor)
+    cursor.execute("""
+        INSERT INTO treenode (id, project_id, location_x, location_y,
+            location_z, editor_id, user_id, skeleton_id, parent_id, radius,
+            confidence)
+        SELECT t.id, %(project_id)s, t.x, t.y, t.z, %(user_id)s, %(user_id)s,
+            t.skeleton_id, t.parent_id, t.radius, t.confidence
+        FROM UNNEST(%(ids)s::bigint[], %(x)s::real[], %(y)s::real[],
+            %(z)s::real[], %(skeleton_ids)s::bigint[], %(parent_ids)s::bigint[],
+            %(radii)s::real[], %(confidences)s::smallint[])
+            AS t(id, x, y, z, skeleton_id, parent_id, radius, confidence)
+        RETURNING id, edition_time
+    """, {
+        'project_id': project_id,
+        'user_id': user.id,
+        'ids': treenode_ids,
+        'x': [loc[0] for loc in locations],
+        'y': [loc[1] for loc in locations],
+        'z': [loc[2] for loc in locations],
+        'skeleton_ids': skeleton_ids,
+        'parent_ids': parent_ids,
+        'radii': [get_radius(n) for n in nodes],
+        'confidences': [get_confidence(n) for n in nodes],
+    })
+    edition_times = dict(cursor.fetchall())
+    suppress_spatial_update_events(cursor, False)
+
+    edges = []
+    for i in range(n_nodes):
+        if batch_parents[i] is not None:
+            parent_location = locations[batch_parents[i]]
+        elif existing_parents[i] is not None:
+            parent_location = list(parent_info[existing_parents[i]][2:5])
+        else:
+            parent_location = locations[i]
+        edges.append([locations[i], parent_location])
+    notify_spatial_update(cursor, project_id, edges)
+
+    created_nodes = [[r, tid, sid, edition_times[tid]] for r, tid, sid in
+            zip(references, treenode_ids, skeleton_ids)]
+    parent_edition_times = [[pid, parent_info[pid][1]] for pid in existing_parent_ids]
+
+    return created_nodes, parent_edition_times
+
+
 @requires_user_role(UserRole.Annotate)
 def update_parent(request:HttpRequest, project_id=None, treenode_id=None) -> JsonResponse:
     treenode_id = int(treenode_id)
@@ -1149,25 +1363,6 @@ def update_confidence(request:HttpRequest, project_id=None, treenode_id=None) ->
     else:
         raise ValueError('Failed to update confidence at treenode %s.' % tnid)
 
-def _skeleton_as_graph(skeleton_id) -> nx.DiGraph:
-    # Fetch all nodes of the skeleton
-    cursor = connection.cursor()
-    cursor.execute('''
-        SELECT id, parent_id
-        FROM treenode
-        WHERE skeleton_id=%s''', [skeleton_id])
-    # Create a directed graph of the skeleton
-    graph = nx.DiGraph()
-    for row in cursor.fetchall():
-        # row[0]: id
-        # row[1]: parent_id
-        graph.add_node(row[0])
-        if row[1]:
-            # Create directional edge from parent to child
-            graph.add_edge(row[1], row[0])
-    return graph
-
-
 def _find_first_interesting_node(sequence):
     """ Find the first node that:
     1. Has confidence lower than 5
@@ -1212,16 +1407,16 @@ def find_previous_branchnode_or_root(request:HttpRequest, project_id=None, treen
         tnid = int(treenode_id)
         alt = 1 == int(request.POST['alt'])
         skid = Treenode.objects.get(pk=tnid).skeleton_id
-        graph = _skeleton_as_graph(skid)
+        arbor = get_skeleton_arbor(skid)
         # Travel upstream until finding a parent node with more than one child
         # or reaching the root node
         seq = [] # Does not include the starting node tnid
         while True:
-            parents = graph.predecessors(tnid)
-            if parents: # list of parents is not empty
-                tnid = parents[0] # Can ony have one parent
+            parent = arbor.parent(tnid)
+            if parent is not None:
+                tnid = parent
                 seq.append(tnid)
-                if 1 != len(graph.successors(tnid)):
+                if 1 != arbor.n_children[arbor.index(tnid)]:
                     break # Found a branch node
             else:
                 break # Found the root node
@@ -1239,9 +1434,9 @@ def find_next_branchnode_or_end(request:HttpRequest, project_id=None, treenode_i
     try:
         tnid = int(treenode_id)
         skid = Treenode.objects.get(pk=tnid).skeleton_id
-        graph = _skeleton_as_graph(skid)
+        arbor = get_skeleton_arbor(skid)
 
-        children = graph.successors(tnid)
+        children = arbor.children(tnid)
         branches = []
         for child_node_id in children:
             # Travel downstream until finding a child node with more than one
@@ -1249,7 +1444,7 @@ def find_next_branchnode_or_end(request:HttpRequest, project_id=None, treenode_i
             seq = [child_node_id] # Does not include the starting node tnid
             branch_end = child_node_id
             while True:
-                branch_children = graph.successors(branch_end)
+                branch_children = arbor.children(branch_end)
                 if 1 == len(branch_children):
                     branch_end = branch_children[0]
                     seq.append(branch_end)
@@ -1262,8 +1457,8 @@ def find_next_branchnode_or_end(request:HttpRequest, project_id=None, treenode_i
 
         # If more than one branch exists, sort based on downstream arbor size.
         if len(children) > 1:
-            branches.sort(
-                   key=lambda b: len(nx.algorithms.traversal.depth_first_search.dfs_successors(graph, b[0])),
+            subtree_sizes = arbor.subtree_sizes()
+            branches.sort(key=lambda b: subtree_sizes[arbor.index(b[0])],
                    reverse=True)
 
         # Leaf nodes will have no branches
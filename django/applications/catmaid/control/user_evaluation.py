@@ -4,7 +4,7 @@ from collections import defaultdict, namedtuple
 from datetime import datetime, timedelta
 from functools import partial
 import json
-from networkx import connected_components
+import numpy as np
 import pytz
 from typing import Any, DefaultDict, Dict, Iterable, List, Optional, Tuple
 
@@ -20,17 +20,13 @@ from catmaid.control.tree_util import lazy_load_trees
 
 def _find_nearest(tree, nodes, loc1) -> Tuple[Any, float]:
     """ Returns a tuple of the closest node and the square of the distance. """
-    min_sqdist = float('inf')
-    for node in nodes:
-        loc2 = (tree.node[node]['location_x'],
-                tree.node[node]['location_y'],
-                tree.node[node]['location_z'])
-        dsq = pow(loc1[0] - loc2[0], 2) + pow(loc1[1] - loc2[1], 2) + pow(loc1[2] - loc2[2], 2)
-        if dsq < min_sqdist:
-            min_sqdist = dsq
-            closest = node
+    indices = tree.indices(nodes)
+    locations = np.column_stack([tree.properties[c][indices].astype(np.float64)
+            for c in ('location_x', 'location_y', 'location_z')])
+    sqdists = np.sum((locations - np.array(list(loc1))) ** 2, axis=1)
+    closest = int(np.argmin(sqdists))
 
-    return closest, min_sqdist
+    return nodes[closest], float(sqdists[closest])
 
 def _parse_location(loc) -> Iterable[float]:
     return map(float, loc[1:-1].split(','))
@@ -89,7 +85,7 @@ def _evaluate_epochs(epochs, skeleton_id, tree, reviews, relations) -> List:
         newer_synapses_count:DefaultDict = defaultdict(partial(defaultdict, int))
 
         for node in nodes:
-            props = tree.node[node]
+            props = tree.node_data(node)
             # Find out review date range for this epoch, based on most recent
             # reviews
             tr = reviews[node][0].review_time
@@ -130,12 +126,12 @@ def _evaluate_epochs(epochs, skeleton_id, tree, reviews, relations) -> List:
             if pre:
                 for s in pre:
                     if in_range(s.creation_time):
-                        reviewer_n_pre[tree.node[s.treenode_id]['user_id']] += 1
+                        reviewer_n_pre[tree.node_data(s.treenode_id)['user_id']] += 1
             post = reviewer_synapses.get(relations['postsynaptic_to'])
             if post:
                 for s in post:
                     if in_range(s.creation_time):
-                        reviewer_n_post[tree.node[s.treenode_id]['user_id']] += 1
+                        reviewer_n_post[tree.node_data(s.treenode_id)['user_id']] += 1
 
 
         date_range = [start_date, end_date]
@@ -173,37 +169,35 @@ def _evaluate_epochs(epochs, skeleton_id, tree, reviews, relations) -> List:
             node, sqdist = _find_nearest(tree, nodes, _parse_location(location))
 
             if 'split_skeleton' == operation_type:
-                splits[tree.node[node]['user_id']] += 1
+                splits[tree.node_data(node)['user_id']] += 1
 
             elif 'join_skeleton' == operation_type:
-                edges = tree[node]
-                if edges:
+                parent = tree.parent(node)
+                if parent is not None:
                     # Replace node with its parent
-                    node = next(edges.keys())
-                merges[tree.node[node]['user_id']] += 1
+                    node = parent
+                merges[tree.node_data(node)['user_id']] += 1
 
         # Count nodes created by the reviewer, as well as
         # the number of connected arbors made by that nodes
         # which will add to the count of merges missed.
         def newlyAdded(node):
-            props = tree.node[node]
+            props = tree.node_data(node)
             return props['user_id'] == reviewer_id and in_range(props['creation_time'])
 
-        owned = filter(newlyAdded, nodes)
+        owned = list(filter(newlyAdded, nodes))
 
         if owned:
-            sub = tree.subgraph(owned)
-            additions = connected_components(sub.to_undirected())
+            additions = tree.components(owned)
             for addition in additions:
                 # Find a node whose parent's creator is not the reviewer, if any
                 # (Could not find any if the reviewer had created that parent node
                 # outside of the review epoch, in which case it does not count
                 # as an error)
                 for node in addition:
-                    edges = tree[node]
-                    if edges:
-                        parent = next(edges.keys())
-                        creator_id = tree.node[parent]['user_id']
+                    parent = tree.parent(node)
+                    if parent is not None:
+                        creator_id = tree.node_data(parent)['user_id']
                         if creator_id != reviewer_id:
                             appended[creator_id].append(len(addition))
                             break
@@ -219,14 +213,12 @@ def _split_into_epochs(skeleton_id, tree, reviews, max_gap) -> List:
     given that different subsets of the arbor may have been joined at a later time. """
 
     # Sort nodes by date of most recent review (first in list)
-    def get_review_time(e):
-        return reviews[e[0]][0].review_time
-    nodes = sorted(tree.nodes_iter(data=True), key=get_review_time)
+    def get_review_time(node):
+        return reviews[node][0].review_time
+    nodes = sorted(tree, key=get_review_time)
 
     # Grab the oldest node
-    oldest = nodes[0]
-    last_id = oldest[0] # id of first node
-    last = oldest[1] # props of first node
+    last_id = nodes[0] # id of first node
 
     # First epoch contains the oldest node
     epoch = [last_id]
@@ -238,7 +230,7 @@ def _split_into_epochs(skeleton_id, tree, reviews, max_gap) -> List:
     epochs = [(last_review.reviewer_id, epoch)]
 
     # Iterate from second-oldest node forward in time
-    for node, props in nodes:
+    for node in nodes:
         # Most recent review of current node
         node_review = reviews[node][0]
         # Add to current epoch if same reviewer and we are within max_gap
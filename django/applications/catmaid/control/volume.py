@@ -1,23 +1,28 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
 from itertools import chain
 import logging
 import json
+import math
+import numpy as np
 import os
 import re
+import threading
 import trimesh
-from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
-from xml.etree import ElementTree as ET
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 from django.conf import settings
 from django.db import connection
 from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from catmaid.control.annotation import get_annotated_entities
 from catmaid.control.authentication import requires_user_role, user_can_edit
-from catmaid.control.common import get_request_list
+from catmaid.control.common import get_request_bool, get_request_list
+from catmaid.control.tree_util import get_skeleton_arbor
 from catmaid.models import UserRole, Project, Volume
 from catmaid.serializers import VolumeSerializer
 
@@ -273,43 +278,6 @@ def _chunk(iterable, length, fn=None):
                 items = []
 
 
-def _x3d_to_points(x3d, fn=None):
-    indexed_triangle_set = ET.fromstring(x3d)
-    assert indexed_triangle_set.tag == "IndexedTriangleSet"
-    assert len(indexed_triangle_set) == 1
-
-    coordinate = indexed_triangle_set[0]
-    assert coordinate.tag == "Coordinate"
-    assert len(coordinate) == 0
-    points_str = coordinate.attrib["point"]
-
-    for item in _chunk(points_str.split(' '), 3, fn):
-        yield item
-
-
-def _x3d_to_stl_ascii(x3d) -> str:
-    solid_fmt = """
-solid
-{}
-endsolid
-            """.strip()
-    facet_fmt = """
-facet normal 0 0 0
-outer loop
-{}
-endloop
-endfacet
-            """.strip()
-    vertex_fmt = "vertex {} {} {}"
-
-    triangle_strs = []
-    for triangle in _chunk(_x3d_to_points(x3d), 3):
-        vertices = '\n'.join(vertex_fmt.format(*point) for point in triangle)
-        triangle_strs.append(facet_fmt.format(vertices))
-
-    return solid_fmt.format('\n'.join(triangle_strs))
-
-
 class InvalidSTLError(ValueError):
     pass
 
@@ -439,13 +407,14 @@ def _volume_collection(project_id, volume_ids, with_meshes=False):
         'data': cursor.fetchall()
     }
 
-def get_volume_details(project_id, volume_id) -> Dict[str, Any]:
+def get_volume_details(project_id, volume_id, with_mesh=True) -> Dict[str, Any]:
     cursor = connection.cursor()
     cursor.execute("""
         SELECT id, project_id, name, comment, user_id, editor_id,
-            creation_time, edition_time, Box3D(geometry), ST_Asx3D(geometry)
+            creation_time, edition_time, Box3D(geometry), {mesh}
         FROM catmaid_volume v
-        WHERE id=%s and project_id=%s""",
+        WHERE id=%s and project_id=%s""".format(
+            mesh='ST_Asx3D(geometry)' if with_mesh else 'NULL'),
         (volume_id, project_id))
     volume = cursor.fetchone()
 
@@ -781,19 +750,23 @@ def export_volume(request, project_id, volume_id, extension) -> HttpResponse:
     Supported formats by extension and media type:
     ##### STL
       - `model/stl`, `model/x.stl-ascii`: ASCII STL
+      - `model/x.stl-binary`: Binary STL
 
     """
     acceptable = {
-        'stl': ['model/stl', 'model/x.stl-ascii'],
+        'stl': ['model/stl', 'model/x.stl-ascii', 'model/x.stl-binary'],
     }
     if extension.lower() in acceptable:
         media_types = request.META.get('HTTP_ACCEPT', '').split(',')
         for media_type in media_types:
             if media_type in acceptable[extension]:
-                details = get_volume_details(project_id, volume_id)
-                ascii_details = _x3d_to_stl_ascii(details['mesh'])
+                p = get_object_or_404(Project, pk=project_id)
+                mesh = get_volume_mesh(p.id, int(volume_id))
                 response = HttpResponse(content_type=media_type)
-                response.write(ascii_details)
+                if media_type == 'model/x.stl-binary':
+                    response.write(mesh.to_stl_binary())
+                else:
+                    response.write(mesh.to_stl_ascii())
                 return response
         return HttpResponse('Media types "{}" not understood. Known types for {}: {}'.format(
             ', '.join(media_types), extension, ', '.join(acceptable[extension])), status=415)
@@ -802,10 +775,403 @@ def export_volume(request, project_id, volume_id, extension) -> HttpResponse:
             extension, ', '.join(chain.from_iterable(acceptable.values()))), status=415)
 
 
+class VolumeMesh():
+    """A triangle mesh of a volume for exact point in volume tests. A point is
+    inside the mesh if a ray from it along the positive Z axis crosses an odd
+    number of triangles. To only test the triangles a ray can cross, triangles
+    are binned into a regular grid by the XY bounding box of their projection.
+    Points on an edge shared by two projected triangles are assigned to only
+    one of them, which makes the test exact for closed meshes.
+
+    For transport, vertices and faces are also kept as packed float32 and
+    uint32 arrays.
+    """
+
+    binary_dtype = np.dtype('<u4')
+
+    def __init__(self, vertices, faces, max_grid_size=256):
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        self.vertices = vertices.astype('<f4')
+        self.faces = faces.astype('<u4')
+        if len(faces):
+            used = vertices[faces.ravel()]
+            self.min, self.max = used.min(axis=0), used.max(axis=0)
+        else:
+            self.min, self.max = np.zeros(3), np.zeros(3)
+
+        a, b, c = (vertices[faces[:, i]] for i in range(3))
+        area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - \
+                (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+        # Orient all projected triangles counter-clockwise and ignore the ones
+        # perpendicular to the XY plane, no ray along Z crosses them.
+        cw = (area < 0)[:, np.newaxis]
+        b, c = np.where(cw, c, b), np.where(cw, b, c)
+        keep = area != 0
+        self.a, self.b, self.c = a[keep], b[keep], c[keep]
+        self.area = np.abs(area[keep])
+
+        n_triangles = len(self.area)
+        self.grid_size = max(1, min(max_grid_size,
+                int(math.ceil(math.sqrt(n_triangles / 4)))))
+        extent = (self.max - self.min)[:2]
+        self.cell_size = np.where(extent > 0, extent / self.grid_size, 1.0)
+
+        # Store the triangles of each cell in a compressed sparse row layout.
+        tri_min = self.cell_index(np.minimum(np.minimum(self.a, self.b), self.c))
+        tri_max = self.cell_index(np.maximum(np.maximum(self.a, self.b), self.c))
+        n_y = tri_max[:, 1] - tri_min[:, 1] + 1
+        n_cells = (tri_max[:, 0] - tri_min[:, 0] + 1) * n_y
+        triangles = np.repeat(np.arange(n_triangles), n_cells)
+        offset = np.arange(len(triangles)) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+        n_y = n_y[triangles]
+        cells = (tri_min[triangles, 0] + offset // n_y) * self.grid_size + \
+                tri_min[triangles, 1] + offset % n_y
+        order = np.argsort(cells, kind='mergesort')
+        self.cell_triangles = triangles[order]
+        self.cell_offsets = np.searchsorted(cells[order],
+                np.arange(self.grid_size * self.grid_size + 1))
+
+    @classmethod
+    def from_x3d(cls, x3d) -> 'VolumeMesh':
+        """Create a mesh from the X3D representation of a PostGIS geometry, an
+        IndexedTriangleSet or IndexedFaceSet. Faces with more than three
+        vertices are triangulated as fans. PostGIS repeats shared vertices for
+        each triangle, they are merged in the order of their first use.
+        """
+        if not x3d:
+            return cls([], [])
+        point_match = re.search("point='(.*?)'", x3d)
+        if point_match is None:
+            raise ValueError('Malformed input: points not found')
+        vertices = np.array(point_match.group(1).split(),
+                dtype=np.float64).reshape(-1, 3)
+
+        index_match = re.search("(coordIndex|index)='(.*?)'", x3d)
+        if index_match is None:
+            raise ValueError('Malformed input: indices not found')
+        indices = np.array(index_match.group(2).split(), dtype=np.int64)
+        if index_match.group(1) == 'index':
+            faces = indices.reshape(-1, 3)
+        else:
+            # Faces are separated by -1
+            fan = []
+            for face in np.split(indices, np.nonzero(indices == -1)[0]):
+                face = face[face != -1]
+                for i in range(1, len(face) - 1):
+                    fan.append((face[0], face[i], face[i + 1]))
+            faces = np.array(fan, dtype=np.int64).reshape(-1, 3)
+
+        if len(vertices):
+            _, first, inverse = np.unique(vertices, axis=0, return_index=True,
+                    return_inverse=True)
+            order = np.argsort(first)
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            vertices = vertices[first[order]]
+            faces = rank[inverse.ravel()][faces]
+
+        return cls(vertices, faces)
+
+    @classmethod
+    def from_binary(cls, data) -> 'VolumeMesh':
+        """Create a mesh from the binary representation of to_binary()."""
+        n_vertices, n_faces = np.frombuffer(data, dtype=cls.binary_dtype, count=2)
+        vertices = np.frombuffer(data, dtype='<f4', count=3 * n_vertices,
+                offset=8)
+        faces = np.frombuffer(data, dtype=cls.binary_dtype, count=3 * n_faces,
+                offset=8 + vertices.nbytes)
+        return cls(vertices, faces)
+
+    def to_binary(self) -> bytes:
+        """Return the number of vertices and faces as two uint32 values,
+        followed by all vertices as float32 triples and all faces as uint32
+        vertex index triples, all little-endian.
+        """
+        header = np.array([len(self.vertices), len(self.faces)],
+                dtype=self.binary_dtype)
+        return b''.join((header.tobytes(), self.vertices.tobytes(),
+                self.faces.tobytes()))
+
+    def to_stl_binary(self) -> bytes:
+        """Return the mesh as binary STL file without face normals."""
+        facets = np.zeros(len(self.faces), dtype=np.dtype([
+            ('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)),
+            ('attributes', '<u2')]))
+        facets['vertices'] = self.vertices[self.faces]
+        return b''.join((b'\0' * 80,
+                np.array([len(facets)], dtype=self.binary_dtype).tobytes(),
+                facets.tobytes()))
+
+    def to_stl_ascii(self) -> str:
+        """Return the mesh as ASCII STL file without face normals."""
+        facet_fmt = "facet normal 0 0 0\nouter loop\n{}\n{}\n{}\nendloop\nendfacet"
+        # Float32 scalars are formatted with the shortest exact representation.
+        vertex_strs = [f"vertex {x} {y} {z}" for x, y, z in
+                self.vertices[self.faces.ravel()]]
+        return "solid\n{}\nendsolid".format('\n'.join(facet_fmt.format(
+                *vertex_strs[i:i + 3]) for i in range(0, len(vertex_strs), 3)))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.vertices, self.faces, self.a,
+                self.b, self.c, self.area, self.cell_triangles,
+                self.cell_offsets))
+
+    def cell_index(self, points) -> np.ndarray:
+        cells = np.floor((points[:, :2] - self.min[:2]) / self.cell_size)
+        return np.clip(cells, 0, self.grid_size - 1).astype(np.int64)
+
+    def contains(self, points, max_tests=2**20) -> np.ndarray:
+        """Return a boolean array that is True for each passed in point that
+        is inside the mesh. Points are tested in batches of at most
+        <max_tests> point-triangle pairs.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        result = np.zeros(len(points), dtype=bool)
+        if not len(self.area):
+            return result
+
+        candidates = np.nonzero(np.all((points >= self.min) &
+                (points <= self.max), axis=1))[0]
+        cell_index = self.cell_index(points[candidates])
+        cells = cell_index[:, 0] * self.grid_size + cell_index[:, 1]
+        order = np.argsort(cells, kind='mergesort')
+        candidates, cells = candidates[order], cells[order]
+        cell_starts = np.nonzero(np.diff(cells, prepend=-1))[0]
+
+        for start, end in zip(cell_starts, np.append(cell_starts[1:], len(cells))):
+            cell = cells[start]
+            triangles = self.cell_triangles[
+                    self.cell_offsets[cell]:self.cell_offsets[cell + 1]]
+            if not len(triangles):
+                continue
+            batch_size = max(1, max_tests // len(triangles))
+            for batch_start in range(start, end, batch_size):
+                batch = candidates[batch_start:min(end, batch_start + batch_size)]
+                crossings = self._count_crossings(points[batch], triangles)
+                result[batch] = crossings % 2 == 1
+
+        return result
+
+    def _count_crossings(self, points, triangles) -> np.ndarray:
+        """Count for each point the passed in triangles that are crossed by a
+        ray from the point along the positive Z axis.
+        """
+        a, b, c = self.a[triangles], self.b[triangles], self.c[triangles]
+        x, y = points[:, 0, np.newaxis], points[:, 1, np.newaxis]
+
+        def edge_weight(start, end):
+            dx, dy = end[:, 0] - start[:, 0], end[:, 1] - start[:, 1]
+            w = dx * (y - start[:, 1]) - dy * (x - start[:, 0])
+            # A point on an edge belongs only to the triangle for which the
+            # edge points up or, if horizontal, to the left.
+            owned = (dy > 0) | ((dy == 0) & (dx < 0))
+            return w, (w > 0) | ((w == 0) & owned)
+
+        w_a, in_a = edge_weight(b, c)
+        w_b, in_b = edge_weight(c, a)
+        w_c, in_c = edge_weight(a, b)
+        z = (w_a * a[:, 2] + w_b * b[:, 2] + w_c * c[:, 2]) / self.area[triangles]
+        return np.count_nonzero(in_a & in_b & in_c & (z > points[:, 2, np.newaxis]),
+                axis=1)
+
+    def innervation(self, locations, parent_index, n_steps=10) -> Tuple[int, float]:
+        """Return the number of passed in nodes inside the mesh and the cable
+        length inside the mesh. Nodes are given as an array of locations and
+        the index of each node's parent (-1 for the root). For edges that
+        leave the mesh, the crossing point is found by <n_steps> bisections.
+        Edges with both nodes outside the mesh aren't counted.
+        """
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+        inside = self.contains(locations)
+        children = np.nonzero(parent_index >= 0)[0]
+        child_locations = locations[children]
+        parent_locations = locations[parent_index[children]]
+        lengths = np.linalg.norm(child_locations - parent_locations, axis=1)
+        child_inside, parent_inside = inside[children], inside[parent_index[children]]
+        cable = lengths[child_inside & parent_inside].sum()
+
+        crossing = child_inside != parent_inside
+        if crossing.any():
+            start = np.where(child_inside[crossing, np.newaxis],
+                    child_locations[crossing], parent_locations[crossing])
+            end = np.where(child_inside[crossing, np.newaxis],
+                    parent_locations[crossing], child_locations[crossing])
+            # The fraction of each edge from the inside node.
+            lower = np.zeros(len(start))
+            upper = np.ones(len(start))
+            for _ in range(n_steps):
+                middle = (lower + upper) / 2
+                middle_inside = self.contains(start + (end - start) * middle[:, np.newaxis])
+                lower = np.where(middle_inside, middle, lower)
+                upper = np.where(middle_inside, upper, middle)
+            cable += (lengths[crossing] * (lower + upper) / 2).sum()
+
+        return int(np.count_nonzero(inside)), float(cable)
+
+
+class VolumeMeshCache():
+    """A size limited in-memory LRU cache of volume meshes for a single
+    process. Entries are keyed by volume ID and carry the edition time of the
+    volume, which is compared to the volume table with each access. Volumes
+    changed in the current transaction aren't cached. A maximum size of zero
+    disables the cache.
+    """
+
+    def __init__(self, max_size=None):
+        self._max_size = max_size
+
+        # Maps volume IDs to (edition time, size, mesh) tuples.
+        self.entries:OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.RLock()
+
+    @property
+    def max_size(self):
+        if self._max_size is None:
+            return getattr(settings, 'VOLUME_MESH_CACHE_MAX_SIZE', 64 * 1024 * 1024)
+        return self._max_size
+
+    def get(self, project_id, volume_id, cursor=None) -> VolumeMesh:
+        return self.get_many(project_id, [volume_id], cursor)[int(volume_id)]
+
+    @staticmethod
+    def get_etag(project_id, volume_id, cursor=None) -> Optional[str]:
+        """Get an entity tag for the current mesh of a volume, which is based
+        on its edition time. Returns None if the volume doesn't exist.
+        """
+        if cursor is None:
+            cursor = connection.cursor()
+        cursor.execute("""
+            SELECT edition_time
+            FROM catmaid_volume
+            WHERE project_id = %(project_id)s
+            AND id = %(volume_id)s
+        """, {
+            'project_id': project_id,
+            'volume_id': volume_id,
+        })
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return f'volume-mesh-{volume_id}-{row[0].timestamp()}'
+
+    def get_many(self, project_id, volume_ids, cursor=None) -> Dict[int, VolumeMesh]:
+        """Get the meshes of all passed in volumes as dictionary. Raises a
+        ValueError if a volume doesn't exist.
+        """
+        volume_ids = set(map(int, volume_ids))
+        if cursor is None:
+            cursor = connection.cursor()
+
+        cursor.execute("""
+            SELECT id, edition_time, edition_time = now()
+            FROM catmaid_volume
+            WHERE project_id = %(project_id)s
+            AND id = ANY(%(volume_ids)s::int[])
+        """, {
+            'project_id': project_id,
+            'volume_ids': list(volume_ids),
+        })
+        versions = dict((r[0], None if r[2] else r[1]) for r in cursor.fetchall())
+        missing = volume_ids - set(versions.keys())
+        if missing:
+            raise ValueError("Could not find volumes: " +
+                    ", ".join(str(v) for v in sorted(missing)))
+
+        meshes = {}
+        max_size = self.max_size
+        with self.lock:
+            for volume_id, version in versions.items():
+                entry = self.entries.get(volume_id)
+                if entry is not None and max_size and entry[0] == version:
+                    self.entries.move_to_end(volume_id)
+                    self.hits += 1
+                    meshes[volume_id] = entry[2]
+                else:
+                    self.misses += 1
+
+        uncached = [v for v in versions if v not in meshes]
+        if uncached:
+            cursor.execute("""
+                SELECT id, ST_AsX3D(geometry)
+                FROM catmaid_volume
+                WHERE id = ANY(%(volume_ids)s::int[])
+            """, {
+                'volume_ids': uncached,
+            })
+            for volume_id, x3d in cursor.fetchall():
+                mesh = VolumeMesh.from_x3d(x3d)
+                meshes[volume_id] = mesh
+                if max_size and versions[volume_id] is not None:
+                    self.put(volume_id, versions[volume_id], mesh)
+
+        return meshes
+
+    def put(self, volume_id, version, mesh) -> None:
+        size = mesh.nbytes
+        with self.lock:
+            if volume_id in self.entries:
+                self._remove(volume_id)
+            if size > self.max_size:
+                return
+            self.entries[volume_id] = (version, size, mesh)
+            self.size += size
+            # Evict least recently used entries
+            while self.entries and self.size > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, volume_id) -> None:
+        entry = self.entries.pop(volume_id)
+        self.size -= entry[1]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+volume_mesh_cache = VolumeMeshCache()
+
+
+def get_volume_mesh(project_id, volume_id, cursor=None) -> VolumeMesh:
+    """Get the mesh of a volume through the mesh cache of this process."""
+    return volume_mesh_cache.get(project_id, volume_id, cursor)
+
+
+def _get_volume_mesh_etag(request, project_id, volume_id) -> Optional[str]:
+    return VolumeMeshCache.get_etag(int(project_id), int(volume_id))
+
+
+@api_view(['GET'])
+@renderer_classes((AnyRenderer,))
+@requires_user_role([UserRole.Browse])
+@condition(etag_func=_get_volume_mesh_etag)
+def volume_mesh(request, project_id, volume_id) -> HttpResponse:
+    """Get the triangle mesh of a volume in a compact binary format.
+
+    The response starts with the number of vertices and the number of
+    triangles as two unsigned 32 bit integers. It is followed by all vertices
+    as triples of 32 bit floats and all triangles as triples of unsigned 32 bit
+    vertex indices. All values are little-endian. The response has an ETag
+    header, which changes only if the volume is edited. Requests with a
+    matching If-None-Match header are answered with status 304.
+    """
+    mesh = get_volume_mesh(int(project_id), int(volume_id))
+    return HttpResponse(mesh.to_binary(), content_type='application/octet-stream')
+
+
 @api_view(['GET'])
 @requires_user_role([UserRole.Browse])
 def intersects(request, project_id, volume_id) -> JsonResponse:
-    """Test if a point intersects with the bounding box of a given volume.
+    """Test if a point is inside a given volume.
+
+    The point is tested against the volume mesh, which is expected to be
+    closed.
     ---
     parameters:
       - name: x
@@ -837,19 +1203,49 @@ def intersects(request, project_id, volume_id) -> JsonResponse:
 
     x, y, z = float(x), float(y), float(z)
 
-    # This test works only for boxes, because it only checks bounding box
-    # overlap (&&& operator).
-    cursor = connection.cursor()
-    cursor.execute("""
-        SELECT pt.geometry &&& catmaid_volume.geometry
-        FROM (SELECT 'POINT(%s %s %s)'::geometry) AS pt, catmaid_volume
-        WHERE catmaid_volume.id=%s""",
-        (x, y, z, volume_id))
+    mesh = get_volume_mesh(p.id, volume_id)
+
+    return JsonResponse({
+        'intersects': bool(mesh.contains([[x, y, z]])[0])
+    })
+
+
+@api_view(['POST'])
+@requires_user_role([UserRole.Browse])
+def contains(request, project_id, volume_id) -> JsonResponse:
+    """Test which of the passed in points are inside a given volume.
+
+    All points are tested against the volume mesh at once, which is expected
+    to be closed.
+    ---
+    parameters:
+      - name: points
+        description: |
+          A list of [x, y, z] lists, optionally as JSON encoded string.
+        required: true
+        type: array
+        items:
+          type: array
+        paramType: form
+    type:
+      'contains':
+        type: array
+        items:
+          type: boolean
+        description: Whether each point is inside the volume
+        required: true
+    """
+    if 'points' in request.POST:
+        points = json.loads(request.POST['points'])
+    else:
+        points = get_request_list(request.POST, 'points', [], map_fn=float)
+    if not points:
+        raise ValueError("Need at least one point")
 
-    result = cursor.fetchone()
+    mesh = get_volume_mesh(int(project_id), volume_id)
 
     return JsonResponse({
-        'intersects': result[0]
+        'contains': mesh.contains(points).tolist()
     })
 
 
@@ -1039,6 +1435,14 @@ def get_skeleton_innervations(request, project_id) -> JsonResponse:
           description: A minimum number of cable length esult skeleton need to have.
           required: false
           type: boolean
+        - name: exact
+          description: |
+            Whether skeletons are tested against the volume meshes rather than
+            only their bounding boxes. If enabled, each result also lists the
+            number of nodes and the cable length inside each volume.
+          required: false
+          type: boolean
+          defaultValue: false
     """
     skeleton_ids = get_request_list(request.POST, 'skeleton_ids', map_fn=int)
     if not skeleton_ids:
@@ -1051,14 +1455,16 @@ def get_skeleton_innervations(request, project_id) -> JsonResponse:
     if min_cable:
         min_cable = int(min_cable)
 
+    exact = get_request_bool(request.POST, 'exact', False)
+
     volume_intersections = _get_skeleton_innervations(project_id, skeleton_ids,
-            volume_annotation, min_nodes, min_cable)
+            volume_annotation, min_nodes, min_cable, exact)
 
     return JsonResponse(volume_intersections, safe=False)
 
 
 def _get_skeleton_innervations(project_id, skeleton_ids, volume_annotation,
-        min_nodes=None, min_cable=None) -> List[Dict[str, Any]]:
+        min_nodes=None, min_cable=None, exact=False) -> List[Dict[str, Any]]:
     # Build an intersection query for each volume bounding box with the passed
     # in set of skeletons.
     query_params = {
@@ -1148,9 +1554,48 @@ def _get_skeleton_innervations(project_id, skeleton_ids, volume_annotation,
         'skeleton_id': x[0],
         'volume_ids': x[1]
     }, cursor.fetchall()))
+
+    if exact:
+        skeleton_intersections = _get_exact_innervations(project_id,
+                skeleton_intersections, cursor)
+
     return skeleton_intersections
 
 
+def _get_exact_innervations(project_id, skeleton_intersections, cursor=None):
+    """Test the skeletons of the passed in bounding box intersections against
+    the meshes of their volumes. Only volumes with nodes or cable inside are
+    kept and their number of nodes and cable length inside are added to each
+    result.
+    """
+    meshes = volume_mesh_cache.get_many(project_id, set(chain.from_iterable(
+            si['volume_ids'] for si in skeleton_intersections)), cursor)
+
+    exact_intersections = []
+    for si in skeleton_intersections:
+        tree = get_skeleton_arbor(si['skeleton_id'], cursor)
+        locations = np.column_stack([tree.properties['location_x'],
+                tree.properties['location_y'], tree.properties['location_z']])
+        innervations = []
+        for volume_id in si['volume_ids']:
+            num_nodes, cable_length = meshes[volume_id].innervation(
+                    locations, tree.parent_index)
+            if num_nodes or cable_length:
+                innervations.append({
+                    'volume_id': volume_id,
+                    'num_nodes': num_nodes,
+                    'cable_length': cable_length,
+                })
+        if innervations:
+            exact_intersections.append({
+                'skeleton_id': si['skeleton_id'],
+                'volume_ids': [i['volume_id'] for i in innervations],
+                'innervations': innervations,
+            })
+
+    return exact_intersections
+
+
 @api_view(['GET'])
 @requires_user_role([UserRole.Annotate])
 def update_meta_information(request, project_id, volume_id) -> JsonResponse:
@@ -1185,13 +1630,13 @@ def update_volume_meta_information(project_id, volume_ids=None):
         volume_ids = list(Volume.objects.filter(project_id=project_id) \
                 .values_list('id', flat=True))
 
-    volumes = get_volume_data(project_id, volume_ids)
+    volumes = volume_mesh_cache.get_many(project_id, volume_ids)
 
     new_data = {}
     for volume_id, v in volumes.items():
         try:
             # Build tri-mesh and get properties
-            mesh = trimesh.Trimesh(vertices=v['vertices'], faces=v['faces'])
+            mesh = trimesh.Trimesh(vertices=v.vertices, faces=v.faces)
             new_data[volume_id] = {
                 'area': mesh.area,
                 'volume': mesh.volume,
@@ -13,7 +13,8 @@ from django.db import connection
 
 from catmaid.control.edge import get_intersected_grid_cells
 from catmaid.control.node import (get_configured_node_providers,
-        GridCachedNodeProvider, Postgis3dNodeProvider, update_grid_cell)
+        GridCachedNodeProvider, Postgis3dNodeProvider, update_grid_cell,
+        update_grid_cell_delta)
 from catmaid.models import NodeGridCache, DirtyNodeGridCacheCell
 from catmaid.util import str2bool
 from .common import set_log_level
@@ -25,7 +26,7 @@ logger = logging.getLogger(__name__)
 class GridWorker():
 
     def __init__(self):
-        pass
+        self.delta_updates = 0
 
     def update(self, updates, cursor):
         """Pop the oldest item from the diry cell table, compute the respective
@@ -59,11 +60,38 @@ class GridWorker():
             if g.hidden_last_editor_id:
                 params['hidden_last_editor_id'] = int(g.hidden_last_editor_id)
 
-            added = update_grid_cell(g.project_id, g.id, w_i, h_i, d_i,
-                    g.cell_width, g.cell_height, g.cell_depth,
-                    params, g.allow_empty, g.n_lod_levels, g.lod_min_bucket_size,
-                    g.lod_strategy, g.has_json_data, g.has_json_text_data,
-                    g.has_msgpack_data, provider=provider, cursor=cursor)
+            # If the spatial update worker recorded the extent of all changes
+            # in this cell, try to only update this part of the cell.
+            cursor.execute("""
+                SELECT dirty_box
+                FROM dirty_node_grid_cache_cell
+                WHERE grid_id = %(grid_id)s
+                AND x_index = %(x)s AND y_index = %(y)s AND z_index = %(z)s
+            """, {
+                'grid_id': g.id,
+                'x': w_i,
+                'y': h_i,
+                'z': d_i,
+            })
+            row = cursor.fetchone()
+            dirty_box = row[0] if row else None
+
+            added = False
+            if dirty_box:
+                added = update_grid_cell_delta(g.project_id, g.id, w_i, h_i,
+                        d_i, g.cell_width, g.cell_height, g.cell_depth, params,
+                        dirty_box, g.has_json_data, g.has_json_text_data,
+                        g.has_msgpack_data, provider=provider, cursor=cursor,
+                        lod_strategy=g.lod_strategy)
+                if added:
+                    self.delta_updates += 1
+
+            if not added:
+                added = update_grid_cell(g.project_id, g.id, w_i, h_i, d_i,
+                        g.cell_width, g.cell_height, g.cell_depth,
+                        params, g.allow_empty, g.n_lod_levels, g.lod_min_bucket_size,
+                        g.lod_strategy, g.has_json_data, g.has_json_text_data,
+                        g.has_msgpack_data, provider=provider, cursor=cursor)
 
             if added:
                 updated_cells += 1
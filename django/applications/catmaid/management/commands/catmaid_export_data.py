@@ -6,13 +6,15 @@ from typing import Dict, List, Optional, Set
 
 from catmaid.control.annotation import (get_annotated_entities,
         get_annotation_to_id_map, get_sub_annotation_ids)
+from catmaid.control.exportarchive import ExportArchiveWriter
 from catmaid.control.tracing import check_tracing_setup
 from catmaid.control.volume import find_volumes
 from catmaid.models import (Class, ClassInstance, ClassInstanceClassInstance,
         Relation, Connector, Project, Treenode, TreenodeClassInstance,
         TreenodeConnector, User, ReducedInfoUser, ExportUser, Volume)
 from catmaid.util import str2bool
-from django.db import connection
+from django.db import connection, transaction
+from django.db.models import QuerySet
 from django.core import serializers
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.hashers import make_password
@@ -62,12 +64,18 @@ class Exporter():
             self.run_noninteractive = options['run_noninteractive']
         else:
             self.run_noninteractive = False
+        self.streaming = options.get('streaming', False)
+        self.chunk_size = options.get('chunk_size', 100000)
+        self.compress = options.get('compress', False)
+        self.copy_tables = set(options.get('copy_tables') or [])
         self.target_file = options.get('file', None)
         if self.target_file:
             self.target_file = self.target_file.format(project.id)
         else:
             now = datetime.now().strftime('%Y-%m-%d-%H-%M')
-            self.target_file = f'catmaid-export-pid-{project.id}-{now}.json'
+            # Streaming exports are written into a directory
+            extension = '' if self.streaming else '.json'
+            self.target_file = f'catmaid-export-pid-{project.id}-{now}{extension}'
 
         self.show_traceback = True
         self.format = 'json'
@@ -363,20 +371,19 @@ class Exporter():
 
 
         # Export referenced neurons and skeletons
-        exported_tids:Set = set()
-        if treenodes:
-            treenode_skeleton_ids = set(t.skeleton_id for t in treenodes)
+        if treenodes is not None:
+            # Treenodes are only counted in the database to not load all of
+            # them into memory.
+            treenode_skeleton_ids = treenodes.order_by().values('skeleton_id').distinct()
             n_skeletons = ClassInstance.objects.filter(
                     project=self.project,
                     id__in=treenode_skeleton_ids).count()
-            neuron_links = ClassInstanceClassInstance.objects \
+            n_neurons = ClassInstanceClassInstance.objects \
                     .filter(project=self.project, class_instance_a__in=treenode_skeleton_ids, \
-                           relation=relations.get('model_of'))
-            n_neuron_links = len(neuron_links)
-            neurons = set([l.class_instance_b_id for l in neuron_links])
+                           relation=relations.get('model_of')) \
+                    .values('class_instance_b_id').distinct().count()
 
-            exported_tids = set(treenodes.values_list('id', flat=True))
-            logger.info(f"Exporting {len(exported_tids)} treenodes in {n_skeletons} skeletons and {len(neurons)} neurons")
+            logger.info(f"Exporting {treenodes.count()} treenodes in {n_skeletons} skeletons and {n_neurons} neurons")
 
         # Get current maximum concept ID
         cursor = connection.cursor()
@@ -395,14 +402,21 @@ class Exporter():
                     .filter(project=self.project, connector__in=connector_ids) \
                     .exclude(skeleton_id__in=skeleton_id_constraints))
                 connector_tids = set(c.treenode_id for c in connector_links)
-                extra_tids = connector_tids - exported_tids
+                if treenodes is not None:
+                    exported_tids = set(treenodes.filter(id__in=connector_tids) \
+                            .values_list('id', flat=True))
+                    extra_tids = connector_tids - exported_tids
+                else:
+                    extra_tids = connector_tids
                 if self.original_placeholder_context:
                     logger.info("Exporting %s placeholder nodes" % len(extra_tids))
                 else:
                     logger.info("Exporting %s placeholder nodes with first new class instance ID %s" % (len(extra_tids), new_skeleton_id))
 
-                placeholder_treenodes = Treenode.objects.prefetch_related(
-                        'treenodeconnector_set').filter(id__in=extra_tids)
+                # Placeholder nodes are changed below, which is why they are
+                # loaded right away.
+                placeholder_treenodes = list(Treenode.objects.prefetch_related(
+                        'treenodeconnector_set').filter(id__in=extra_tids))
                 # Placeholder nodes will be transformed into root nodes of new
                 # skeletons.
                 new_skeleton_cis = []
@@ -524,15 +538,21 @@ class Exporter():
 
         # Export users, either completely or in a reduced form
         seen_user_ids = set()
-        # Find users involved in exported data
+        # Find users involved in exported data. User references of query sets
+        # are looked up in the database to not load all objects into memory.
+        user_fields = ('user_id', 'reviewer_id', 'editor_id')
         for group in self.to_serialize:
+            if isinstance(group, QuerySet):
+                fields = [f.attname for f in group.model._meta.concrete_fields
+                        if f.attname in user_fields]
+                if fields:
+                    for row in group.order_by().values_list(*fields).distinct():
+                        seen_user_ids.update(row)
+                continue
             for o in group:
-                if hasattr(o, 'user_id'):
-                    seen_user_ids.add(o.user_id)
-                if hasattr(o, 'reviewer_id'):
-                    seen_user_ids.add(o.reviewer_id)
-                if hasattr(o, 'editor_id'):
-                    seen_user_ids.add(o.editor_id)
+                for field in user_fields:
+                    if hasattr(o, field):
+                        seen_user_ids.add(getattr(o, field))
         users = [ExportUser(id=u.id, username=u.username, password=u.password,
                 first_name=u.first_name, last_name=u.last_name, email=u.email,
                 date_joined=u.date_joined) \
@@ -555,6 +575,9 @@ class Exporter():
     def export(self):
         """ Writes all objects matching
         """
+        if self.streaming:
+            return self.export_streaming()
+
         try:
             self.collect_data()
 
@@ -570,6 +593,42 @@ class Exporter():
                 raise
             raise CommandError("Unable to serialize database: %s" % e)
 
+    def export_streaming(self):
+        """Write all objects matching into an export archive directory. Query
+        sets are read in chunks using server-side cursors and each chunk is
+        written into its own file. Query sets of tables in copy_tables are
+        written with PostgreSQL's COPY. To get a consistent snapshot, all
+        queries run in a single read-only transaction.
+        """
+        try:
+            with transaction.atomic():
+                cursor = connection.cursor()
+                cursor.execute("""
+                    SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY
+                """)
+
+                self.collect_data()
+
+                writer = ExportArchiveWriter(self.target_file, self.chunk_size,
+                        self.compress)
+                for group in self.to_serialize:
+                    if isinstance(group, QuerySet):
+                        if group.model._meta.db_table in self.copy_tables:
+                            n_written = writer.write_copy(group)
+                        else:
+                            n_written = writer.write_objects(
+                                    group.iterator(chunk_size=self.chunk_size))
+                    else:
+                        n_written = writer.write_objects(group)
+                    logger.debug(f"Wrote {n_written} objects, {len(writer.files)} files in total")
+                writer.close({
+                    'project_id': self.project.id,
+                })
+        except Exception as e:
+            if self.show_traceback:
+                raise
+            raise CommandError("Unable to export database: %s" % e)
+
 
 class Command(BaseCommand):
     """ Call e.g. like
@@ -622,6 +681,20 @@ class Command(BaseCommand):
             action='store_true', default=False, help='Whether or not neurons ' +
             'should be excluded if in addition to an exclusion annotation ' +
             'they are also annotated with a required (inclusion) annotation.')
+        parser.add_argument('--streaming', dest='streaming',
+            action='store_true', default=False, help='Write an export archive ' +
+            'directory with a manifest and per-table JSON lines files instead ' +
+            'of a single JSON file. Data is read and written in chunks, which ' +
+            'allows exporting large projects.')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+            default=100000, help='With --streaming: the maximum number of ' +
+            'objects per file')
+        parser.add_argument('--compress', dest='compress', action='store_true',
+            default=False, help='With --streaming: compress all files with gzip')
+        parser.add_argument('--copy-table', dest='copy_tables', action='append',
+            choices=('treenode', 'treenode_connector'), help='With ' +
+            '--streaming: write this table with PostgreSQL\'s COPY, which is ' +
+            'faster for large tables. Can be used multiple times.')
 
     def ask_for_project(self, title):
         """ Return a valid project object.
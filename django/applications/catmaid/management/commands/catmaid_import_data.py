@@ -3,14 +3,17 @@
 from abc import ABC, abstractmethod
 import argparse
 from collections import defaultdict
+from contextlib import contextmanager
 import inspect
 import logging
+import os
 import progressbar
 from typing import Any, DefaultDict, Dict, List, Set, Type
 
 from catmaid.apps import get_system_user
 from catmaid.control.annotationadmin import copy_annotations
 from catmaid.control.edge import rebuild_edge_tables, rebuild_edges_selectively
+from catmaid.control.exportarchive import is_export_archive, read_export_archive
 import catmaid.models
 from catmaid.models import (Class, ClassClass, ClassInstance,
         ClassInstanceClassInstance, Project, Relation, User, Treenode,
@@ -73,6 +76,20 @@ def ask_for_user(title):
         if u:
             return u
 
+@contextmanager
+def open_import_source(source, format):
+    """Provide the deserialized objects of either a single file in the passed
+    in format or of an export archive directory.
+    """
+    if os.path.isdir(source):
+        if not is_export_archive(source):
+            raise CommandError(f"Directory {source} is no export archive")
+        yield read_export_archive(source)
+    else:
+        with open(source, "r") as data:
+            yield serializers.deserialize(format, data)
+
+
 class AbstractImporter(ABC):
     def __init__(self, source, target, user, options):
         self.source = source
@@ -383,8 +400,7 @@ class FileImporter(AbstractImporter):
 
         # Read the file and sort by type
         logger.info(f"Loading data from {self.source}")
-        with open(self.source, "r") as data:
-            loaded_data = serializers.deserialize(self.format, data)
+        with open_import_source(self.source, self.format) as loaded_data:
             for deserialized_object in progressbar.progressbar(loaded_data,
                     max_value=progressbar.UnknownLength, redirect_stdout=True):
                 obj = deserialized_object.object
@@ -703,7 +719,8 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--source', dest='source', default=None,
-            help='The ID of the source project or the path to a file to import')
+            help='The ID of the source project or the path to a file or ' +
+            'export archive directory to import')
         parser.add_argument('--target', dest='target', default=None,
             help='The ID of the target project')
         parser.add_argument('--user', dest='user', default=None,
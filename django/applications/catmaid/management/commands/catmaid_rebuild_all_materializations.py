@@ -11,7 +11,7 @@ class Command(BaseCommand):
     help = "Recreates all entries for the following tables, which act as " + \
            "materialized views: treenode_edge, treenode_connector_edge, " + \
            "connector_geom, catmaid_stats_summary, node_query_cache, " + \
-           "catmaid_skeleton_summary"
+           "catmaid_skeleton_summary, catmaid_skeleton_connectivity"
 
     def handle(self, *args, **options):
         cursor = connection.cursor()
@@ -32,6 +32,11 @@ class Command(BaseCommand):
             SELECT refresh_skeleton_summary_table();
         """)
 
+        self.stdout.write('Recreating catmaid_skeleton_connectivity')
+        cursor.execute("""
+            SELECT refresh_skeleton_connectivity_table();
+        """)
+
         self.stdout.write('Recreating node_query_cache')
         update_node_query_cache(log=lambda x: self.stdout.write(x))
 
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+
+class Command(BaseCommand):
+    help = "Recreate the skeleton connectivity table from all connector " + \
+           "links, optionally only for particular projects."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project_id', dest='project_id', nargs='+',
+            type=int, default=None, help='Recreate connectivity only for these projects (otherwise all)')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        project_ids = options['project_id']
+        if project_ids:
+            self.stdout.write(f'Recreating skeleton connectivity for projects {project_ids}')
+        else:
+            self.stdout.write('Recreating skeleton connectivity for all projects')
+
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT refresh_skeleton_connectivity_table(%(project_ids)s::integer[])
+        """, {
+            'project_ids': project_ids,
+        })
+
+        self.stdout.write('Done')
@@ -4,7 +4,7 @@ import logging
 import select
 import signal
 import time
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
 
 from django.conf import settings
@@ -14,13 +14,72 @@ from django.db import connection
 from catmaid.control.edge import get_intersected_grid_cells
 from catmaid.control.node import (get_configured_node_providers,
         GridCachedNodeProvider)
-from catmaid.models import NodeGridCache
+from catmaid.control.presence_grid import (get_cells_in_box,
+        update_presence_grid_cells)
+from catmaid.models import NodeGridCache, SpatialPresenceGrid
 from catmaid.util import str2bool
 from .common import set_log_level
 
 
 logger = logging.getLogger(__name__)
 
+# Box updates, e.g. from bulk imports, that intersect with more grid cells than
+# this, aren't expanded into individual cells. Instead, all existing cells of
+# the grid in the box are marked dirty with a single query.
+MAX_BOX_UPDATE_CELLS = 10000
+
+
+def get_update_bounding_box(data) -> Optional[List[float]]:
+    """Get the bounding box [min_x, min_y, min_z, max_x, max_y, max_z] of all
+    points in a spatial update event, which includes old and new locations of
+    changed nodes. Returns None for unknown event types.
+    """
+    data_type = data.get('type')
+    if data_type == 'edge':
+        points = [data['p1'], data['p2']]
+    elif data_type == 'edges':
+        points = [p for edge in data['edges'] for p in edge]
+    elif data_type == 'point':
+        points = [data['p']]
+    elif data_type == 'box':
+        points = [data['min'], data['max']]
+    else:
+        return None
+    return [min(p[0] for p in points), min(p[1] for p in points),
+            min(p[2] for p in points), max(p[0] for p in points),
+            max(p[1] for p in points), max(p[2] for p in points)]
+
+
+def get_update_bounding_boxes(data) -> List[List[float]]:
+    """Get the bounding boxes [min_x, min_y, min_z, max_x, max_y, max_z] of
+    each edge, point or box in a spatial update event. Returns an empty list
+    for unknown event types.
+    """
+    data_type = data.get('type')
+    if data_type == 'edge':
+        edges = [[data['p1'], data['p2']]]
+    elif data_type == 'edges':
+        edges = data['edges']
+    elif data_type == 'point':
+        edges = [[data['p'], data['p']]]
+    elif data_type == 'box':
+        edges = [[data['min'], data['max']]]
+    else:
+        return []
+    return [[min(e[0][0], e[1][0]), min(e[0][1], e[1][1]),
+            min(e[0][2], e[1][2]), max(e[0][0], e[1][0]),
+            max(e[0][1], e[1][1]), max(e[0][2], e[1][2])] for e in edges]
+
+
+def merge_bounding_boxes(a, b) -> Optional[List[float]]:
+    """Return the union of two bounding boxes. If one of them is None, the
+    result is None as well, which represents an unknown extent.
+    """
+    if a is None or b is None:
+        return None
+    return [min(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]),
+            max(a[3], b[3]), max(a[4], b[4]), max(a[5], b[5])]
+
 
 class GridWorker():
 
@@ -66,31 +125,109 @@ class GridWorker():
         project and then, for each notification compute the intersected grid
         indices with each grid, update existing grids and create missing ones.
         """
-        # Batch of grids to update during one run
-        grid_coords_to_update:Dict = {}
+        # Batch of grids to update during one run. Each dirty cell is mapped
+        # to the bounding box of all changes in it, which allows cache workers
+        # to only update the changed part of a cell.
+        dirty_boxes:Dict = {}
+        # Cell ranges of large box updates as (grid ID, min cell, max cell)
+        dirty_ranges:List = []
         for update in updates:
             self.updatesReceived += 1
-            self.get_intersected_grid_cell_ids(update,
-                    cursor, create=True, grid_coords_to_update=grid_coords_to_update)
-
-        dirty_rows:Set = set()
-        for grid_id, coords in grid_coords_to_update.items():
-            for c in coords:
-                self.cellsMarkedDirty += 1
-                key = f"({grid_id},{c[0]},{c[1]},{c[2]})"
-                if key not in dirty_rows:
-                    dirty_rows.add(key)
-
-        if dirty_rows:
-            # Mark cells as dirty
-            cursor.execute(f"""
-                INSERT INTO dirty_node_grid_cache_cell (grid_id, x_index, y_index, z_index)
-                VALUES {','.join(dirty_rows)}
+            update_box = get_update_bounding_box(update)
+            grid_coords_to_update = self.get_intersected_grid_cell_ids(update,
+                    cursor, create=True, grid_coords_to_update={},
+                    dirty_ranges=dirty_ranges)
+            if not grid_coords_to_update:
+                continue
+            for grid_id, coords in grid_coords_to_update.items():
+                for c in coords:
+                    self.cellsMarkedDirty += 1
+                    key = (grid_id, c[0], c[1], c[2])
+                    if key in dirty_boxes:
+                        dirty_boxes[key] = merge_bounding_boxes(
+                                dirty_boxes[key], update_box)
+                    else:
+                        dirty_boxes[key] = update_box
+
+        if dirty_boxes:
+            keys = list(dirty_boxes.keys())
+            boxes = [dirty_boxes[k] or [None] * 6 for k in keys]
+            # Mark cells as dirty. If a cell is already marked dirty, the
+            # union of both dirty boxes is stored. A missing box means the
+            # whole cell has to be updated.
+            cursor.execute("""
+                INSERT INTO dirty_node_grid_cache_cell (grid_id, x_index,
+                    y_index, z_index, dirty_box)
+                SELECT d.grid_id, d.x_index, d.y_index, d.z_index,
+                    CASE WHEN d.min_x IS NULL THEN NULL
+                    ELSE ARRAY[d.min_x, d.min_y, d.min_z, d.max_x, d.max_y, d.max_z]
+                    END
+                FROM UNNEST(%(grid_ids)s::int[], %(x_indices)s::int[],
+                    %(y_indices)s::int[], %(z_indices)s::int[],
+                    %(min_x)s::float8[], %(min_y)s::float8[], %(min_z)s::float8[],
+                    %(max_x)s::float8[], %(max_y)s::float8[], %(max_z)s::float8[])
+                    d(grid_id, x_index, y_index, z_index, min_x, min_y, min_z,
+                    max_x, max_y, max_z)
                 ON CONFLICT (grid_id, x_index, y_index, z_index)
-                DO UPDATE SET invalidation_time = EXCLUDED.invalidation_time
-            """)
-
-            logger.debug(f'Marked {len(dirty_rows)} grid cells as dirty and queued update')
+                DO UPDATE SET invalidation_time = EXCLUDED.invalidation_time,
+                    dirty_box = CASE
+                        WHEN dirty_node_grid_cache_cell.dirty_box IS NULL
+                            OR EXCLUDED.dirty_box IS NULL THEN NULL
+                        ELSE ARRAY[
+                            LEAST(dirty_node_grid_cache_cell.dirty_box[1], EXCLUDED.dirty_box[1]),
+                            LEAST(dirty_node_grid_cache_cell.dirty_box[2], EXCLUDED.dirty_box[2]),
+                            LEAST(dirty_node_grid_cache_cell.dirty_box[3], EXCLUDED.dirty_box[3]),
+                            GREATEST(dirty_node_grid_cache_cell.dirty_box[4], EXCLUDED.dirty_box[4]),
+                            GREATEST(dirty_node_grid_cache_cell.dirty_box[5], EXCLUDED.dirty_box[5]),
+                            GREATEST(dirty_node_grid_cache_cell.dirty_box[6], EXCLUDED.dirty_box[6])]
+                        END
+            """, {
+                'grid_ids': [k[0] for k in keys],
+                'x_indices': [k[1] for k in keys],
+                'y_indices': [k[2] for k in keys],
+                'z_indices': [k[3] for k in keys],
+                'min_x': [b[0] for b in boxes],
+                'min_y': [b[1] for b in boxes],
+                'min_z': [b[2] for b in boxes],
+                'max_x': [b[3] for b in boxes],
+                'max_y': [b[4] for b in boxes],
+                'max_z': [b[5] for b in boxes],
+            })
+
+            logger.debug(f'Marked {len(dirty_boxes)} grid cells as dirty and queued update')
+
+        for grid_id, min_cell, max_cell in dirty_ranges:
+            self.mark_cell_range_dirty(cursor, grid_id, min_cell, max_cell)
+
+    def mark_cell_range_dirty(self, cursor, grid_id, min_cell, max_cell):
+        """Mark all existing cells of a grid within the passed in cell index
+        range as dirty, so that they are updated completely. Cells that don't
+        exist can't be outdated.
+        """
+        cursor.execute("""
+            INSERT INTO dirty_node_grid_cache_cell (grid_id, x_index,
+                y_index, z_index, dirty_box)
+            SELECT c.grid_id, c.x_index, c.y_index, c.z_index, NULL
+            FROM node_grid_cache_cell c
+            WHERE c.grid_id = %(grid_id)s
+                AND c.x_index BETWEEN %(min_x)s AND %(max_x)s
+                AND c.y_index BETWEEN %(min_y)s AND %(max_y)s
+                AND c.z_index BETWEEN %(min_z)s AND %(max_z)s
+            ON CONFLICT (grid_id, x_index, y_index, z_index)
+            DO UPDATE SET invalidation_time = EXCLUDED.invalidation_time,
+                dirty_box = NULL
+        """, {
+            'grid_id': grid_id,
+            'min_x': min_cell[0],
+            'min_y': min_cell[1],
+            'min_z': min_cell[2],
+            'max_x': max_cell[0],
+            'max_y': max_cell[1],
+            'max_z': max_cell[2],
+        })
+        self.cellsMarkedDirty += cursor.rowcount
+        logger.debug(f'Marked {cursor.rowcount} grid cells of a large box '
+                f'in grid {grid_id} as dirty')
 
     def append_cells_to_update(self, coords_to_update, p1, p2, cell_width,
             cell_height, cell_depth):
@@ -125,9 +262,11 @@ class GridWorker():
                 p2, cell_width, cell_height, cell_depth, p1_cell, p2_cell))
 
     def get_intersected_grid_cell_ids(self, data, cursor, create=True,
-            grid_coords_to_update=dict()):
+            grid_coords_to_update=dict(), dirty_ranges=None):
         """Iterate over all known enabled grid caches and find all intersected
-        cells.
+        cells. Boxes with more than MAX_BOX_UPDATE_CELLS cells are added as
+        (grid ID, min cell, max cell) to the passed in dirty_ranges list
+        instead, or are skipped if no list is passed in.
         """
         project_id = data.get('project_id')
         if project_id is None:
@@ -158,12 +297,31 @@ class GridWorker():
                 # Format: {"project_id": 1, "type": "edges", "edges": [
                 #    [[595708,418558,40000], [608508,418558,40000]],
                 #    [[595708,418558,40000], [608508,418558,40000]]]}
-                edge_1 = data['edges'][0]
-                edge_2 = data['edges'][1]
-                self.append_cells_to_update(coords_to_update, edge_1[0], edge_1[1],
-                        cell_width, cell_height, cell_depth)
-                self.append_cells_to_update(coords_to_update, edge_2[0], edge_2[1],
-                        cell_width, cell_height, cell_depth)
+                for edge in data['edges']:
+                    self.append_cells_to_update(coords_to_update, edge[0], edge[1],
+                            cell_width, cell_height, cell_depth)
+            elif data_type == 'box':
+                # Format: {"project_id": 1, "type": "box",
+                #    "min": [595708,418558,40000], "max": [608508,418558,40000]}
+                min_cell = [int(data['min'][0] // cell_width),
+                        int(data['min'][1] // cell_height),
+                        int(data['min'][2] // cell_depth)]
+                max_cell = [int(data['max'][0] // cell_width),
+                        int(data['max'][1] // cell_height),
+                        int(data['max'][2] // cell_depth)]
+                n_cells = (max_cell[0] - min_cell[0] + 1) * \
+                        (max_cell[1] - min_cell[1] + 1) * \
+                        (max_cell[2] - min_cell[2] + 1)
+                if n_cells > MAX_BOX_UPDATE_CELLS:
+                    if dirty_ranges is not None:
+                        dirty_ranges.append((grid_id, min_cell, max_cell))
+                    else:
+                        logger.warning(f'Ignoring box update with {n_cells} cells')
+                    continue
+                for x in range(min_cell[0], max_cell[0] + 1):
+                    for y in range(min_cell[1], max_cell[1] + 1):
+                        for z in range(min_cell[2], max_cell[2] + 1):
+                            coords_to_update.append([x, y, z])
             elif data_type == 'point':
                 p = data['p']
                 coords_to_update.append([
@@ -177,6 +335,49 @@ class GridWorker():
         return grid_coords_to_update
 
 
+class PresenceGridWorker():
+    """Recompute all cells of enabled presence grids that are touched by a
+    changed edge, point or box.
+    """
+
+    def __init__(self):
+        self.updatesReceived = 0
+        self.cellsUpdated = 0
+
+    def update(self, updates, cursor):
+        # Grids are enabled after they have been built, which is why they are
+        # looked up again for each batch of updates.
+        grids = list(SpatialPresenceGrid.objects.filter(enabled=True))
+        if not grids:
+            return
+
+        grid_cells:Dict = defaultdict(set)
+        for update in updates:
+            self.updatesReceived += 1
+            project_id = update.get('project_id')
+            if project_id is None:
+                logger.warn('Could not parse project ID of message: ' + str(update))
+                continue
+            boxes = get_update_bounding_boxes(update)
+            if not boxes:
+                logger.error(f"Unknown data type: {update.get('type')}")
+                continue
+            for grid in grids:
+                if grid.project_id != project_id:
+                    continue
+                cells = grid_cells[grid.id]
+                for box in boxes:
+                    cells.update(get_cells_in_box(box, grid.cell_width,
+                            grid.cell_height, grid.cell_depth))
+
+        for grid in grids:
+            cells = grid_cells.get(grid.id)
+            if cells:
+                update_presence_grid_cells(cursor, grid, list(cells))
+                self.cellsUpdated += len(cells)
+                logger.debug(f'Updated {len(cells)} cells of presence grid {grid.id}')
+
+
 class Command(BaseCommand):
     help = ""
     # The queue to process. Subclass and set this.
@@ -192,6 +393,8 @@ class Command(BaseCommand):
         )
         parser.add_argument("--grid-cache", type=str2bool, nargs='?',
                 const=True, default=True, help="Update spatial grid caches.")
+        parser.add_argument("--presence-grid", type=str2bool, nargs='?',
+                const=True, default=True, help="Update spatial presence grids.")
 
     def handle(self, **options):
         set_log_level(logger, options.get('verbosity', 1))
@@ -205,6 +408,9 @@ class Command(BaseCommand):
         if options['grid_cache']:
             self.workers.append(GridWorker())
 
+        if options['presence_grid']:
+            self.workers.append(PresenceGridWorker())
+
         if not self.workers:
             logger.warn("No grids provided")
             return
@@ -64,7 +64,8 @@ class Command(BaseCommand):
         parser.add_argument('--lod-bucket-size', dest='lod_bucket_size', default=500,
                 type=int, help='Optional, number of (smallest) LOD bucket.'),
         parser.add_argument('--lod-strategy', dest='lod_strategy', default='quadratic',
-                type=str, help='Optional, the strategy of LOD bucket size change with LOD. Can be "linear" or "quadratic".'),
+                type=str, help='Optional, the strategy of LOD bucket size change with LOD. Can be "linear", "quadratic", "exponential" or "topology". ' +
+                'The latter stores a topology preserving decimation of all nodes in each bucket and is only supported by grid caches.'),
         parser.add_argument('--from-config', action="store_true", dest='from_config',
             default=False, help="Update cache based on NODE_PROVIDERS variable in settings")
         parser.add_argument('--progress', dest='progress', default=True,
@@ -77,6 +78,8 @@ class Command(BaseCommand):
                 help='The number of cache cells evaluated per process')
         parser.add_argument('--order', dest='order', default=None, type=str,
                 help='The order of data in the cache, can be either "cable-asc" or "cable-desc". By default no ordering is applied.')
+        parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                help='Skip grid cells that exist already, e.g. to continue an interrupted update')
 
     def handle(self, *args, **options):
         if options['from_config']:
@@ -177,8 +180,10 @@ class Command(BaseCommand):
             lod_bucket_size = int(lod_bucket_size)
 
         lod_strategy = options['lod_strategy']
-        if lod_strategy not in ('linear', 'quadratic', 'exponential'):
+        if lod_strategy not in ('linear', 'quadratic', 'exponential', 'topology'):
             raise ValueError(f"Unknown LOD strategy: {lod_strategy}")
+        if lod_strategy == 'topology' and cache_type != 'grid':
+            raise ValueError("The topology LOD strategy works currently only with grid caches")
 
         jobs = options['jobs']
         if jobs > 1 and cache_type != 'grid':
@@ -192,6 +197,10 @@ class Command(BaseCommand):
         ordering = options['order']
         progress = options['progress']
 
+        resume = options['resume']
+        if resume and cache_type != 'grid':
+            raise ValueError("Resuming works currently only with grid caches")
+
 
         for p in projects:
             self.stdout.write(f'Updating {cache_type} cache for project {p.id}')
@@ -209,5 +218,5 @@ class Command(BaseCommand):
                         lod_bucket_size=lod_bucket_size,
                         lod_strategy=lod_strategy, jobs=jobs,
                         depth_steps=depth_steps, chunksize=chunksize,
-                        ordering=ordering)
+                        ordering=ordering, resume=resume)
             self.stdout.write(f'Updated {cache_type} cache for project {p.id}')
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catmaid.models import Project
+
+
+class Command(BaseCommand):
+    help = "Create or update the NBLAST dotprops cache of the configured " + \
+            "NBLAST backend, optionally only for changed objects."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project_id', dest='project_id', nargs='+',
+            default=False, help='Update caches for these projects only (otherwise all)'),
+        parser.add_argument('--type', dest='object_type', nargs='+',
+            default=['skeleton'], choices=['skeleton', 'pointcloud'],
+            help='The object types to update caches for (default: skeleton)'),
+        parser.add_argument('--incremental', action='store_true',
+            dest='incremental', default=False, help='Only recompute objects ' +
+            'that changed since the cache was created and drop deleted ones'),
+        parser.add_argument('--tangent-neighbors', dest='tangent_neighbors',
+            type=int, default=20, help='Number of points used for tangent vectors'),
+        parser.add_argument('--detail', dest='detail', type=int, default=10,
+            help='Branching level below which skeletons are pruned (R backend only)'),
+        parser.add_argument('--min-nodes', dest='min_nodes', type=int,
+            default=500, help='Minimum number of nodes of cached skeletons'),
+
+    def handle(self, *args, **options):
+        project_ids = options['project_id']
+        if project_ids:
+            projects = Project.objects.filter(id__in=project_ids)
+        else:
+            projects = Project.objects.all()
+
+        backend = getattr(settings, 'NBLAST_BACKEND', 'r')
+        for p in projects:
+            for object_type in options['object_type']:
+                if backend == 'python':
+                    from catmaid.control.nat.nblast import create_dotprops_cache
+                    create_dotprops_cache(p.id, object_type,
+                            tangent_neighbors=options['tangent_neighbors'],
+                            min_nodes=options['min_nodes'],
+                            incremental=options['incremental'])
+                else:
+                    from catmaid.control.nat.r import create_dps_data_cache
+                    create_dps_data_cache(p.id, object_type,
+                            tangent_neighbors=options['tangent_neighbors'],
+                            detail=options['detail'],
+                            min_nodes=options['min_nodes'],
+                            incremental=options['incremental'])
+                self.stdout.write(f'Updated {object_type} cache for project {p.id}')
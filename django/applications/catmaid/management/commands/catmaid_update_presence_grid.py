@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from catmaid.control.presence_grid import update_presence_grid
+from catmaid.models import Project, SpatialPresenceGrid
+
+
+class Command(BaseCommand):
+    help = "Build the spatial presence grid of all or individual projects, " \
+            "which is used by bounding box queries for skeletons and connectors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project_id', dest='project_id', nargs='+',
+            default=False, help='Build only presence grids for these projects (otherwise all)'),
+        parser.add_argument('--cell-width', dest='cell_width', type=int,
+            default=25000, help='Grid cell width in nm'),
+        parser.add_argument('--cell-height', dest='cell_height', type=int,
+            default=25000, help='Grid cell height in nm'),
+        parser.add_argument('--cell-depth', dest='cell_depth', type=int,
+            default=25000, help='Grid cell depth in nm'),
+        parser.add_argument('--batch-size', dest='batch_size', type=int,
+            default=1000, help='Number of cells computed in one transaction'),
+        parser.add_argument('--disable', action='store_true', dest='disable',
+            default=False, help='Disable existing presence grids instead of building them'),
+
+    def handle(self, *args, **options):
+        project_ids = options['project_id']
+        if project_ids:
+            projects = Project.objects.filter(id__in=project_ids)
+        else:
+            projects = Project.objects.all()
+
+        if options['disable']:
+            n_disabled = SpatialPresenceGrid.objects.filter(
+                    project__in=projects).update(enabled=False)
+            self.stdout.write(f'Disabled {n_disabled} presence grid(s)')
+            return
+
+        cell_width = options['cell_width']
+        cell_height = options['cell_height']
+        cell_depth = options['cell_depth']
+        if cell_width <= 0 or cell_height <= 0 or cell_depth <= 0:
+            raise CommandError('Cell dimensions need to be positive')
+
+        for p in projects:
+            def report(n_done, n_total):
+                self.stdout.write(f'Project {p.id}: computed {n_done}/{n_total} cells')
+
+            grid = update_presence_grid(p.id, cell_width, cell_height,
+                    cell_depth, options['batch_size'], report)
+            self.stdout.write(f'Built presence grid {grid.id} for project {p.id}')
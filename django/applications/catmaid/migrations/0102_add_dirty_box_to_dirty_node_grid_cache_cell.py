@@ -0,0 +1,35 @@
+from django.db import migrations, models
+import django.contrib.postgres.fields
+
+
+forward = """
+    ALTER TABLE dirty_node_grid_cache_cell
+    ADD COLUMN dirty_box double precision[];
+"""
+
+backward = """
+    ALTER TABLE dirty_node_grid_cache_cell
+    DROP COLUMN dirty_box;
+"""
+
+
+class Migration(migrations.Migration):
+    """Dirty grid cache cells can now optionally store the bounding box of all
+    changes that made them dirty: [min_x, min_y, min_z, max_x, max_y, max_z].
+    This allows cache workers to only update the changed part of a cell. If no
+    bounding box is set, the whole cell has to be recomputed.
+    """
+
+    dependencies = [
+        ('catmaid', '0101_optimize_disabled_spatial_update_events'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.AddField(
+                model_name='dirtynodegridcachecell',
+                name='dirty_box',
+                field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), null=True, size=6),
+            ),
+        ]),
+    ]
@@ -0,0 +1,280 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+forward = """
+    -- The connectivity table does not have a history table associated.
+    CREATE TABLE catmaid_skeleton_connectivity (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        project_id integer NOT NULL,
+        skeleton_id bigint NOT NULL,
+        relation_id bigint NOT NULL,
+        partner_skeleton_id bigint NOT NULL,
+        partner_relation_id bigint NOT NULL,
+        confidence smallint NOT NULL,
+        count integer DEFAULT 0 NOT NULL,
+
+        CONSTRAINT catmaid_skeleton_connectivity_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT catmaid_skeleton_connectivity_link_uniq
+            UNIQUE (skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence)
+    );
+
+    CREATE INDEX catmaid_skeleton_connectivity_partner_skeleton_id_idx
+        ON catmaid_skeleton_connectivity (partner_skeleton_id);
+    CREATE INDEX catmaid_skeleton_connectivity_project_id_idx
+        ON catmaid_skeleton_connectivity (project_id);
+
+
+    -- Apply the connectivity changes caused by removing and adding the passed
+    -- in treenode_connector rows. All links of affected connectors are
+    -- compared in their old and new state. Each pair of different links to
+    -- the same connector contributes one count in both directions.
+    --
+    -- Affected connectors are locked first, because concurrent transactions
+    -- that change links of the same connector would otherwise not see each
+    -- other's links and miss the pairs between them. The NO KEY UPDATE lock
+    -- doesn't conflict with foreign key checks on the connector. Since this
+    -- function is volatile, the following statement sees all links committed
+    -- before the lock was acquired.
+    CREATE OR REPLACE FUNCTION update_skeleton_connectivity(
+            removed_links treenode_connector[], added_links treenode_connector[])
+        RETURNS void
+        LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        emptied_ids bigint[];
+    BEGIN
+        PERFORM 1
+        FROM connector c
+        WHERE c.id IN (
+            SELECT connector_id FROM UNNEST(removed_links)
+            UNION
+            SELECT connector_id FROM UNNEST(added_links)
+        )
+        ORDER BY c.id
+        FOR NO KEY UPDATE OF c;
+
+        WITH removed AS (
+            SELECT * FROM UNNEST(removed_links)
+        ), added AS (
+            SELECT * FROM UNNEST(added_links)
+        ), changed_connector AS (
+            SELECT connector_id FROM removed
+            UNION
+            SELECT connector_id FROM added
+        ), new_state AS (
+            SELECT tc.id, tc.project_id, tc.connector_id, tc.skeleton_id,
+                tc.relation_id, tc.confidence
+            FROM treenode_connector tc
+            JOIN changed_connector c
+                ON c.connector_id = tc.connector_id
+        ), old_state AS (
+            SELECT s.id, s.project_id, s.connector_id, s.skeleton_id,
+                s.relation_id, s.confidence
+            FROM new_state s
+            LEFT JOIN added a
+                ON a.id = s.id
+            WHERE a.id IS NULL
+            UNION ALL
+            SELECT r.id, r.project_id, r.connector_id, r.skeleton_id,
+                r.relation_id, r.confidence
+            FROM removed r
+        ), delta AS (
+            SELECT a.project_id, a.skeleton_id, a.relation_id,
+                b.skeleton_id AS partner_skeleton_id,
+                b.relation_id AS partner_relation_id,
+                LEAST(a.confidence, b.confidence) AS confidence, 1 AS n
+            FROM new_state a
+            JOIN new_state b
+                ON a.connector_id = b.connector_id
+                AND a.id <> b.id
+            UNION ALL
+            SELECT a.project_id, a.skeleton_id, a.relation_id,
+                b.skeleton_id AS partner_skeleton_id,
+                b.relation_id AS partner_relation_id,
+                LEAST(a.confidence, b.confidence) AS confidence, -1 AS n
+            FROM old_state a
+            JOIN old_state b
+                ON a.connector_id = b.connector_id
+                AND a.id <> b.id
+        ), summed_delta AS (
+            SELECT project_id, skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence, SUM(n) AS n
+            FROM delta
+            GROUP BY project_id, skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence
+            HAVING SUM(n) <> 0
+        ), updated AS (
+            INSERT INTO catmaid_skeleton_connectivity AS sc (project_id,
+                skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence, count)
+            SELECT d.project_id, d.skeleton_id, d.relation_id,
+                d.partner_skeleton_id, d.partner_relation_id, d.confidence, d.n
+            FROM summed_delta d
+            ON CONFLICT (skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence)
+            DO UPDATE SET count = sc.count + EXCLUDED.count
+            RETURNING sc.id, sc.count
+        )
+        SELECT array_agg(id) INTO emptied_ids
+        FROM updated
+        WHERE count <= 0;
+
+        IF emptied_ids IS NOT NULL THEN
+            DELETE FROM catmaid_skeleton_connectivity
+            WHERE id = ANY(emptied_ids);
+        END IF;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_insert_treenode_connector_update_skeleton_connectivity()
+        RETURNS trigger
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM update_skeleton_connectivity('{}'::treenode_connector[],
+            ARRAY(SELECT ROW(tc.*)::treenode_connector
+                  FROM inserted_treenode_connector tc));
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION on_edit_treenode_connector_update_skeleton_connectivity()
+        RETURNS trigger
+        LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        removed_links treenode_connector[];
+        added_links treenode_connector[];
+    BEGIN
+        -- Only links with changed connectivity information are relevant.
+        SELECT array_agg(ROW(ot.*)::treenode_connector),
+            array_agg(ROW(nt.*)::treenode_connector)
+        INTO removed_links, added_links
+        FROM old_treenode_connector ot
+        JOIN new_treenode_connector nt
+            ON ot.id = nt.id
+        WHERE ot.connector_id <> nt.connector_id
+            OR ot.skeleton_id <> nt.skeleton_id
+            OR ot.relation_id <> nt.relation_id
+            OR ot.confidence <> nt.confidence;
+
+        IF removed_links IS NOT NULL THEN
+            PERFORM update_skeleton_connectivity(removed_links, added_links);
+        END IF;
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION on_delete_treenode_connector_update_skeleton_connectivity()
+        RETURNS trigger
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM update_skeleton_connectivity(
+            ARRAY(SELECT ROW(tc.*)::treenode_connector
+                  FROM deleted_treenode_connector tc),
+            '{}'::treenode_connector[]);
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER on_insert_treenode_connector_update_skeleton_connectivity
+    AFTER INSERT ON treenode_connector
+    REFERENCING NEW TABLE as inserted_treenode_connector
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_treenode_connector_update_skeleton_connectivity();
+
+    CREATE TRIGGER on_edit_treenode_connector_update_skeleton_connectivity
+    AFTER UPDATE ON treenode_connector
+    REFERENCING NEW TABLE as new_treenode_connector OLD TABLE as old_treenode_connector
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_treenode_connector_update_skeleton_connectivity();
+
+    CREATE TRIGGER on_delete_treenode_connector_update_skeleton_connectivity
+    AFTER DELETE ON treenode_connector
+    REFERENCING OLD TABLE as deleted_treenode_connector
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_treenode_connector_update_skeleton_connectivity();
+
+
+    -- Recreate all connectivity entries, optionally only for the passed in
+    -- projects.
+    CREATE OR REPLACE FUNCTION refresh_skeleton_connectivity_table(
+            project_ids integer[] DEFAULT NULL)
+        RETURNS void
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        IF project_ids IS NULL THEN
+            TRUNCATE catmaid_skeleton_connectivity;
+        ELSE
+            DELETE FROM catmaid_skeleton_connectivity
+            WHERE project_id = ANY(project_ids);
+        END IF;
+
+        INSERT INTO catmaid_skeleton_connectivity (project_id, skeleton_id,
+            relation_id, partner_skeleton_id, partner_relation_id,
+            confidence, count)
+        SELECT t1.project_id, t1.skeleton_id, t1.relation_id, t2.skeleton_id,
+            t2.relation_id, LEAST(t1.confidence, t2.confidence), COUNT(*)
+        FROM treenode_connector t1
+        JOIN treenode_connector t2
+            ON t1.connector_id = t2.connector_id
+            AND t1.id <> t2.id
+        WHERE project_ids IS NULL OR t1.project_id = ANY(project_ids)
+        GROUP BY t1.project_id, t1.skeleton_id, t1.relation_id, t2.skeleton_id,
+            t2.relation_id, LEAST(t1.confidence, t2.confidence);
+    END;
+    $$;
+
+    SELECT refresh_skeleton_connectivity_table();
+"""
+
+backward = """
+    DROP TRIGGER on_insert_treenode_connector_update_skeleton_connectivity ON treenode_connector;
+    DROP TRIGGER on_edit_treenode_connector_update_skeleton_connectivity ON treenode_connector;
+    DROP TRIGGER on_delete_treenode_connector_update_skeleton_connectivity ON treenode_connector;
+
+    DROP FUNCTION on_insert_treenode_connector_update_skeleton_connectivity();
+    DROP FUNCTION on_edit_treenode_connector_update_skeleton_connectivity();
+    DROP FUNCTION on_delete_treenode_connector_update_skeleton_connectivity();
+    DROP FUNCTION update_skeleton_connectivity(treenode_connector[], treenode_connector[]);
+    DROP FUNCTION refresh_skeleton_connectivity_table(integer[]);
+
+    DROP TABLE catmaid_skeleton_connectivity;
+"""
+
+
+class Migration(migrations.Migration):
+    """Add a materialized view on the number of links between skeletons
+    through shared connectors, maintained by triggers on the
+    treenode_connector table. Connectivity queries can use it instead of
+    joining treenode_connector with itself.
+    """
+
+    dependencies = [
+        ('catmaid', '0102_add_dirty_box_to_dirty_node_grid_cache_cell'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.CreateModel(
+                name='SkeletonConnectivity',
+                fields=[
+                    ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                    ('skeleton_id', models.BigIntegerField()),
+                    ('relation_id', models.BigIntegerField()),
+                    ('partner_skeleton_id', models.BigIntegerField()),
+                    ('partner_relation_id', models.BigIntegerField()),
+                    ('confidence', models.SmallIntegerField()),
+                    ('count', models.IntegerField(default=0)),
+                    ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                ],
+                options={
+                    'db_table': 'catmaid_skeleton_connectivity',
+                    'unique_together': {('skeleton_id', 'relation_id', 'partner_skeleton_id', 'partner_relation_id', 'confidence')},
+                },
+            ),
+        ]),
+    ]
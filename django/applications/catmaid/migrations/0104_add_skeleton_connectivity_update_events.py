@@ -0,0 +1,290 @@
+from django.db import migrations
+
+
+forward = """
+    -- Apply connectivity changes like before, including the lock on affected
+    -- connectors, and additionally emit a "catmaid.connectivity-update" event
+    -- for each changed project.
+    CREATE OR REPLACE FUNCTION update_skeleton_connectivity(
+            removed_links treenode_connector[], added_links treenode_connector[])
+        RETURNS void
+        LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        emptied_ids bigint[];
+        notifications text[];
+        notification text;
+    BEGIN
+        PERFORM 1
+        FROM connector c
+        WHERE c.id IN (
+            SELECT connector_id FROM UNNEST(removed_links)
+            UNION
+            SELECT connector_id FROM UNNEST(added_links)
+        )
+        ORDER BY c.id
+        FOR NO KEY UPDATE OF c;
+
+        WITH removed AS (
+            SELECT * FROM UNNEST(removed_links)
+        ), added AS (
+            SELECT * FROM UNNEST(added_links)
+        ), changed_connector AS (
+            SELECT connector_id FROM removed
+            UNION
+            SELECT connector_id FROM added
+        ), new_state AS (
+            SELECT tc.id, tc.project_id, tc.connector_id, tc.skeleton_id,
+                tc.relation_id, tc.confidence
+            FROM treenode_connector tc
+            JOIN changed_connector c
+                ON c.connector_id = tc.connector_id
+        ), old_state AS (
+            SELECT s.id, s.project_id, s.connector_id, s.skeleton_id,
+                s.relation_id, s.confidence
+            FROM new_state s
+            LEFT JOIN added a
+                ON a.id = s.id
+            WHERE a.id IS NULL
+            UNION ALL
+            SELECT r.id, r.project_id, r.connector_id, r.skeleton_id,
+                r.relation_id, r.confidence
+            FROM removed r
+        ), delta AS (
+            SELECT a.project_id, a.skeleton_id, a.relation_id,
+                b.skeleton_id AS partner_skeleton_id,
+                b.relation_id AS partner_relation_id,
+                LEAST(a.confidence, b.confidence) AS confidence, 1 AS n
+            FROM new_state a
+            JOIN new_state b
+                ON a.connector_id = b.connector_id
+                AND a.id <> b.id
+            UNION ALL
+            SELECT a.project_id, a.skeleton_id, a.relation_id,
+                b.skeleton_id AS partner_skeleton_id,
+                b.relation_id AS partner_relation_id,
+                LEAST(a.confidence, b.confidence) AS confidence, -1 AS n
+            FROM old_state a
+            JOIN old_state b
+                ON a.connector_id = b.connector_id
+                AND a.id <> b.id
+        ), summed_delta AS (
+            SELECT project_id, skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence, SUM(n) AS n
+            FROM delta
+            GROUP BY project_id, skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence
+            HAVING SUM(n) <> 0
+        ), updated AS (
+            INSERT INTO catmaid_skeleton_connectivity AS sc (project_id,
+                skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence, count)
+            SELECT d.project_id, d.skeleton_id, d.relation_id,
+                d.partner_skeleton_id, d.partner_relation_id, d.confidence, d.n
+            FROM summed_delta d
+            ON CONFLICT (skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence)
+            DO UPDATE SET count = sc.count + EXCLUDED.count
+            RETURNING sc.id, sc.project_id, sc.skeleton_id, sc.count
+        ), changed_skeletons AS (
+            SELECT project_id, array_agg(DISTINCT skeleton_id) AS skeleton_ids
+            FROM updated
+            GROUP BY project_id
+        )
+        SELECT (SELECT array_agg(id) FROM updated WHERE count <= 0),
+            (SELECT array_agg(json_build_object('project_id', project_id,
+                    'skeleton_ids', CASE WHEN cardinality(skeleton_ids) > 500
+                        THEN NULL ELSE skeleton_ids END)::text)
+                FROM changed_skeletons)
+        INTO emptied_ids, notifications;
+
+        IF emptied_ids IS NOT NULL THEN
+            DELETE FROM catmaid_skeleton_connectivity
+            WHERE id = ANY(emptied_ids);
+        END IF;
+
+        -- Let listeners know which skeletons changed their connectivity. If
+        -- too many skeletons are affected, the whole project is marked changed.
+        IF notifications IS NOT NULL THEN
+            FOREACH notification IN ARRAY notifications LOOP
+                PERFORM notify_conditionally('catmaid.connectivity-update', notification);
+            END LOOP;
+        END IF;
+    END;
+    $$;
+
+
+    -- Recreate connectivity entries like before and additionally emit a
+    -- "catmaid.connectivity-update" event without skeleton IDs for each
+    -- refreshed project.
+    CREATE OR REPLACE FUNCTION refresh_skeleton_connectivity_table(
+            project_ids integer[] DEFAULT NULL)
+        RETURNS void
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        IF project_ids IS NULL THEN
+            TRUNCATE catmaid_skeleton_connectivity;
+        ELSE
+            DELETE FROM catmaid_skeleton_connectivity
+            WHERE project_id = ANY(project_ids);
+        END IF;
+
+        INSERT INTO catmaid_skeleton_connectivity (project_id, skeleton_id,
+            relation_id, partner_skeleton_id, partner_relation_id,
+            confidence, count)
+        SELECT t1.project_id, t1.skeleton_id, t1.relation_id, t2.skeleton_id,
+            t2.relation_id, LEAST(t1.confidence, t2.confidence), COUNT(*)
+        FROM treenode_connector t1
+        JOIN treenode_connector t2
+            ON t1.connector_id = t2.connector_id
+            AND t1.id <> t2.id
+        WHERE project_ids IS NULL OR t1.project_id = ANY(project_ids)
+        GROUP BY t1.project_id, t1.skeleton_id, t1.relation_id, t2.skeleton_id,
+            t2.relation_id, LEAST(t1.confidence, t2.confidence);
+
+        PERFORM notify_conditionally('catmaid.connectivity-update',
+            json_build_object('project_id', p.id)::text)
+        FROM project p
+        WHERE project_ids IS NULL OR p.id = ANY(project_ids);
+    END;
+    $$;
+"""
+
+backward = """
+    CREATE OR REPLACE FUNCTION update_skeleton_connectivity(
+            removed_links treenode_connector[], added_links treenode_connector[])
+        RETURNS void
+        LANGUAGE plpgsql AS
+    $$
+    DECLARE
+        emptied_ids bigint[];
+    BEGIN
+        PERFORM 1
+        FROM connector c
+        WHERE c.id IN (
+            SELECT connector_id FROM UNNEST(removed_links)
+            UNION
+            SELECT connector_id FROM UNNEST(added_links)
+        )
+        ORDER BY c.id
+        FOR NO KEY UPDATE OF c;
+
+        WITH removed AS (
+            SELECT * FROM UNNEST(removed_links)
+        ), added AS (
+            SELECT * FROM UNNEST(added_links)
+        ), changed_connector AS (
+            SELECT connector_id FROM removed
+            UNION
+            SELECT connector_id FROM added
+        ), new_state AS (
+            SELECT tc.id, tc.project_id, tc.connector_id, tc.skeleton_id,
+                tc.relation_id, tc.confidence
+            FROM treenode_connector tc
+            JOIN changed_connector c
+                ON c.connector_id = tc.connector_id
+        ), old_state AS (
+            SELECT s.id, s.project_id, s.connector_id, s.skeleton_id,
+                s.relation_id, s.confidence
+            FROM new_state s
+            LEFT JOIN added a
+                ON a.id = s.id
+            WHERE a.id IS NULL
+            UNION ALL
+            SELECT r.id, r.project_id, r.connector_id, r.skeleton_id,
+                r.relation_id, r.confidence
+            FROM removed r
+        ), delta AS (
+            SELECT a.project_id, a.skeleton_id, a.relation_id,
+                b.skeleton_id AS partner_skeleton_id,
+                b.relation_id AS partner_relation_id,
+                LEAST(a.confidence, b.confidence) AS confidence, 1 AS n
+            FROM new_state a
+            JOIN new_state b
+                ON a.connector_id = b.connector_id
+                AND a.id <> b.id
+            UNION ALL
+            SELECT a.project_id, a.skeleton_id, a.relation_id,
+                b.skeleton_id AS partner_skeleton_id,
+                b.relation_id AS partner_relation_id,
+                LEAST(a.confidence, b.confidence) AS confidence, -1 AS n
+            FROM old_state a
+            JOIN old_state b
+                ON a.connector_id = b.connector_id
+                AND a.id <> b.id
+        ), summed_delta AS (
+            SELECT project_id, skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence, SUM(n) AS n
+            FROM delta
+            GROUP BY project_id, skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence
+            HAVING SUM(n) <> 0
+        ), updated AS (
+            INSERT INTO catmaid_skeleton_connectivity AS sc (project_id,
+                skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence, count)
+            SELECT d.project_id, d.skeleton_id, d.relation_id,
+                d.partner_skeleton_id, d.partner_relation_id, d.confidence, d.n
+            FROM summed_delta d
+            ON CONFLICT (skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence)
+            DO UPDATE SET count = sc.count + EXCLUDED.count
+            RETURNING sc.id, sc.count
+        )
+        SELECT array_agg(id) INTO emptied_ids
+        FROM updated
+        WHERE count <= 0;
+
+        IF emptied_ids IS NOT NULL THEN
+            DELETE FROM catmaid_skeleton_connectivity
+            WHERE id = ANY(emptied_ids);
+        END IF;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION refresh_skeleton_connectivity_table(
+            project_ids integer[] DEFAULT NULL)
+        RETURNS void
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        IF project_ids IS NULL THEN
+            TRUNCATE catmaid_skeleton_connectivity;
+        ELSE
+            DELETE FROM catmaid_skeleton_connectivity
+            WHERE project_id = ANY(project_ids);
+        END IF;
+
+        INSERT INTO catmaid_skeleton_connectivity (project_id, skeleton_id,
+            relation_id, partner_skeleton_id, partner_relation_id,
+            confidence, count)
+        SELECT t1.project_id, t1.skeleton_id, t1.relation_id, t2.skeleton_id,
+            t2.relation_id, LEAST(t1.confidence, t2.confidence), COUNT(*)
+        FROM treenode_connector t1
+        JOIN treenode_connector t2
+            ON t1.connector_id = t2.connector_id
+            AND t1.id <> t2.id
+        WHERE project_ids IS NULL OR t1.project_id = ANY(project_ids)
+        GROUP BY t1.project_id, t1.skeleton_id, t1.relation_id, t2.skeleton_id,
+            t2.relation_id, LEAST(t1.confidence, t2.confidence);
+    END;
+    $$;
+"""
+
+
+class Migration(migrations.Migration):
+    """Emit "catmaid.connectivity-update" events when the skeleton
+    connectivity table changes, so that in-memory connectivity graphs can be
+    updated. Like other spatial update events, they are only sent if spatial
+    update events are enabled.
+    """
+
+    dependencies = [
+        ('catmaid', '0103_add_skeleton_connectivity_table'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+
+
+forward = """
+    -- With spatial update events enabled, "catmaid.spatial-update" events can
+    -- now be suppressed for the current transaction by setting
+    -- "catmaid.suppress_spatial_update_events" to "on". This allows bulk
+    -- operations to emit a single event instead of one event per edge.
+    CREATE OR REPLACE FUNCTION enable_spatial_update_events() RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        CREATE OR REPLACE FUNCTION notify_conditionally(channel text, payload text) RETURNS int
+        LANGUAGE plpgsql AS
+        $inner$
+        BEGIN
+            IF channel <> 'catmaid.spatial-update' OR
+                    current_setting('catmaid.suppress_spatial_update_events', TRUE)
+                    IS DISTINCT FROM 'on' THEN
+                PERFORM pg_notify(channel, payload);
+            END IF;
+            RETURN 0;
+        END;
+        $inner$;
+    END;
+    $$;
+
+    -- Update the current notification function, if events are enabled.
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_proc
+                WHERE proname = 'notify_conditionally'
+                AND prosrc LIKE '%pg_notify%') THEN
+            PERFORM enable_spatial_update_events();
+        END IF;
+    END
+    $$;
+"""
+
+backward = """
+    CREATE OR REPLACE FUNCTION enable_spatial_update_events() RETURNS void
+    LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        CREATE OR REPLACE FUNCTION notify_conditionally(channel text, payload text) RETURNS int
+        LANGUAGE plpgsql AS
+        $inner$
+        BEGIN
+            PERFORM pg_notify(channel, payload);
+            RETURN 0;
+        END;
+        $inner$;
+    END;
+    $$;
+
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_proc
+                WHERE proname = 'notify_conditionally'
+                AND prosrc LIKE '%pg_notify%') THEN
+            PERFORM enable_spatial_update_events();
+        END IF;
+    END
+    $$;
+"""
+
+
+class Migration(migrations.Migration):
+    """Allow transactions to suppress spatial update events, so that bulk
+    operations can replace the events of individual edges with a single event
+    covering all changes.
+    """
+
+    dependencies = [
+        ('catmaid', '0104_add_skeleton_connectivity_update_events'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,93 @@
+from django.db import migrations, models
+import django.contrib.postgres.fields
+import django.contrib.postgres.functions
+import django.db.models.deletion
+
+import catmaid.fields
+
+
+forward = """
+    CREATE TABLE spatial_presence_grid (
+        id integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        project_id integer NOT NULL,
+        cell_width integer NOT NULL,
+        cell_height integer NOT NULL,
+        cell_depth integer NOT NULL,
+        enabled boolean DEFAULT false NOT NULL,
+        CONSTRAINT spatial_presence_grid_project_id_fkey FOREIGN KEY (project_id)
+            REFERENCES project(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT spatial_presence_grid_uniq
+            UNIQUE (project_id, cell_width, cell_height, cell_depth)
+    );
+
+    -- Cells without any skeleton or connector have no entry.
+    CREATE TABLE spatial_presence_grid_cell (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        grid_id integer NOT NULL,
+        x_index integer NOT NULL,
+        y_index integer NOT NULL,
+        z_index integer NOT NULL,
+        update_time timestamptz DEFAULT now() NOT NULL,
+        skeleton_ids bigint[] NOT NULL,
+        connector_ids bigint[] NOT NULL,
+        linked_connector_ids bigint[] NOT NULL,
+        CONSTRAINT spatial_presence_grid_cell_grid_id_fkey FOREIGN KEY (grid_id)
+            REFERENCES spatial_presence_grid(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        CONSTRAINT spatial_presence_grid_cell_uniq
+            UNIQUE (grid_id, x_index, y_index, z_index)
+    );
+"""
+
+backward = """
+    DROP TABLE spatial_presence_grid_cell;
+    DROP TABLE spatial_presence_grid;
+"""
+
+
+class Migration(migrations.Migration):
+    """Add a coarse grid of skeleton and connector presence per cell, which
+    bounding box queries can use instead of intersecting all edges in large
+    bounding boxes.
+    """
+
+    dependencies = [
+        ('catmaid', '0105_allow_suppressing_spatial_update_events'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.CreateModel(
+                name='SpatialPresenceGrid',
+                fields=[
+                    ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                    ('cell_width', models.IntegerField()),
+                    ('cell_height', models.IntegerField()),
+                    ('cell_depth', models.IntegerField()),
+                    ('enabled', models.BooleanField(default=False)),
+                    ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.Project')),
+                ],
+                options={
+                    'db_table': 'spatial_presence_grid',
+                    'unique_together': {('project', 'cell_width', 'cell_height', 'cell_depth')},
+                },
+            ),
+            migrations.CreateModel(
+                name='SpatialPresenceGridCell',
+                fields=[
+                    ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                    ('x_index', models.IntegerField()),
+                    ('y_index', models.IntegerField()),
+                    ('z_index', models.IntegerField()),
+                    ('update_time', catmaid.fields.DbDefaultDateTimeField(default=django.contrib.postgres.functions.TransactionNow)),
+                    ('skeleton_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                    ('connector_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                    ('linked_connector_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None)),
+                    ('grid', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catmaid.SpatialPresenceGrid')),
+                ],
+                options={
+                    'db_table': 'spatial_presence_grid_cell',
+                    'unique_together': {('grid', 'x_index', 'y_index', 'z_index')},
+                },
+            ),
+        ]),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+forward = """
+    ALTER TABLE node_grid_cache DROP CONSTRAINT check_valid_lod_strategy;
+    ALTER TABLE node_grid_cache ADD CONSTRAINT check_valid_lod_strategy
+        CHECK (lod_strategy IN ('linear', 'quadratic', 'exponential', 'topology'));
+"""
+
+backward = """
+    -- Grid caches with a topology LOD strategy can't be represented anymore.
+    DELETE FROM node_grid_cache WHERE lod_strategy = 'topology';
+
+    ALTER TABLE node_grid_cache DROP CONSTRAINT check_valid_lod_strategy;
+    ALTER TABLE node_grid_cache ADD CONSTRAINT check_valid_lod_strategy
+        CHECK (lod_strategy IN ('linear', 'quadratic', 'exponential'));
+"""
+
+
+class Migration(migrations.Migration):
+    """Allow grid caches to use the "topology" LOD strategy, which stores a
+    topology preserving decimation of each cell per LOD level.
+    """
+
+    dependencies = [
+        ('catmaid', '0106_add_spatial_presence_grid'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward),
+    ]
@@ -0,0 +1,136 @@
+from django.db import migrations, models
+
+
+forward = """
+    -- The version table does not have a history table associated. Versions
+    -- are taken from a sequence, so that a version of a rolled back
+    -- transaction is never used again. Skeletons without an entry haven't
+    -- changed since this table was created, which corresponds to version 0.
+    -- No foreign key is used for skeletons, because treenodes of skeletons
+    -- are typically deleted in the same transaction as the skeleton itself.
+    CREATE SEQUENCE catmaid_skeleton_version_seq;
+
+    CREATE TABLE catmaid_skeleton_version (
+        skeleton_id bigint PRIMARY KEY,
+        version bigint NOT NULL
+    );
+
+
+    -- Set a new version for each of the passed in skeletons.
+    CREATE OR REPLACE FUNCTION update_skeleton_version(skeleton_ids bigint[])
+        RETURNS void
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        INSERT INTO catmaid_skeleton_version AS sv (skeleton_id, version)
+        SELECT s.skeleton_id, nextval('catmaid_skeleton_version_seq')
+        FROM (
+            SELECT DISTINCT skeleton_id
+            FROM UNNEST(skeleton_ids) s(skeleton_id)
+            ORDER BY skeleton_id
+        ) s
+        ON CONFLICT (skeleton_id)
+        DO UPDATE SET version = EXCLUDED.version;
+    END;
+    $$;
+
+
+    CREATE OR REPLACE FUNCTION on_insert_treenode_update_skeleton_version()
+        RETURNS trigger
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM update_skeleton_version(ARRAY(
+            SELECT skeleton_id FROM inserted_treenode));
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION on_edit_treenode_update_skeleton_version()
+        RETURNS trigger
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        -- Only changes of arbor information are relevant.
+        PERFORM update_skeleton_version(ARRAY(
+            SELECT UNNEST(ARRAY[ot.skeleton_id, nt.skeleton_id])
+            FROM old_treenode ot
+            JOIN new_treenode nt
+                ON ot.id = nt.id
+            WHERE ot.skeleton_id <> nt.skeleton_id
+                OR ot.parent_id IS DISTINCT FROM nt.parent_id
+                OR ot.location_x <> nt.location_x
+                OR ot.location_y <> nt.location_y
+                OR ot.location_z <> nt.location_z
+                OR ot.confidence <> nt.confidence
+                OR ot.user_id <> nt.user_id));
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION on_delete_treenode_update_skeleton_version()
+        RETURNS trigger
+        LANGUAGE plpgsql AS
+    $$
+    BEGIN
+        PERFORM update_skeleton_version(ARRAY(
+            SELECT skeleton_id FROM deleted_treenode));
+        RETURN NULL;
+    END;
+    $$;
+
+    CREATE TRIGGER on_insert_treenode_update_skeleton_version
+    AFTER INSERT ON treenode
+    REFERENCING NEW TABLE as inserted_treenode
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_insert_treenode_update_skeleton_version();
+
+    CREATE TRIGGER on_edit_treenode_update_skeleton_version
+    AFTER UPDATE ON treenode
+    REFERENCING NEW TABLE as new_treenode OLD TABLE as old_treenode
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_edit_treenode_update_skeleton_version();
+
+    CREATE TRIGGER on_delete_treenode_update_skeleton_version
+    AFTER DELETE ON treenode
+    REFERENCING OLD TABLE as deleted_treenode
+    FOR EACH STATEMENT EXECUTE PROCEDURE on_delete_treenode_update_skeleton_version();
+"""
+
+backward = """
+    DROP TRIGGER on_insert_treenode_update_skeleton_version ON treenode;
+    DROP TRIGGER on_edit_treenode_update_skeleton_version ON treenode;
+    DROP TRIGGER on_delete_treenode_update_skeleton_version ON treenode;
+
+    DROP FUNCTION on_insert_treenode_update_skeleton_version();
+    DROP FUNCTION on_edit_treenode_update_skeleton_version();
+    DROP FUNCTION on_delete_treenode_update_skeleton_version();
+    DROP FUNCTION update_skeleton_version(bigint[]);
+
+    DROP TABLE catmaid_skeleton_version;
+    DROP SEQUENCE catmaid_skeleton_version_seq;
+"""
+
+
+class Migration(migrations.Migration):
+    """Add a version number for each skeleton, which triggers on the treenode
+    table update with every change of the skeleton's arbor. In-memory arbor
+    caches can check it with a single primary key lookup.
+    """
+
+    dependencies = [
+        ('catmaid', '0107_allow_topology_lod_strategy'),
+    ]
+
+    operations = [
+        migrations.RunSQL(forward, backward, [
+            migrations.CreateModel(
+                name='SkeletonVersion',
+                fields=[
+                    ('skeleton_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                    ('version', models.BigIntegerField()),
+                ],
+                options={
+                    'db_table': 'catmaid_skeleton_version',
+                },
+            ),
+        ]),
+    ]
@@ -1347,6 +1347,51 @@ class SkeletonSummary(models.Model):
     def __str__(self) -> str:
         return f"Skeleton {self.skeleton_id} summary ({self.num_nodes} nodes, {self.cable_length} nm)"
 
+
+class SkeletonVersion(models.Model):
+    """Holds a version number for each skeleton, which is updated by the
+    database through triggers on the treenode table with every change of the
+    skeleton's arbor. Skeletons without entry haven't changed since the table
+    was created.
+    """
+
+    class Meta:
+        db_table = "catmaid_skeleton_version"
+
+    # No foreign key is used, skeletons and their nodes are typically deleted
+    # in the same transaction.
+    skeleton_id = models.BigIntegerField(primary_key=True)
+    version = models.BigIntegerField()
+
+
+class SkeletonConnectivity(models.Model):
+    """Holds the number of links between two skeletons through shared
+    connectors, grouped by the relation of both links and their lower
+    confidence. Each pair of different links to the same connector is counted
+    in both directions. Data insertion and updates are managed by the database
+    through triggers on the treenode_connector table.
+    """
+
+    class Meta:
+        db_table = "catmaid_skeleton_connectivity"
+        unique_together = (('skeleton_id', 'relation_id', 'partner_skeleton_id',
+                'partner_relation_id', 'confidence'),)
+
+    id = models.BigAutoField(primary_key=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    # No foreign keys are used for skeletons and relations, entries are
+    # removed by the database if no more links exist.
+    skeleton_id = models.BigIntegerField()
+    relation_id = models.BigIntegerField()
+    partner_skeleton_id = models.BigIntegerField()
+    partner_relation_id = models.BigIntegerField()
+    confidence = models.SmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"Skeleton {self.skeleton_id} to {self.partner_skeleton_id} connectivity ({self.count} links)"
+
+
 class DataSource(NonCascadingUserFocusedModel):
     """A simple object representing a data source, which are mainly used to
     reference the origin of imported skeletons. This table is tracked by the
@@ -1467,11 +1512,50 @@ class DirtyNodeGridCacheCell(models.Model):
     y_index = models.IntegerField(null=False)
     z_index = models.IntegerField(null=False)
     invalidation_time = DbDefaultDateTimeField(null=False)
+    # Optional bounding box of all changes in this cell:
+    # [min_x, min_y, min_z, max_x, max_y, max_z]
+    dirty_box = ArrayField(models.FloatField(), size=6, null=True)
 
     class Meta:
         db_table = "dirty_node_grid_cache_cell"
         unique_together = (('grid', 'x_index', 'y_index', 'z_index'),)
 
+
+class SpatialPresenceGrid(models.Model):
+    """A coarse grid that stores which skeletons and connectors are present in
+    each of its cells. Cells without any skeletons and connectors have no
+    entry. Only enabled grids are used by bounding box queries and kept up to
+    date by the spatial update worker.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE)
+    cell_width = models.IntegerField(null=False)
+    cell_height = models.IntegerField(null=False)
+    cell_depth = models.IntegerField(null=False)
+    enabled = models.BooleanField(default=False, null=False)
+
+    class Meta:
+        db_table = "spatial_presence_grid"
+        unique_together = (('project', 'cell_width', 'cell_height', 'cell_depth'),)
+
+
+class SpatialPresenceGridCell(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    grid = models.ForeignKey(SpatialPresenceGrid, on_delete=models.CASCADE)
+    x_index = models.IntegerField(null=False)
+    y_index = models.IntegerField(null=False)
+    z_index = models.IntegerField(null=False)
+    update_time = DbDefaultDateTimeField(null=False)
+    # Skeletons with an edge intersecting this cell
+    skeleton_ids = ArrayField(models.BigIntegerField(), null=False)
+    # Connectors located in this cell
+    connector_ids = ArrayField(models.BigIntegerField(), null=False)
+    # Connectors with a link edge intersecting this cell
+    linked_connector_ids = ArrayField(models.BigIntegerField(), null=False)
+
+    class Meta:
+        db_table = "spatial_presence_grid_cell"
+        unique_together = (('grid', 'x_index', 'y_index', 'z_index'),)
+
 initial_colors = ((1.0, 0.0, 0.0, 1.0),
                   (0.0, 1.0, 0.0, 1.0),
                   (0.0, 0.0, 1.0, 1.0),
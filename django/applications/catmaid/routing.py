@@ -1,8 +1,16 @@
 from django.conf.urls import url
 
-from catmaid.consumers import UpdateConsumer
+from channels.auth import AuthMiddlewareStack
+
+from catmaid.consumers import NodeListConsumer, UpdateConsumer
 
 
 websocket_urlpatterns = [
     url(r'^channels/updates/$', UpdateConsumer),
 ]
+
+# HTTP endpoints that are only available if HTTP requests are served through
+# ASGI. All other requests are handled by regular Django views.
+http_urlpatterns = [
+    url(r'^channels/(?P<project_id>\d+)/node/list$', AuthMiddlewareStack(NodeListConsumer)),
+]
@@ -1,3 +1,5 @@
+import json
+
 from django.db import connection
 
 from catmaid import locks
@@ -49,3 +51,48 @@ def disable_spatial_update_events(ignore_missing_fn:bool=False) -> bool:
         'lock_id':  locks.spatial_update_event_lock
     })
     return True
+
+
+# Notification payloads of PostgreSQL are limited to 8000 bytes.
+MAX_SPATIAL_UPDATE_PAYLOAD_SIZE = 7500
+
+
+def suppress_spatial_update_events(cursor, suppress:bool=True) -> None:
+    """Suppress "catmaid.spatial-update" events of database triggers for the
+    rest of the current transaction, or allow them again. This has only an
+    effect if spatial update events are enabled.
+    """
+    cursor.execute("""
+        SELECT set_config('catmaid.suppress_spatial_update_events', %(value)s, TRUE)
+    """, {
+        'value': 'on' if suppress else 'off',
+    })
+
+
+def notify_spatial_update(cursor, project_id, edges) -> None:
+    """Emit a single "catmaid.spatial-update" event for all passed in edges,
+    each one a pair of [x, y, z] points. If the edges don't fit into one
+    event, the bounding box of all edges is sent instead. Like events of
+    database triggers, this is only done if spatial update events are
+    enabled.
+    """
+    if not edges:
+        return
+    payload = json.dumps({
+        'project_id': project_id,
+        'type': 'edges',
+        'edges': edges,
+    })
+    if len(payload) > MAX_SPATIAL_UPDATE_PAYLOAD_SIZE:
+        points = [p for edge in edges for p in edge]
+        payload = json.dumps({
+            'project_id': project_id,
+            'type': 'box',
+            'min': [min(p[i] for p in points) for i in range(3)],
+            'max': [max(p[i] for p in points) for i in range(3)],
+        })
+    cursor.execute("""
+        SELECT notify_conditionally('catmaid.spatial-update', %(payload)s)
+    """, {
+        'payload': payload,
+    })
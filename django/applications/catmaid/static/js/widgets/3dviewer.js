@@ -2368,13 +2368,9 @@
         return Promise.resolve();
       }
 
-      return CATMAID.Volumes.get(project.id, volumeId)
-        .then((function(volume) {
-          // Convert X3D mesh to simple VRML and have Three.js load it
-          var vrml = CATMAID.Volumes.x3dToVrml(volume.mesh);
-          var loader = new THREE.VRMLLoader();
-          var scene = loader.parse(vrml);
-          if (scene.children) {
+      return CATMAID.Volumes.getMesh(project.id, volumeId)
+        .then((function(geometry) {
+          if (geometry.index.count > 0) {
             var material = this.options.createMeshMaterial(color, opacity);
             material.wireframe = !faces;
 
@@ -2388,7 +2384,7 @@
               material2.side = THREE.DoubleSide;
             }
 
-            var addedMeshes = scene.children.reduce((collection, mesh) => {
+            var addedMeshes = [new THREE.Mesh(geometry)].reduce((collection, mesh) => {
               mesh.material = material;
               this.space.scene.project.add(mesh);
               collection.push(mesh);
@@ -509,6 +509,31 @@
       return CATMAID.fetch(projectId + "/nodes/nearest", "GET", params);
     },
 
+    /**
+     * Get the closest treenode for each of the passed in locations.
+     *
+     * @param {number}     projectId   The project to operate in.
+     * @param {number[][]} points      A list of [x, y, z] query locations.
+     * @param {number[]}   skeletonIds (optional) A skeleton ID or null for
+     *                                 each location to restrict the result to.
+     * @param {number[]}   neuronIds   (optional) A neuron ID or null for each
+     *                                 location to restrict the result to.
+     * @returns Promise resolving in a list of [treenode ID, skeleton ID, x,
+     *          y, z] lists, one for each query location.
+     */
+    nearestNodes: function(projectId, points, skeletonIds, neuronIds) {
+      let params = {
+        points: JSON.stringify(points),
+      };
+      if (skeletonIds) {
+        params.skeleton_ids = JSON.stringify(skeletonIds);
+      }
+      if (neuronIds) {
+        params.neuron_ids = JSON.stringify(neuronIds);
+      }
+      return CATMAID.fetch(projectId + "/nodes/nearest/batch", "POST", params);
+    },
+
     /**
      * Get the most recently edited treenode.
      *
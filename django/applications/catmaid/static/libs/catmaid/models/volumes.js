@@ -44,6 +44,45 @@
       return CATMAID.fetch(url, 'GET');
     },
 
+    /**
+     * Retrieve the triangle mesh of a specific volume in its binary
+     * representation. Responses are cached by the browser until the volume
+     * changes.
+     *
+     * @param {integer} projectId        The project the volume is part of
+     * @param {integer} volumeId         The volume to retrieve the mesh of
+     *
+     * @returns {Object} Promise that is resolved with a THREE.BufferGeometry
+     *                   of the volume mesh.
+     */
+    getMesh: function(projectId, volumeId) {
+      return CATMAID.fetch({
+          url: projectId + '/volumes/' + volumeId + '/mesh',
+          method: 'GET',
+          raw: true,
+          responseType: 'arraybuffer',
+        })
+        .then(function(data) {
+          return CATMAID.Volumes.binaryToGeometry(data);
+        });
+    },
+
+    /**
+     * Create a THREE.BufferGeometry from the binary mesh representation: the
+     * number of vertices and triangles as two uint32 values, followed by
+     * float32 vertex coordinates and uint32 vertex indices.
+     */
+    binaryToGeometry: function(data) {
+      var header = new Uint32Array(data, 0, 2);
+      var vertices = new Float32Array(data, 8, header[0] * 3);
+      var indices = new Uint32Array(data, 8 + vertices.byteLength, header[1] * 3);
+      var geometry = new THREE.BufferGeometry();
+      geometry.setIndex(new THREE.BufferAttribute(indices, 1));
+      geometry.addAttribute('position', new THREE.BufferAttribute(vertices, 3));
+      geometry.computeVertexNormals();
+      return geometry;
+    },
+
     /**
      * Update a specific volume with a new representation.
      *
@@ -244,21 +283,38 @@
      * @param skeletonIds {integer[]} The skeletons to find intersecting volumes for.
      * @param annotation  {string}    (optional) An annotation that is expected
      *                                on intersecting volumes.
+     * @param exact       {boolean}   (optional) Whether skeletons should be
+     *                                tested against volume meshes rather than
+     *                                only their bounding boxes.
      * @returns Promise resolving with result.
      */
-    findSkeletonInnervations: function(projectId, skeletonIds, annotation) {
+    findSkeletonInnervations: function(projectId, skeletonIds, annotation, exact) {
       return CATMAID.fetch(projectId + '/volumes/skeleton-innervations', 'POST', {
         'skeleton_ids': skeletonIds,
         'annotation': annotation,
+        'exact': !!exact,
       });
     },
 
     /**
-     * Find out if the passed in location intersects with the bounding box of
-     * the passed in volume.
+     * Find out which of the passed in points are inside the passed in volume.
+     *
+     * @param {number}     projectId The project to operate in.
+     * @param {number}     volumeId  The volume to test the points against.
+     * @param {number[][]} points    A list of [x, y, z] points.
+     * @returns Promise resolving in an object with a boolean for each point
+     *          in its "contains" field.
+     */
+    containsPoints: function(projectId, volumeId, points) {
+      let url = projectId + "/volumes/" + volumeId + "/contains";
+      return CATMAID.fetch(url, "POST", {points: JSON.stringify(points)});
+    },
+
+    /**
+     * Find out if the passed in location is inside the passed in volume.
      *
      * @param {number} projectId The project to operate in.
-     * @param {number} volumeId  The volume to check the boundinx box for.
+     * @param {number} volumeId  The volume to check the location for.
      * @param {number} x         The X coordinate of the point to check.
      * @param {number} y         The Y coordinate of the point to check.
      * @param {number} z         The Z coordinate of the point to check.
@@ -2,6 +2,8 @@
 
 import json
 
+from catmaid.control.presence_grid import (get_presence_grid_split,
+        update_presence_grid)
 from catmaid.models import Connector, TreenodeConnector
 from catmaid.state import make_nocheck_state
 
@@ -837,3 +839,39 @@ class ConnectorsApiTests(CatmaidApiTestCase):
             [2466, 6420.0, 5565.0, 0.0, 2468, 5, 3, 2464, '2016-03-09T18:10:50.846Z', '2016-03-09T18:10:50.846Z', 1024],
         ]
         self.assertEqual(expected_result, parsed_response)
+
+    def test_connectors_in_bb_presence_grid(self):
+        self.fake_authentication()
+
+        bb = {
+            'minx': 6000,
+            'maxx': 8000,
+            'miny': 5000,
+            'maxy': 6000,
+            'minz': 0,
+            'maxz': 100,
+        }
+        options = [{}, {'with_locations': True}, {'only_linked': True},
+                {'skeleton_ids': [2468]}, {'limit': 2}]
+
+        url = '/%d/connectors/in-bounding-box' % self.test_project_id
+
+        def get_results():
+            results = []
+            for o in options:
+                response = self.client.post(url, with_dict(o, bb))
+                self.assertStatus(response)
+                results.append(sorted(json.loads(response.content.decode('utf-8'))))
+            return results
+
+        expected_results = get_results()
+
+        # The first grid has only fully contained cells, the second one
+        # needs boundary queries along Y and Z.
+        with self.settings(SPATIAL_PRESENCE_GRID_MIN_CELLS=1):
+            for cell_size in ((500, 500, 50), (400, 400, 30)):
+                grid = update_presence_grid(self.test_project_id, *cell_size)
+                self.assertTrue(get_presence_grid_split(self.test_project_id, bb))
+                self.assertEqual(expected_results, get_results())
+                grid.enabled = False
+                grid.save()
@@ -4,6 +4,8 @@ import json
 
 from django.db import connection
 
+from catmaid.control.node import (CONNECTOR_COLUMNS, LINK_COLUMNS,
+        _treenode_columns_from_rows, pack_node_columns, unpack_node_columns)
 from catmaid.models import Connector, Treenode
 from catmaid.state import make_nocheck_state
 
@@ -91,6 +93,42 @@ class NodesApiTests(CatmaidApiTestCase):
         self.assertEqual(expected_result, parsed_response)
 
 
+    def test_nodes_nearest(self):
+        self.fake_authentication()
+        response = self.client.post(
+            '/%d/nodes/nearest/batch' % self.test_project_id,
+            {
+                'points': json.dumps([[5115, 3835, 4050], [5115, 3835, 0],
+                        [5115, 3835, 0], [7030, 1980, 0]]),
+                'skeleton_ids': json.dumps([2388, None, -1, None]),
+                'neuron_ids': json.dumps([None, 362, None, None]),
+            }
+        )
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        expected_result = [
+            [2394, 2388, 3110, 6030, 0],
+            [367, 361, 7030, 1980, 0],
+            [2437, 2433, 5290, 3930, 279],
+            [367, 361, 7030, 1980, 0],
+        ]
+        self.assertEqual(expected_result, parsed_response)
+
+        # Form encoded lists
+        response = self.client.post(
+            '/%d/nodes/nearest/batch' % self.test_project_id,
+            {
+                'points[0][0]': 5115,
+                'points[0][1]': 3835,
+                'points[0][2]': 4050,
+                'skeleton_ids[0]': 2388,
+            }
+        )
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([[2394, 2388, 3110, 6030, 0]], parsed_response)
+
+
     def test_node_user_info(self):
         self.fake_authentication()
 
@@ -519,3 +557,64 @@ class NodesApiTests(CatmaidApiTestCase):
         self.assertEqual({}, parsed_response[2])
         self.assertEqual(False, parsed_response[3])
         self.assertEqual(expected_rel_response, parsed_response[4])
+
+
+    def test_node_list_columnar(self):
+        self.fake_authentication()
+
+        response = self.client.post('/%d/node/list' % (self.test_project_id,), {
+            'z1': 0,
+            'top': 4625,
+            'left': 2860,
+            'right': 12625,
+            'bottom': 8075,
+            'z2': 9,
+            'format': 'columnar',
+        })
+        self.assertStatus(response)
+        columns = unpack_node_columns(response.content)
+
+        # Compare with the regular tuple result of the same query
+        response = self.client.post('/%d/node/list' % (self.test_project_id,), {
+            'z1': 0,
+            'top': 4625,
+            'left': 2860,
+            'right': 12625,
+            'bottom': 8075,
+            'z2': 9,
+        })
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        # The values of all columns need to belong to the same rows.
+        treenodes = columns['treenodes']
+        expected_treenodes = [(t[0], t[1] or -1, t[7], t[2], t[5])
+                for t in parsed_response[0]]
+        self.assertCountEqual(expected_treenodes, list(zip(
+                treenodes['id'].tolist(), treenodes['parent_id'].tolist(),
+                treenodes['skeleton_id'].tolist(), treenodes['x'].tolist(),
+                treenodes['confidence'].tolist())))
+
+        self.assertCountEqual([c[0] for c in parsed_response[1]],
+                columns['connectors']['id'].tolist())
+        expected_links = [(c[0], link[0], link[1], link[4])
+                for c in parsed_response[1] for link in c[7]]
+        links = columns['links']
+        self.assertCountEqual(expected_links, list(zip(
+                links['connector_id'].tolist(), links['treenode_id'].tolist(),
+                links['relation_id'].tolist(), links['id'].tolist())))
+
+        self.assertEqual(False, columns['node_limit_reached'])
+        self.assertEqual({1024: 'postsynaptic_to', 1023: 'presynaptic_to'},
+                columns['relation_map'])
+
+    def test_node_columns_missing_values(self):
+        # A root node without confidence
+        treenodes = _treenode_columns_from_rows([
+                (1, None, 1.0, 2.0, 3.0, None, 10.0, 5, 0.0, 3)])
+        data = pack_node_columns(treenodes,
+                {name: [] for name, _ in CONNECTOR_COLUMNS},
+                {name: [] for name, _ in LINK_COLUMNS}, {}, False, {})
+        columns = unpack_node_columns(data)
+        self.assertEqual([-1], columns['treenodes']['parent_id'].tolist())
+        self.assertEqual([-1], columns['treenodes']['confidence'].tolist())
@@ -12,6 +12,9 @@ from django.shortcuts import get_object_or_404
 from guardian.shortcuts import assign_perm
 
 from catmaid.control.annotation import _annotate_entities
+from catmaid.control.presence_grid import (get_bounding_box_params,
+        get_presence_grid_split, update_presence_grid)
+from catmaid.control.skeleton import get_skeletons_in_bb
 from catmaid.models import (
     ClassInstance, ClassInstanceClassInstance, Log, Review, TreenodeConnector,
     ReviewerWhitelist, Treenode, User, ClientDatastore, ClientData
@@ -520,6 +523,66 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         self.assertEqual(expected_result, parsed_response)
 
 
+    def test_compact_skeleton_detail_many_stream(self):
+        self.fake_authentication()
+
+        skeleton_ids = [373, 235, 2388]
+        params:Dict[str, Any] = {
+            'with_connectors': True,
+            'with_tags': True,
+        }
+        for i, k in enumerate(skeleton_ids):
+            params['skeleton_ids[%d]' % i] = k
+        response = self.client.post(
+                '/%d/skeletons/compact-detail' % (self.test_project_id,),
+                params)
+        self.assertStatus(response)
+        expected_result = json.loads(response.content.decode('utf-8'))['skeletons']
+
+        params['stream'] = True
+        response = self.client.post(
+                '/%d/skeletons/compact-detail' % (self.test_project_id,),
+                params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        content = b''.join(response.streaming_content).decode('utf-8')
+        lines = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(skeleton_ids), len(lines))
+        for skeleton_id, skeleton in lines:
+            self.assertEqual(expected_result[str(skeleton_id)], skeleton)
+
+        # Class instances that aren't skeletons are rejected before streaming.
+        params['skeleton_ids[3]'] = 2365
+        response = self.client.post(
+                '/%d/skeletons/compact-detail' % (self.test_project_id,),
+                params)
+        self.assertEqual(response.status_code, 404)
+
+
+    def test_measure_skeletons(self):
+        self.fake_authentication()
+
+        skeleton_ids = [235, 373]
+        params = {}
+        for i, k in enumerate(skeleton_ids):
+            params['skeleton_ids[%d]' % i] = k
+        response = self.client.post(
+                '/%d/skeletons/measure' % (self.test_project_id,),
+                params)
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        # Skeleton ID, raw cable, smooth cable, n inputs, n outputs, n nodes,
+        # n branch nodes, n end nodes, principal branch cable
+        expected_result = [
+            [235, 11243, 10640, 0, 3, 28, 2, 4, 7391.129118],
+            [373, 2345, 2324, 2, 0, 5, 0, 2, 1705.858546],
+        ]
+        self.assertEqual(len(expected_result), len(parsed_response))
+        for expected_row, row in zip(expected_result, parsed_response):
+            self.assertEqual(expected_row[:8], row[:8])
+            self.assertAlmostEqual(expected_row[8], row[8], places=3)
+
+
     def test_skeleton_connectivity_matrix(self):
         self.fake_authentication()
 
@@ -541,6 +604,27 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         self.assertEqual(expected_result, parsed_response)
 
 
+    def test_find_directed_paths(self):
+        self.fake_authentication()
+
+        params = {
+            'sources[0]': 235,
+            'targets[0]': 373,
+            'path_length': 2,
+            'min_synapses': 1,
+        }
+        response = self.client.post(
+                '/%d/graph/directedpaths' % (self.test_project_id,), params)
+        self.assertStatus(response)
+        self.assertEqual([[235, 373]], json.loads(response.content.decode('utf-8')))
+
+        # A minimum synapse count is required
+        params['min_synapses'] = -1
+        response = self.client.post(
+                '/%d/graph/directedpaths' % (self.test_project_id,), params)
+        self.assertEqual(response.status_code, 400)
+
+
     def test_skeleton_connectivity_matrix_with_locations(self):
         self.fake_authentication()
 
@@ -1325,6 +1409,50 @@ class SkeletonsApiTests(CatmaidApiTestCase):
         # Also check response length to be sure there were no duplicates.
         self.assertEqual(len(expected_result), len(parsed_response))
 
+    def test_skeletons_in_bounding_box_presence_grid(self):
+        self.fake_authentication()
+
+        bb = {
+            'minx': 2000,
+            'maxx': 8000,
+            'miny': 1000,
+            'maxy': 7000,
+            'minz': 0,
+            'maxz': 300,
+        }
+        options = [{}, {'min_nodes': 5}, {'skeleton_ids': [235, 361, 2388]}]
+
+        url = '/%d/skeletons/in-bounding-box' % self.test_project_id
+
+        def get_results():
+            results = []
+            for o in options:
+                response = self.client.post(url, dict(bb, **o))
+                self.assertStatus(response)
+                results.append(sorted(json.loads(response.content.decode('utf-8'))))
+            # The postgis2d query uses a half-open Z range, maxz is on a cell
+            # boundary of the first grid.
+            for src in ('postgis2d', 'postgis3d'):
+                params = get_bounding_box_params({
+                    'project_id': self.test_project_id,
+                    'src': src,
+                }, bb)
+                results.append(sorted(get_skeletons_in_bb(params)))
+            return results
+
+        expected_results = get_results()
+        self.assertTrue(expected_results[0])
+
+        # The first grid has only fully contained cells, the second one
+        # needs boundary queries along all dimensions.
+        with self.settings(SPATIAL_PRESENCE_GRID_MIN_CELLS=1):
+            for cell_size in ((1000, 1000, 100), (1500, 1500, 120)):
+                grid = update_presence_grid(self.test_project_id, *cell_size)
+                self.assertTrue(get_presence_grid_split(self.test_project_id, bb))
+                self.assertEqual(expected_results, get_results())
+                grid.enabled = False
+                grid.save()
+
 
 class SkeletonsApiTransactionTests(CatmaidApiTransactionTestCase):
 
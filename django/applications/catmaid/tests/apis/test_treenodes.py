@@ -300,6 +300,77 @@ class TreenodesApiTests(CatmaidApiTestCase):
         self.assertEqual(relation_count, TreenodeClassInstance.objects.all().count())
 
 
+    def test_create_treenodes(self):
+        self.fake_authentication()
+        class_map = get_class_to_id_map(self.test_project_id)
+        count_treenodes = lambda: Treenode.objects.all().count()
+        count_skeletons = lambda: ClassInstance.objects.filter(
+                project=self.test_project_id,
+                class_column=class_map['skeleton']).count()
+        treenode_count = count_treenodes()
+        skeleton_count = count_skeletons()
+
+        # A new skeleton with a branch and a new path attached to an existing
+        # treenode. References can be listed before their parents.
+        parent_id = 2372
+        parent = Treenode.objects.get(pk=parent_id)
+        response = self.client.post('/%d/treenodes/create' % self.test_project_id, {
+            'nodes': json.dumps([
+                ['b', 'a', 10, 20, 30, 2, 4],
+                ['a', None, 0, 0, 0],
+                ['c', 'a', 15, 25, 35],
+                ['d', parent_id, 1, 2, 3],
+                ['e', 'd', 4, 5, 6, None, 3],
+            ]),
+            'state': make_nocheck_state()})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(treenode_count + 5, count_treenodes())
+        self.assertEqual(skeleton_count + 1, count_skeletons())
+        self.assertEqual([parent_id],
+                [p[0] for p in parsed_response['parent_edition_times']])
+
+        created = dict((n[0], n[1:]) for n in parsed_response['treenodes'])
+        self.assertEqual(['b', 'a', 'c', 'd', 'e'],
+                [n[0] for n in parsed_response['treenodes']])
+        nodes = dict((k, Treenode.objects.get(pk=v[0])) for k, v in created.items())
+        self.assertEqual(None, nodes['a'].parent_id)
+        self.assertEqual(nodes['a'].id, nodes['b'].parent_id)
+        self.assertEqual(nodes['a'].id, nodes['c'].parent_id)
+        self.assertEqual(parent_id, nodes['d'].parent_id)
+        self.assertEqual(nodes['d'].id, nodes['e'].parent_id)
+        self.assertEqual(2, nodes['b'].radius)
+        self.assertEqual(4, nodes['b'].confidence)
+        self.assertEqual(0, nodes['e'].radius)
+        self.assertEqual(3, nodes['e'].confidence)
+        for ref, node in nodes.items():
+            self.assertEqual(created[ref][1], node.skeleton_id)
+            self.assertEqual(self.test_user_id, node.user_id)
+        self.assertEqual(nodes['a'].skeleton_id, nodes['c'].skeleton_id)
+        self.assertEqual(parent.skeleton_id, nodes['e'].skeleton_id)
+
+    def test_create_treenodes_failure(self):
+        self.fake_authentication()
+        treenode_count = Treenode.objects.all().count()
+
+        # Cycles
+        response = self.client.post('/%d/treenodes/create' % self.test_project_id, {
+            'nodes': json.dumps([['a', 'b', 1, 2, 3], ['b', 'a', 4, 5, 6]])})
+        self.assertEqual(response.status_code, 400)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertIn('cycle', parsed_response['error'])
+
+        # Missing parents
+        response = self.client.post('/%d/treenodes/create' % self.test_project_id, {
+            'nodes': json.dumps([['a', 555555, 1, 2, 3]]),
+            'state': make_nocheck_state()})
+        self.assertEqual(response.status_code, 400)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertIn('555555', parsed_response['error'])
+
+        self.assertEqual(treenode_count, Treenode.objects.all().count())
+
     def test_update_treenode_parent(self):
         self.fake_authentication()
 
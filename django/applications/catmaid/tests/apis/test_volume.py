@@ -166,6 +166,39 @@ class VolumeTests(CatmaidApiTestCase):
 
         self.assertStatus(response)
 
+    def test_point_in_volume(self):
+        self.fake_authentication()
+        response = self.client.get(
+            f"/{self.test_project_id}/volumes/{self.test_vol_1_id}/intersect",
+            {'x': 0.5, 'y': -0.5, 'z': 0})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual({'intersects': True}, parsed_response)
+
+        response = self.client.post(
+            f"/{self.test_project_id}/volumes/{self.test_vol_1_id}/contains",
+            {'points': json.dumps([[0, 0, 0], [2, 0, 0], [0, 0, -1.5]])})
+        self.assertStatus(response)
+        parsed_response = json.loads(response.content.decode('utf-8'))
+        self.assertEqual({'contains': [True, False, False]}, parsed_response)
+
+    def test_volume_mesh(self):
+        self.fake_authentication()
+        url = f"/{self.test_project_id}/volumes/{self.test_vol_1_id}/mesh"
+        response = self.client.get(url)
+        self.assertStatus(response)
+        self.assertEqual(8 + 8 * 3 * 4 + 12 * 3 * 4, len(response.content))
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+        response = self.client.get(
+            f"/{self.test_project_id}/volumes/{self.test_vol_1_id}/export.stl",
+            HTTP_ACCEPT="model/x.stl-binary")
+        self.assertStatus(response)
+        self.assertEqual(80 + 4 + 12 * 50, len(response.content))
+
     def test_import_malformed_data(self):
         self.fake_authentication()
         assign_perm('can_import', self.test_user, self.test_project)
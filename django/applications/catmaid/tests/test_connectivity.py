@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+from io import BytesIO
+
+from scipy import sparse
+
+from django.test import TestCase, override_settings
+
+from catmaid.control.connectivity import (ConnectivityGraph,
+        ConnectivityGraphCache, ConnectivityMatrix)
+
+
+class ConnectivityMatrixTests(TestCase):
+
+    def setUp(self):
+        # Skeleton 1 is requested twice and skeleton 4 isn't a row skeleton.
+        self.matrix = ConnectivityMatrix.from_edges([3, 1, 2, 1], [2, 5, 9],
+                [1, 3, 2, 4], [5, 2, 9, 5], [5, 1, 2, 7])
+
+    def test_from_edges(self):
+        self.assertEqual([[1, 0, 0], [0, 5, 0], [0, 0, 2], [0, 5, 0]],
+                self.matrix.matrix.toarray().tolist())
+        self.assertEqual({3: {2: 1}, 1: {5: 5}, 2: {9: 2}}, self.matrix.to_dict())
+
+    def test_iter_rows(self):
+        self.matrix.set_labels({3: 'A', 5: 'B'})
+        self.assertEqual([['', 2, 'B', 9], ['A', 1, 0, 0], [1, 0, 5, 0],
+                [2, 0, 0, 2], [1, 0, 5, 0]], list(self.matrix.iter_rows()))
+
+    def test_aggregate(self):
+        matrix = self.matrix.aggregate([(100, 'Group', [1, 3])],
+                [(200, 'Other group', [2, 9])])
+        self.assertEqual([100, 2], matrix.row_ids.tolist())
+        self.assertEqual(['Other group', 5], matrix.col_labels)
+        self.assertEqual([[1, 5], [2, 0]], matrix.matrix.toarray().tolist())
+
+    def test_sort(self):
+        matrix = self.matrix.sort('count', 'id')
+        self.assertEqual([1, 1, 2, 3], matrix.row_ids.tolist())
+        self.assertEqual([2, 5, 9], matrix.col_ids.tolist())
+
+    def test_write_npz(self):
+        data = BytesIO()
+        self.matrix.write_npz(data)
+        data.seek(0)
+        self.assertEqual(self.matrix.matrix.toarray().tolist(),
+                sparse.load_npz(data).toarray().tolist())
+
+
+class ConnectivityGraphTests(TestCase):
+
+    def setUp(self):
+        # 1 -> 2 -> 3 -> 4 and 1 -> 3 with a single synapse, 5 -> 1
+        self.graph = ConnectivityGraph([1, 2, 3, 1, 5], [2, 3, 4, 3, 1], [3, 2, 5, 1, 4])
+
+    def test_expand(self):
+        self.assertEqual({2, 3, 5}, self.graph.expand([1], 1))
+        self.assertEqual({2, 3, 4, 5}, self.graph.expand([1], 2))
+        self.assertEqual({2}, self.graph.expand([1], 1, min_downstream=2,
+                min_upstream=float('inf')))
+        self.assertEqual(set(), self.graph.expand([6], 2))
+
+    def test_fronts(self):
+        self.assertEqual([{1}, {2}, {3}, {4}], self.graph.fronts([1], 4,
+                min_downstream=2, min_upstream=float('inf')))
+
+    def test_directed_paths(self):
+        self.assertEqual([[1, 3]], self.graph.directed_paths([1], [3], 1))
+        self.assertEqual(sorted([[1, 2, 3], [1, 3]]),
+                sorted(self.graph.directed_paths([1], [3], 2)))
+        self.assertEqual([[1, 2, 3]], self.graph.directed_paths([1], [3], 2, min_weight=2))
+        self.assertEqual(1, len(self.graph.directed_paths([5], [3, 4], 4, max_paths=1)))
+
+    def test_update(self):
+        n_edges = self.graph.n_edges
+        updated_graph = self.graph.updated([3], [2, 3], [3, 6], [2, 1])
+        edges = sorted(zip(*[e.tolist() for e in updated_graph.edges()]))
+        self.assertEqual([(1, 2, 3), (2, 3, 2), (3, 6, 1), (5, 1, 4)], edges)
+        # The original graph is unchanged.
+        self.assertEqual(n_edges, self.graph.n_edges)
+
+
+class ConnectivityGraphCacheTests(TestCase):
+
+    @override_settings(CONNECTIVITY_GRAPH_MAX_AGE=None)
+    def test_default_max_age(self):
+        # Without update notifications, graphs aren't cached by default.
+        with self.settings(SPATIAL_UPDATE_NOTIFICATIONS=False):
+            self.assertEqual(0, ConnectivityGraphCache().max_age)
+        with self.settings(SPATIAL_UPDATE_NOTIFICATIONS=True):
+            self.assertEqual(60, ConnectivityGraphCache().max_age)
+        with self.settings(CONNECTIVITY_GRAPH_MAX_AGE=10):
+            self.assertEqual(10, ConnectivityGraphCache().max_age)
+        self.assertEqual(5, ConnectivityGraphCache(max_age=5).max_age)
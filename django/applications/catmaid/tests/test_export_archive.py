@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from catmaid.control.exportarchive import (ExportArchiveWriter,
+        read_export_archive, unescape_copy_value)
+from catmaid.models import Relation, Treenode, TreenodeConnector
+from catmaid.tests.common import CatmaidTestCase
+
+
+class ExportArchiveTests(CatmaidTestCase):
+
+    def get_values(self, objects):
+        return sorted((o.id, o.parent_id, o.skeleton_id, o.location_x,
+                o.location_y, o.location_z, o.radius, o.confidence, o.user_id,
+                o.editor_id, o.creation_time, o.edition_time) for o in objects)
+
+    def test_write_and_read_archive(self):
+        treenodes = Treenode.objects.filter(project_id=self.test_project_id)
+        links = TreenodeConnector.objects.filter(project_id=self.test_project_id)
+        relations = list(Relation.objects.filter(project_id=self.test_project_id))
+
+        with TemporaryDirectory() as path:
+            for compress in (False, True):
+                archive_path = os.path.join(path, f'archive-{compress}')
+                writer = ExportArchiveWriter(archive_path, chunk_size=40,
+                        compress=compress)
+                self.assertEqual(treenodes.count(),
+                        writer.write_objects(treenodes.iterator()))
+                writer.write_copy(links)
+                writer.write_objects(relations)
+                manifest = writer.close({'project_id': self.test_project_id})
+
+                # Treenodes are split into chunks of 40 objects.
+                treenode_files = [f for f in manifest['files']
+                        if f['model'] == 'catmaid.treenode']
+                self.assertEqual(list(range(40, treenodes.count(), 40)) + [treenodes.count()],
+                        [sum(f['count'] for f in treenode_files[:i + 1])
+                        for i in range(len(treenode_files))])
+                with open(os.path.join(archive_path, 'manifest.json')) as f:
+                    self.assertEqual(manifest, json.load(f))
+
+                # Another archive can't be written into the same directory.
+                with self.assertRaises(ValueError):
+                    ExportArchiveWriter(archive_path)
+
+                imported = [o.object for o in read_export_archive(archive_path)]
+                imported_treenodes = [o for o in imported if isinstance(o, Treenode)]
+                self.assertEqual(self.get_values(treenodes),
+                        self.get_values(imported_treenodes))
+
+                imported_links = sorted((o.id, o.treenode_id, o.connector_id,
+                        o.relation_id, o.skeleton_id, o.edition_time)
+                        for o in imported if isinstance(o, TreenodeConnector))
+                self.assertEqual(sorted(links.values_list('id', 'treenode_id',
+                        'connector_id', 'relation_id', 'skeleton_id',
+                        'edition_time')), imported_links)
+
+                self.assertEqual(sorted(r.relation_name for r in relations),
+                        sorted(o.relation_name for o in imported
+                            if isinstance(o, Relation)))
+
+    def test_unescape_copy_value(self):
+        self.assertIsNone(unescape_copy_value('\\N'))
+        self.assertEqual('a\tb\\c\n', unescape_copy_value('a\\tb\\\\c\\n'))
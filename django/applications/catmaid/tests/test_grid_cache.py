@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+from concurrent import futures
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+
+from catmaid.control.node import (get_grid_cell_buckets, run_batches,
+        update_grid_cache, update_grid_cell, update_grid_cell_delta)
+from catmaid.models import NodeGridCache, NodeGridCacheCell
+from catmaid.tests.common import CatmaidTestCase
+
+
+class GridCacheBatchTests(TestCase):
+
+    def test_run_batches(self):
+        submitted = []
+
+        with futures.ThreadPoolExecutor(2) as executor:
+            def submit(batch):
+                # No more than the allowed number of batches is pending.
+                self.assertLess(sum(1 for f in submitted if not f.done()), 3)
+                future = executor.submit(sum, batch)
+                submitted.append(future)
+                return future
+
+            batches = [[i, i] for i in range(10)]
+            results = list(run_batches(submit, iter(batches), 3))
+
+        self.assertEqual(10, len(submitted))
+        self.assertCountEqual([2 * i for i in range(10)], results)
+
+
+class GridCacheBuildTests(CatmaidTestCase):
+
+    def test_resume(self):
+        update_grid_cache(self.test_project_id, 'json', ['xy'],
+                cell_width=2000, cell_height=2000, cell_depth=100,
+                progress=False, log=lambda *args: None)
+        grid = NodeGridCache.objects.get(project_id=self.test_project_id)
+        cells = set(NodeGridCacheCell.objects.filter(grid=grid).values_list(
+                'x_index', 'y_index', 'z_index'))
+        self.assertTrue(cells)
+
+        # Without worker processes, a resumed build only recreates missing
+        # cells.
+        NodeGridCacheCell.objects.filter(grid=grid, x_index=1, y_index=3,
+                z_index=0).delete()
+        messages = []
+        update_grid_cache(self.test_project_id, 'json', ['xy'],
+                cell_width=2000, cell_height=2000, cell_depth=100,
+                progress=False, log=messages.append, jobs=1, resume=True)
+        resumed_cells = set(NodeGridCacheCell.objects.filter(
+                grid=grid).values_list('x_index', 'y_index', 'z_index'))
+        self.assertEqual(cells, resumed_cells)
+        self.assertTrue(any(f'{len(cells) - 1} skipped' in m
+                for m in messages))
+
+
+class GridCacheDeltaUpdateTests(CatmaidTestCase):
+    """Test partial updates of grid cache cells against a full update of the
+    same cell.
+    """
+
+    def setUp(self):
+        super().setUp()
+        update_grid_cache(self.test_project_id, 'json', ['xy'],
+                cell_width=2000, cell_height=2000, cell_depth=100,
+                lod_levels=1, progress=False, log=lambda *args: None)
+        self.grid = NodeGridCache.objects.get(project_id=self.test_project_id)
+        self.cursor = connection.cursor()
+
+    def get_params(self):
+        return {
+            'project_id': self.test_project_id,
+            'limit': settings.NODE_LIST_MAXIMUM_COUNT,
+        }
+
+    def move_treenode(self, treenode_id, x, y):
+        self.cursor.execute("""
+            UPDATE treenode
+            SET location_x = %(x)s, location_y = %(y)s, edition_time = now()
+            WHERE id = %(id)s
+        """, {
+            'id': treenode_id,
+            'x': x,
+            'y': y,
+        })
+
+    def update_cell_delta(self, w_i, h_i, d_i, dirty_box):
+        g = self.grid
+        return update_grid_cell_delta(self.test_project_id, g.id, w_i, h_i,
+                d_i, g.cell_width, g.cell_height, g.cell_depth,
+                self.get_params(), dirty_box, True, False, False,
+                cursor=self.cursor, lod_strategy=g.lod_strategy)
+
+    def update_cell(self, w_i, h_i, d_i):
+        g = self.grid
+        update_grid_cell(self.test_project_id, g.id, w_i, h_i, d_i,
+                g.cell_width, g.cell_height, g.cell_depth, self.get_params(),
+                g.allow_empty, g.n_lod_levels, g.lod_min_bucket_size,
+                g.lod_strategy, True, False, False, cursor=self.cursor)
+
+    def get_cell_nodes(self, w_i, h_i, d_i):
+        buckets = get_grid_cell_buckets(self.cursor, self.grid.id, w_i, h_i, d_i)
+        self.assertEqual(1, len(buckets))
+        treenodes = sorted(buckets[0][0])
+        connectors = sorted([c[:7] + [sorted(c[7])] for c in buckets[0][1]])
+        return treenodes, connectors, buckets[0][2]
+
+    def test_moved_node(self):
+        # Treenode 2396 moves within cell (1, 3, 0). The dirty box contains
+        # the old and new location of its edge to parent 2394.
+        self.move_treenode(2396, 3600.0, 6500.0)
+        dirty_box = [3110.0, 6030.0, 0.0, 3680.0, 6550.0, 0.0]
+        self.assertTrue(self.update_cell_delta(1, 3, 0, dirty_box))
+        delta_nodes = self.get_cell_nodes(1, 3, 0)
+        moved = [t for t in delta_nodes[0] if t[0] == 2396]
+        self.assertEqual(1, len(moved))
+        self.assertEqual([3600.0, 6500.0], moved[0][2:4])
+
+        self.update_cell(1, 3, 0)
+        self.assertEqual(self.get_cell_nodes(1, 3, 0), delta_nodes)
+
+    def test_moved_parent(self):
+        # Treenode 2378 is outside of cell (1, 2, 0), but is cached, because
+        # the edge to its parent 2376 intersects the cell. After 2376 moves
+        # next to its child, 2378 doesn't belong to the cell anymore, which
+        # can't be decided from the cached data.
+        treenode_ids = [t[0] for t in self.get_cell_nodes(1, 2, 0)[0]]
+        self.assertIn(2378, treenode_ids)
+
+        self.move_treenode(2376, 4300.0, 4400.0)
+        dirty_box = [3310.0, 4330.0, 0.0, 4420.0, 5190.0, 0.0]
+        self.assertFalse(self.update_cell_delta(1, 2, 0, dirty_box))
+
+        self.update_cell(1, 2, 0)
+        treenode_ids = [t[0] for t in self.get_cell_nodes(1, 2, 0)[0]]
+        self.assertIn(2376, treenode_ids)
+        self.assertNotIn(2378, treenode_ids)
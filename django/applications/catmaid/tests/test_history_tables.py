@@ -276,6 +276,10 @@ class HistoryTableTests(TransactionTestCase):
         'catmaid_transaction_info',
         'catmaid_stats_summary',
         'catmaid_skeleton_summary',
+        'catmaid_skeleton_connectivity',
+        'catmaid_skeleton_version',
+        'spatial_presence_grid',
+        'spatial_presence_grid_cell',
 
         # Regular unversioned non-CATMAID tables
         'djkombu_queue',
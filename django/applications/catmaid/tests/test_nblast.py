@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from django.test import TestCase
+
+from catmaid.control.nat.nblast import (DotpropsList, ScoreFunction,
+        compute_dotprops, find_stale_objects, histogram, nblast_scores,
+        resample_skeleton)
+from catmaid.models import (NblastConfigDefaultDistanceBreaks,
+        NblastConfigDefaultDotBreaks)
+
+
+class NativeNblastTests(TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+        objects = [compute_dotprops(rng.normal(size=(50, 3)) * 5 + i, 5)
+                for i in range(4)]
+        self.dotprops = DotpropsList.from_objects([10, 11, 12, 13], objects)
+
+        # Close and parallel points score best.
+        n_dist = len(NblastConfigDefaultDistanceBreaks) - 1
+        n_dot = len(NblastConfigDefaultDotBreaks) - 1
+        scoring = np.add.outer(-np.arange(n_dist), np.arange(n_dot))
+        self.score_fn = ScoreFunction(scoring,
+                NblastConfigDefaultDistanceBreaks, NblastConfigDefaultDotBreaks)
+
+    def test_dotprops_of_line(self):
+        points = np.column_stack([np.linspace(0, 10, 20), np.zeros(20), np.zeros(20)])
+        _, vectors, alphas = compute_dotprops(points, 5)
+        self.assertTrue(np.allclose(np.abs(vectors), [1, 0, 0]))
+        self.assertTrue(np.allclose(alphas, 1))
+
+    def test_resample_skeleton(self):
+        # A 10 unit long main path with a 5 unit long side branch
+        points = resample_skeleton([1, 2, 3, 4], [None, 1, 2, 2],
+                [[0, 0, 0], [5, 0, 0], [10, 0, 0], [5, 5, 0]], 1.0)
+        self.assertEqual(16, len(points))
+
+    def test_histogram(self):
+        # Zero and too large values are outside the right-closed bins.
+        counts = histogram([0, 0.5, 1, 600], [0.05, 0.5, 1.0, 0.2],
+                NblastConfigDefaultDistanceBreaks, NblastConfigDefaultDotBreaks)
+        self.assertEqual(2, counts.sum())
+        self.assertEqual(1, counts[0, 4])
+        self.assertEqual(1, counts[1, 9])
+
+    def test_normalized_scores(self):
+        scores = nblast_scores(self.dotprops, self.dotprops, self.score_fn,
+                'normalized', parallel=1)
+        self.assertEqual((4, 4), scores.shape)
+        self.assertTrue(np.allclose(np.diag(scores), 1))
+
+        mean = nblast_scores(self.dotprops, self.dotprops.subset([12, 10]),
+                self.score_fn, 'mean', parallel=1)
+        expected = (scores[:, [2, 0]] + scores[[2, 0], :].T) / 2
+        self.assertTrue(np.allclose(expected, mean))
+
+    def test_scores_in_daemonic_process(self):
+        # Daemonic processes can't have children, scores are computed without
+        # a process pool.
+        expected = nblast_scores(self.dotprops, self.dotprops, self.score_fn,
+                'raw', parallel=1)
+        process = multiprocessing.current_process()
+        daemon = process.daemon
+        process.daemon = True
+        try:
+            scores = nblast_scores(self.dotprops, self.dotprops,
+                    self.score_fn, 'raw', parallel=2)
+        finally:
+            process.daemon = daemon
+        self.assertTrue(np.allclose(expected, scores))
+
+    def test_cache_roundtrip(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(cache_dir, 'dps')
+            self.dotprops.save(path, {'tangent_neighbors': 5})
+            loaded, meta = DotpropsList.load(path)
+            self.assertEqual({'tangent_neighbors': 5}, meta)
+            self.assertEqual(self.dotprops.object_ids, loaded.object_ids)
+            for i in range(len(self.dotprops)):
+                for a, b in zip(self.dotprops.get(i), loaded.get(i)):
+                    self.assertTrue(np.array_equal(a, b))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_find_stale_objects(self):
+        manifest = {'1': '2020-01-01T00:00:00', '2': '2020-01-01T00:00:00',
+                '3': '2020-01-01T00:00:00'}
+        edition_times = {1: '2020-01-01T00:00:00', 2: '2020-02-01T00:00:00',
+                4: '2020-02-01T00:00:00'}
+        # Skeleton 3 has been deleted, 2 edited and 4 created.
+        current, stale = find_stale_objects(manifest, [1, 2, 4], edition_times)
+        self.assertEqual([1], current)
+        self.assertEqual([2, 4], stale)
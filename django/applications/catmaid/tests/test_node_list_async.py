@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+from django.test import TestCase
+
+from catmaid.consumers import NodeListConsumer
+from catmaid.control.authentication import PermissionError
+from catmaid.control.node import (BasicNodeProvider,
+        compile_node_list_result_async)
+from catmaid.middleware import AjaxExceptionMiddleware
+
+
+class StaticNodeProvider(BasicNodeProvider):
+
+    def __init__(self, result, delay=0, error=None):
+        super().__init__()
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    def get_tuples(self, params, project_id, *args):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.result, 'json_text' if self.result else None
+
+
+class AsyncNodeListTests(TestCase):
+
+    def compile(self, node_providers):
+        return asyncio.get_event_loop().run_until_complete(
+                compile_node_list_result_async(1, node_providers, {}))
+
+    def test_first_result_wins(self):
+        response = self.compile([StaticNodeProvider('[1]', delay=1),
+                StaticNodeProvider('[2]')])
+        self.assertEqual(b'[2]', response.content)
+
+    def test_empty_results_are_skipped(self):
+        response = self.compile([StaticNodeProvider(None),
+                StaticNodeProvider('[2]', delay=0.1)])
+        self.assertEqual(b'[2]', response.content)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            self.compile([StaticNodeProvider(None)])
+        with self.assertRaises(KeyError):
+            self.compile([StaticNodeProvider(None, error=KeyError('test')),
+                    StaticNodeProvider(None, delay=0.1)])
+        response = self.compile([StaticNodeProvider(None, error=KeyError('test')),
+                StaticNodeProvider('[2]', delay=0.1)])
+        self.assertEqual(b'[2]', response.content)
+
+    def test_invalid_token(self):
+        consumer = NodeListConsumer.__new__(NodeListConsumer)
+        consumer.scope = {'headers': [(b'x-authorization', b'Token invalid')]}
+        with self.assertRaises(PermissionError) as e:
+            consumer.check_permissions(1)
+        response = AjaxExceptionMiddleware(None).process_exception(None, e.exception)
+        self.assertEqual(403, response.status_code)
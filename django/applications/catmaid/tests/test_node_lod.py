@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from django.db import connection
+from django.test import TestCase
+
+from catmaid.control.node import (decimate_treenodes, get_lod_buckets,
+        update_grid_cache)
+from catmaid.models import NodeGridCache
+
+from catmaid.tests.common import CatmaidTestCase
+
+
+class TopologyLodTests(TestCase):
+
+    def setUp(self):
+        # A main path 1-6 with a bend at node 4 and a straight side branch 7-9
+        # starting at node 3. Treenodes are stored as (id, parent_id, x, y, z,
+        # confidence, radius, skeleton_id, edition_time, user_id).
+        self.treenodes = [
+            (1, None, 0, 0, 0, 5, 0, 1, 0, 1),
+            (2, 1, 10, 0, 0, 2, 0, 1, 0, 1),
+            (3, 2, 20, 0, 0, 5, 0, 1, 0, 1),
+            (4, 3, 30, 0, 0, 5, 0, 1, 0, 1),
+            (5, 4, 40, 15, 0, 5, 0, 1, 0, 1),
+            (6, 5, 50, 30, 0, 5, 0, 1, 0, 1),
+            (7, 3, 20, 10, 0, 5, 0, 1, 0, 1),
+            (8, 7, 20, 20, 0, 5, 0, 1, 0, 1),
+            (9, 8, 20, 30, 0, 5, 0, 1, 0, 1),
+        ]
+
+    def test_decimate_treenodes(self):
+        treenodes = decimate_treenodes(self.treenodes, set(), 0.001)
+        parents = dict((t[0], t[1]) for t in treenodes)
+        # Root, branch, bend and leaves are kept.
+        self.assertEqual({1: None, 3: 1, 4: 3, 6: 4, 9: 3}, parents)
+        # The virtual edge has the lowest confidence of the replaced edges.
+        confidences = dict((t[0], t[5]) for t in treenodes)
+        self.assertEqual(2, confidences[3])
+        self.assertEqual(5, confidences[6])
+
+    def test_decimate_protected_treenodes(self):
+        treenodes = decimate_treenodes(self.treenodes, {2, 8}, 0.001)
+        self.assertEqual([1, 2, 3, 4, 6, 8, 9], [t[0] for t in treenodes])
+
+    def test_decimate_within_bounds(self):
+        # Nodes 6 and 9 are outside, which keeps their parents and the
+        # parents of those.
+        treenodes = decimate_treenodes(self.treenodes, set(), 0.001,
+                (0, 0, 0, 100, 25, 10))
+        self.assertEqual([1, 3, 4, 5, 6, 7, 8, 9], [t[0] for t in treenodes])
+
+    def test_topology_lod_buckets(self):
+        connectors = [(100, 10, 0, 0, 5, 0, 1, [(5, 1, 5, 0, 1000)])]
+        result_tuple = [self.treenodes, connectors, {8: ['tag']}, False, {}]
+        buckets = get_lod_buckets(result_tuple, 2, 500, 'topology')
+        self.assertEqual(2, len(buckets))
+        self.assertEqual(result_tuple, buckets[1])
+        self.assertEqual([1, 3, 4, 5, 6, 8, 9], [t[0] for t in buckets[0][0]])
+        self.assertEqual(result_tuple[1:], buckets[0][1:])
+
+
+class TopologyGridCacheTests(CatmaidTestCase):
+
+    def test_store_topology_grid(self):
+        update_grid_cache(self.test_project_id, 'json', ['xy'],
+                cell_width=20000, cell_height=20000, cell_depth=20000,
+                lod_levels=2, lod_strategy='topology', progress=False,
+                log=lambda *args: None)
+        grid = NodeGridCache.objects.get(project_id=self.test_project_id)
+        self.assertEqual('topology', grid.lod_strategy)
+
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT array_length(json_data, 1)
+            FROM node_grid_cache_cell
+            WHERE grid_id = %(grid_id)s
+        """, {
+            'grid_id': grid.id,
+        })
+        n_levels = [r[0] for r in cursor.fetchall()]
+        self.assertTrue(n_levels)
+        self.assertEqual([2] * len(n_levels), n_levels)
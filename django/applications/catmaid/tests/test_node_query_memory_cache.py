@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import msgpack
+from unittest.mock import patch
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from catmaid.control.node import (NodeQueryMemoryCache, Postgis3dNodeProvider,
+        _node_list_tuples_query)
+from catmaid.tests.common import CatmaidTestCase
+
+
+class NodeQueryMemoryCacheTests(TestCase):
+
+    def setUp(self):
+        self.provider = Postgis3dNodeProvider()
+        self.queried_boxes = []
+        self.params = {'top': 0, 'z1': 0, 'bottom': 10, 'z2': 10}
+
+    def query(self, params, project_id, provider, *args, **kwargs):
+        # One root node every 100 units along X.
+        self.queried_boxes.append((params['left'], params['right']))
+        treenodes = [[i, None, i * 100 + 50, 5, 5, 5, -1, i, 0, 1]
+                for i in range(params['left'] // 100, params['right'] // 100)]
+        return [treenodes[:params['limit']], [], {},
+                len(treenodes) >= params['limit'], {}]
+
+    def get_tuples(self, cache, params, include_labels=False):
+        with patch('catmaid.control.node._node_list_tuples_query', self.query):
+            data, data_type = cache.get_tuples(self.provider, params, 1, None,
+                    None, include_labels, 'used', False)
+        return msgpack.unpackb(data) if data_type == 'msgpack' else data
+
+    @override_settings(SPATIAL_UPDATE_NOTIFICATIONS=False)
+    def test_requires_expiration(self):
+        self.assertRaises(ImproperlyConfigured, NodeQueryMemoryCache)
+        NodeQueryMemoryCache(max_age=10)
+
+    def test_quantization(self):
+        # Both requests are answered from the same quantized bounding box,
+        # cropped to the requested one.
+        cache = NodeQueryMemoryCache(max_age=10)
+        result = self.get_tuples(cache, dict(self.params, left=100, right=300,
+                limit=100))
+        self.assertEqual([1, 2], [t[0] for t in result[0]])
+        result = self.get_tuples(cache, dict(self.params, left=200, right=400,
+                limit=100))
+        self.assertEqual([2, 3], [t[0] for t in result[0]])
+        self.assertEqual([(0, 2048)], self.queried_boxes)
+
+    def test_node_limit(self):
+        # The quantized bounding box reaches the node limit, the requested
+        # bounding box is used instead.
+        cache = NodeQueryMemoryCache(max_age=10)
+        params = dict(self.params, left=100, right=300, limit=5)
+        result = self.get_tuples(cache, params)
+        self.assertEqual(2, len(result[0]))
+        self.assertFalse(result[3])
+        self.get_tuples(cache, params)
+        self.assertEqual([(0, 2048), (100, 300)], self.queried_boxes)
+
+        # A requested bounding box that is already aligned is cached
+        # separately.
+        result = self.get_tuples(cache, dict(self.params, left=0, right=2048,
+                bottom=2048, limit=5))
+        self.assertTrue(result[3])
+        self.assertEqual([(0, 2048), (100, 300), (0, 2048)], self.queried_boxes)
+
+    def test_labels_not_cached(self):
+        cache = NodeQueryMemoryCache(max_age=10)
+        params = dict(self.params, left=100, right=300, limit=100)
+        self.get_tuples(cache, params, True)
+        self.get_tuples(cache, params, True)
+        self.assertEqual([(100, 300), (100, 300)], self.queried_boxes)
+        self.assertEqual(0, cache.stats()['entries'])
+
+
+class NodeQueryMemoryCacheQueryTests(CatmaidTestCase):
+
+    def test_cropped_result(self):
+        # Cached results of the quantized bounding boxes are the same as the
+        # results of queries for the requested bounding boxes.
+        provider = Postgis3dNodeProvider()
+        cache = NodeQueryMemoryCache(max_age=10, quantization=(4096, 4096, None))
+        boxes = [
+            (3000, 5000, 3700, 6200),
+            (3500, 4500, 4000, 5700),
+            (2000, 4000, 2500, 6600),
+            (100, 100, 200, 200),
+        ]
+        for left, top, right, bottom in boxes:
+            params = {'project_id': self.test_project_id, 'left': left,
+                    'top': top, 'z1': 0, 'right': right, 'bottom': bottom,
+                    'z2': 1, 'limit': 1000}
+            data, data_type = cache.get_tuples(provider, dict(params),
+                    self.test_project_id, None, None, False, 'used', False)
+            self.assertEqual('msgpack', data_type)
+            cached = msgpack.unpackb(data, raw=False, strict_map_key=False)
+            expected = _node_list_tuples_query(dict(params),
+                    self.test_project_id, provider)
+
+            self.assertCountEqual([list(t) for t in expected[0]], cached[0])
+            self.assertCountEqual([list(c[:7]) +
+                    [sorted(list(link) for link in c[7])] for c in expected[1]],
+                    [c[:7] + [sorted(c[7])] for c in cached[1]])
+            self.assertEqual(expected[3], cached[3])
+            self.assertEqual(expected[4], cached[4])
+        # Only the second bounding box shares a quantized bounding box with a
+        # previous one.
+        self.assertEqual(1, cache.stats()['hits'])
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from guardian.shortcuts import assign_perm, remove_perm
+
+from django.contrib.auth.models import Group, User
+from django.test import TestCase
+
+from catmaid.control.authentication import (ProjectPermissionCache,
+        has_any_role, permission_cache)
+from catmaid.models import Project, UserRole
+
+
+class ProjectPermissionCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="permission-test")
+        self.project = Project.objects.create(title="Permission test project")
+        self.cache = ProjectPermissionCache(max_age=60)
+
+    def test_hits_and_misses(self):
+        assign_perm('can_browse', self.user, self.project)
+        self.assertEqual({'can_browse'}, self.cache.get_perms(self.user, self.project.id))
+        self.assertEqual({'can_browse'}, self.cache.get_perms(self.user, self.project.id))
+        stats = self.cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+    def test_disabled(self):
+        cache = ProjectPermissionCache(max_age=0)
+        cache.get_perms(self.user, self.project.id)
+        cache.get_perms(self.user, self.project.id)
+        self.assertEqual(0, cache.stats()['entries'])
+
+    def test_signal_invalidation(self):
+        # The signal handlers invalidate the global cache of this process.
+        permission_cache._max_age = 60
+        try:
+            permission_cache.clear()
+            self.assertFalse(permission_cache.get_perms(self.user, self.project.id))
+
+            assign_perm('can_annotate', self.user, self.project)
+            self.assertEqual({'can_annotate'},
+                    permission_cache.get_perms(self.user, self.project.id))
+
+            remove_perm('can_annotate', self.user, self.project)
+            self.assertFalse(permission_cache.get_perms(self.user, self.project.id))
+
+            group = Group.objects.create(name="permission-test-group")
+            assign_perm('can_browse', group, self.project)
+            self.assertFalse(permission_cache.get_perms(self.user, self.project.id))
+            self.user.groups.add(group)
+            self.assertEqual({'can_browse'},
+                    permission_cache.get_perms(self.user, self.project.id))
+        finally:
+            permission_cache._max_age = None
+            permission_cache.clear()
+
+    def test_has_any_role(self):
+        self.assertTrue(has_any_role({'can_browse'}, [UserRole.Browse, UserRole.Annotate]))
+        self.assertFalse(has_any_role({'can_browse'}, UserRole.Annotate))
+        self.assertTrue(has_any_role({'can_administer'}, UserRole.Annotate))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from catmaid.control.presence_grid import get_cells_in_box, split_bounding_box
+
+
+class PresenceGridTests(TestCase):
+
+    def test_split_aligned_bounding_box(self):
+        bb = {'minx': 0, 'miny': 100, 'minz': -20, 'maxx': 300, 'maxy': 200,
+                'maxz': 20}
+        cell_range, boundary_boxes = split_bounding_box(bb, 100, 100, 10)
+        self.assertEqual([(0, 2), (1, 1), (-2, 1)], cell_range)
+        self.assertEqual([], boundary_boxes)
+
+    def test_split_bounding_box(self):
+        bb = {'minx': 50, 'miny': 0, 'minz': 0, 'maxx': 350, 'maxy': 100,
+                'maxz': 25}
+        cell_range, boundary_boxes = split_bounding_box(bb, 100, 100, 10)
+        self.assertEqual([(1, 2), (0, 0), (0, 1)], cell_range)
+        self.assertEqual([
+            {'minx': 50, 'miny': 0, 'minz': 0, 'maxx': 100, 'maxy': 100,
+                'maxz': 25},
+            {'minx': 300, 'miny': 0, 'minz': 0, 'maxx': 350, 'maxy': 100,
+                'maxz': 25},
+            {'minx': 100, 'miny': 0, 'minz': 20, 'maxx': 300, 'maxy': 100,
+                'maxz': 25},
+        ], boundary_boxes)
+        # Contained cells and boundary boxes cover the bounding box.
+        boundary_volume = sum((b['maxx'] - b['minx']) * (b['maxy'] - b['miny']) *
+                (b['maxz'] - b['minz']) for b in boundary_boxes)
+        self.assertEqual(300 * 100 * 25,
+                2 * 100 * 100 * 10 * 2 + boundary_volume)
+
+    def test_split_half_open_bounding_box(self):
+        # Cells that end at maxz aren't contained in [minz, maxz).
+        bb = {'minx': 0, 'miny': 100, 'minz': -20, 'maxx': 300, 'maxy': 200,
+                'maxz': 20}
+        cell_range, boundary_boxes = split_bounding_box(bb, 100, 100, 10, True)
+        self.assertEqual([(0, 2), (1, 1), (-2, 0)], cell_range)
+        self.assertEqual([{'minx': 0, 'miny': 100, 'minz': 10, 'maxx': 300,
+                'maxy': 200, 'maxz': 20}], boundary_boxes)
+
+        bb['maxz'] = 25
+        cell_range, boundary_boxes = split_bounding_box(bb, 100, 100, 10, True)
+        self.assertEqual([(0, 2), (1, 1), (-2, 1)], cell_range)
+
+    def test_split_small_bounding_box(self):
+        bb = {'minx': 10, 'miny': 10, 'minz': 10, 'maxx': 90, 'maxy': 190,
+                'maxz': 30}
+        cell_range, boundary_boxes = split_bounding_box(bb, 100, 100, 10)
+        self.assertIsNone(cell_range)
+        self.assertEqual([bb], boundary_boxes)
+
+    def test_cells_in_box(self):
+        # Cells that only share a boundary with the box are included.
+        self.assertEqual([(0, 0, 0), (1, 0, 0)],
+                get_cells_in_box([50, 20, 5, 100, 80, 5], 100, 100, 10))
+        self.assertEqual([(-1, 0, 0), (-1, 0, 1), (0, 0, 0), (0, 0, 1)],
+                get_cells_in_box([0, 50, 10, 0, 50, 10], 100, 100, 10))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from django.db import connection
+
+from catmaid.models import TreenodeConnector
+from catmaid.tests.common import CatmaidTestCase
+
+
+class SkeletonConnectivityTableTests(CatmaidTestCase):
+    """Test whether the trigger maintained catmaid_skeleton_connectivity table
+    matches the connectivity computed from all connector links.
+    """
+
+    def assertConnectivityConsistent(self):
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT project_id, skeleton_id, relation_id, partner_skeleton_id,
+                partner_relation_id, confidence, count
+            FROM catmaid_skeleton_connectivity
+        """)
+        stored = cursor.fetchall()
+        cursor.execute("""
+            SELECT t1.project_id, t1.skeleton_id, t1.relation_id,
+                t2.skeleton_id, t2.relation_id,
+                LEAST(t1.confidence, t2.confidence), COUNT(*)
+            FROM treenode_connector t1
+            JOIN treenode_connector t2
+                ON t1.connector_id = t2.connector_id
+                AND t1.id <> t2.id
+            GROUP BY t1.project_id, t1.skeleton_id, t1.relation_id,
+                t2.skeleton_id, t2.relation_id, LEAST(t1.confidence, t2.confidence)
+        """)
+        expected = cursor.fetchall()
+        self.assertTrue(expected)
+        self.assertCountEqual(expected, stored)
+
+    def test_initial_state(self):
+        self.assertConnectivityConsistent()
+
+    def test_insert(self):
+        # Connector 356 links skeleton 235 to skeletons 361 and 373.
+        TreenodeConnector.objects.create(project_id=self.test_project_id,
+                user_id=3, connector_id=356, treenode_id=2394,
+                skeleton_id=2388, relation_id=1024, confidence=3)
+        self.assertConnectivityConsistent()
+
+    def test_update_relation(self):
+        TreenodeConnector.objects.filter(id=382).update(relation_id=1023)
+        self.assertConnectivityConsistent()
+        TreenodeConnector.objects.filter(id=382).update(confidence=2)
+        self.assertConnectivityConsistent()
+
+    def test_update_skeleton(self):
+        TreenodeConnector.objects.filter(id=372).update(treenode_id=2394,
+                skeleton_id=2388)
+        self.assertConnectivityConsistent()
+
+    def test_update_connector(self):
+        TreenodeConnector.objects.filter(id=429).update(connector_id=356)
+        self.assertConnectivityConsistent()
+
+    def test_delete(self):
+        TreenodeConnector.objects.filter(id=360).delete()
+        self.assertConnectivityConsistent()
+        # Remove all remaining links of connector 421
+        TreenodeConnector.objects.filter(connector_id=421).delete()
+        self.assertConnectivityConsistent()
+
+    def test_rebuild(self):
+        cursor = connection.cursor()
+        cursor.execute("""
+            DELETE FROM catmaid_skeleton_connectivity;
+            SELECT refresh_skeleton_connectivity_table(%(project_ids)s::integer[]);
+        """, {
+            'project_ids': [self.test_project_id],
+        })
+        self.assertConnectivityConsistent()
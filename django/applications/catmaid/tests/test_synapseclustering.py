@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import networkx as nx
+import numpy as np
+
+from django.test import TestCase
+
+from catmaid.control.graph2 import split_skeleton
+from catmaid.control.synapseclustering import (TreeDistances,
+        tree_max_density, tree_synapse_domains)
+
+
+class SynapseClusteringTests(TestCase):
+
+    def setUp(self):
+        # A straight line of 21 nodes with a spacing of 100 and two groups of
+        # synapses at each end.
+        self.node_ids = np.arange(1, 22)
+        self.parent_ids = np.arange(0, 21)
+        self.parent_ids[0] = -1
+        self.locations = np.zeros((21, 3))
+        self.locations[:, 0] = np.arange(21) * 100.0
+        self.synapses = [(1, 101, 1, 5), (2, 102, 2, 5), (3, 103, 1, 4),
+                (19, 104, 2, 5), (21, 105, 1, 3)]
+
+    def test_tree_distances(self):
+        #      0
+        #     / \
+        #    1   4     5 (separate component)
+        #   / \
+        #  2   3
+        distances = TreeDistances([-1, 0, 1, 1, 0, -1], [0, 1, 2, 3, 4, 0])
+        self.assertEqual([1, 0, 0], distances.lca([2, 3, 4], [3, 4, 0]).tolist())
+        self.assertEqual([5, 7, 4, 0], distances.distance([2, 2, 4, 3], [3, 4, 0, 3]).tolist())
+        matrix = distances.distance_matrix([2, 5], [0, 5])
+        self.assertEqual([[3, np.inf], [np.inf, 0]], matrix.tolist())
+
+    def test_tree_max_density(self):
+        graph = nx.Graph()
+        for node_id, parent_id in zip(self.node_ids[1:], self.parent_ids[1:]):
+            graph.add_edge(parent_id, node_id, weight=100.0)
+        groups = tree_max_density(graph, [s[0] for s in self.synapses],
+                [s[1] for s in self.synapses], [s[2] for s in self.synapses],
+                [200, 5000])
+        self.assertEqual([[101, 102, 103], [104, 105]],
+                [g.connector_ids for g in groups[200].values()])
+        self.assertEqual(1, len(groups[5000]))
+
+    def test_tree_synapse_domains(self):
+        synapse_indices = [s[0] - 1 for s in self.synapses]
+        domains, maxima = tree_synapse_domains(self.parent_ids - 1,
+                self.locations, synapse_indices, 200)
+        self.assertEqual([0, 0, 0, 1, 1], domains.tolist())
+        self.assertEqual(2, len(maxima))
+
+        # A large bandwidth merges all synapses into one domain
+        domains, maxima = tree_synapse_domains(self.parent_ids - 1,
+                self.locations, synapse_indices, 5000)
+        self.assertEqual([0] * 5, domains.tolist())
+
+    def test_split_by_confidence(self):
+        confidences = np.full(21, 5)
+        confidences[10] = 1
+        nodes, branch_nodes, intraedges, links = split_skeleton(7,
+                self.node_ids, self.parent_ids, confidences, self.synapses, 3)
+        self.assertEqual(['7_1', '7_2'], nodes)
+        self.assertEqual([], branch_nodes)
+        self.assertEqual([(101, 1, '7_1', 5), (102, 2, '7_1', 5),
+                (103, 1, '7_1', 4), (104, 2, '7_2', 5), (105, 1, '7_2', 3)], links)
+
+    def test_split_by_both(self):
+        confidences = np.full(21, 5)
+        nodes, branch_nodes, intraedges, links = split_skeleton(7,
+                self.node_ids, self.parent_ids, confidences, self.synapses, 3,
+                200, self.locations)
+        self.assertEqual(['7_1', '7_2'], sorted(nodes))
+        self.assertEqual([], branch_nodes)
+        self.assertEqual([('7_1', '7_2')], [tuple(sorted(e)) for e in intraedges])
+        self.assertEqual(['7_1', '7_1', '7_1', '7_2', '7_2'], [link[2] for link in links])
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+from django.db import connection
+from django.test import TestCase
+
+from catmaid.control.tree_util import (ArrayTree, SkeletonArborCache,
+        cable_length, edge_count_to_root, find_common_ancestor, find_root,
+        partition, reroot, simplify)
+from catmaid.models import Treenode
+
+
+class ArrayTreeTests(TestCase):
+
+    def setUp(self):
+        #      1
+        #     / \
+        #    2   5
+        #   / \   \
+        #  3   4   6
+        #           \
+        #            7
+        self.tree = ArrayTree([7, 3, 1, 2, 4, 5, 6], [6, 2, None, 1, 2, 1, 5], {
+            'location_x': [0.0, 1.0, 0.0, 0.0, 2.0, 3.0, 4.0],
+            'location_y': [0.0] * 7,
+            'location_z': [0.0] * 7,
+        })
+
+    def test_structure(self):
+        tree = self.tree
+        self.assertEqual(7, len(tree))
+        self.assertEqual(1, find_root(tree))
+        self.assertEqual(2, tree.parent(3))
+        self.assertIsNone(tree.parent(1))
+        self.assertIn(6, tree)
+        self.assertNotIn(8, tree)
+        self.assertEqual({'location_x': 2.0, 'location_y': 0.0, 'location_z': 0.0},
+                tree.node_data(4))
+
+    def test_unknown_parent(self):
+        self.assertRaises(ValueError, ArrayTree, [1, 2, 3], [None, 1, 4])
+        self.assertRaises(ValueError, ArrayTree, [1, 2, 3], [None, 1, 0])
+
+    def test_edge_count_to_root(self):
+        tree = self.tree
+        self.assertEqual({1: 1, 2: 2, 3: 3, 4: 3, 5: 2, 6: 3, 7: 4},
+                edge_count_to_root(tree))
+
+    def test_partition(self):
+        tree = self.tree
+        self.assertEqual([[7, 6, 5, 1], [3, 2, 1], [4, 2]],
+                list(partition(tree)))
+
+    def test_find_common_ancestor(self):
+        tree = self.tree
+        self.assertEqual((2, 2), find_common_ancestor(tree, [3, 4]))
+        self.assertEqual((1, 1), find_common_ancestor(tree, [3, 4, 7]))
+        self.assertEqual((4, 0), find_common_ancestor(tree, [4]))
+
+    def test_reroot(self):
+        tree = self.tree
+        reroot(tree, 7)
+        self.assertEqual(7, find_root(tree))
+        self.assertEqual(5, tree.parent(1))
+        self.assertEqual(7, tree.parent(6))
+        self.assertEqual(2, tree.parent(3))
+
+    def test_simplify(self):
+        tree = self.tree
+        mini = simplify(tree, [3, 4, 7])
+        self.assertEqual({3, 4, 7, 2}, set(mini.nodes()))
+        self.assertEqual(3, mini.number_of_edges())
+
+    def test_cable_length(self):
+        tree = self.tree
+        self.assertAlmostEqual(11.0, cable_length(tree))
+
+    def test_components(self):
+        tree = self.tree
+        components = sorted(tree.components([2, 3, 4, 6]), key=len)
+        self.assertEqual([{6}, {2, 3, 4}], components)
+
+    def test_to_digraph(self):
+        tree = self.tree
+        graph = tree.to_digraph()
+        self.assertEqual([(1, 2), (1, 5), (2, 3), (2, 4), (5, 6), (6, 7)],
+                sorted(graph.edges()))
+
+    def test_children(self):
+        tree = self.tree
+        self.assertEqual([2, 5], sorted(tree.children(1)))
+        self.assertEqual([], tree.children(7))
+        reroot(tree, 7)
+        self.assertEqual([2], tree.children(1))
+
+    def test_subtree(self):
+        tree = self.tree
+        sizes = dict(zip(tree.node_ids.tolist(), tree.subtree_sizes().tolist()))
+        self.assertEqual({1: 7, 2: 3, 3: 1, 4: 1, 5: 3, 6: 2, 7: 1}, sizes)
+        subtree = tree.subtree(5)
+        self.assertEqual([5, 6, 7], sorted(subtree))
+        self.assertEqual(5, find_root(subtree))
+        self.assertEqual(4.0, subtree.node_data(6)['location_x'])
+
+
+class SkeletonArborCacheTests(TestCase):
+    fixtures = ['catmaid_testdata']
+
+    class VersionedCache(SkeletonArborCache):
+        version = 1
+
+        def _query_version(self, skeleton_id, cursor):
+            return self.version
+
+    def test_get(self):
+        cache = self.VersionedCache(max_size=1024 * 1024)
+        arbor = cache.get(2388)
+        self.assertEqual([2392, 2394, 2396], sorted(arbor))
+        self.assertEqual(2392, find_root(arbor))
+        self.assertEqual(3680.0, arbor.node_data(2396)['location_x'])
+
+        # Changing the returned tree doesn't change the cached one.
+        reroot(arbor, 2396)
+        self.assertEqual(2392, find_root(cache.get(2388)))
+        self.assertEqual(1, cache.stats()['hits'])
+
+        cache.version = 2
+        cache.get(2388)
+        stats = cache.stats()
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(1, stats['invalidations'])
+
+    def test_size_limit(self):
+        cache = self.VersionedCache(max_size=1)
+        cache.get(2388)
+        self.assertEqual(0, cache.stats()['entries'])
+
+    def test_missing_skeleton(self):
+        cache = SkeletonArborCache()
+        self.assertRaises(ValueError, cache.get, 1)
+
+    def test_version(self):
+        cache = SkeletonArborCache()
+        cursor = connection.cursor()
+        version = cache._query_version(2388, cursor)
+
+        # Confidence changes don't update the skeleton summary, but they
+        # change the version.
+        Treenode.objects.filter(id=2394).update(confidence=1)
+        new_version = cache._query_version(2388, cursor)
+        self.assertNotEqual(version, new_version)
+
+        # Changes that aren't part of the arbor keep the version.
+        Treenode.objects.filter(id=2394).update(radius=10)
+        self.assertEqual(new_version, cache._query_version(2388, cursor))
+
+        # Moving a leaf to another skeleton changes both versions.
+        other_version = cache._query_version(2364, cursor)
+        Treenode.objects.filter(id=2396).update(skeleton_id=2364, parent=None)
+        self.assertNotEqual(new_version, cache._query_version(2388, cursor))
+        self.assertNotEqual(other_version, cache._query_version(2364, cursor))
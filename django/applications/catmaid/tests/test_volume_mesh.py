@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from django.test import TestCase
+
+from catmaid.control.volume import VolumeMesh
+
+
+class VolumeMeshTests(TestCase):
+
+    def setUp(self):
+        # A cube from (-1, -1, -1) to (1, 1, 1) with outward facing triangles
+        vertices = [(-1, -1, -1), (1, -1, -1), (-1, 1, -1), (1, 1, -1),
+                (-1, -1, 1), (1, -1, 1), (-1, 1, 1), (1, 1, 1)]
+        faces = [(0, 2, 1), (1, 2, 3), (0, 1, 5), (0, 5, 4), (2, 6, 7),
+                (2, 7, 3), (4, 7, 6), (4, 5, 7), (0, 6, 2), (0, 4, 6),
+                (1, 3, 5), (3, 7, 5)]
+        self.box = VolumeMesh(vertices, faces)
+
+    def test_contains(self):
+        # The center projects onto the shared edge of two triangles.
+        self.assertEqual([True, True, True, False, False, False],
+                self.box.contains([[0, 0, 0], [0.5, -0.5, 0.9],
+                    [0.99, 0.99, 0.99], [2, 2, 2], [0, 0, 1.5],
+                    [0, 0, -1.5]]).tolist())
+
+    def test_contains_convex_mesh(self):
+        # Compare with the half-space representation of a regular octahedron.
+        vertices = [(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1),
+                (0, 0, -1)]
+        faces = [(0, 2, 4), (2, 1, 4), (1, 3, 4), (3, 0, 4), (2, 0, 5),
+                (1, 2, 5), (3, 1, 5), (0, 3, 5)]
+        mesh = VolumeMesh(vertices, faces)
+        points = np.random.RandomState(1).uniform(-1.2, 1.2, (5000, 3))
+        expected = np.abs(points).sum(axis=1) < 1
+        self.assertEqual(expected.tolist(),
+                mesh.contains(points, max_tests=100).tolist())
+
+    def test_from_x3d(self):
+        mesh = VolumeMesh.from_x3d("<IndexedFaceSet coordIndex='0 1 2 3 -1 0 1 4'>"
+                "<Coordinate point='0 0 0 1 0 0 1 1 0 0 1 0 0 0 1'/></IndexedFaceSet>")
+        self.assertEqual([[0, 1, 2], [0, 2, 3], [0, 1, 4]], mesh.faces.tolist())
+        self.assertEqual([False], VolumeMesh.from_x3d('').contains([[0, 0, 0]]).tolist())
+
+        # Repeated vertices are merged.
+        mesh = VolumeMesh.from_x3d("<IndexedTriangleSet index='0 1 2 3 4 5'>"
+                "<Coordinate point='0 0 0 1 0 0 0 1 0 1 0 0 1 1 0 0 1 0'/>"
+                "</IndexedTriangleSet>")
+        self.assertEqual([[0, 0, 0], [1, 0, 0], [0, 1, 0], [1, 1, 0]],
+                mesh.vertices.tolist())
+        self.assertEqual([[0, 1, 2], [1, 3, 2]], mesh.faces.tolist())
+
+    def test_binary(self):
+        data = self.box.to_binary()
+        self.assertEqual(8 + 8 * 3 * 4 + 12 * 3 * 4, len(data))
+        copy = VolumeMesh.from_binary(data)
+        self.assertEqual(self.box.vertices.tolist(), copy.vertices.tolist())
+        self.assertEqual(self.box.faces.tolist(), copy.faces.tolist())
+        self.assertEqual(80 + 4 + 12 * 50, len(self.box.to_stl_binary()))
+
+    def test_innervation(self):
+        # A path along X that crosses the box and ends outside of it.
+        locations = [[-2, 0.1, 0.1], [-0.5, 0.1, 0.1], [0.5, 0.1, 0.1],
+                [2, 0.1, 0.1], [3, 0, 0]]
+        num_nodes, cable_length = self.box.innervation(locations,
+                np.array([-1, 0, 1, 2, 3]))
+        self.assertEqual(2, num_nodes)
+        self.assertAlmostEqual(2, cable_length, places=2)
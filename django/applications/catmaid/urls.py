@@ -241,6 +241,7 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/nodes/most-recent$', node.most_recent_treenode),
     url(r'^(?P<project_id>\d+)/nodes/location$', node.get_locations),
     url(r'^(?P<project_id>\d+)/nodes/nearest$', node.node_nearest),
+    url(r'^(?P<project_id>\d+)/nodes/nearest/batch$', node.nodes_nearest),
     url(r'^(?P<project_id>\d+)/node/update$', record_view("nodes.update_location")(node.node_update)),
     url(r'^(?P<project_id>\d+)/node/list$', node.node_list_tuples),
     url(r'^(?P<project_id>\d+)/node/get_location$', node.get_location),
@@ -254,6 +255,7 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/treenode/create$', record_view("treenodes.create")(treenode.create_treenode)),
     url(r'^(?P<project_id>\d+)/treenode/insert$', record_view("treenodes.insert")(treenode.insert_treenode)),
     url(r'^(?P<project_id>\d+)/treenode/delete$', record_view("treenodes.remove")(treenode.delete_treenode)),
+    url(r'^(?P<project_id>\d+)/treenodes/create$', record_view("treenodes.create")(treenode.create_treenodes)),
     url(r'^(?P<project_id>\d+)/treenodes/compact-detail$', treenode.compact_detail_list),
     url(r'^(?P<project_id>\d+)/treenodes/(?P<treenode_id>\d+)/info$', treenode.treenode_info),
     url(r'^(?P<project_id>\d+)/treenodes/(?P<treenode_id>\d+)/compact-detail$', treenode.compact_detail),
@@ -531,6 +533,8 @@ urlpatterns += [
     url(r'^(?P<project_id>\d+)/volumes/skeleton-innervations$', volume.get_skeleton_innervations),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/$', volume.VolumeDetail.as_view()),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/intersect$', volume.intersects),
+    url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/contains$', volume.contains),
+    url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/mesh$', volume.volume_mesh),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/export\.(?P<extension>\w+)', volume.export_volume),
     url(r'^(?P<project_id>\d+)/volumes/(?P<volume_id>\d+)/update-meta-info$', volume.update_meta_information),
 ]
@@ -15,3 +15,6 @@ class TestSuiteRunner(DiscoverRunner):
         super().setup_test_environment(**kwargs)
         settings.STATICFILES_STORAGE = 'pipeline.storage.NonPackagingPipelineStorage'
         pipeline_settings.DEBUG = True
+        # Tests roll back permission changes without sending signals.
+        settings.PERMISSION_CACHE_MAX_AGE = 0
+        settings.CONNECTIVITY_GRAPH_MAX_AGE = 0
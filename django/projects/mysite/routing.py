@@ -1,10 +1,19 @@
+from django.conf.urls import url
+
 from channels.auth import AuthMiddlewareStack
+from channels.http import AsgiHandler
 from channels.routing import ProtocolTypeRouter, URLRouter
 
 import catmaid.routing
 
 application = ProtocolTypeRouter({
-    # (http->django views is added by default)
+    # Requests that don't match an ASGI specific endpoint are handled by
+    # regular Django views.
+    'http': URLRouter(
+        catmaid.routing.http_urlpatterns + [
+            url(r'', AsgiHandler),
+        ]
+    ),
     'websocket': AuthMiddlewareStack(
         URLRouter(
             catmaid.routing.websocket_urlpatterns
@@ -170,6 +170,22 @@ AUTHENTICATION_BACKENDS = (
 # for admin accounts.
 REQUIRE_EXTRA_TOKEN_PERMISSIONS = True
 
+# The permissions of users on projects are kept in memory for this many
+# seconds by each process. Changes made by other processes become visible after
+# this time at the latest. Setting it to zero disables the permission cache.
+PERMISSION_CACHE_MAX_AGE = 10
+
+# Each process keeps recently used skeleton arbors in memory, up to this many
+# bytes. Entries are checked against the version of a skeleton on each use,
+# which the database updates with every change of the skeleton's nodes. Setting
+# it to zero disables the arbor cache.
+SKELETON_ARBOR_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+# Each process keeps recently used volume meshes for exact point in volume
+# tests in memory, up to this many bytes. Entries are checked against the
+# edition time of a volume on each use. Setting it to zero disables the cache.
+VOLUME_MESH_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
 # Main ASGI router for CATMAID
 ASGI_APPLICATION = "mysite.routing.application"
 
@@ -230,6 +246,11 @@ ROI_AUTO_CREATE_IMAGE = False
 # result; that will be between 1x and 2x this value.
 NODE_LIST_MAXIMUM_COUNT = 3500
 
+# The number of threads, and with it database connections, each ASGI server
+# process uses for node queries of the async node list endpoint, which queries
+# all node providers concurrently.
+NODE_LIST_ASYNC_POOL_SIZE = 8
+
 # Default importer tile width, tile height and tile source type
 IMPORTER_DEFAULT_DATA_SOURCE = 'filesystem'
 IMPORTER_DEFAULT_TILE_WIDTH = 512
@@ -431,18 +452,43 @@ CREATE_DEFAULT_DATAVIEWS = True
 
 # NBLAST support
 NBLAST_ALL_BY_ALL_MIN_SIZE = 10
+# Which NBLAST implementation to use: 'r' uses the nat.nblast R package through
+# Rpy2, 'python' uses CATMAID's own NumPy/SciPy implementation.
+NBLAST_BACKEND = 'r'
 MAX_PARALLEL_ASYNC_WORKERS = 1
 
+# Number of processes used to split multiple skeletons into synapse domains for
+# the graph widget. A value of 1 disables parallel processing.
+MAX_PARALLEL_GRAPH_WORKERS = 1
+
 # Intersection grid settings, dimensions in project coordinates (nm)
 DEFAULT_CACHE_GRID_CELL_WIDTH = 25000
 DEFAULT_CACHE_GRID_CELL_HEIGHT = 25000
 DEFAULT_CACHE_GRID_CELL_DEPTH = 40
+# Collinearity tolerance of the "topology" LOD strategy for grid cells. It is
+# used for the second most detailed LOD level and doubles with each coarser one.
+DEFAULT_CACHE_GRID_LOD_TOLERANCE = 0.05
+
+# Bounding box queries for skeletons and connectors use an enabled presence grid
+# of a project, if the bounding box contains at least this many of its cells.
+# Only the remaining boundary of the bounding box is queried by intersecting
+# edges then. A value of zero disables the use of presence grids.
+SPATIAL_PRESENCE_GRID_MIN_CELLS = 8
 
 # Whether Postgres should emit "catmaid.spatial-update" events on changes of
 # spatial data (e.g. inserts, updates and deletions of treenodes, connectors and
 # connector links).
 SPATIAL_UPDATE_NOTIFICATIONS = False
 
+# Graph queries like circles of hell and directed paths use an in-memory
+# connectivity graph of a project, which each process reloads after this many
+# seconds. With SPATIAL_UPDATE_NOTIFICATIONS enabled, the graph is additionally
+# updated with each change. Setting it to zero loads the graph for each query.
+# If set to None, graphs are kept for 60 seconds if SPATIAL_UPDATE_NOTIFICATIONS
+# is enabled and are otherwise loaded for each query, so that results always
+# include the latest changes.
+CONNECTIVITY_GRAPH_MAX_AGE = None
+
 # On statup, the default client instance settings can be populated based on a
 # JSON string, representing a list of objects with a "key" field and a "value"
 # field. These settings will only be applied if they exist already.
@@ -15,7 +15,8 @@
 #
 # EXCLUDED_TABLES: Defines which tables to exclude. Defaults to:
 #                  '-T treenode_edge -T treenode_connector_edge -T connector_geom -T \
-#                  catmaid_stats_summary -T node_query_cache -T catmaid_skeleton_summary'
+#                  catmaid_stats_summary -T node_query_cache -T catmaid_skeleton_summary \
+#                  -T catmaid_skeleton_connectivity'
 #
 # Restoring backups:
 #
@@ -46,7 +47,7 @@ DUMPALL=${DUMPALL:-'/usr/bin/pg_dumpall'}
 PGDUMP=${PGDUMP:-'/usr/bin/pg_dump'}
 PSQL=${PSQL:-'/usr/bin/psql'}
 
-EXCLUDED_TABLES=${EXCLUDED_TABLES:-'-T treenode_edge -T treenode_connector_edge -T connector_geom -T catmaid_stats_summary -T node_query_cache -T catmaid_skeleton_summary'}
+EXCLUDED_TABLES=${EXCLUDED_TABLES:-'-T treenode_edge -T treenode_connector_edge -T connector_geom -T catmaid_stats_summary -T node_query_cache -T catmaid_skeleton_summary -T catmaid_skeleton_connectivity'}
 
 # directory to save backups in, must be rwx by postgres user
 BASE_DIR=${BASE_DIR:-'/var/backups/postgres'}